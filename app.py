@@ -1,9 +1,22 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, send_from_directory
+from flask import Flask, Response, g, render_template, request, redirect, url_for, flash, send_from_directory, jsonify, stream_with_context
 from markupsafe import Markup
 from dotenv import load_dotenv
+from werkzeug.local import LocalProxy
 import os
-from plate_recognizer import recognize_plate_from_webcam_api
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional, Tuple, Union
+from plate_recognizer import recognize_plate_from_webcam_api, recognize_plate_headless
 from parking_manager import ParkingManager
+from event_log import EventLogParkingManager
+from parking_results import ParkingResult, ResultStatus
+from tariffs import TariffEngine
+from result_messages import format_result
+from invoice_export import INVOICE_ZIP_FILENAME, export_invoices_zip
+import metrics
+import tracing
 from vehicle import VehicleType
 
 # Cargar las variables de entorno
@@ -15,14 +28,145 @@ app.secret_key = os.environ.get("FLASK_SECRET_KEY")
 
 # Configuraciones
 DB_NAME = "parking_system.db"
+# Almacenamiento de las entradas y salidas: "sqlite" (ParkingManager sobre DB_NAME) o "event_log"
+# (EventLogParkingManager, un registro de eventos en EVENT_LOG_DIR)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "sqlite")
+EVENT_LOG_DIR = os.environ.get("EVENT_LOG_DIR", "event_log")
 PARKING_CAPACITY = 10 
 CSV_EXPORT_FILENAME = "parking_history.csv"
-
-# Inicializar instancia de ParkingManager
-parking_manager = ParkingManager(db_name=DB_NAME, capacity=PARKING_CAPACITY)
-
-# Directorio donde se guardan las facturas
-INVOICES_DIR = os.path.join(app.root_path, parking_manager.invoices_dir)
+HISTORY_PAGE_SIZE = 50 # Registros por página en /history
+HISTORY_MAX_PAGE_SIZE = 500
+GATE_EVENTS_MAX_BATCH = 1000 # Eventos de barrera admitidos por petición en /api/v1/events
+SSE_KEEPALIVE_SECONDS = 15.0 # Comentario periódico para que proxies y clientes no cierren el stream
+OCCUPANCY_MAX_DAYS = 366 # Días admitidos por petición en /api/v1/occupancy/daily
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8)) # Conexiones SQLite (una por hilo de petición)
+DB_BUSY_TIMEOUT = float(os.environ.get("DB_BUSY_TIMEOUT", 5.0)) # Segundos de espera ante bloqueos
+INVOICE_WORKERS = int(os.environ.get("INVOICE_WORKERS", 2)) # Hilos que generan facturas en segundo plano
+# Fuente de frames para el reconocimiento sin ventana: índice de cámara, archivo de vídeo o directorio de imágenes.
+# Con PLATE_CAPTURE_INTERACTIVE=1 se usa la ventana de la webcam (requiere pantalla en el servidor).
+PLATE_CAPTURE_SOURCE = os.environ.get("PLATE_CAPTURE_SOURCE", "0")
+PLATE_CAPTURE_INTERACTIVE = os.environ.get("PLATE_CAPTURE_INTERACTIVE") == "1"
+PLATE_CAPTURE_TIMEOUT = float(os.environ.get("PLATE_CAPTURE_TIMEOUT", 30.0))
+INVOICE_EXPORT_WORKERS = int(os.environ.get("INVOICE_EXPORT_WORKERS", 2)) # Procesos que generan facturas en /export_invoices
+# Archivo JSON con las tarifas (franjas horarias, máximos diarios, cortesía). Sin él se usa la tarifa plana por hora.
+TARIFF_CONFIG = os.environ.get("TARIFF_CONFIG")
+# Histogramas de latencia (rutas, SQL, PDF, API de matrículas) expuestos en /metrics; desactivados no tienen coste apreciable
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED") == "1"
+metrics.REGISTRY.enabled = METRICS_ENABLED
+# Trazas por muestreo (1 de cada TRACE_SAMPLE_RATE peticiones; 0 las desactiva) con su árbol de spans (SQL, PDF, archivos)
+TRACE_SAMPLE_RATE = int(os.environ.get("TRACE_SAMPLE_RATE", 0))
+TRACE_BUFFER_SIZE = int(os.environ.get("TRACE_BUFFER_SIZE", 100)) # Trazas recientes en memoria (/debug/traces)
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", 500.0)) # Las trazas más lentas se guardan en TRACE_DUMP_DIR
+TRACE_DUMP_DIR = os.environ.get("TRACE_DUMP_DIR", "traces")
+tracing.TRACER.sample_rate = TRACE_SAMPLE_RATE
+tracing.TRACER.buffer_size = TRACE_BUFFER_SIZE
+tracing.TRACER.slow_ms = TRACE_SLOW_MS
+tracing.TRACER.dump_dir = TRACE_DUMP_DIR or None
+
+def create_parking_manager() -> Union[ParkingManager, EventLogParkingManager]:
+    """Crea el gestor de la aplicación con la configuración del entorno, con el almacenamiento de
+    STORAGE_BACKEND. Lanza ValueError si no es uno de los admitidos."""
+    tariffs = TariffEngine.from_file(TARIFF_CONFIG) if TARIFF_CONFIG else None
+    manager: Union[ParkingManager, EventLogParkingManager]
+    if STORAGE_BACKEND == "sqlite":
+        manager = ParkingManager(db_name=DB_NAME, capacity=PARKING_CAPACITY,
+                                 pool_size=DB_POOL_SIZE, busy_timeout=DB_BUSY_TIMEOUT,
+                                 invoice_workers=INVOICE_WORKERS if DB_POOL_SIZE > 0 else 0,
+                                 tariffs=tariffs)
+    elif STORAGE_BACKEND == "event_log":
+        manager = EventLogParkingManager(EVENT_LOG_DIR, capacity=PARKING_CAPACITY, tariffs=tariffs)
+    else:
+        raise ValueError(f"STORAGE_BACKEND no válido: {STORAGE_BACKEND} (use sqlite o event_log).")
+
+    # Datos del establecimiento y de las facturas (opcionales; por defecto, los de invoice_template.DEFAULT_ISSUER)
+    manager.parking_name = os.environ.get("PARKING_NAME", manager.parking_name)
+    manager.parking_address = os.environ.get("PARKING_ADDRESS", manager.parking_address)
+    manager.parking_nif = os.environ.get("PARKING_NIF", manager.parking_nif)
+    manager.invoice_customer = os.environ.get("INVOICE_CUSTOMER", manager.invoice_customer)
+    manager.invoice_employee = os.environ.get("INVOICE_EMPLOYEE", manager.invoice_employee)
+    return manager
+
+_parking_manager: Optional[Union[ParkingManager, EventLogParkingManager]] = None
+_parking_manager_lock = threading.Lock()
+
+def get_parking_manager() -> Union[ParkingManager, EventLogParkingManager]:
+    """Devuelve el gestor de la aplicación y lo crea en el primer uso. No se crea al importar
+    el módulo: con 'spawn', los procesos de /export_invoices vuelven a importar el módulo principal
+    (este, si se arranca con `python app.py`) y cada uno abriría la base de datos y arrancaría su
+    propia cola de facturas."""
+    global _parking_manager
+    manager = _parking_manager
+    if manager is None:
+        with _parking_manager_lock:
+            if _parking_manager is None:
+                _parking_manager = create_parking_manager()
+            manager = _parking_manager
+    return manager
+
+def set_parking_manager(manager: Optional[Union[ParkingManager, EventLogParkingManager]]):
+    """Sustituye el ParkingManager de la aplicación (p. ej. en las pruebas). Con None se vuelve a
+    crear con create_parking_manager() en el siguiente uso."""
+    global _parking_manager
+    with _parking_manager_lock:
+        _parking_manager = manager
+
+# Las rutas usan el gestor a través de este proxy, que lo obtiene con get_parking_manager()
+parking_manager: ParkingManager = LocalProxy(get_parking_manager) # type: ignore
+
+def invoices_dir() -> str:
+    """Directorio donde se guardan las facturas."""
+    return os.path.join(app.root_path, parking_manager.invoices_dir)
+
+@app.teardown_request
+def release_db_connection(exception=None):
+    """Devuelve al pool la conexión usada por el hilo de la petición. Si el gestor aún no se ha creado
+    (p. ej. en /metrics), la petición no ha usado ninguna y no se crea aquí."""
+    manager = _parking_manager
+    if manager is not None:
+        manager.release_connection()
+
+@app.teardown_request
+def finish_request_trace(exception=None):
+    """Cierra la traza de la petición, si se muestreó, aunque la vista haya lanzado una excepción."""
+    handle = g.pop("trace", None)
+    if handle is not None:
+        tracing.TRACER.end(handle, **({"error": type(exception).__name__} if exception is not None else {}))
+
+@app.before_request
+def start_request_timer():
+    if metrics.REGISTRY.enabled:
+        g.request_start = time.perf_counter()
+    if tracing.TRACER.sample_rate > 0:
+        g.trace = tracing.TRACER.begin(request.endpoint or "not_found", method=request.method, path=request.path)
+
+@app.after_request
+def record_request_duration(response):
+    """Registra el tiempo de la petición por ruta, método y código HTTP (en las respuestas en streaming,
+    hasta que se empieza a enviar el cuerpo)."""
+    start = g.pop("request_start", None)
+    if start is not None:
+        metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, request.endpoint or "not_found",
+                                             request.method, str(response.status_code))
+    if g.get("trace") is not None:
+        g.trace[0].root.attributes["status"] = response.status_code
+    return response
+
+def manager_gauge(read: Callable[[ParkingManager], Optional[float]]) -> Callable[[], Optional[float]]:
+    """Gauge que se lee del gestor actual al exponer las métricas, por si se sustituye. Si aún no se ha
+    creado, no se expone: exponer las métricas no debe abrir la base de datos."""
+    return lambda: read(_parking_manager) if _parking_manager is not None else None
+
+metrics.REGISTRY.gauge_function("parking_occupancy", "Vehículos aparcados.",
+                                manager_gauge(lambda manager: manager.get_current_occupancy()))
+metrics.REGISTRY.gauge_function("parking_capacity", "Plazas del parking.", manager_gauge(lambda manager: manager.capacity))
+metrics.REGISTRY.gauge_function("parking_invoice_queue_depth", "Facturas pendientes de generar en la cola.",
+                                manager_gauge(lambda manager: (manager.get_invoice_queue_metrics() or {}).get("queue_depth")))
+
+def recognize_plate():
+    """Reconoce una matrícula con la cámara: sin ventana (captura automática) salvo que se configure el modo interactivo."""
+    if PLATE_CAPTURE_INTERACTIVE:
+        return recognize_plate_from_webcam_api()
+    return recognize_plate_headless(PLATE_CAPTURE_SOURCE, timeout=PLATE_CAPTURE_TIMEOUT)
 
 def get_vehicle_types_for_template():
     """Obtiene todos los tipos de vehículos para el formulario"""
@@ -49,14 +193,10 @@ def check_in():
             flash("Error: Debe seleccionar un tipo de vehículo.", "error")
             return redirect(url_for('check_in'))
 
-        if not parking_manager.check_capacity():
-            flash("Error: El parking está lleno.", "error")
-            return redirect(url_for('index'))
-
         try:
             vehicle_type = VehicleType(float(vehicle_type_value))
-            message = parking_manager.check_in_vehicle(plate, vehicle_type)
-            flash(message, "success" if "registrado" in message else "error")
+            result = parking_manager.check_in_vehicle(plate, vehicle_type)
+            flash(format_result(result, parking_manager.date_format_str), "success" if result.ok else "error")
         except ValueError:
             flash("Error: Tipo de vehículo no válido.", "error")
         except Exception as e:
@@ -72,7 +212,7 @@ def check_in_webcam():
         flash("Error: El parking está lleno.", "error")
         return redirect(url_for('index'))
 
-    plate = recognize_plate_from_webcam_api()
+    plate = recognize_plate()
 
     if not plate:
         flash("No se pudo reconocer la matrícula o la operación fue cancelada.", "info")
@@ -92,17 +232,15 @@ def check_out():
             flash("Error: La matrícula no puede estar vacía.", "error")
             return redirect(url_for('index'))
 
-        message, generated_invoice_filename = parking_manager.check_out_vehicle(plate)
-        is_success = "Salida registrada" in message
-
-        if is_success:
-            success_message_to_flash = message
+        result = parking_manager.check_out_vehicle(plate)
+        message = format_result(result, parking_manager.date_format_str)
 
-            flash(success_message_to_flash, "success")
+        if result.ok:
+            flash(message, "success")
 
-            if generated_invoice_filename:
-                invoice_url = url_for('serve_invoice', filename=generated_invoice_filename)
-                flash(Markup(f'Factura generada: <a href="{invoice_url}" target="_blank" class="alert-link">{generated_invoice_filename}</a>.'), "info")
+            if result.invoice:
+                invoice_url = url_for('serve_invoice', filename=result.invoice)
+                flash(Markup(f'Factura generada: <a href="{invoice_url}" target="_blank" class="alert-link">{result.invoice}</a>.'), "info")
         else:
             flash(message, "error")
 
@@ -114,7 +252,7 @@ def check_out():
 @app.route('/check_out_webcam', methods=['GET'])
 def check_out_webcam():
     """Página para registrar la salida de un vehículo mediante cámara. Devuelve la plantilla con el formulario de check-out (matricula pre-rellenada)."""
-    plate = recognize_plate_from_webcam_api()
+    plate = recognize_plate()
 
     if not plate:
         flash("No se pudo reconocer la matrícula o la operación fue cancelada.", "info")
@@ -131,36 +269,258 @@ def current_vehicles_route():
 
 @app.route('/history')
 def history_route():
-    """Muestra el historial de vehículos."""
-    history = parking_manager.get_vehicle_history_data()
-    return render_template('vehicle_history.html', history=history)
+    """Muestra una página del historial de vehículos.
+    Parámetros opcionales: `limit` (tamaño de página) y `after` (cursor devuelto por la página anterior)."""
+    limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), HISTORY_MAX_PAGE_SIZE)
+    after = request.args.get('after') or None
+    try:
+        history, next_cursor = parking_manager.get_vehicle_history_page(limit=limit, after=after)
+    except ValueError:
+        flash("Error: Cursor de paginación no válido.", "error")
+        return redirect(url_for('history_route'))
+    return render_template('vehicle_history.html', history=history, next_cursor=next_cursor,
+                           limit=limit, is_first_page=after is None)
+
+def parse_date_range_args() -> Tuple[Optional[int], Optional[int]]:
+    """Lee los parámetros opcionales `start` y `end` (AAAA-MM-DD, ambos incluidos) de la petición
+    y los devuelve como rango [start_ms, end_ms) en milisegundos. Lanza ValueError si no son válidos."""
+    start_ms = end_ms = None
+    if request.args.get('start'):
+        start_ms = int(datetime.strptime(request.args['start'], "%Y-%m-%d").timestamp() * 1000)
+    if request.args.get('end'):
+        end_dt = datetime.strptime(request.args['end'], "%Y-%m-%d") + timedelta(days=1)
+        end_ms = int(end_dt.timestamp() * 1000)
+    return start_ms, end_ms
 
 @app.route('/export_csv')
 def export_csv():
-    """Exporta el historial a un archivo CSV."""
-    full_filepath = os.path.join(app.root_path, CSV_EXPORT_FILENAME)
-
+    """Exporta el historial a CSV en streaming (sin archivo intermedio), opcionalmente filtrado por
+    fecha de salida con los parámetros `start` y `end` (AAAA-MM-DD)."""
     try:
-        returned_path = parking_manager.export_history_to_csv(filename=full_filepath)
+        start_ms, end_ms = parse_date_range_args()
+    except ValueError:
+        flash("Error: Fecha no válida. Use el formato AAAA-MM-DD.", "error")
+        return redirect(url_for('index'))
 
-        if returned_path is None:
-            flash("No hay datos para exportar o error al escribir el archivo CSV.", "error")
-        elif os.path.exists(returned_path):
-            return send_file(returned_path, as_attachment=True, download_name=CSV_EXPORT_FILENAME)
-        else:
-            flash("Error: El archivo CSV fue generado pero no se encontró.", "error")
+    try:
+        if not parking_manager.has_history(start_ms, end_ms):
+            flash("No hay datos para exportar.", "error")
+            return redirect(url_for('index'))
     except Exception as e:
         flash(f"Error inesperado al exportar CSV: {str(e)}", "error")
-    return redirect(url_for('index'))
+        return redirect(url_for('index'))
+
+    csv_stream = stream_with_context(parking_manager.stream_history_csv(start_ms, end_ms))
+    return Response(csv_stream, mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={CSV_EXPORT_FILENAME}'})
+
+@app.route('/reports')
+def reports_route():
+    """Muestra visitas, ingresos y duración media por tipo de vehículo, por día y en total, a partir
+    de los agregados diarios. Parámetros opcionales `start` y `end` (AAAA-MM-DD, ambos incluidos);
+    por defecto, el mes en curso."""
+    today = datetime.now().date()
+    start_day = request.args.get('start') or today.replace(day=1).isoformat()
+    end_day = request.args.get('end') or today.isoformat()
+    try:
+        datetime.strptime(start_day, "%Y-%m-%d")
+        datetime.strptime(end_day, "%Y-%m-%d")
+    except ValueError:
+        flash("Error: Fecha no válida. Use el formato AAAA-MM-DD.", "error")
+        return redirect(url_for('reports_route'))
+    summary = parking_manager.get_report_summary(start_day, end_day)
+    daily = parking_manager.get_daily_report(start_day, end_day)
+    return render_template('reports.html', summary=summary, daily=daily, start=start_day, end=end_day)
+
+@app.route('/export_invoices')
+def export_invoices():
+    """Descarga en un ZIP las facturas del historial, generadas de nuevo a partir de vehicle_history con
+    un pool de procesos y enviadas en streaming. Parámetros opcionales `start` y `end` (AAAA-MM-DD)."""
+    try:
+        start_ms, end_ms = parse_date_range_args()
+    except ValueError:
+        flash("Error: Fecha no válida. Use el formato AAAA-MM-DD.", "error")
+        return redirect(url_for('index'))
+    if not parking_manager.has_history(start_ms, end_ms):
+        flash("No hay facturas para exportar.", "error")
+        return redirect(url_for('index'))
+
+    zip_stream = stream_with_context(export_invoices_zip(parking_manager, start_ms, end_ms, INVOICE_EXPORT_WORKERS))
+    return Response(zip_stream, mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename={INVOICE_ZIP_FILENAME}'})
 
 @app.route('/invoices/<filename>')
 def serve_invoice(filename):
-    """Envía un archivo de factura PDF desde el directorio de facturas, forzando la descarga."""
-    return send_from_directory(INVOICES_DIR, 
+    """Envía un archivo de factura PDF desde el directorio de facturas, forzando la descarga.
+    Si la factura sigue en la cola de generación, se genera en el momento."""
+    directory = invoices_dir()
+    if not os.path.exists(os.path.join(directory, os.path.basename(filename))):
+        parking_manager.render_invoice_now(filename)
+    return send_from_directory(directory, 
                                filename, 
                                as_attachment=True, 
                                download_name=filename)
 
+@app.route('/invoice_queue_metrics')
+def invoice_queue_metrics():
+    """Devuelve en JSON la profundidad de la cola de facturas y sus tiempos de generación."""
+    return jsonify(parking_manager.get_invoice_queue_metrics() or {})
+
+@app.route('/metrics')
+def metrics_route():
+    """Expone las métricas en el formato de texto de Prometheus (404 si están desactivadas)."""
+    if not metrics.REGISTRY.enabled:
+        return Response("Métricas desactivadas. Defina METRICS_ENABLED=1 para activarlas.\n", status=404,
+                        mimetype="text/plain")
+    return Response(metrics.REGISTRY.expose(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/debug/traces')
+def debug_traces():
+    """Devuelve en JSON las trazas muestreadas más recientes, con su árbol de spans (404 si el muestreo
+    está desactivado). Con `slow=1` solo las que superan TRACE_SLOW_MS; `limit` limita el número."""
+    if tracing.TRACER.sample_rate <= 0:
+        return jsonify({"error": "Trazas desactivadas. Defina TRACE_SAMPLE_RATE para activarlas."}), 404
+    min_duration = tracing.TRACER.slow_ms if request.args.get('slow') == '1' else 0.0
+    return jsonify({"sample_rate": tracing.TRACER.sample_rate, "slow_ms": tracing.TRACER.slow_ms,
+                    "traces": tracing.TRACER.recent(request.args.get('limit', type=int), min_duration)})
+
+# Código HTTP de cada resultado de entrada/salida en la API JSON (el resto son peticiones inválidas: 400)
+API_STATUS_CODES = {
+    ResultStatus.CHECKED_IN: 201,
+    ResultStatus.CHECKED_OUT: 200,
+    ResultStatus.FULL: 409,
+    ResultStatus.ALREADY_PARKED: 409,
+    ResultStatus.NOT_FOUND: 404,
+    ResultStatus.CHECK_OUT_BEFORE_CHECK_IN: 409,
+    ResultStatus.UNKNOWN_VEHICLE_TYPE: 500,
+    ResultStatus.DB_ERROR: 500,
+}
+
+def api_result_body(result: ParkingResult) -> dict:
+    """Resultado estructurado para la API JSON, con la URL de descarga de la factura si la hay."""
+    body = result.to_dict()
+    if result.invoice:
+        body["invoice_url"] = url_for('serve_invoice', filename=result.invoice)
+    return body
+
+def api_gate_result(event: dict):
+    """Aplica un único evento con la hora actual y devuelve el resultado estructurado con el código
+    HTTP que le corresponde."""
+    event["timestamp"] = int(time.time() * 1000)
+    result = parking_manager.process_gate_events([event])[0]
+    return jsonify(api_result_body(result)), API_STATUS_CODES.get(result.status, 400)
+
+@app.route('/api/v1/occupancy')
+def api_occupancy():
+    """Devuelve en JSON la capacidad, la ocupación y las plazas libres."""
+    return jsonify(parking_manager.get_occupancy_snapshot())
+
+def format_sse(event: dict) -> str:
+    """Serializa un evento del bus en el formato de Server-Sent Events."""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+@app.route('/api/v1/occupancy/stream')
+def api_occupancy_stream():
+    """Stream de Server-Sent Events con la ocupación y las entradas y salidas en tiempo real.
+    Envía primero la ocupación actual y después cada evento publicado en el bus de ParkingManager,
+    sin consultar la base de datos."""
+    def generate():
+        # La suscripción se crea dentro del generador para que se libere siempre en el finally,
+        # y antes de leer la ocupación para no perder eventos entre ambas cosas
+        subscription = parking_manager.events.subscribe()
+        try:
+            yield "retry: 3000\n" + format_sse({"id": 0, "type": "occupancy",
+                                                 "data": parking_manager.get_occupancy_snapshot()})
+            while True:
+                event = subscription.get(timeout=SSE_KEEPALIVE_SECONDS)
+                yield format_sse(event) if event is not None else ": keepalive\n\n"
+        finally:
+            parking_manager.events.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/v1/occupancy/daily')
+def api_occupancy_daily():
+    """Devuelve en JSON el pico, la media y los percentiles de ocupación de cada día, en total y por
+    tipo de vehículo. Parámetros `start` y `end` (AAAA-MM-DD, ambos incluidos; por defecto, los
+    últimos 7 días)."""
+    today = datetime.now().date()
+    start_day = request.args.get('start') or (today - timedelta(days=6)).isoformat()
+    end_day = request.args.get('end') or today.isoformat()
+    try:
+        days = (datetime.strptime(end_day, "%Y-%m-%d") - datetime.strptime(start_day, "%Y-%m-%d")).days + 1
+    except ValueError:
+        return jsonify({"status": "invalid_date"}), 400
+    if not 0 < days <= OCCUPANCY_MAX_DAYS:
+        return jsonify({"status": "invalid_range"}), 400
+    return jsonify({"days": parking_manager.get_occupancy_engine().daily_stats(start_day, end_day)})
+
+@app.route('/api/v1/occupancy/hourly')
+def api_occupancy_hourly():
+    """Devuelve en JSON el pico y la media de ocupación de cada hora de un día (`day`, AAAA-MM-DD;
+    por defecto, hoy), opcionalmente de un tipo de vehículo (`vehicle_type`)."""
+    day = request.args.get('day') or datetime.now().date().isoformat()
+    try:
+        datetime.strptime(day, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"status": "invalid_date"}), 400
+    vehicle_type = request.args.get('vehicle_type') or None
+    return jsonify({"day": day, "vehicle_type_name": vehicle_type,
+                    "hours": parking_manager.get_occupancy_engine().hourly(day, vehicle_type)})
+
+@app.route('/api/v1/vehicles')
+def api_vehicles():
+    """Devuelve en JSON los vehículos aparcados (hora de entrada en ms desde la época)."""
+    return jsonify({"vehicles": parking_manager.get_current_vehicles_data(raw_times=True)})
+
+@app.route('/api/v1/check_in', methods=['POST'])
+def api_check_in():
+    """Registra una entrada. Espera un JSON {"plate": "...", "vehicle_type": "COCHE"}."""
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"status": "invalid_request"}), 400
+    return api_gate_result({"type": "check_in", "plate": payload.get("plate"),
+                            "vehicle_type": payload.get("vehicle_type")})
+
+@app.route('/api/v1/check_out', methods=['POST'])
+def api_check_out():
+    """Registra una salida. Espera un JSON {"plate": "..."} y devuelve duración, coste y factura."""
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"status": "invalid_request"}), 400
+    return api_gate_result({"type": "check_out", "plate": payload.get("plate")})
+
+@app.route('/api/v1/history')
+def api_history():
+    """Devuelve en JSON una página del historial (horas en ms) y el cursor `next` de la siguiente.
+    Parámetros opcionales: `limit` y `after`, como en /history."""
+    limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), HISTORY_MAX_PAGE_SIZE)
+    try:
+        history, next_cursor = parking_manager.get_vehicle_history_page(
+            limit=limit, after=request.args.get('after') or None, raw_times=True)
+    except ValueError:
+        return jsonify({"status": "invalid_cursor"}), 400
+    return jsonify({"items": history, "next": next_cursor})
+
+@app.route('/api/v1/events', methods=['POST'])
+def gate_events():
+    """Aplica en una sola transacción un lote de eventos de barrera con su hora original.
+    Espera un JSON {"events": [{"type", "plate", "vehicle_type", "timestamp"}, ...]} y devuelve
+    un resultado por evento."""
+    payload = request.get_json(silent=True)
+    events = payload.get("events") if isinstance(payload, dict) else None
+    if not isinstance(events, list):
+        return jsonify({"error": "Se esperaba un JSON con una lista 'events'."}), 400
+    if len(events) > GATE_EVENTS_MAX_BATCH:
+        return jsonify({"error": f"El lote supera el máximo de {GATE_EVENTS_MAX_BATCH} eventos."}), 413
+
+    results = parking_manager.process_gate_events(events)
+    applied = sum(1 for result in results if result.ok)
+    return jsonify({"applied": applied, "rejected": len(results) - applied,
+                    "results": [dict(api_result_body(result), index=index, type=result.operation)
+                                for index, result in enumerate(results)]})
+
 if __name__ == '__main__':
-    parking_manager._create_tables()
+    get_parking_manager() # Abre la base de datos (o el registro de eventos) antes de la primera petición
     app.run(debug=True)
@@ -0,0 +1,54 @@
+"""Tiempo de generación de una factura: maquetación completa frente a plantilla precompilada.
+
+Uso: python benchmarks/bench_invoices.py [--count 2000]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from invoice_template import DEFAULT_ISSUER, EURO_SYMBOL, get_invoice_template, invoice_values, layout_invoice # noqa: E402
+
+
+def _values(i: int) -> dict:
+    check_in = datetime(2024, 3, 1, 8, 0) + timedelta(minutes=i)
+    return invoice_values(DEFAULT_ISSUER, f"{i:04d}ABC", "COCHE", f"1.50 {EURO_SYMBOL}/hora", 1.5 + i % 10,
+                          check_in, check_in + timedelta(minutes=60 + i % 120), 60 + i % 120)
+
+
+def _measure(render, count: int) -> tuple[float, float]:
+    """Devuelve los ms por factura de la maquetación y de la maquetación más la serialización a PDF."""
+    values = [_values(i) for i in range(count)]
+    start = time.perf_counter()
+    for v in values:
+        render(v)
+    layout_ms = (time.perf_counter() - start) * 1000 / count
+    start = time.perf_counter()
+    for v in values:
+        render(v).output(dest="S")
+    total_ms = (time.perf_counter() - start) * 1000 / count
+    return layout_ms, total_ms
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=2000, help="Facturas por medición")
+    args = parser.parse_args(argv)
+
+    template = get_invoice_template(DEFAULT_ISSUER)
+    results = {
+        "maquetación completa": _measure(lambda v: layout_invoice(DEFAULT_ISSUER, v), args.count),
+        "plantilla precompilada": _measure(template.render, args.count),
+    }
+    print(f"{'':24} {'maquetación':>12} {'con salida PDF':>15}")
+    for name, (layout_ms, total_ms) in results.items():
+        print(f"{name:24} {layout_ms:9.3f} ms {total_ms:12.3f} ms")
+    before, after = results["maquetación completa"], results["plantilla precompilada"]
+    print(f"Mejora: x{before[0] / after[0]:.2f} en maquetación, x{before[1] / after[1]:.2f} con salida PDF")
+
+
+if __name__ == "__main__":
+    main()
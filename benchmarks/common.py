@@ -0,0 +1,79 @@
+"""Utilidades comunes de los benchmarks: estadísticas de latencia y resultados en JSON."""
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def summarize(samples_ms, elapsed_s: Optional[float] = None) -> dict:
+    """Resume una lista de latencias (ms): número, media, percentiles y operaciones por segundo.
+    Sin `elapsed_s`, el rendimiento se calcula con la suma de las latencias (operaciones en serie)."""
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    if len(samples) == 0:
+        return {"count": 0}
+    elapsed_s = elapsed_s if elapsed_s is not None else samples.sum() / 1000
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        "count": int(len(samples)),
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(samples.max()),
+        "ops_per_s": float(len(samples) / elapsed_s) if elapsed_s > 0 else 0.0,
+    }
+
+
+def time_calls(func: Callable, args_list) -> list[float]:
+    """Llama a func con cada tupla de argumentos y devuelve la latencia de cada llamada en ms."""
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict:
+    """Datos del entorno para poder comparar resultados entre ejecuciones."""
+    return {
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "sqlite": sqlite3.sqlite_version,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def result_key(result: dict) -> tuple:
+    """Identifica una medición para compararla entre ejecuciones."""
+    return result["name"], result.get("size"), result.get("clients")
+
+
+def write_results(path: str, results: list[dict], args: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as results_file:
+        json.dump({"environment": environment(), "args": args, "results": results}, results_file, indent=2)
+
+
+def load_results(path: str) -> dict:
+    with open(path, encoding="utf-8") as results_file:
+        return json.load(results_file)
@@ -0,0 +1,58 @@
+"""Compara dos archivos de resultados de run_benchmarks.py y señala las regresiones.
+
+Uso: python benchmarks/compare.py base.json nuevo.json [--threshold 0.15]
+Termina con código 1 si alguna medición empeora más que el umbral (p95 o rendimiento).
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import load_results, result_key # noqa: E402
+
+
+def compare_results(base: list[dict], new: list[dict], threshold: float = 0.15) -> list[dict]:
+    """Empareja las mediciones por (nombre, tamaño, clientes) y calcula la variación relativa de p50,
+    p95 y operaciones por segundo. `regression` indica si p95 sube o el rendimiento baja más que el umbral."""
+    base_by_key = {result_key(result): result for result in base}
+    comparisons = []
+    for result in new:
+        previous = base_by_key.get(result_key(result))
+        if previous is None or not previous.get("count") or not result.get("count"):
+            continue
+        changes = {}
+        for metric in ("p50_ms", "p95_ms", "ops_per_s"):
+            if previous.get(metric):
+                changes[metric] = (result[metric] - previous[metric]) / previous[metric]
+        regression = changes.get("p95_ms", 0) > threshold or changes.get("ops_per_s", 0) < -threshold
+        comparisons.append({"key": result_key(result), "base": previous, "new": result,
+                            "changes": changes, "regression": regression})
+    return comparisons
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Variación relativa tolerada (0.15 = 15%%)")
+    args = parser.parse_args(argv)
+
+    base, new = load_results(args.base), load_results(args.new)
+    print(f"Base: {base['environment'].get('git_commit')}  Nuevo: {new['environment'].get('git_commit')}")
+    comparisons = compare_results(base["results"], new["results"], args.threshold)
+    print(f"{'medición':34} {'p95 base':>10} {'p95 nuevo':>10} {'Δp95':>8} {'Δops/s':>8}")
+    for comparison in comparisons:
+        name, size, clients = comparison["key"]
+        label = f"{name} [{size}{f' x{clients}' if clients else ''}]"
+        changes = comparison["changes"]
+        print(f"{label:34} {comparison['base']['p95_ms']:10.3f} {comparison['new']['p95_ms']:10.3f} "
+              f"{changes.get('p95_ms', 0):+8.1%} {changes.get('ops_per_s', 0):+8.1%}"
+              f"{'  REGRESIÓN' if comparison['regression'] else ''}")
+    regressions = sum(comparison["regression"] for comparison in comparisons)
+    print(f"{regressions} regresiones de {len(comparisons)} mediciones comparadas.")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
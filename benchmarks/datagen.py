@@ -0,0 +1,109 @@
+"""Generadores de datos sintéticos para los benchmarks: historial de estancias y vehículos aparcados.
+
+Uso: python benchmarks/datagen.py parking_bench.db --history 1000000 --parked 500
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from typing import Iterator, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import reports # noqa: E402
+from migrations import apply_migrations # noqa: E402
+from tariffs import TariffEngine # noqa: E402
+from vehicle import VehicleType # noqa: E402
+
+ONE_MINUTE_MS = 60 * 1000
+ONE_DAY_MS = 24 * 60 * ONE_MINUTE_MS
+VEHICLE_TYPE_NAMES = [vt.name for vt in VehicleType]
+VEHICLE_TYPE_WEIGHTS = {"COCHE": 0.7, "MOTO": 0.2, "FURGONETA": 0.1} # Proporción de estancias por tipo
+
+
+def synthetic_plates(rng: np.random.Generator, count: int, prefix: str = "") -> list[str]:
+    """Matrículas con formato español (4 dígitos y 3 letras sin vocales); pueden repetirse entre estancias."""
+    digits = rng.integers(0, 10000, count)
+    letters = np.array(list("BCDFGHJKLMNPRSTVWXYZ"))[rng.integers(0, 20, (count, 3))]
+    return [f"{prefix}{d:04d}{''.join(l)}" for d, l in zip(digits, letters)]
+
+
+def history_batches(count: int, end_ms: int, days: int = 365, seed: int = 0,
+                    batch_size: int = 100000) -> Iterator[list[tuple]]:
+    """Genera `count` estancias cerradas repartidas en los `days` días anteriores a end_ms, con más
+    salidas en horario diurno y duraciones log-normales (mediana ~1 h). Las filas tienen el formato de
+    vehicle_history e importes calculados con la tarifa por defecto."""
+    rng = np.random.default_rng(seed)
+    tariffs = TariffEngine.default()
+    weights = np.array([VEHICLE_TYPE_WEIGHTS.get(name, 0.1) for name in VEHICLE_TYPE_NAMES])
+    weights /= weights.sum()
+    for start in range(0, count, batch_size):
+        n = min(batch_size, count - start)
+        day = rng.integers(0, days, n)
+        minute_of_day = np.clip(rng.normal(14 * 60, 4 * 60, n), 0, 24 * 60 - 1).astype(np.int64)
+        check_out = end_ms - (days - day) * ONE_DAY_MS + minute_of_day * ONE_MINUTE_MS
+        durations = np.clip(rng.lognormal(np.log(60), 0.8, n), 1, 3 * 24 * 60).astype(np.int64)
+        check_in = check_out - durations * ONE_MINUTE_MS - rng.integers(0, ONE_MINUTE_MS, n)
+        type_names = np.array(VEHICLE_TYPE_NAMES)[rng.choice(len(VEHICLE_TYPE_NAMES), n, p=weights)]
+        fees = np.round(tariffs.fees(type_names, check_in, check_out), 2)
+        plates = synthetic_plates(rng, n)
+        yield list(zip(plates, type_names.tolist(), check_in.tolist(), check_out.tolist(),
+                       durations.tolist(), fees.tolist()))
+
+
+def populate(db_path: str, history_rows: int, parked: int = 0, seed: int = 0, end_ms: Optional[int] = None,
+             days: int = 365, verbose: bool = False) -> dict:
+    """Crea (o amplía) una base de datos con `history_rows` estancias cerradas y `parked` vehículos
+    aparcados, y recalcula los agregados de informes. Devuelve los tiempos de carga."""
+    end_ms = end_ms if end_ms is not None else int(time.time() * 1000)
+    conn = sqlite3.connect(db_path)
+    try:
+        apply_migrations(conn)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF") # Solo durante la carga
+        start = time.perf_counter()
+        loaded = 0
+        for rows in history_batches(history_rows, end_ms, days, seed):
+            conn.executemany(
+                """INSERT INTO vehicle_history (plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee)
+                   VALUES (?, ?, ?, ?, ?, ?)""", rows
+            )
+            conn.commit()
+            loaded += len(rows)
+            if verbose:
+                print(f"  {loaded}/{history_rows} filas de historial", file=sys.stderr)
+        history_s = time.perf_counter() - start
+
+        rng = np.random.default_rng(seed + 1)
+        parked_rows = [(plate, str(rng.choice(VEHICLE_TYPE_NAMES)), end_ms - int(rng.integers(1, 8 * 60)) * ONE_MINUTE_MS)
+                       for plate in synthetic_plates(rng, parked, prefix="P")]
+        conn.executemany("INSERT OR IGNORE INTO parked_vehicles (plate, vehicle_type_name, check_in_time) VALUES (?, ?, ?)",
+                         parked_rows)
+        conn.commit()
+
+        start = time.perf_counter()
+        reports.rebuild_rollups(conn)
+        rollups_s = time.perf_counter() - start
+        return {"history_rows": loaded, "parked": len(parked_rows), "history_load_s": history_s, "rollups_s": rollups_s}
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera una base de datos sintética del parking.")
+    parser.add_argument("db", help="Archivo de base de datos a crear o ampliar")
+    parser.add_argument("--history", type=int, default=100000, help="Estancias cerradas en el historial")
+    parser.add_argument("--parked", type=int, default=0, help="Vehículos aparcados")
+    parser.add_argument("--days", type=int, default=365, help="Días que cubre el historial")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    stats = populate(args.db, args.history, args.parked, args.seed, days=args.days, verbose=True)
+    print(f"{stats['history_rows']} estancias y {stats['parked']} vehículos aparcados en {args.db} "
+          f"({stats['history_load_s']:.1f} s de carga, {stats['rollups_s']:.1f} s de agregados).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Benchmarks de las rutas críticas de ParkingManager y de la API web con un historial creciente.
+
+Para cada tamaño de historial se genera una base de datos sintética (ver datagen.py) y se mide:
+  - check_in / check_out: latencia de entradas y salidas (la salida incluye la factura en PDF)
+  - history_first_page / history_deep_page: una página del historial al principio y a mitad
+  - history_full: get_vehicle_history_data() completo (solo hasta --full-history-max filas)
+  - export_csv: export_history_to_csv() de todo el historial
+  - report_month: resumen de informes del mes en curso
+  - http_mixed: clientes concurrentes contra la aplicación Flask (entradas, salidas, ocupación e historial)
+
+Uso:
+  python benchmarks/run_benchmarks.py --sizes 10000,100000,1000000 --output resultados/base.json
+  python benchmarks/compare.py resultados/base.json resultados/nuevo.json
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import summarize, time_calls, write_results # noqa: E402
+from datagen import populate # noqa: E402
+from parking_manager import ParkingManager # noqa: E402
+from vehicle import VehicleType # noqa: E402
+
+HISTORY_PAGE_SIZE = 50
+
+
+def _dataset(data_dir: str, size: int, parked: int, seed: int) -> str:
+    """Devuelve la base de datos sintética de un tamaño, generándola si no existe en data_dir."""
+    path = os.path.join(data_dir, f"bench_{size}_{parked}_{seed}.db")
+    if not os.path.exists(path):
+        print(f"Generando {size} filas de historial y {parked} vehículos aparcados...", file=sys.stderr)
+        populate(path + ".tmp", size, parked, seed)
+        for suffix in ("-wal", "-shm"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path + ".tmp" + suffix)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def _copy_dataset(path: str, work_dir: str) -> str:
+    """Copia de trabajo de la base de datos, para que las mediciones que escriben no alteren la original."""
+    copy = os.path.join(work_dir, os.path.basename(path))
+    shutil.copyfile(path, copy)
+    return copy
+
+
+def bench_manager(db_path: str, work_dir: str, size: int, ops: int, full_history_max: int) -> list[dict]:
+    manager = ParkingManager(db_path, capacity=10 ** 9)
+    manager.invoices_dir = os.path.join(work_dir, "invoices")
+    os.makedirs(manager.invoices_dir, exist_ok=True)
+    results = []
+
+    def record(name, samples, **extra):
+        results.append({"name": name, "size": size, **summarize(samples), **extra})
+        print(f"  {name:20} p50 {results[-1]['p50_ms']:9.3f} ms  p95 {results[-1]['p95_ms']:9.3f} ms", file=sys.stderr)
+
+    try:
+        plates = [(f"BENCH{i:06d}", VehicleType.COCHE) for i in range(ops)]
+        record("check_in", time_calls(manager.check_in_vehicle, plates))
+        record("check_out", time_calls(manager.check_out_vehicle, [(plate,) for plate, _ in plates]))
+
+        reads = max(ops // 5, 10)
+        record("history_first_page", time_calls(manager.get_vehicle_history_data, [(HISTORY_PAGE_SIZE,)] * reads))
+        middle = manager.conn.execute( # type: ignore
+            "SELECT check_out_time, id FROM vehicle_history ORDER BY check_out_time DESC, id DESC LIMIT 1 OFFSET ?",
+            (size // 2,)
+        ).fetchone()
+        if middle:
+            cursor = ParkingManager.encode_history_cursor(*middle)
+            record("history_deep_page", time_calls(manager.get_vehicle_history_data,
+                                                   [(HISTORY_PAGE_SIZE, cursor)] * reads))
+        if size <= full_history_max:
+            record("history_full", time_calls(manager.get_vehicle_history_data, [()] * 3))
+
+        csv_path = os.path.join(work_dir, "export.csv")
+        samples = time_calls(manager.export_history_to_csv, [(csv_path,)] * (3 if size <= 1000000 else 1))
+        record("export_csv", samples, rows_per_s=size / (min(samples) / 1000) if samples else 0.0)
+
+        today = datetime.now().date()
+        month = (today.replace(day=1).isoformat(), today.isoformat())
+        record("report_month", time_calls(manager.get_report_summary, [month] * reads))
+    finally:
+        manager.close_db()
+    return results
+
+
+class _Server:
+    """Servidor WSGI con hilos en un puerto libre, en segundo plano."""
+
+    def __init__(self, wsgi_app):
+        from werkzeug.serving import make_server
+        logging.getLogger("werkzeug").setLevel(logging.WARNING) # Sin una línea de registro por petición
+        self._server = make_server("127.0.0.1", 0, wsgi_app, threaded=True)
+        self.port = self._server.server_port
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._thread.join()
+
+
+def _request(host: str, port: int, method: str, path: str, body=None) -> int:
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    try:
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+def _http_client(host: str, port: int, client_id: int, deadline: float, samples: dict, errors: list):
+    """Ciclo de un cliente: entrada, consulta de ocupación y de historial, y salida de su propio vehículo."""
+    i = 0
+    while time.perf_counter() < deadline:
+        plate = f"HTTP{client_id:03d}{i:06d}"
+        steps = [("check_in", "POST", "/api/v1/check_in", {"plate": plate, "vehicle_type": "COCHE"}),
+                 ("occupancy", "GET", "/api/v1/occupancy", None),
+                 ("history", "GET", f"/api/v1/history?limit={HISTORY_PAGE_SIZE}", None),
+                 ("check_out", "POST", "/api/v1/check_out", {"plate": plate})]
+        for name, method, path, body in steps:
+            start = time.perf_counter()
+            try:
+                status = _request(host, port, method, path, body)
+            except OSError as e:
+                errors.append(str(e))
+                continue
+            samples[name].append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                errors.append(f"{name}: HTTP {status}")
+        i += 1
+
+
+def bench_http(db_path: str, work_dir: str, size: int, clients_list: list[int], seconds: float,
+               url: str = None) -> list[dict]:
+    results = []
+    app_module = None
+    if url is None:
+        # app.py crea su ParkingManager al importarse: se importa desde el directorio de trabajo y
+        # después se sustituye por uno sobre la base de datos sintética
+        os.environ.setdefault("FLASK_SECRET_KEY", "benchmark")
+        os.environ.setdefault("DB_POOL_SIZE", "8")
+        cwd = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                import app as app_module
+        finally:
+            os.chdir(cwd)
+
+    for clients in clients_list:
+        server = None
+        if app_module is not None:
+            app_module.parking_manager.close_db()
+            app_module.parking_manager = ParkingManager(db_path, capacity=10 ** 9, pool_size=max(8, clients),
+                                                        invoice_workers=2)
+            app_module.parking_manager.invoices_dir = os.path.join(work_dir, "invoices")
+            os.makedirs(app_module.parking_manager.invoices_dir, exist_ok=True)
+            server = _Server(app_module.app)
+            host, port = "127.0.0.1", server.port
+        else:
+            host, _, port = url.split("://", 1)[-1].partition(":")
+            port = int(port or 80)
+
+        samples = {name: [] for name in ("check_in", "occupancy", "history", "check_out")}
+        errors: list = []
+        with server if server is not None else contextlib.nullcontext():
+            deadline = time.perf_counter() + seconds
+            start = time.perf_counter()
+            threads = [threading.Thread(target=_http_client, args=(host, port, c, deadline, samples, errors))
+                       for c in range(clients)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+        all_samples = [s for values in samples.values() for s in values]
+        result = {"name": "http_mixed", "size": size, "clients": clients, **summarize(all_samples, elapsed),
+                  "errors": len(errors),
+                  "endpoints": {name: summarize(values, elapsed) for name, values in samples.items()}}
+        results.append(result)
+        print(f"  http_mixed x{clients:<3} {result.get('ops_per_s', 0):9.1f} pet/s  p95 {result.get('p95_ms', 0):9.3f} ms"
+              f"  errores {len(errors)}", file=sys.stderr)
+    if app_module is not None:
+        app_module.parking_manager.close_db()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        help="Filas de historial de cada escenario, separadas por comas (p. ej. hasta 10000000)")
+    parser.add_argument("--parked-ratio", type=float, default=0.01,
+                        help="Vehículos aparcados por cada fila de historial (ocupación del escenario)")
+    parser.add_argument("--ops", type=int, default=500, help="Entradas y salidas medidas por escenario")
+    parser.add_argument("--full-history-max", type=int, default=1000000,
+                        help="Tamaño máximo con el que se mide get_vehicle_history_data() sin límite")
+    parser.add_argument("--clients", default="1,8,32", help="Clientes HTTP concurrentes (0 para omitir)")
+    parser.add_argument("--http-seconds", type=float, default=5.0, help="Duración de cada escenario HTTP")
+    parser.add_argument("--url", help="Servidor externo contra el que lanzar los clientes HTTP (p. ej. http://localhost:5000)")
+    parser.add_argument("--data-dir", help="Directorio donde guardar y reutilizar las bases de datos sintéticas")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json", help="Archivo JSON de resultados")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    clients_list = [int(c) for c in args.clients.split(",") if int(c) > 0]
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="parking_bench_data_")
+    os.makedirs(data_dir, exist_ok=True)
+    results = []
+    try:
+        for size in sizes:
+            print(f"Historial de {size} filas:", file=sys.stderr)
+            dataset = _dataset(data_dir, size, int(size * args.parked_ratio), args.seed)
+            with tempfile.TemporaryDirectory(prefix="parking_bench_") as work_dir:
+                results += bench_manager(_copy_dataset(dataset, work_dir), work_dir, size, args.ops, args.full_history_max)
+            if clients_list:
+                with tempfile.TemporaryDirectory(prefix="parking_bench_") as work_dir:
+                    results += bench_http(_copy_dataset(dataset, work_dir), work_dir, size, clients_list,
+                                          args.http_seconds, args.url)
+    finally:
+        if args.data_dir is None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    write_results(args.output, results, vars(args))
+    print(f"Resultados guardados en {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
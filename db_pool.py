@@ -0,0 +1,101 @@
+import queue
+import sqlite3
+import threading
+from typing import Optional
+
+
+class SQLiteConnectionPool:
+    """Pool acotado de conexiones SQLite con una conexión por hilo.
+
+    Cada hilo obtiene su propia conexión la primera vez que la necesita y la
+    conserva hasta que llama a release(), momento en que vuelve al pool para que
+    otro hilo la reutilice. Las conexiones se abren en modo WAL para que las
+    lecturas no bloqueen a las escrituras.
+
+    Atributos:
+        db_name str: Ruta del archivo de la base de datos
+        max_connections int: Número máximo de conexiones abiertas a la vez
+        busy_timeout float: Segundos que SQLite espera por un bloqueo antes de fallar
+        acquire_timeout float: Segundos que un hilo espera por una conexión libre"""
+
+    def __init__(self, db_name: str, max_connections: int = 8, busy_timeout: float = 5.0,
+                 acquire_timeout: float = 10.0):
+        if db_name == ":memory:":
+            raise ValueError("El pool de conexiones no admite bases de datos en memoria.")
+        if max_connections < 1:
+            raise ValueError("El pool necesita al menos una conexión.")
+        self.db_name = db_name
+        self.max_connections = max_connections
+        self.busy_timeout = busy_timeout
+        self.acquire_timeout = acquire_timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all: list[sqlite3.Connection] = []
+        self._closed = False
+
+    def _open_connection(self) -> sqlite3.Connection:
+        """Abre una nueva conexión configurada con WAL y busy timeout."""
+        conn = sqlite3.connect(self.db_name, timeout=self.busy_timeout, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """Devuelve la conexión del hilo actual, tomándola del pool si aún no tiene una."""
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        if self._closed:
+            raise sqlite3.ProgrammingError("El pool de conexiones está cerrado.")
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise sqlite3.OperationalError(
+                f"No hay conexiones libres en el pool tras {self.acquire_timeout} segundos.")
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                conn = self._open_connection()
+            except Exception:
+                self._slots.release()
+                raise
+        self._local.conn = conn
+        return conn
+
+    def has_connection(self) -> bool:
+        """Indica si el hilo actual tiene una conexión asignada."""
+        return getattr(self._local, "conn", None) is not None
+
+    def release(self):
+        """Devuelve al pool la conexión del hilo actual (si la tiene)."""
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.put(conn)
+        except sqlite3.ProgrammingError:
+            pass  # La conexión ya fue cerrada por close_all()
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        """Cierra todas las conexiones abiertas por el pool."""
+        self._closed = True
+        with self._lock:
+            connections, self._all = self._all, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
@@ -0,0 +1,74 @@
+import itertools
+import queue
+import threading
+import time
+from typing import Optional
+
+
+class Subscription:
+    """Cola de eventos de un suscriptor del bus. Si el suscriptor no consume a tiempo, se descartan
+    sus eventos más antiguos: a un panel de ocupación solo le interesa el estado más reciente.
+
+    Atributos:
+        max_pending int: Número máximo de eventos pendientes de leer"""
+
+    def __init__(self, max_pending: int = 100):
+        self._events: "queue.Queue[dict]" = queue.Queue(max_pending)
+        self.dropped = 0
+
+    def put(self, event: dict):
+        while True:
+            try:
+                self._events.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self._events.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Devuelve el siguiente evento, o None si no llega ninguno en `timeout` segundos."""
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """Bus de eventos en proceso. publish() reparte cada evento a todos los suscriptores sin
+    consultar la base de datos, por lo que el coste de tener muchos paneles conectados es
+    independiente de la carga del parking.
+
+    Cada evento es un diccionario con id (secuencial), type, time (ms desde la época) y data."""
+
+    def __init__(self, max_pending: int = 100):
+        self.max_pending = max_pending
+        self._subscribers: set[Subscription] = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self.max_pending)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event_type: str, data: dict) -> dict:
+        """Publica un evento a todos los suscriptores y lo devuelve."""
+        with self._lock:
+            # Se reparte dentro del lock para que todos los suscriptores reciban los eventos en orden de id
+            event = {"id": next(self._ids), "type": event_type, "time": int(time.time() * 1000), "data": data}
+            for subscription in self._subscribers:
+                subscription.put(event)
+        return event
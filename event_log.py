@@ -0,0 +1,803 @@
+import argparse
+import bisect
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Iterator, Optional, Tuple
+
+import reports
+import tracing
+from event_bus import EventBus
+from invoice_template import DEFAULT_ISSUER, EURO_SYMBOL
+from metrics import EVENT_LOG_SECONDS
+from migrations import apply_migrations
+from occupancy import OccupancyEngine
+from parking_manager import CSV_HEADERS, ParkingManager, validate_gate_events, write_invoice_pdf
+from parking_results import ParkingResult, ResultStatus
+from tariffs import TariffEngine
+from tracing import traced
+from vehicle import Vehicle, VehicleType
+
+SEGMENT_PREFIX = "events_"
+SNAPSHOT_PREFIX = "snapshot_"
+
+
+def _log_span(operation: str):
+    """Mide una operación del registro en su histograma y, si se está trazando, como span "event_log:<operation>"."""
+    return tracing.span("event_log", EVENT_LOG_SECONDS, operation)
+
+
+def _encode_record(record: dict) -> bytes:
+    """Una línea del registro: CRC32 del JSON en hexadecimal, un espacio y el JSON."""
+    payload = json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+
+def _decode_record(line: bytes) -> Optional[dict]:
+    """Devuelve el evento de una línea completa, o None si está incompleta o su CRC no coincide."""
+    if not line.endswith(b"\n"):
+        return None
+    checksum, _, payload = line[:-1].partition(b" ")
+    try:
+        if len(checksum) != 8 or int(checksum, 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+def _fsync_dir(directory: str):
+    """Hace persistentes las altas y renombrados de archivos del directorio (no disponible en Windows)."""
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class EventLog:
+    """Registro de eventos de solo escritura al final, repartido en segmentos y con snapshots.
+
+    Cada evento es una línea de `events_<primer seq>.log` con su CRC32 y su JSON, que incluye un
+    número de secuencia `seq` consecutivo. Un snapshot (`snapshot_<seq>.json`) guarda el estado
+    tras el evento `seq`; al tomarlo se empieza un segmento nuevo, por lo que la recuperación solo
+    lee el snapshot y los segmentos posteriores. Los segmentos antiguos no se borran: son el historial
+    de auditoría completo.
+
+    Atributos:
+        directory str: Directorio del registro
+        fsync bool: Si append() seguido de sync() espera a que los eventos estén en disco (os.fsync)
+        last_seq int: Número de secuencia del último evento escrito"""
+
+    def __init__(self, directory: str, fsync: bool = True):
+        self.directory = directory
+        self.fsync = fsync
+        self.last_seq = 0
+        self._lock = threading.Lock() # Escritura en el segmento actual
+        self._sync_lock = threading.Lock() # Un solo fsync a la vez; los que esperan se agrupan en el siguiente
+        self._synced_seq = 0
+        self._file = None
+        self._failed: Optional[OSError] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, prefix: str, seq: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"{prefix}{seq:012d}{suffix}")
+
+    def _list(self, prefix: str, suffix: str) -> list[tuple[int, str]]:
+        """(seq, ruta) de los archivos del directorio con ese prefijo y extensión, ordenados por seq."""
+        found = []
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith(suffix):
+                try:
+                    found.append((int(name[len(prefix):-len(suffix)]), os.path.join(self.directory, name)))
+                except ValueError:
+                    continue
+        return sorted(found)
+
+    def _segments(self) -> list[tuple[int, str]]:
+        return self._list(SEGMENT_PREFIX, ".log")
+
+    def _check_seq(self, record: dict, expected: int, path: str):
+        if record.get("seq") != expected:
+            raise ValueError(f"Registro de eventos corrupto: se esperaba el evento {expected} en {path} "
+                             f"y se ha leído {record.get('seq')}.")
+
+    def recover(self) -> Tuple[int, Optional[dict], list[dict]]:
+        """Abre el registro para escribir. Devuelve (seq del último snapshot, su estado o None, eventos
+        posteriores al snapshot en orden). Una línea incompleta o con el CRC incorrecto en el último
+        segmento es una escritura interrumpida: se descarta desde ahí hasta el final (esos eventos no
+        llegaron a confirmarse). En cualquier otro punto lanza ValueError."""
+        snapshot_seq, state = 0, None
+        snapshots = self._list(SNAPSHOT_PREFIX, ".json")
+        if snapshots:
+            snapshot_seq, snapshot_path = snapshots[-1]
+            with open(snapshot_path, encoding="utf-8") as snapshot_file:
+                state = json.load(snapshot_file)
+
+        segments = self._segments()
+        # Desde el último segmento que empieza como muy tarde justo después del snapshot
+        first = max([i for i, (first_seq, _) in enumerate(segments) if first_seq <= snapshot_seq + 1], default=0)
+        if segments and segments[first][0] > snapshot_seq + 1:
+            raise ValueError(f"Registro de eventos corrupto: faltan los eventos posteriores al snapshot {snapshot_seq}.")
+        records = []
+        expected = segments[first][0] if segments else snapshot_seq + 1
+        for i in range(first, len(segments)):
+            first_seq, path = segments[i]
+            if first_seq != expected:
+                raise ValueError(f"Registro de eventos corrupto: falta el evento {expected} (el segmento {path} "
+                                 f"empieza en {first_seq}).")
+            offset = 0
+            with open(path, "rb") as segment:
+                for line in segment:
+                    record = _decode_record(line)
+                    if record is None:
+                        if i < len(segments) - 1:
+                            raise ValueError(f"Registro de eventos corrupto: línea no válida en {path} (byte {offset}).")
+                        break
+                    self._check_seq(record, expected, path)
+                    expected += 1
+                    offset += len(line)
+                    if record["seq"] > snapshot_seq:
+                        records.append(record)
+            if i == len(segments) - 1 and offset < os.path.getsize(path):
+                print(f"Aviso: se descartan {os.path.getsize(path) - offset} bytes de una escritura interrumpida en {path}.")
+                with open(path, "r+b") as segment:
+                    segment.truncate(offset)
+                    os.fsync(segment.fileno())
+
+        self.last_seq = self._synced_seq = expected - 1
+        if self.last_seq < snapshot_seq:
+            raise ValueError(f"Registro de eventos incompleto: el snapshot {snapshot_seq} es posterior al "
+                             f"último evento ({self.last_seq}).")
+        if segments:
+            self._file = open(segments[-1][1], "ab")
+        else:
+            self._open_segment()
+        return snapshot_seq, state, records
+
+    def _open_segment(self):
+        self._file = open(self._path(SEGMENT_PREFIX, self.last_seq + 1, ".log"), "ab")
+        _fsync_dir(self.directory)
+
+    def append(self, records: list[dict]) -> int:
+        """Añade los eventos (asignándoles su `seq`) con una sola escritura y devuelve el seq del último.
+        No espera al disco: hay que llamar a sync() antes de confirmar la operación. Si la escritura
+        falla, el registro deja de aceptar eventos hasta volver a abrirlo (ver recover())."""
+        with self._lock:
+            if self._failed is not None:
+                raise OSError(f"El registro de eventos no está disponible tras un error de escritura: {self._failed}")
+            seq = self.last_seq
+            lines = []
+            for record in records:
+                seq += 1
+                record["seq"] = seq
+                lines.append(_encode_record(record))
+            try:
+                with _log_span("append"):
+                    self._file.write(b"".join(lines)) # type: ignore
+                    self._file.flush() # type: ignore
+            except OSError as e:
+                self._failed = e
+                raise
+            self.last_seq = seq
+            return seq
+
+    def sync(self, seq: int):
+        """Espera a que los eventos hasta `seq` estén en disco. Un solo os.fsync cubre todo lo escrito
+        hasta ese momento, así que con varias barreras concurrentes las escrituras se confirman en
+        grupo. Si el fsync falla, el registro deja de aceptar eventos (lo escrito puede no estar en disco)."""
+        if not self.fsync:
+            return
+        with self._sync_lock:
+            if self._synced_seq >= seq:
+                return
+            with self._lock:
+                if self._failed is not None:
+                    raise OSError(f"El registro de eventos no está disponible tras un error de escritura: {self._failed}")
+                target, fileno = self.last_seq, self._file.fileno() # type: ignore
+            try:
+                with _log_span("fsync"):
+                    os.fsync(fileno)
+            except OSError as e:
+                with self._lock:
+                    self._failed = e
+                raise
+            self._synced_seq = target
+
+    def rotate(self) -> int:
+        """Lleva a disco el segmento actual y empieza uno nuevo. Devuelve el seq del último evento escrito."""
+        with self._sync_lock, self._lock:
+            if self._failed is not None:
+                raise OSError(f"El registro de eventos no está disponible tras un error de escritura: {self._failed}")
+            if self._file.tell() > 0: # type: ignore
+                os.fsync(self._file.fileno()) # type: ignore
+                self._file.close() # type: ignore
+                self._open_segment()
+            self._synced_seq = self.last_seq
+            return self.last_seq
+
+    def write_snapshot(self, seq: int, state: dict):
+        """Guarda de forma atómica (archivo temporal + os.replace) el estado tras el evento `seq` y borra
+        los snapshots anteriores. Los eventos hasta `seq` deben estar ya en disco (ver rotate())."""
+        path = self._path(SNAPSHOT_PREFIX, seq, ".json")
+        with open(path + ".tmp", "w", encoding="utf-8") as snapshot_file:
+            json.dump(dict(state, seq=seq), snapshot_file, separators=(",", ":"))
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(path + ".tmp", path)
+        _fsync_dir(self.directory)
+        for old_seq, old_path in self._list(SNAPSHOT_PREFIX, ".json"):
+            if old_seq < seq:
+                os.remove(old_path)
+
+    def read(self, start_seq: int = 1) -> Iterator[dict]:
+        """Recorre los eventos desde `start_seq` hasta el último escrito al empezar la lectura, segmento
+        a segmento y sin cargarlos en memoria. Lanza ValueError si encuentra una línea dañada."""
+        end_seq = self.last_seq
+        segments = self._segments()
+        for i, (first_seq, path) in enumerate(segments):
+            if i + 1 < len(segments) and segments[i + 1][0] <= start_seq:
+                continue # El segmento entero es anterior a start_seq
+            if first_seq > end_seq:
+                return
+            with open(path, "rb") as segment:
+                expected = first_seq
+                for line in segment:
+                    if expected > end_seq:
+                        return
+                    if expected < start_seq: # Anterior a start_seq: no hace falta decodificarlo
+                        expected += 1
+                        continue
+                    record = _decode_record(line)
+                    if record is None:
+                        raise ValueError(f"Registro de eventos corrupto: línea no válida en {path} (evento {expected}).")
+                    self._check_seq(record, expected, path)
+                    expected += 1
+                    yield record
+
+    def close(self):
+        with self._sync_lock, self._lock:
+            if self._file is not None:
+                if self._failed is None:
+                    self._file.flush()
+                    if self.fsync:
+                        os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+
+class EventLogParkingManager:
+    """Alternativa a ParkingManager que guarda las entradas y salidas en un EventLog en lugar de en
+    SQLite: cada operación es una línea añadida al final del registro (sin DELETE ni reinserción en
+    el historial) y los vehículos aparcados se mantienen en memoria, reconstruidos al abrir a partir
+    del último snapshot y los eventos posteriores. Cada `snapshot_every` eventos se toma un snapshot.
+
+    Ofrece la misma API que ParkingManager que usan las rutas de app.py (STORAGE_BACKEND=event_log):
+    entradas, salidas, ocupación, vehículos aparcados, historial paginado, CSV, informes y análisis de
+    ocupación, con los mismos ParkingResult. Las consultas del historial usan un índice en memoria de
+    las estancias cerradas, ordenado por hora de salida, que se construye con la primera consulta y
+    después solo lee los eventos nuevos. Los agregados de los informes (en una base de datos SQLite en
+    memoria) y el motor de ocupación se crean en su primer uso y el índice les añade después cada
+    estancia nueva. Las facturas se generan siempre al registrar la salida (no hay cola de facturas).
+
+    Si falla el fsync de un lote, sus eventos pueden estar o no en disco (y otros lotes pueden haberse
+    aplicado ya sobre ellos), así que el estado en memoria no se deshace: el gestor queda inservible y
+    todas las operaciones fallan (DB_ERROR u OSError) hasta volver a abrirlo, lo que recupera lo que
+    realmente llegó al disco.
+
+    Atributos:
+        log EventLog: Registro de eventos
+        capacity int: Número de plazas
+        tariffs TariffEngine: Motor de tarifas con el que se cobran las salidas
+        snapshot_every int: Eventos entre snapshots automáticos (0: solo con snapshot())
+        invoices_dir str: Directorio donde se generan las facturas
+        events EventBus: Bus de eventos de entradas, salidas y ocupación (como en ParkingManager)
+        recovered_events int: Eventos que se aplicaron sobre el snapshot al abrir el registro"""
+
+    def __init__(self, log_dir: str, capacity: int, tariffs: Optional[TariffEngine] = None,
+                 snapshot_every: int = 10000, fsync: bool = True):
+        self.log = EventLog(log_dir, fsync=fsync)
+        self.capacity = capacity
+        self.tariffs = tariffs if tariffs is not None else TariffEngine.default()
+        self.snapshot_every = snapshot_every
+        self.date_format_str: str = DEFAULT_ISSUER["date_format"]
+        # Datos que aparecen en las facturas (ver invoice_issuer())
+        self.parking_name: str = DEFAULT_ISSUER["name"]
+        self.parking_address: str = DEFAULT_ISSUER["address"]
+        self.parking_nif: str = DEFAULT_ISSUER["nif"]
+        self.invoice_customer: str = DEFAULT_ISSUER["customer"]
+        self.invoice_employee: str = DEFAULT_ISSUER["employee"]
+        self.invoices_dir: str = "invoices"
+        os.makedirs(self.invoices_dir, exist_ok=True)
+        self.events = EventBus()
+        # Vehículos aparcados: matrícula -> (tipo, hora de entrada). El lock ordena los cambios de estado
+        # igual que las líneas del registro.
+        self._lock = threading.Lock()
+        self._parked: dict[str, tuple[str, int]] = {}
+        self._failed: Optional[OSError] = None
+        # Índice del historial: (hora de salida, seq, fila, tarifa aplicada) ordenado, en total y por
+        # matrícula, con los eventos hasta _history_seq
+        self._history_lock = threading.Lock()
+        self._history: list[tuple] = []
+        self._history_by_plate: dict[str, list[tuple]] = {}
+        self._history_seq = 0
+        # Agregados de los informes y motor de ocupación, creados en su primer uso (con _history_lock)
+        self._reports_conn: Optional[sqlite3.Connection] = None
+        self._occupancy_engine: Optional[OccupancyEngine] = None
+        with _log_span("recover"):
+            _, state, records = self.log.recover()
+            if state is not None:
+                self._parked = {plate: (type_name, check_in) for plate, (type_name, check_in) in state["parked"].items()}
+            for record in records:
+                self._replay(record)
+        self.recovered_events = len(records)
+        self._since_snapshot = len(records)
+
+    def _replay(self, record: dict):
+        """Aplica al estado en memoria un evento leído del registro."""
+        plate = record["plate"]
+        if record["type"] == "check_in" and plate not in self._parked:
+            self._parked[plate] = (record["vehicle_type"], record["timestamp"])
+        elif record["type"] == "check_out" and plate in self._parked:
+            del self._parked[plate]
+        else:
+            raise ValueError(f"Registro de eventos incoherente en el evento {record['seq']} ({record['type']} de {plate}).")
+
+    # Mismos datos de factura, publicación de resultados y formato del historial que ParkingManager
+    invoice_issuer = ParkingManager.invoice_issuer
+    _publish_results = ParkingManager._publish_results
+    _history_row_to_dict = ParkingManager._history_row_to_dict
+    encode_history_cursor = staticmethod(ParkingManager.encode_history_cursor)
+    decode_history_cursor = staticmethod(ParkingManager.decode_history_cursor)
+    # Mismo CSV que ParkingManager, a partir de los lotes de _iter_history_batches
+    _history_csv_row = staticmethod(ParkingManager._history_csv_row)
+    has_history = ParkingManager.has_history
+    stream_history_csv = ParkingManager.stream_history_csv
+    export_history_to_csv = ParkingManager.export_history_to_csv
+
+    def check_capacity(self) -> bool:
+        """Comprueba si hay espacio disponible en el parking."""
+        self._check_available()
+        return len(self._parked) < self.capacity
+
+    def check_in_vehicle(self, plate: str, vehicle_type: VehicleType) -> ParkingResult:
+        """Registra la entrada de un vehículo con la hora actual."""
+        return self.process_gate_events([{"type": "check_in", "plate": plate, "vehicle_type": vehicle_type.name,
+                                           "timestamp": int(time.time() * 1000)}])[0]
+
+    def check_out_vehicle(self, plate: str) -> ParkingResult:
+        """Registra la salida de un vehículo con la hora actual, calcula el coste y genera la factura."""
+        return self.process_gate_events([{"type": "check_out", "plate": plate,
+                                          "timestamp": int(time.time() * 1000)}])[0]
+
+    @traced()
+    def process_gate_events(self, events: list[dict]) -> list[ParkingResult]:
+        """Aplica un lote de eventos de barrera como ParkingManager.process_gate_events, escribiendo
+        todos los cambios en el registro con una sola escritura y un solo fsync. Si el registro no se
+        puede escribir, el estado no cambia y los eventos válidos devuelven DB_ERROR."""
+        results, valid = validate_gate_events(events)
+
+        start = time.perf_counter()
+        records: list[dict] = []
+        undo: list[tuple] = []
+        snapshot_due = False
+        with self._lock:
+            if self._failed is not None:
+                return self._db_error(results, valid, self._failed)
+            for timestamp, index, event in valid:
+                plate = results[index].plate
+                if event["type"] == "check_in":
+                    results[index] = self._apply_check_in(plate, event["vehicle_type"], timestamp, records, undo)
+                else:
+                    results[index] = self._apply_check_out(plate, timestamp, records, undo)
+            if records:
+                try:
+                    seq = self.log.append(records)
+                except OSError as e:
+                    for plate, previous in reversed(undo):
+                        if previous is None:
+                            del self._parked[plate]
+                        else:
+                            self._parked[plate] = previous
+                    return self._db_error(results, valid, e)
+                self._since_snapshot += len(records)
+                if self.snapshot_every and self._since_snapshot >= self.snapshot_every:
+                    self._since_snapshot = 0
+                    snapshot_due = True
+        if records:
+            try:
+                self.log.sync(seq)
+            except OSError as e:
+                with self._lock:
+                    self._failed = e
+                return self._db_error(results, valid, e)
+        db_ms = (time.perf_counter() - start) * 1000
+        for _, index, _ in valid:
+            results[index].db_ms = db_ms
+
+        if snapshot_due:
+            self.snapshot()
+        self._finish_invoices([result for result in results if result.ok and result.operation == "check_out"])
+        self._publish_results(results)
+        return results
+
+    def _check_available(self):
+        """Lanza OSError si el gestor quedó inservible tras un fallo al llevar el registro a disco."""
+        if self._failed is not None:
+            raise OSError(f"El registro de eventos no está disponible tras un error de escritura ({self._failed}); "
+                          "hay que volver a abrirlo.")
+
+    @staticmethod
+    def _db_error(results: list[ParkingResult], valid: list[tuple], error: OSError) -> list[ParkingResult]:
+        for _, index, event in valid:
+            results[index] = ParkingResult(ResultStatus.DB_ERROR, results[index].plate, event["type"], detail=str(error))
+        return results
+
+    def _apply_check_in(self, plate: str, vehicle_type_name: str, timestamp: int, records: list,
+                        undo: list) -> ParkingResult:
+        """Aplica una entrada al estado en memoria y añade su evento a `records`. Requiere el lock."""
+        if len(self._parked) >= self.capacity:
+            return ParkingResult(ResultStatus.FULL, plate, "check_in")
+        if plate in self._parked:
+            return ParkingResult(ResultStatus.ALREADY_PARKED, plate, "check_in")
+        self._parked[plate] = (vehicle_type_name, timestamp)
+        undo.append((plate, None))
+        records.append({"type": "check_in", "plate": plate, "vehicle_type": vehicle_type_name, "timestamp": timestamp,
+                        "logged_at": int(time.time() * 1000)})
+        return ParkingResult(ResultStatus.CHECKED_IN, plate, "check_in",
+                             vehicle=Vehicle(plate, VehicleType[vehicle_type_name], timestamp))
+
+    def _apply_check_out(self, plate: str, timestamp: int, records: list, undo: list) -> ParkingResult:
+        """Aplica una salida al estado en memoria y añade su evento, que incluye la estancia completa
+        (el registro del historial), a `records`. Requiere el lock."""
+        parked = self._parked.get(plate)
+        if parked is None:
+            return ParkingResult(ResultStatus.NOT_FOUND, plate, "check_out")
+        vehicle_type_name, check_in_time = parked
+        if vehicle_type_name not in VehicleType.__members__:
+            return ParkingResult(ResultStatus.UNKNOWN_VEHICLE_TYPE, plate, "check_out", detail=vehicle_type_name)
+        if timestamp < check_in_time:
+            return ParkingResult(ResultStatus.CHECK_OUT_BEFORE_CHECK_IN, plate, "check_out")
+
+        with tracing.span("compute.fee"):
+            vehicle_obj = Vehicle(plate, VehicleType[vehicle_type_name], check_in_time, timestamp)
+            duration_minutes = vehicle_obj.calculate_parking_duration_in_minutes()
+            fee = self.tariffs.fee(vehicle_type_name, check_in_time, timestamp)
+            tariff = self.tariffs.describe(vehicle_type_name, EURO_SYMBOL)
+            invoice_filename = ParkingManager._invoice_filename(plate, datetime.fromtimestamp(timestamp / 1000))
+        del self._parked[plate]
+        undo.append((plate, parked))
+        records.append({"type": "check_out", "plate": plate, "vehicle_type": vehicle_type_name,
+                        "check_in_time": check_in_time, "timestamp": timestamp, "duration_minutes": duration_minutes,
+                        "fee": fee, "tariff": tariff, "invoice": invoice_filename, "logged_at": int(time.time() * 1000)})
+        return ParkingResult(ResultStatus.CHECKED_OUT, plate, "check_out", vehicle=vehicle_obj,
+                             duration_minutes=duration_minutes, fee=fee, invoice=invoice_filename)
+
+    @traced()
+    def _finish_invoices(self, results: list[ParkingResult]):
+        """Genera las facturas de las salidas ya escritas en el registro."""
+        for result in results:
+            vehicle_obj: Vehicle = result.vehicle # type: ignore
+            start = time.perf_counter()
+            generated = write_invoice_pdf(
+                self.invoice_issuer(), os.path.join(self.invoices_dir, result.invoice), vehicle_obj, result.fee, # type: ignore
+                datetime.fromtimestamp(vehicle_obj.check_in_time / 1000),
+                datetime.fromtimestamp(vehicle_obj.check_out_time / 1000), # type: ignore
+                result.duration_minutes, # type: ignore
+                self.tariffs.describe(vehicle_obj.type.name, EURO_SYMBOL)
+            )
+            result.invoice_ms = (time.perf_counter() - start) * 1000
+            if not generated:
+                result.invoice = None
+                result.invoice_failed = True
+
+    @traced()
+    def snapshot(self) -> int:
+        """Guarda un snapshot de los vehículos aparcados y empieza un segmento nuevo del registro.
+        Devuelve el seq del último evento incluido."""
+        with _log_span("snapshot"):
+            with self._lock:
+                seq = self.log.rotate()
+                parked = {plate: list(entry) for plate, entry in self._parked.items()}
+                self._since_snapshot = 0
+            self.log.write_snapshot(seq, {"parked": parked, "created_at": int(time.time() * 1000)})
+        return seq
+
+    def get_occupancy_snapshot(self) -> dict:
+        """Devuelve la capacidad, la ocupación y las plazas libres."""
+        self._check_available()
+        occupancy = len(self._parked)
+        return {"capacity": self.capacity, "occupancy": occupancy, "available": max(self.capacity - occupancy, 0)}
+
+    def get_current_occupancy(self) -> int:
+        """Devuelve el número actual de vehículos en el parking."""
+        self._check_available()
+        return len(self._parked)
+
+    def get_current_vehicles_data(self, raw_times: bool = False) -> list[dict]:
+        """Devuelve los vehículos aparcados por hora de entrada, con el formato de ParkingManager."""
+        self._check_available()
+        with self._lock:
+            parked = sorted(self._parked.items(), key=lambda item: item[1][1])
+        return [{
+            "plate": plate,
+            "vehicle_type_name": vehicle_type_name,
+            "check_in_time": check_in_time if raw_times else
+            datetime.fromtimestamp(check_in_time / 1000).strftime(self.date_format_str)
+        } for plate, (vehicle_type_name, check_in_time) in parked]
+
+    def _update_history(self):
+        """Incorpora al índice del historial las salidas escritas desde la última consulta. Las estancias
+        se ordenan por hora de salida y, a igual hora, de registro (un lote puede traer horas antiguas)."""
+        self._check_available()
+        with self._history_lock, _log_span("index_history"):
+            rows = []
+            for record in self.log.read(self._history_seq + 1):
+                self._history_seq = record["seq"]
+                if record["type"] != "check_out":
+                    continue
+                row = (record["plate"], record["vehicle_type"], record["check_in_time"], record["timestamp"],
+                       record["duration_minutes"], record["fee"])
+                entry = (record["timestamp"], record["seq"], row, record.get("tariff")) # Sin tarifa en registros antiguos
+                bisect.insort(self._history, entry)
+                bisect.insort(self._history_by_plate.setdefault(record["plate"], []), entry)
+                rows.append(row)
+            self._add_stays(rows)
+
+    def _add_stays(self, rows: list[tuple]):
+        """Suma estancias del historial a los agregados de los informes y al motor de ocupación, si ya
+        se han creado. Requiere _history_lock."""
+        if not rows:
+            return
+        if self._reports_conn is not None:
+            self._record_reports(self._reports_conn, rows)
+        if self._occupancy_engine is not None:
+            self._record_occupancy(self._occupancy_engine, rows)
+
+    @staticmethod
+    def _record_reports(conn: sqlite3.Connection, rows: list[tuple]):
+        cursor = conn.cursor()
+        for _, vehicle_type_name, _, check_out_time, duration_minutes, fee in rows:
+            reports.record_check_out(cursor, vehicle_type_name, check_out_time, duration_minutes, fee)
+        conn.commit()
+
+    @staticmethod
+    def _record_occupancy(engine: OccupancyEngine, rows: list[tuple]):
+        if rows:
+            _, type_names, check_ins, check_outs, _, _ = zip(*rows)
+            engine.add_stays(type_names, check_ins, check_outs)
+
+    @staticmethod
+    def _range(entries: list[tuple], start_ms: Optional[int], end_ms: Optional[int]) -> Tuple[int, int]:
+        """Posiciones en el índice de las salidas en [start_ms, end_ms)."""
+        low = bisect.bisect_left(entries, (start_ms,)) if start_ms is not None else 0
+        high = bisect.bisect_left(entries, (end_ms,)) if end_ms is not None else len(entries)
+        return low, high
+
+    def _history_rows(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                      plate: Optional[str] = None) -> list[tuple]:
+        """Estancias cerradas (eventos check_out) en orden de hora de salida y, a igual hora, de registro,
+        como filas (plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee)."""
+        self._update_history()
+        with self._history_lock:
+            entries = self._history if plate is None else self._history_by_plate.get(plate, [])
+            low, high = self._range(entries, start_ms, end_ms)
+            return [row for _, _, row, _ in entries[low:high]]
+
+    def _iter_history_batches(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                              batch_size: int = 1000, with_tariff: bool = False) -> Iterator[list[tuple]]:
+        """Recorre el historial en orden cronológico por lotes, como ParkingManager._iter_history_batches:
+        copia el índice por lotes de batch_size, continuando cada lote tras la última estancia del anterior."""
+        self._update_history()
+        position: tuple = (start_ms,) if start_ms is not None else ()
+        while True:
+            with self._history_lock:
+                _, high = self._range(self._history, None, end_ms)
+                low = bisect.bisect_left(self._history, position)
+                batch = self._history[low:min(low + batch_size, high)]
+            if not batch:
+                return
+            yield [row + (tariff,) for _, _, row, tariff in batch] if with_tariff else [row for _, _, row, _ in batch]
+            position = (batch[-1][0], batch[-1][1] + 1)
+
+    def iter_history_rows(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                          batch_size: int = 1000) -> Iterator[tuple]:
+        """Recorre el historial fila a fila en orden cronológico, como ParkingManager.iter_history_rows."""
+        for rows in self._iter_history_batches(start_ms, end_ms, batch_size):
+            yield from rows
+
+    def iter_invoice_rows(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                          batch_size: int = 1000) -> Iterator[tuple]:
+        """Como iter_history_rows, con la tarifa aplicada como séptimo campo, como ParkingManager.iter_invoice_rows."""
+        for rows in self._iter_history_batches(start_ms, end_ms, batch_size, with_tariff=True):
+            yield from rows
+
+    @traced()
+    def get_vehicle_history_page(self, limit: int = 50, after: Optional[str] = None,
+                                 raw_times: bool = False) -> Tuple[list[dict], Optional[str]]:
+        """Devuelve una página del historial (de más reciente a más antiguo) y el cursor de la página
+        siguiente, como ParkingManager.get_vehicle_history_page. El cursor es (hora de salida, seq).
+        Lanza ValueError si el cursor `after` no es válido."""
+        position = self.decode_history_cursor(after) if after else None
+        self._update_history()
+        with self._history_lock:
+            high = bisect.bisect_left(self._history, position) if position is not None else len(self._history)
+            entries = self._history[max(high - limit - 1, 0):high][::-1]
+        next_cursor = None
+        if len(entries) > limit:
+            entries = entries[:limit]
+            next_cursor = self.encode_history_cursor(entries[-1][0], entries[-1][1]) if entries else None
+        with tracing.span("format.history_rows"):
+            return [self._history_row_to_dict(row, raw_times) for _, _, row, _ in entries], next_cursor
+
+    @traced()
+    def get_vehicle_history_data(self, limit: Optional[int] = None, after: Optional[str] = None) -> list[dict]:
+        """Devuelve el historial (de más reciente a más antiguo) para Flask; con `limit`, solo una página."""
+        if limit is not None:
+            return self.get_vehicle_history_page(limit, after)[0]
+        self._update_history()
+        with self._history_lock:
+            entries = list(self._history)
+        return [self._history_row_to_dict(row) for _, _, row, _ in reversed(entries)]
+
+    @traced()
+    def get_plate_history(self, plate: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> list[dict]:
+        """Devuelve el historial de una matrícula (de más reciente a más antiguo), opcionalmente
+        limitado a salidas en [start_ms, end_ms)."""
+        return [self._history_row_to_dict(row) for row in self._history_rows(start_ms, end_ms, plate)[::-1]]
+
+    def audit_events(self, plate: Optional[str] = None, start_ms: Optional[int] = None,
+                     end_ms: Optional[int] = None) -> list[dict]:
+        """Devuelve los eventos del registro tal como se escribieron (con su seq y la hora de registro
+        `logged_at`), opcionalmente de una matrícula y con hora del evento en [start_ms, end_ms)."""
+        return [record for record in self.log.read()
+                if (plate is None or record["plate"] == plate)
+                and (start_ms is None or record["timestamp"] >= start_ms)
+                and (end_ms is None or record["timestamp"] < end_ms)]
+
+    @traced()
+    def project_to_sqlite(self, conn: sqlite3.Connection) -> int:
+        """Reconstruye en `conn` (con el esquema de ParkingManager) el historial, los vehículos aparcados
+        y los agregados de los informes a partir del registro. Devuelve el número de estancias del historial."""
+        apply_migrations(conn)
+        with self._lock:
+            parked = [(plate, type_name, check_in) for plate, (type_name, check_in) in self._parked.items()]
+        rows = list(self.iter_invoice_rows())
+        conn.execute("DELETE FROM parked_vehicles")
+        conn.execute("DELETE FROM vehicle_history")
+        conn.executemany("INSERT INTO parked_vehicles (plate, vehicle_type_name, check_in_time) VALUES (?, ?, ?)", parked)
+        conn.executemany(
+            """INSERT INTO vehicle_history
+               (plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee, tariff)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            rows
+        )
+        reports.rebuild_rollups(conn) # Hace commit de todo
+        return len(rows)
+
+    def _reports(self) -> sqlite3.Connection:
+        """Base de datos en memoria con los agregados de los informes, al día con el registro. Requiere
+        _history_lock (las consultas sobre ella también)."""
+        if self._reports_conn is None:
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+            apply_migrations(conn)
+            self._record_reports(conn, [row for _, _, row, _ in self._history])
+            self._reports_conn = conn
+        return self._reports_conn
+
+    @traced()
+    def get_daily_report(self, start_day: Optional[str] = None, end_day: Optional[str] = None) -> list[dict]:
+        """Visitas, ingresos y duración media por día y tipo de vehículo, como ParkingManager.get_daily_report."""
+        self._update_history()
+        with self._history_lock:
+            return reports.daily_report(self._reports(), start_day, end_day)
+
+    @traced()
+    def get_hourly_report(self, day: str) -> list[dict]:
+        """Visitas, ingresos y duración media por hora y tipo de vehículo de un día (AAAA-MM-DD)."""
+        self._update_history()
+        with self._history_lock:
+            return reports.hourly_report(self._reports(), day)
+
+    @traced()
+    def get_report_summary(self, start_day: Optional[str] = None, end_day: Optional[str] = None) -> dict:
+        """Totales del periodo, en conjunto y por tipo de vehículo, como ParkingManager.get_report_summary."""
+        self._update_history()
+        with self._history_lock:
+            return reports.summary(self._reports(), start_day, end_day)
+
+    @traced()
+    def get_occupancy_engine(self) -> OccupancyEngine:
+        """Devuelve el motor de análisis de ocupación con las estancias cerradas del registro y los
+        vehículos aparcados ahora, como ParkingManager.get_occupancy_engine."""
+        self._update_history()
+        with self._history_lock:
+            if self._occupancy_engine is None:
+                engine = OccupancyEngine()
+                self._record_occupancy(engine, [row for _, _, row, _ in self._history])
+                self._occupancy_engine = engine
+            engine = self._occupancy_engine
+        with self._lock:
+            parked = list(self._parked.values())
+        type_names, check_ins = zip(*parked) if parked else ((), ())
+        engine.set_open_stays(type_names, check_ins, int(time.time() * 1000))
+        return engine
+
+    def render_invoice_now(self, filename: str) -> bool:
+        """Siempre False: las facturas se generan al registrar la salida, sin cola."""
+        return False
+
+    def get_invoice_queue_metrics(self) -> Optional[dict]:
+        """Siempre None: no hay cola de facturas."""
+        return None
+
+    def release_connection(self):
+        """No hace nada: existe por compatibilidad con ParkingManager (ver app.py y loadgen.ManagerTarget)."""
+
+    def close_db(self):
+        """Cierra el registro llevando a disco lo escrito."""
+        self.log.close()
+        if self._reports_conn is not None:
+            self._reports_conn.close()
+            self._reports_conn = None
+
+
+def _parse_time(value: Optional[str]) -> Optional[int]:
+    return int(datetime.fromisoformat(value).timestamp() * 1000) if value else None
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Consulta y mantiene un registro de eventos del parking.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    audit = commands.add_parser("audit", help="Muestra los eventos del registro")
+    audit.add_argument("log_dir", help="Directorio del registro de eventos")
+    audit.add_argument("--plate", help="Solo los eventos de esta matrícula")
+    audit.add_argument("--start", help="Inicio del periodo (AAAA-MM-DD o AAAA-MM-DDTHH:MM, hora local)")
+    audit.add_argument("--end", help="Fin del periodo (hora local, excluido)")
+
+    snapshot = commands.add_parser("snapshot", help="Toma un snapshot de los vehículos aparcados")
+    snapshot.add_argument("log_dir", help="Directorio del registro de eventos")
+
+    project = commands.add_parser("project", help="Proyecta el registro en una base de datos SQLite para los informes")
+    project.add_argument("log_dir", help="Directorio del registro de eventos")
+    project.add_argument("db", help="Base de datos a crear o sobrescribir")
+    args = parser.parse_args(argv)
+
+    try:
+        start_ms = _parse_time(getattr(args, "start", None))
+        end_ms = _parse_time(getattr(args, "end", None))
+    except ValueError as e:
+        parser.error(str(e))
+    manager = EventLogParkingManager(args.log_dir, capacity=0, snapshot_every=0)
+    try:
+        if args.command == "audit":
+            for record in manager.audit_events(args.plate.upper() if args.plate else None, start_ms, end_ms):
+                event_time = datetime.fromtimestamp(record["timestamp"] / 1000).strftime(manager.date_format_str)
+                line = f"{record['seq']:>8}  {event_time}  {record['type']:<9}  {record['plate']:<10}  {record['vehicle_type']}"
+                if record["type"] == "check_out":
+                    line += f"  {record['duration_minutes']} min  €{record['fee']:.2f}  {record['invoice']}"
+                print(line)
+        elif args.command == "snapshot":
+            seq = manager.snapshot()
+            print(f"Snapshot guardado tras el evento {seq} ({manager.get_current_occupancy()} vehículos aparcados).")
+        else:
+            conn = sqlite3.connect(args.db)
+            try:
+                count = manager.project_to_sqlite(conn)
+            finally:
+                conn.close()
+            print(f"{count} estancias y {manager.get_current_occupancy()} vehículos aparcados proyectados en {args.db}.")
+    finally:
+        manager.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import argparse
+import multiprocessing
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional, Tuple
+
+from invoice_template import UNRECORDED_TARIFF
+from parking_manager import ParkingManager, build_invoice_pdf
+from vehicle import Vehicle, VehicleType
+
+INVOICE_ZIP_FILENAME = "facturas.zip"
+DEFAULT_CHUNK_SIZE = 32 # Facturas por tarea enviada a un proceso trabajador
+
+# Resultado de generar una factura: (nombre del archivo, contenido del PDF o None si falló)
+RenderedInvoice = Tuple[str, Optional[bytes]]
+
+
+def render_invoice(issuer: dict, row: tuple) -> RenderedInvoice:
+    """Genera en memoria la factura de una fila del historial (plate, vehicle_type_name,
+    check_in_time, check_out_time, duration_minutes, fee, tariff), ver iter_invoice_rows(). La
+    tarifa es la que se guardó al cobrar la estancia, no la configurada ahora: si no se guardó
+    (estancias anteriores a la migración 5), la factura lo indica con UNRECORDED_TARIFF."""
+    plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee, tariff = row
+    check_in_dt = datetime.fromtimestamp(check_in_time / 1000)
+    check_out_dt = datetime.fromtimestamp(check_out_time / 1000)
+    filename = ParkingManager._invoice_filename(plate, check_out_dt)
+    try:
+        vehicle = Vehicle(plate, VehicleType[vehicle_type_name], check_in_time, check_out_time)
+        pdf = build_invoice_pdf(issuer, vehicle, fee, check_in_dt, check_out_dt, duration_minutes,
+                                tariff if tariff is not None else UNRECORDED_TARIFF)
+        return filename, pdf.output(dest="S").encode("latin-1")
+    except Exception as e:
+        print(f"Error al generar el PDF de la factura {filename}: {e}")
+        return filename, None
+
+
+def render_invoice_chunk(issuer: dict, rows: list[tuple]) -> list[RenderedInvoice]:
+    """Genera un grupo de facturas. Es la tarea que ejecuta cada proceso trabajador: agrupar las
+    filas reduce el coste de enviar cada tarea entre procesos."""
+    return [render_invoice(issuer, row) for row in rows]
+
+
+def _chunks(rows: Iterable[tuple], size: int) -> Iterator[list[tuple]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def render_invoices(issuer: dict, rows: Iterable[tuple], workers: int = 0,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[RenderedInvoice]:
+    """Genera las facturas de `rows` en el mismo orden. Con workers > 0 se reparten por grupos entre un
+    pool de procesos; como mucho hay 2 * workers grupos en curso, de modo que la memoria no depende
+    del número de facturas aunque quien consume el resultado (p. ej. un ZIP) sea más lento."""
+    if workers <= 0:
+        for row in rows:
+            yield render_invoice(issuer, row)
+        return
+
+    # 'spawn' evita heredar con fork el estado de los hilos del servidor (pool de conexiones, colas)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending: "deque[Future]" = deque()
+        try:
+            for chunk in _chunks(rows, chunk_size):
+                pending.append(executor.submit(render_invoice_chunk, issuer, chunk))
+                if len(pending) >= 2 * workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            for future in pending: # Si se deja de consumir (p. ej. el cliente cancela la descarga)
+                future.cancel()
+
+
+class _ChunkWriter:
+    """Destino de escritura sin seek para zipfile: acumula lo escrito hasta que se recoge con take()."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_invoice_zip(invoices: Iterable[RenderedInvoice], stats: Optional[dict] = None) -> Iterator[bytes]:
+    """Genera un ZIP con las facturas por fragmentos (uno por factura), sin tener el archivo completo en
+    memoria. Las facturas que no se pudieron generar se omiten y se cuentan en stats["failed"]."""
+    stats = stats if stats is not None else {}
+    stats.setdefault("written", 0)
+    stats.setdefault("failed", 0)
+    writer = _ChunkWriter()
+    # Los PDF ya van comprimidos: se guardan sin volver a comprimir
+    with zipfile.ZipFile(writer, "w", compression=zipfile.ZIP_STORED) as archive: # type: ignore
+        for filename, content in invoices:
+            if content is None:
+                stats["failed"] += 1
+                continue
+            archive.writestr(filename, content)
+            stats["written"] += 1
+            yield writer.take()
+    yield writer.take() # Directorio central del ZIP
+
+
+def export_invoices_zip(manager: ParkingManager, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                        workers: int = 0, stats: Optional[dict] = None) -> Iterator[bytes]:
+    """Genera en streaming un ZIP con las facturas del historial con hora de salida en [start_ms, end_ms)."""
+    rows = manager.iter_invoice_rows(start_ms, end_ms)
+    return stream_invoice_zip(render_invoices(manager.invoice_issuer(), rows, workers), stats)
+
+
+def regenerate_invoices(manager: ParkingManager, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                        workers: int = 0, overwrite: bool = False) -> dict:
+    """Vuelve a generar en el directorio de facturas las del historial con hora de salida en
+    [start_ms, end_ms). Sin overwrite, las que ya existen no se generan. Devuelve cuántas se
+    escribieron, se omitieron y fallaron."""
+    stats = {"written": 0, "skipped": 0, "failed": 0}
+
+    def missing_rows() -> Iterator[tuple]:
+        for row in manager.iter_invoice_rows(start_ms, end_ms):
+            filename = ParkingManager._invoice_filename(row[0], datetime.fromtimestamp(row[3] / 1000))
+            if not overwrite and os.path.exists(os.path.join(manager.invoices_dir, filename)):
+                stats["skipped"] += 1
+                continue
+            yield row
+
+    os.makedirs(manager.invoices_dir, exist_ok=True)
+    for filename, content in render_invoices(manager.invoice_issuer(), missing_rows(), workers):
+        if content is None:
+            stats["failed"] += 1
+            continue
+        with open(os.path.join(manager.invoices_dir, filename), "wb") as invoice_file:
+            invoice_file.write(content)
+        stats["written"] += 1
+    return stats
+
+
+def parse_day_range(start: Optional[str], end: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """Convierte las fechas `start` y `end` (AAAA-MM-DD, ambas incluidas) en el rango [start_ms, end_ms)."""
+    start_ms = int(datetime.strptime(start, "%Y-%m-%d").timestamp() * 1000) if start else None
+    end_ms = None
+    if end:
+        end_ms = int((datetime.strptime(end, "%Y-%m-%d") + timedelta(days=1)).timestamp() * 1000)
+    return start_ms, end_ms
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Regenera en bloque las facturas del historial.")
+    parser.add_argument("--db", default="parking_system.db", help="Base de datos del parking")
+    parser.add_argument("--start", help="Primer día (AAAA-MM-DD) por hora de salida")
+    parser.add_argument("--end", help="Último día (AAAA-MM-DD, incluido) por hora de salida")
+    parser.add_argument("--zip", dest="zip_path", help="Escribe las facturas en este ZIP en lugar de en el directorio de facturas")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Procesos que generan facturas (0: en este proceso)")
+    parser.add_argument("--overwrite", action="store_true", help="Vuelve a generar también las facturas que ya existen")
+    args = parser.parse_args(argv)
+
+    try:
+        start_ms, end_ms = parse_day_range(args.start, args.end)
+    except ValueError:
+        parser.error("Fecha no válida. Use el formato AAAA-MM-DD.")
+    manager = ParkingManager(db_name=args.db, capacity=0)
+    try:
+        if args.zip_path:
+            stats: dict = {}
+            with open(args.zip_path, "wb") as zip_file:
+                for chunk in export_invoices_zip(manager, start_ms, end_ms, args.workers, stats):
+                    zip_file.write(chunk)
+            print(f"{stats['written']} facturas exportadas a {args.zip_path} ({stats['failed']} con error).")
+        else:
+            stats = regenerate_invoices(manager, start_ms, end_ms, args.workers, args.overwrite)
+            print(f"{stats['written']} facturas generadas en {manager.invoices_dir} "
+                  f"({stats['skipped']} ya existían, {stats['failed']} con error).")
+    finally:
+        manager.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+
+INVOICE_JOB_COLUMNS = ("id", "filename", "plate", "vehicle_type_name", "check_in_time",
+                       "check_out_time", "duration_minutes", "fee", "tariff")
+
+
+class InvoiceQueue:
+    """Cola persistente de facturas pendientes con un pool de hilos que las genera en segundo plano.
+
+    Los trabajos se guardan en la tabla invoice_jobs de la misma base de datos, dentro de la
+    transacción de la salida, por lo que sobreviven a un reinicio: al arrancar se vuelven a
+    encolar los que quedaron pendientes o a medio generar.
+
+    Estados de un trabajo: 'pending' -> 'rendering' -> 'done' | 'failed'.
+
+    Atributos:
+        get_connection Callable: Devuelve la conexión SQLite del hilo actual
+        release_connection Callable: Libera la conexión del hilo actual
+        render Callable[[dict], bool]: Genera el PDF de un trabajo y devuelve si tuvo éxito
+        workers int: Número de hilos que generan facturas"""
+
+    def __init__(self, get_connection: Callable[[], sqlite3.Connection], release_connection: Callable[[], None],
+                 render: Callable[[dict], bool], workers: int = 2):
+        self._get_connection = get_connection
+        self._release_connection = release_connection
+        self._render = render
+        self._jobs: "queue.Queue[Optional[int]]" = queue.Queue()
+        self._pending_ids: set[int] = set()
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self.rendered_count = 0
+        self.failed_count = 0
+        self.total_render_ms = 0.0
+        self.last_render_ms = 0.0
+        self.max_render_ms = 0.0
+        self._threads = [threading.Thread(target=self._worker, name=f"invoice-worker-{i}", daemon=True)
+                         for i in range(workers)]
+
+    @staticmethod
+    def enqueue(cursor: sqlite3.Cursor, filename: str, plate: str, vehicle_type_name: str, check_in_time: int,
+                check_out_time: int, duration_minutes: int, fee: float, tariff: Optional[str] = None) -> int:
+        """Inserta un trabajo usando el cursor del llamante (sin hacer commit), para que quede
+        dentro de la misma transacción que la salida. `tariff` es el resumen de la tarifa aplicada.
+        Devuelve el id del trabajo."""
+        cursor.execute(
+            """INSERT INTO invoice_jobs
+               (filename, plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee, tariff,
+                status, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending', ?)""",
+            (filename, plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee, tariff,
+             int(time.time() * 1000))
+        )
+        return cursor.lastrowid # type: ignore
+
+    def start(self):
+        """Recupera los trabajos pendientes de la base de datos y arranca los hilos."""
+        try:
+            conn = self._get_connection()
+            conn.execute("UPDATE invoice_jobs SET status = 'pending' WHERE status = 'rendering'")
+            conn.commit()
+            rows = conn.execute("SELECT id FROM invoice_jobs WHERE status = 'pending' ORDER BY id").fetchall()
+        finally:
+            self._release_connection()
+        for (job_id,) in rows:
+            self.submit(job_id)
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, job_id: int):
+        """Encola un trabajo ya confirmado en la base de datos."""
+        with self._lock:
+            self._pending_ids.add(job_id)
+        self._jobs.put(job_id)
+
+    def shutdown(self, timeout: float = 5.0):
+        """Detiene los hilos tras terminar los trabajos en curso. Los pendientes siguen en la base de datos."""
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join(timeout)
+
+    def _worker(self):
+        while True:
+            job_id = self._jobs.get()
+            if job_id is None:
+                break
+            try:
+                self._process(job_id)
+            except Exception as e:
+                print(f"Error al procesar el trabajo de factura {job_id}: {e}")
+            finally:
+                self._release_connection()
+
+    def _process(self, job_id: int) -> Optional[bool]:
+        """Reclama un trabajo pendiente y lo genera. Devuelve None si el trabajo ya no estaba
+        pendiente (otro hilo lo reclamó antes)."""
+        conn = self._get_connection()
+        claimed = conn.execute(
+            "UPDATE invoice_jobs SET status = 'rendering' WHERE id = ? AND status = 'pending'", (job_id,)
+        )
+        conn.commit()
+        if claimed.rowcount == 0:
+            return None
+        row = conn.execute(
+            f"SELECT {', '.join(INVOICE_JOB_COLUMNS)} FROM invoice_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        job = dict(zip(INVOICE_JOB_COLUMNS, row))
+
+        start = time.perf_counter()
+        try:
+            success = self._render(job)
+        except Exception as e:
+            print(f"Error al generar la factura {job['filename']}: {e}")
+            success = False
+        render_ms = (time.perf_counter() - start) * 1000
+
+        conn.execute("UPDATE invoice_jobs SET status = ?, render_ms = ? WHERE id = ?",
+                     ("done" if success else "failed", render_ms, job["id"]))
+        conn.commit()
+        with self._finished:
+            self._pending_ids.discard(job["id"])
+            if success:
+                self.rendered_count += 1
+                self.total_render_ms += render_ms
+                self.last_render_ms = render_ms
+                self.max_render_ms = max(self.max_render_ms, render_ms)
+            else:
+                self.failed_count += 1
+            self._finished.notify_all()
+        return success
+
+    def render_now(self, filename: str, timeout: float = 10.0) -> bool:
+        """Genera la factura en el hilo actual si su trabajo aún no se ha ejecutado, o espera a que
+        termine si un hilo la está generando. Devuelve True si la factura quedó generada."""
+        conn = self._get_connection()
+        pending = conn.execute(
+            "SELECT id FROM invoice_jobs WHERE filename = ? AND status = 'pending' ORDER BY id DESC LIMIT 1",
+            (filename,)
+        ).fetchone()
+        if pending is not None:
+            result = self._process(pending[0])
+            if result is not None:
+                return result
+        deadline = time.monotonic() + timeout
+        while True:
+            row = conn.execute("SELECT status FROM invoice_jobs WHERE filename = ? ORDER BY id DESC LIMIT 1",
+                               (filename,)).fetchone()
+            if row is None or row[0] != "rendering":
+                return row is not None and row[0] == "done"
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            with self._finished:
+                self._finished.wait(min(remaining, 0.5))
+
+    def metrics(self) -> dict:
+        """Devuelve la profundidad de la cola y las estadísticas de tiempo de generación."""
+        with self._lock:
+            return {
+                "queue_depth": len(self._pending_ids),
+                "rendered": self.rendered_count,
+                "failed": self.failed_count,
+                "last_render_ms": self.last_render_ms,
+                "avg_render_ms": self.total_render_ms / self.rendered_count if self.rendered_count else 0.0,
+                "max_render_ms": self.max_render_ms,
+            }
@@ -0,0 +1,185 @@
+import functools
+import string
+from datetime import datetime
+from typing import NamedTuple, Union
+
+from fpdf import FPDF
+
+FONT_FAMILY = "Arial"
+EURO_SYMBOL = chr(128) # Símbolo del Euro para FPDF
+# Texto de "Tarifa Aplicada" en las facturas de estancias cobradas antes de guardar la tarifa en el historial
+UNRECORDED_TARIFF = "no registrada"
+
+# Datos del establecimiento por defecto (ver ParkingManager.invoice_issuer())
+DEFAULT_ISSUER = {
+    "name": "Parking Central",
+    "address": "Cto Juan Pablo II 2457, La Hacienda, 72570 Heroica Puebla de Zaragoza, Pue., México",
+    "nif": "B12345678",
+    "customer": "José Luis Ábalos",
+    "employee": "Jessica Rodríguez",
+    "date_format": "%d/%m/%Y %H:%M:%S",
+}
+
+
+class InvoiceLine(NamedTuple):
+    """Línea de la factura. `text` es una plantilla de str.format con campos del establecimiento
+    (ver DEFAULT_ISSUER) o de la factura (ver invoice_values()).
+
+    Atributos:
+        style str: Estilo de la fuente ("", "B" o "I")
+        size int: Tamaño de la fuente en puntos
+        height float: Alto de la celda
+        text str: Plantilla del texto
+        align str: Alineación de la celda ("" a la izquierda, "C" centrada)
+        space_after float: Espacio vertical tras la línea"""
+    style: str
+    size: int
+    height: float
+    text: str
+    align: str = ""
+    space_after: float = 0
+
+
+INVOICE_LAYOUT = [
+    InvoiceLine("B", 16, 10, "FACTURA SIMPLIFICADA", "C", space_after=5),
+    # Información del Parking
+    InvoiceLine("", 12, 6, "Establecimiento: {name}"),
+    InvoiceLine("", 12, 6, "Dirección: {address}"),
+    InvoiceLine("", 12, 6, "NIF: {nif}", space_after=5),
+    InvoiceLine("B", 10, 6, "Fecha Factura: {invoice_date}", space_after=5),
+    # Detalles del Servicio
+    InvoiceLine("B", 12, 6, "DETALLES DEL SERVICIO:"),
+    InvoiceLine("", 11, 6, "Cliente: {customer}"),
+    InvoiceLine("", 11, 6, "Empleada: {employee}"),
+    InvoiceLine("", 11, 6, "Vehículo Matrícula: {plate}"),
+    InvoiceLine("", 11, 6, "Tipo de Vehículo:   {vehicle_type}", space_after=3),
+    InvoiceLine("", 11, 6, "Hora de Entrada: {check_in}"),
+    InvoiceLine("", 11, 6, "Hora de Salida:  {check_out}"),
+    InvoiceLine("", 11, 6, "Duración Total:  {duration_minutes} minutos", space_after=5),
+    # Importe a Pagar
+    InvoiceLine("B", 12, 6, "IMPORTE A PAGAR"),
+    InvoiceLine("", 11, 6, "Tarifa Aplicada: {tariff}"),
+    InvoiceLine("B", 14, 8, "TOTAL A PAGAR:   {euro}{fee:.2f}", space_after=10),
+    # Agradecimiento
+    InvoiceLine("I", 10, 10, "Gracias por su visita.", "C"),
+]
+
+
+def invoice_values(issuer: dict, plate: str, vehicle_type_name: str, tariff: str, fee: float,
+                   check_in_dt: datetime, check_out_dt: datetime, duration_minutes: int) -> dict:
+    """Campos variables de una factura, con las fechas ya formateadas. `tariff` es el resumen de la
+    tarifa con la que se calculó el importe (ver TariffRule.describe), con EURO_SYMBOL como moneda."""
+    date_format = issuer.get("date_format", DEFAULT_ISSUER["date_format"])
+    return {
+        "invoice_date": check_out_dt.strftime(date_format),
+        "plate": plate,
+        "vehicle_type": vehicle_type_name,
+        "check_in": check_in_dt.strftime(date_format),
+        "check_out": check_out_dt.strftime(date_format),
+        "duration_minutes": duration_minutes,
+        "tariff": tariff,
+        "fee": fee,
+    }
+
+
+def _fields(text: str) -> set[str]:
+    return {field for _, field, _, _ in string.Formatter().parse(text) if field}
+
+
+def _new_document(pdf_class, fonts: list[tuple[str, int]]) -> FPDF:
+    """Crea el documento registrando todas las fuentes antes de la primera página, de modo que sus
+    números (/F1, /F2...) son siempre los mismos y el contenido precompilado es válido."""
+    pdf = pdf_class()
+    for style, size in fonts:
+        pdf.set_font(FONT_FAMILY, style, size)
+    pdf.add_page()
+    return pdf
+
+
+def _draw(pdf: FPDF, line: InvoiceLine, text: str):
+    pdf.set_font(FONT_FAMILY, line.style, line.size)
+    pdf.cell(0, line.height, text, 0, 1, line.align)
+    if line.space_after:
+        pdf.ln(line.space_after)
+
+
+class _VariableLine(NamedTuple):
+    line: InvoiceLine
+    x: float
+    y: float
+    font: tuple # Fuente activa antes de la línea: (familia, estilo, tamaño)
+
+
+class InvoiceTemplate:
+    """Plantilla de factura precompilada para unos datos del establecimiento.
+
+    Al crearla se maqueta una vez la factura y se guarda el contenido PDF ya generado de las líneas
+    fijas (cabecera, establecimiento, textos), junto con la posición y la fuente de cada línea
+    variable. render() solo copia ese contenido y maqueta las líneas variables, con un resultado
+    idéntico al de maquetar la factura completa (layout_invoice()).
+
+    Atributos:
+        issuer dict: Datos del establecimiento (ver DEFAULT_ISSUER)
+        layout list[InvoiceLine]: Líneas de la factura"""
+
+    def __init__(self, issuer: dict, layout: list[InvoiceLine] = INVOICE_LAYOUT):
+        self.issuer = {**DEFAULT_ISSUER, **issuer}
+        self.layout = layout
+        self._static_values = {**self.issuer, "euro": EURO_SYMBOL}
+        self._fonts = list(dict.fromkeys((line.style, line.size) for line in layout))
+        self._segments: list[Union[str, _VariableLine]] = []
+        self._compile()
+
+    def _compile(self):
+        pdf = _new_document(FPDF, self._fonts)
+        for line in self.layout:
+            if _fields(line.text) <= self._static_values.keys():
+                before = len(pdf.pages[pdf.page])
+                _draw(pdf, line, line.text.format(**self._static_values))
+                content = pdf.pages[pdf.page][before:]
+                if self._segments and isinstance(self._segments[-1], str):
+                    self._segments[-1] += content
+                elif content:
+                    self._segments.append(content)
+            else:
+                self._segments.append(_VariableLine(line, pdf.x, pdf.y,
+                                                    (pdf.font_family, pdf.font_style, pdf.font_size_pt)))
+                _draw(pdf, line, "") # El alto de la línea no depende del texto
+
+    def render(self, values: dict, pdf_class=FPDF) -> FPDF:
+        """Devuelve el documento de una factura con los campos variables de `values`."""
+        pdf = _new_document(pdf_class, self._fonts)
+        all_values = {**self._static_values, **values}
+        for segment in self._segments:
+            if isinstance(segment, str):
+                pdf._out(segment[:-1]) # _out añade el salto de línea final
+                continue
+            # Se restaura la fuente activa en la maquetación original, para que set_font emita
+            # exactamente los mismos cambios de fuente
+            family, style, size = segment.font
+            pdf.font_family, pdf.font_style, pdf.font_size_pt = family, style, size
+            pdf.font_size = size / pdf.k
+            pdf.current_font = pdf.fonts[family + style] if family else {}
+            pdf.set_xy(segment.x, segment.y)
+            _draw(pdf, segment.line, segment.line.text.format(**all_values))
+        return pdf
+
+
+def layout_invoice(issuer: dict, values: dict, layout: list[InvoiceLine] = INVOICE_LAYOUT, pdf_class=FPDF) -> FPDF:
+    """Maqueta la factura completa sin plantilla precompilada (referencia para pruebas y benchmarks)."""
+    all_values = {**DEFAULT_ISSUER, **issuer, "euro": EURO_SYMBOL, **values}
+    pdf = _new_document(pdf_class, list(dict.fromkeys((line.style, line.size) for line in layout)))
+    for line in layout:
+        _draw(pdf, line, line.text.format(**all_values))
+    return pdf
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_template(issuer_items: tuple) -> InvoiceTemplate:
+    return InvoiceTemplate(dict(issuer_items))
+
+
+def get_invoice_template(issuer: dict) -> InvoiceTemplate:
+    """Devuelve la plantilla precompilada para unos datos del establecimiento (se compila una vez por
+    proceso y se reutiliza mientras no cambien)."""
+    return _cached_template(tuple(sorted(issuer.items())))
@@ -0,0 +1,447 @@
+import argparse
+import http.client
+import json
+import queue
+import threading
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, Union
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from event_log import EventLogParkingManager
+from parking_manager import ParkingManager
+from vehicle import VehicleType
+
+ONE_MINUTE_MS = 60 * 1000
+ONE_HOUR_MS = 60 * ONE_MINUTE_MS
+MAX_STAY_MINUTES = 3 * 24 * 60
+PLATE_LETTERS = "BCDFGHJKLMNPRSTVWXYZ" # Letras de las matrículas españolas (sin vocales ni Ñ, Q)
+
+
+@dataclass
+class VehicleTraffic:
+    """Tráfico de un tipo de vehículo a lo largo del día.
+
+    Atributos:
+        arrivals_per_hour list[float]: Llegadas medias en cada hora del día (24 valores, de 0 a 23 h)
+        median_stay_minutes float: Mediana de la duración de las estancias
+        stay_sigma float: Dispersión de la duración (desviación típica de su logaritmo)"""
+    arrivals_per_hour: list[float]
+    median_stay_minutes: float
+    stay_sigma: float = 0.8
+
+    def __post_init__(self):
+        if len(self.arrivals_per_hour) != 24 or min(self.arrivals_per_hour) < 0:
+            raise ValueError("arrivals_per_hour debe tener 24 valores no negativos.")
+        if self.median_stay_minutes <= 0 or self.stay_sigma < 0:
+            raise ValueError("La duración mediana debe ser positiva y la dispersión no negativa.")
+
+
+# Perfiles de tráfico por tipo de vehículo. "laborable" tiene la hora punta de entrada a primera
+# hora de la mañana y estancias de jornada laboral; "noche_evento" concentra las llegadas antes de
+# un evento nocturno y las salidas al terminar (estancias largas y poco dispersas).
+PROFILES: dict[str, dict[str, VehicleTraffic]] = {
+    "laborable": {
+        "COCHE": VehicleTraffic([2, 1, 1, 1, 2, 6, 25, 90, 120, 60, 35, 30, 40, 45, 35, 30, 30, 35, 25, 15, 10, 8, 5, 3],
+                                median_stay_minutes=240, stay_sigma=0.9),
+        "MOTO": VehicleTraffic([0, 0, 0, 0, 0, 1, 5, 18, 24, 12, 7, 6, 8, 9, 7, 6, 6, 7, 5, 3, 2, 1, 1, 0],
+                               median_stay_minutes=180, stay_sigma=0.9),
+        "FURGONETA": VehicleTraffic([0, 0, 0, 0, 1, 2, 5, 8, 10, 10, 9, 8, 6, 6, 8, 8, 6, 4, 2, 1, 0, 0, 0, 0],
+                                    median_stay_minutes=45, stay_sigma=0.6),
+    },
+    "noche_evento": {
+        "COCHE": VehicleTraffic([3, 2, 1, 1, 1, 2, 4, 8, 10, 12, 15, 18, 20, 18, 15, 15, 20, 60, 150, 200, 80, 20, 10, 5],
+                                median_stay_minutes=210, stay_sigma=0.35),
+        "MOTO": VehicleTraffic([0, 0, 0, 0, 0, 0, 1, 1, 2, 2, 2, 3, 3, 3, 2, 2, 3, 9, 22, 30, 12, 3, 1, 1],
+                               median_stay_minutes=210, stay_sigma=0.35),
+        "FURGONETA": VehicleTraffic([0, 0, 0, 0, 0, 1, 2, 4, 5, 5, 4, 4, 3, 3, 4, 4, 3, 2, 1, 0, 0, 0, 0, 0],
+                                    median_stay_minutes=45, stay_sigma=0.6),
+    },
+}
+
+
+def load_profile(path: str) -> dict[str, VehicleTraffic]:
+    """Carga un perfil de tráfico de un JSON {"COCHE": {"arrivals_per_hour": [...], "median_stay_minutes": 240,
+    "stay_sigma": 0.9}, ...}. Lanza ValueError si algún tipo de vehículo no existe."""
+    with open(path, encoding="utf-8") as profile_file:
+        data = json.load(profile_file)
+    unknown = set(data) - set(VehicleType.__members__)
+    if unknown:
+        raise ValueError(f"Tipos de vehículo desconocidos en el perfil: {', '.join(sorted(unknown))}")
+    return {name: VehicleTraffic(**traffic) for name, traffic in data.items()}
+
+
+def synthetic_plate(index: int) -> str:
+    """Matrícula con formato español única para cada índice (hasta 80 millones)."""
+    number, digits = divmod(index, 10000)
+    letters = ""
+    for _ in range(3):
+        number, letter = divmod(number, len(PLATE_LETTERS))
+        letters = PLATE_LETTERS[letter] + letters
+    return f"{digits:04d}{letters}"
+
+
+def generate_events(profile: dict[str, VehicleTraffic], start_ms: int, hours: float, scale: float = 1.0,
+                    seed: int = 0, first_plate: int = 0) -> list[dict]:
+    """Genera las entradas y salidas de `hours` horas a partir de start_ms, en el formato de
+    process_gate_events y ordenadas por hora.
+
+    Las llegadas de cada tipo siguen un proceso de Poisson con la tasa de cada hora del perfil
+    multiplicada por `scale` (hora local de start_ms), y cada estancia dura lo que indica una
+    distribución log-normal. Solo se incluyen las salidas anteriores al final del periodo: los
+    vehículos que siguen dentro quedan aparcados. Cada estancia usa una matrícula distinta, a partir
+    del índice first_plate (para no repetir matrículas al generar varios periodos sobre la misma base
+    de datos)."""
+    rng = np.random.default_rng(seed)
+    end_ms = start_ms + int(hours * ONE_HOUR_MS)
+    first_hour = datetime.fromtimestamp(start_ms / 1000).hour
+    hour_starts = np.arange(start_ms, end_ms, ONE_HOUR_MS, dtype=np.int64)
+    check_ins, check_outs, type_names = [], [], []
+    for type_name, traffic in profile.items():
+        rates = np.asarray(traffic.arrivals_per_hour, dtype=np.float64)[(first_hour + np.arange(len(hour_starts))) % 24]
+        # La última hora puede estar incompleta: su tasa se reduce en proporción
+        rates[-1:] *= (end_ms - hour_starts[-1:]) / ONE_HOUR_MS
+        counts = rng.poisson(rates * scale)
+        arrivals = np.repeat(hour_starts, counts) + rng.integers(0, ONE_HOUR_MS, counts.sum())
+        arrivals = np.minimum(arrivals, end_ms - 1)
+        stays = np.clip(rng.lognormal(np.log(traffic.median_stay_minutes), traffic.stay_sigma, len(arrivals)),
+                        1, MAX_STAY_MINUTES)
+        check_ins.append(arrivals)
+        check_outs.append(arrivals + (stays * ONE_MINUTE_MS).astype(np.int64))
+        type_names += [type_name] * len(arrivals)
+
+    check_in = np.concatenate(check_ins) if check_ins else np.empty(0, dtype=np.int64)
+    check_out = np.concatenate(check_outs) if check_outs else np.empty(0, dtype=np.int64)
+    order = np.argsort(check_in, kind="stable")
+    events = []
+    for plate_index, i in enumerate(order.tolist(), start=first_plate):
+        plate = synthetic_plate(plate_index)
+        events.append({"type": "check_in", "plate": plate, "vehicle_type": type_names[i],
+                       "timestamp": int(check_in[i])})
+        if check_out[i] < end_ms:
+            events.append({"type": "check_out", "plate": plate, "timestamp": int(check_out[i])})
+    events.sort(key=lambda event: event["timestamp"]) # Las estancias duran al menos un minuto: la entrada siempre va antes
+    return events
+
+
+def events_from_history(manager: ParkingManager, start_ms: Optional[int] = None,
+                        end_ms: Optional[int] = None) -> list[dict]:
+    """Reconstruye las entradas y salidas de las estancias del historial con salida en [start_ms, end_ms),
+    ordenadas por hora, para reproducir el tráfico real de un periodo."""
+    events = []
+    for plate, vehicle_type_name, check_in_time, check_out_time, _, _ in manager.iter_history_rows(start_ms, end_ms):
+        events.append({"type": "check_in", "plate": plate, "vehicle_type": vehicle_type_name,
+                       "timestamp": check_in_time})
+        events.append({"type": "check_out", "plate": plate, "timestamp": check_out_time})
+    events.sort(key=lambda event: (event["timestamp"], event["type"] == "check_out"))
+    return events
+
+
+def write_event_log(path: str, events: Iterable[dict]) -> int:
+    """Guarda los eventos en un registro JSON Lines (un evento por línea). Devuelve cuántos escribió."""
+    count = 0
+    with open(path, "w", encoding="utf-8") as log_file:
+        for event in events:
+            log_file.write(json.dumps(event, separators=(",", ":")) + "\n")
+            count += 1
+    return count
+
+
+def read_event_log(path: str) -> Iterator[dict]:
+    """Lee un registro JSON Lines de eventos sin cargarlo entero en memoria."""
+    with open(path, encoding="utf-8") as log_file:
+        for line in log_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+class ManagerTarget:
+    """Aplica los eventos directamente en un ParkingManager, como la API: cada evento por separado
+    con la hora actual o, con keep_timestamps, con su hora original.
+
+    Atributos:
+        manager ParkingManager | EventLogParkingManager: Gestor sobre el que se aplican los eventos
+        keep_timestamps bool: Conserva la hora original de cada evento"""
+
+    def __init__(self, manager: Union[ParkingManager, EventLogParkingManager], keep_timestamps: bool = False):
+        self.manager = manager
+        self.keep_timestamps = keep_timestamps
+
+    def send(self, event: dict) -> tuple[str, bool]:
+        """Aplica un evento y devuelve (código de resultado, éxito)."""
+        if not self.keep_timestamps:
+            event = dict(event, timestamp=int(time.time() * 1000))
+        try:
+            result = self.manager.process_gate_events([event])[0]
+        finally:
+            self.manager.release_connection() # Como al terminar cada petición en app.py
+        return result.status.value, result.ok
+
+
+class HttpTarget:
+    """Envía los eventos a la API HTTP de app.py: /api/v1/check_in y /api/v1/check_out (hora del
+    servidor) o, con keep_timestamps, /api/v1/events con la hora original.
+
+    Atributos:
+        url str: URL base del servidor, p. ej. http://localhost:5000
+        keep_timestamps bool: Conserva la hora original de cada evento
+        timeout float: Segundos de espera por petición"""
+
+    def __init__(self, url: str, keep_timestamps: bool = False, timeout: float = 30.0):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"URL no válida: {url}")
+        self.url = url
+        self.keep_timestamps = keep_timestamps
+        self.timeout = timeout
+        self._connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self._host = parts.hostname
+        self._port = parts.port
+        self._base_path = parts.path.rstrip("/")
+        self._local = threading.local() # Una conexión persistente (keep-alive) por hilo
+
+    def _post(self, path: str, body: str) -> tuple[http.client.HTTPResponse, bytes]:
+        conn = getattr(self._local, "conn", None)
+        reused = conn is not None
+        if conn is None:
+            conn = self._local.conn = self._connection_class(self._host, self._port, timeout=self.timeout)
+        try:
+            conn.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            data = response.read()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            self.close()
+            if not reused:
+                raise
+            # El servidor cerró la conexión inactiva antes de recibir la petición: se repite en una nueva
+            return self._post(path, body)
+        except (http.client.HTTPException, OSError):
+            self.close()
+            raise
+        if response.will_close:
+            self.close()
+        return response, data
+
+    def close(self):
+        """Cierra la conexión del hilo actual."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+
+    def send(self, event: dict) -> tuple[str, bool]:
+        if self.keep_timestamps:
+            path, body = "/api/v1/events", {"events": [event]}
+        elif event.get("type") == "check_in":
+            path, body = "/api/v1/check_in", {"plate": event.get("plate"), "vehicle_type": event.get("vehicle_type")}
+        else:
+            path, body = "/api/v1/check_out", {"plate": event.get("plate")}
+        response, data = self._post(self._base_path + path, json.dumps(body))
+        try:
+            payload = json.loads(data)
+            if self.keep_timestamps:
+                payload = payload["results"][0]
+            return payload["status"], bool(payload["ok"])
+        except (ValueError, KeyError, IndexError, TypeError):
+            return f"http_{response.status}", False
+
+
+def latency_summary(samples_ms: list[float]) -> dict:
+    """Número de muestras, media, percentiles 50/95/99 y máximo (ms)."""
+    if not samples_ms:
+        return {"count": 0}
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"count": len(samples_ms), "mean_ms": float(samples.mean()), "p50_ms": float(p50),
+            "p95_ms": float(p95), "p99_ms": float(p99), "max_ms": float(samples.max())}
+
+
+# Resultados que indican un fallo del sistema y no un rechazo de negocio (parking lleno, etc.)
+ERROR_STATUSES = {"error", "db_error", "unknown_vehicle_type"}
+
+
+def replay(events: Iterable[dict], target, speed: float = 1.0, workers: int = 4) -> dict:
+    """Reproduce los eventos contra `target` (ManagerTarget o HttpTarget) respetando los intervalos
+    entre sus horas divididos por `speed` (speed=60: una hora en un minuto; speed=0: sin esperas).
+
+    Los eventos se reparten entre `workers` hilos, que hacen de barreras concurrentes. Todos los
+    eventos de una matrícula van al mismo hilo, de modo que su entrada y su salida se envían en orden.
+    Devuelve el número de eventos, duración, eventos por segundo, latencias por operación, cuántas
+    veces se obtuvo cada resultado, errores y el retraso respecto al horario previsto (si el sistema
+    no da abasto, crece el retraso)."""
+    if workers < 1:
+        raise ValueError("Se necesita al menos un hilo.")
+    queues: list[queue.Queue] = [queue.Queue(maxsize=1000) for _ in range(workers)]
+    latencies: list[dict[str, list[float]]] = [{} for _ in range(workers)]
+    lags: list[list[float]] = [[] for _ in range(workers)]
+    statuses: list[Counter] = [Counter() for _ in range(workers)]
+    last_errors: list[Optional[str]] = [None] * workers
+
+    def work(worker: int):
+        while True:
+            item = queues[worker].get()
+            if item is None:
+                close = getattr(target, "close", None)
+                if close is not None: # HttpTarget: cierra la conexión de este hilo
+                    close()
+                return
+            event, due = item
+            start = time.perf_counter()
+            lags[worker].append(max(start - due, 0.0) * 1000)
+            try:
+                status, _ = target.send(event)
+            except Exception as e: # Un fallo de red o de la base de datos no detiene la reproducción
+                status = "error"
+                last_errors[worker] = f"{type(e).__name__}: {e}"
+            latencies[worker].setdefault(str(event.get("type")), []).append((time.perf_counter() - start) * 1000)
+            statuses[worker][status] += 1
+
+    threads = [threading.Thread(target=work, args=(worker,), daemon=True) for worker in range(workers)]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    first_timestamp = None
+    count = 0
+    try:
+        for event in events:
+            timestamp = event.get("timestamp", 0)
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            if speed > 0:
+                due = start + (timestamp - first_timestamp) / 1000 / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                due = time.perf_counter() # Sin horario: el retraso es solo el tiempo en cola
+            worker = zlib.crc32(str(event.get("plate")).encode()) % workers
+            queues[worker].put((event, due))
+            count += 1
+    finally:
+        for worker_queue in queues:
+            worker_queue.put(None)
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    by_operation: dict[str, list[float]] = {}
+    for worker_latencies in latencies:
+        for operation, samples in worker_latencies.items():
+            by_operation.setdefault(operation, []).extend(samples)
+    status_counts = sum(statuses, Counter())
+    return {
+        "events": count,
+        "elapsed_s": elapsed,
+        "events_per_s": count / elapsed if elapsed > 0 else 0.0,
+        "latency": {operation: latency_summary(samples) for operation, samples in sorted(by_operation.items())},
+        "statuses": dict(status_counts.most_common()),
+        "errors": sum(status_counts[status] for status in status_counts
+                      if status in ERROR_STATUSES or status.startswith("http_")),
+        "last_error": next((error for error in last_errors if error), None),
+        "lag": latency_summary([lag for worker_lags in lags for lag in worker_lags]),
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [f"{report['events']} eventos en {report['elapsed_s']:.1f} s ({report['events_per_s']:.1f} eventos/s), "
+             f"{report['errors']} errores."]
+    for operation, stats in report["latency"].items():
+        lines.append(f"  {operation:10} p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  "
+                     f"p99 {stats['p99_ms']:8.2f} ms  máx {stats['max_ms']:8.2f} ms")
+    if report["lag"]["count"]:
+        lines.append(f"  retraso    p95 {report['lag']['p95_ms']:8.2f} ms  máx {report['lag']['max_ms']:8.2f} ms")
+    lines.append("  resultados: " + ", ".join(f"{status} {count}" for status, count in report["statuses"].items()))
+    if report["last_error"]:
+        lines.append(f"  último error: {report['last_error']}")
+    return "\n".join(lines)
+
+
+def _parse_start(value: Optional[str]) -> int:
+    if not value:
+        return int(datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp() * 1000)
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Genera y reproduce tráfico de barreras contra el parking.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="Genera un registro de eventos sintético")
+    generate.add_argument("output", help="Registro de eventos a escribir (JSON Lines)")
+    generate.add_argument("--profile", default="laborable",
+                          help=f"Perfil de tráfico ({', '.join(PROFILES)}) o archivo JSON con uno propio")
+    generate.add_argument("--start", help="Inicio (AAAA-MM-DD o AAAA-MM-DDTHH:MM, hora local; por defecto, hoy a las 0 h)")
+    generate.add_argument("--hours", type=float, default=24, help="Horas de tráfico a generar")
+    generate.add_argument("--scale", type=float, default=1.0, help="Multiplicador de las llegadas del perfil")
+    generate.add_argument("--seed", type=int, default=0)
+    generate.add_argument("--first-plate", type=int, default=0, help="Índice de la primera matrícula generada")
+
+    record = commands.add_parser("record", help="Extrae un registro de eventos del historial de una base de datos")
+    record.add_argument("output", help="Registro de eventos a escribir (JSON Lines)")
+    record.add_argument("--db", default="parking_system.db", help="Base de datos del parking")
+    record.add_argument("--start", help="Inicio del periodo (hora local)")
+    record.add_argument("--end", help="Fin del periodo (hora local, excluido)")
+
+    replay_parser = commands.add_parser("replay", help="Reproduce un registro de eventos")
+    replay_parser.add_argument("log", help="Registro de eventos (JSON Lines)")
+    target = replay_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Servidor de app.py, p. ej. http://localhost:5000")
+    target.add_argument("--db", help="Base de datos sobre la que aplicar los eventos con ParkingManager")
+    target.add_argument("--event-log", help="Directorio de un registro de eventos (EventLogParkingManager) sobre el que aplicarlos")
+    replay_parser.add_argument("--capacity", type=int, default=10, help="Capacidad del parking (con --db o --event-log)")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="Factor de velocidad (0: sin esperas)")
+    replay_parser.add_argument("--workers", type=int, default=4, help="Barreras concurrentes")
+    replay_parser.add_argument("--keep-timestamps", action="store_true",
+                               help="Envía la hora original de cada evento (por /api/v1/events) en lugar de la actual")
+    replay_parser.add_argument("--json", dest="json_output", help="Guarda también el informe en este archivo JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        try:
+            profile = PROFILES[args.profile] if args.profile in PROFILES else load_profile(args.profile)
+            start_ms = _parse_start(args.start)
+        except (OSError, ValueError, TypeError) as e:
+            parser.error(str(e))
+        count = write_event_log(args.output, generate_events(profile, start_ms, args.hours, args.scale,
+                                                             args.seed, args.first_plate))
+        print(f"{count} eventos guardados en {args.output}.")
+    elif args.command == "record":
+        try:
+            start_ms = _parse_start(args.start) if args.start else None
+            end_ms = _parse_start(args.end) if args.end else None
+        except ValueError as e:
+            parser.error(str(e))
+        manager = ParkingManager(db_name=args.db, capacity=0)
+        try:
+            count = write_event_log(args.output, events_from_history(manager, start_ms, end_ms))
+        finally:
+            manager.close_db()
+        print(f"{count} eventos guardados en {args.output}.")
+    else:
+        manager = None
+        if args.url:
+            replay_target = HttpTarget(args.url, args.keep_timestamps)
+        elif args.event_log:
+            manager = EventLogParkingManager(args.event_log, capacity=args.capacity)
+            replay_target = ManagerTarget(manager, args.keep_timestamps)
+        else:
+            manager = ParkingManager(db_name=args.db, capacity=args.capacity, pool_size=args.workers)
+            replay_target = ManagerTarget(manager, args.keep_timestamps)
+        try:
+            report = replay(read_event_log(args.log), replay_target, args.speed, args.workers)
+        finally:
+            if manager is not None:
+                manager.close_db()
+        print(format_report(report))
+        if args.json_output:
+            with open(args.json_output, "w", encoding="utf-8") as report_file:
+                json.dump(report, report_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import time
+from datetime import date, datetime
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+ONE_MINUTE_MS = 60 * 1000
+ONE_HOUR_MS = 60 * ONE_MINUTE_MS
+ONE_DAY_MS = 24 * ONE_HOUR_MS
+EPOCH = date(1970, 1, 1)
+
+
+class LocalClock:
+    """Conversión entre instantes (ms desde la época) y hora local, para las franjas de las tarifas y
+    los días de ocupación.
+
+    Con utc_offset_minutes el desfase es fijo. Si no, se calcula para cada instante con la zona
+    horaria indicada (nombre IANA, p. ej. "Europe/Madrid") o con la del sistema, la misma que usa
+    SQLite con 'localtime' en los informes, de modo que se aplican los cambios de horario de verano.
+
+    Atributos:
+        utc_offset_minutes Optional[int]: Desfase fijo de la hora local respecto a UTC
+        timezone Optional[str]: Zona horaria (por defecto, la del sistema)"""
+
+    def __init__(self, utc_offset_minutes: Optional[int] = None, timezone: Optional[str] = None):
+        self.utc_offset_minutes = utc_offset_minutes
+        self.timezone = timezone
+        self._zone = ZoneInfo(timezone) if timezone else None
+
+    @property
+    def fixed(self) -> bool:
+        return self.utc_offset_minutes is not None
+
+    def offset_at(self, ms: int) -> int:
+        """Desfase (minutos) de la hora local respecto a UTC en un instante."""
+        if self.utc_offset_minutes is not None:
+            return self.utc_offset_minutes
+        seconds = int(ms) // 1000
+        if self._zone is None:
+            return time.localtime(seconds).tm_gmtoff // 60
+        return int(datetime.fromtimestamp(seconds, self._zone).utcoffset().total_seconds()) // 60
+
+    def offsets(self, ms_values) -> np.ndarray:
+        """Desfase de cada instante de un array. Se consulta la zona horaria una vez por cada hora
+        distinta del lote; solo en las horas en que cambia el desfase se consulta cada instante."""
+        values = np.asarray(ms_values, dtype=np.int64)
+        if self.utc_offset_minutes is not None or len(values) == 0:
+            return np.full(values.shape, self.utc_offset_minutes or 0, dtype=np.int64)
+        hours, inverse = np.unique(values // ONE_HOUR_MS, return_inverse=True)
+        inverse = inverse.reshape(values.shape)
+        first = np.array([self.offset_at(h * ONE_HOUR_MS) for h in hours.tolist()], dtype=np.int64)
+        last = np.array([self.offset_at((h + 1) * ONE_HOUR_MS - 1) for h in hours.tolist()], dtype=np.int64)
+        result = first[inverse]
+        for i in np.flatnonzero((first != last)[inverse]):
+            result.flat[i] = self.offset_at(int(values.flat[i]))
+        return result
+
+    def local_date(self, ms: int) -> date:
+        """Día local de un instante."""
+        local_ms = int(ms) + self.offset_at(ms) * ONE_MINUTE_MS
+        return date.fromordinal(EPOCH.toordinal() + local_ms // ONE_DAY_MS)
+
+    def local_hour(self, ms: int) -> int:
+        """Hora local (0-23) de un instante."""
+        return (int(ms) + self.offset_at(ms) * ONE_MINUTE_MS) % ONE_DAY_MS // ONE_HOUR_MS
+
+    def midnight_ms(self, day: date) -> int:
+        """Instante en que empieza un día local."""
+        if self.utc_offset_minutes is not None:
+            return (day - EPOCH).days * ONE_DAY_MS - self.utc_offset_minutes * ONE_MINUTE_MS
+        # Con tzinfo None, datetime interpreta la fecha en la zona del sistema
+        return int(datetime(day.year, day.month, day.day, tzinfo=self._zone).timestamp()) * 1000
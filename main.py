@@ -1,5 +1,7 @@
+import os
 from typing import Optional
 from parking_manager import ParkingManager
+from result_messages import format_result
 from vehicle import VehicleType
 from plate_recognizer import recognize_plate_from_webcam_api as recognize_plate_from_webcam
 
@@ -56,7 +58,8 @@ def main():
 
             vehicle_type = ask_vehicle_type()
             if vehicle_type:
-                parking_manager.check_in_vehicle(plate, vehicle_type)
+                result = parking_manager.check_in_vehicle(plate, vehicle_type)
+                print(format_result(result, parking_manager.date_format_str))
             else:
                 print("Error: Tipo de vehículo no válido.")
 
@@ -66,7 +69,10 @@ def main():
             if not plate:
                 print("Error: La matrícula no puede estar vacía.")
                 continue
-            parking_manager.check_out_vehicle(plate)
+            result = parking_manager.check_out_vehicle(plate)
+            print(format_result(result, parking_manager.date_format_str))
+            if result.invoice:
+                print(f"Factura generada: {os.path.join(parking_manager.invoices_dir, result.invoice)}")
 
         elif choice == 3:
             parking_manager.get_current_vehicles()
@@ -96,7 +102,8 @@ def main():
 
             vehicle_type = ask_vehicle_type()
             if vehicle_type:
-                parking_manager.check_in_vehicle(plate, vehicle_type)
+                result = parking_manager.check_in_vehicle(plate, vehicle_type)
+                print(format_result(result, parking_manager.date_format_str))
             else:
                 print("Error: Tipo de vehículo no válido.")
         elif choice == 7:
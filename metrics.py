@@ -0,0 +1,199 @@
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Optional, Sequence
+
+# Límites (en segundos) de los buckets de los histogramas de latencia: de 0,1 ms a 10 s
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8" # Formato de exposición de texto de Prometheus
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _NoopTimer:
+    """Temporizador que no mide nada: es el que se usa con las métricas desactivadas."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_labels", "_start")
+
+    def __init__(self, histogram: "Histogram", labels: tuple):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start, *self._labels)
+        return False
+
+
+class Histogram:
+    """Histograma de valores (latencias en segundos) por combinación de etiquetas.
+
+    Atributos:
+        name str: Nombre de la métrica
+        documentation str: Descripción (línea HELP)
+        labelnames tuple[str]: Nombres de las etiquetas, en el orden en que se pasan sus valores
+        buckets tuple[float]: Límites superiores de los buckets, en orden creciente"""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self._registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # Por etiquetas: [cuenta de cada bucket (sin acumular, el último es +Inf), suma, número de observaciones]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        """Registra un valor con los valores de etiqueta dados (uno por cada nombre de labelnames).
+        No hace nada si el registro está desactivado."""
+        if not self._registry.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labels: str):
+        """Context manager que registra la duración del bloque en segundos. Con el registro desactivado
+        devuelve un temporizador vacío compartido, sin medir ni reservar memoria."""
+        if not self._registry.enabled:
+            return _NOOP_TIMER
+        return _Timer(self, labels)
+
+    def snapshot(self, *labels: str) -> Optional[dict]:
+        """Número de observaciones y suma de una combinación de etiquetas (None si no hay ninguna)."""
+        with self._lock:
+            series = self._series.get(labels)
+            return {"count": series[2], "sum": series[1]} if series else None
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items())
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                label_text = _format_labels((*self.labelnames, "le"), (*labels, _format_value(bound)))
+                lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Registro de métricas con exposición en el formato de texto de Prometheus.
+
+    Desactivado (el estado por defecto), Histogram.observe() y Histogram.time() vuelven nada más
+    comprobar `enabled`, por lo que la instrumentación puede quedarse en las rutas críticas.
+
+    Atributos:
+        enabled bool: Si se registran observaciones"""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._histograms: dict[str, Histogram] = {}
+        self._gauges: dict[str, tuple[str, Callable[[], float]]] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Devuelve el histograma `name`, creándolo si no existe."""
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(self, name, documentation, labelnames, buckets)
+            return self._histograms[name]
+
+    def gauge_function(self, name: str, documentation: str, function: Callable[[], float]):
+        """Registra (o sustituye) un gauge cuyo valor se obtiene llamando a `function` al exponer las métricas."""
+        with self._lock:
+            self._gauges[name] = (documentation, function)
+
+    def clear(self):
+        """Borra las observaciones de todos los histogramas (los gauges se mantienen)."""
+        for histogram in list(self._histograms.values()):
+            histogram.clear()
+
+    def expose(self) -> str:
+        """Devuelve todas las métricas en el formato de exposición de texto."""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            gauges = sorted(self._gauges.items())
+        for _, histogram in histograms:
+            lines += histogram.expose()
+        for name, (documentation, function) in gauges:
+            try:
+                value = function()
+            except Exception: # Un gauge que falla no debe impedir exponer el resto
+                continue
+            if value is None:
+                continue
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {_format_value(value)}"]
+        return "\n".join(lines) + "\n"
+
+
+# Registro global que usan app.py, ParkingManager y PlateRecognizerClient
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "parking_http_request_duration_seconds",
+    "Tiempo de respuesta de cada ruta de app.py hasta devolver la respuesta (sin el cuerpo en streaming).",
+    ("route", "method", "status"))
+SQL_STATEMENT_SECONDS = REGISTRY.histogram(
+    "parking_sql_statement_duration_seconds",
+    "Tiempo de cada clase de sentencia SQL de ParkingManager.",
+    ("statement",))
+PDF_RENDER_SECONDS = REGISTRY.histogram(
+    "parking_invoice_render_duration_seconds",
+    "Tiempo de generar y escribir el PDF de una factura.",
+    ("result",))
+PLATE_API_SECONDS = REGISTRY.histogram(
+    "parking_plate_api_request_duration_seconds",
+    "Tiempo de ida y vuelta de las peticiones a la API de reconocimiento de matrículas (con reintentos).",
+    ("status",))
+EVENT_LOG_SECONDS = REGISTRY.histogram(
+    "parking_event_log_operation_duration_seconds",
+    "Tiempo de las operaciones del registro de eventos de EventLogParkingManager (escritura, fsync, snapshot, recuperación).",
+    ("operation",))
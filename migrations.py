@@ -0,0 +1,135 @@
+import sqlite3
+import time
+from typing import Callable, Sequence, Tuple, Union
+
+# Un paso de migración es una sentencia SQL o una función que recibe la conexión
+MigrationStep = Union[str, Callable[[sqlite3.Connection], None]]
+Migration = Tuple[int, str, Sequence[MigrationStep]]
+
+# Migraciones en orden. Nunca se modifica una migración ya publicada: los cambios de esquema
+# se añaden siempre como una migración nueva al final de la lista.
+MIGRATIONS: list[Migration] = [
+    (1, "Tablas iniciales de vehículos aparcados e historial", [
+        """CREATE TABLE IF NOT EXISTS parked_vehicles (
+            plate TEXT PRIMARY KEY,
+            vehicle_type_name TEXT NOT NULL,
+            check_in_time INTEGER NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS vehicle_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plate TEXT NOT NULL,
+            vehicle_type_name TEXT NOT NULL,
+            check_in_time INTEGER NOT NULL,
+            check_out_time INTEGER NOT NULL,
+            duration_minutes INTEGER NOT NULL,
+            fee REAL NOT NULL
+        )""",
+    ]),
+    (2, "Cola de facturas e índice de paginación del historial", [
+        """CREATE TABLE IF NOT EXISTS invoice_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL,
+            plate TEXT NOT NULL,
+            vehicle_type_name TEXT NOT NULL,
+            check_in_time INTEGER NOT NULL,
+            check_out_time INTEGER NOT NULL,
+            duration_minutes INTEGER NOT NULL,
+            fee REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_at INTEGER NOT NULL,
+            render_ms REAL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_invoice_jobs_status ON invoice_jobs(status)",
+        "CREATE INDEX IF NOT EXISTS idx_invoice_jobs_filename ON invoice_jobs(filename)",
+        # También sirve para los informes por rango de fechas de salida: un índice solo sobre
+        # check_out_time sería redundante con este y encarecería cada inserción.
+        "CREATE INDEX IF NOT EXISTS idx_vehicle_history_checkout ON vehicle_history(check_out_time, id)",
+    ]),
+    (3, "Índice del historial por matrícula y hora de salida", [
+        "CREATE INDEX IF NOT EXISTS idx_vehicle_history_plate ON vehicle_history(plate, check_out_time)",
+    ]),
+    (4, "Agregados diarios y horarios de salidas por tipo de vehículo", [
+        """CREATE TABLE IF NOT EXISTS daily_rollup (
+            day TEXT NOT NULL,
+            vehicle_type_name TEXT NOT NULL,
+            visits INTEGER NOT NULL,
+            revenue REAL NOT NULL,
+            total_duration_minutes INTEGER NOT NULL,
+            PRIMARY KEY (day, vehicle_type_name)
+        )""",
+        """CREATE TABLE IF NOT EXISTS hourly_rollup (
+            hour TEXT NOT NULL,
+            vehicle_type_name TEXT NOT NULL,
+            visits INTEGER NOT NULL,
+            revenue REAL NOT NULL,
+            total_duration_minutes INTEGER NOT NULL,
+            PRIMARY KEY (hour, vehicle_type_name)
+        )""",
+        # Se rellenan con el historial existente; a partir de aquí cada salida los actualiza (ver reports.py)
+        """INSERT INTO daily_rollup (day, vehicle_type_name, visits, revenue, total_duration_minutes)
+           SELECT strftime('%Y-%m-%d', check_out_time / 1000, 'unixepoch', 'localtime') AS day,
+                  vehicle_type_name, COUNT(*), SUM(fee), SUM(duration_minutes)
+           FROM vehicle_history GROUP BY day, vehicle_type_name""",
+        """INSERT INTO hourly_rollup (hour, vehicle_type_name, visits, revenue, total_duration_minutes)
+           SELECT strftime('%Y-%m-%d %H', check_out_time / 1000, 'unixepoch', 'localtime') AS hour,
+                  vehicle_type_name, COUNT(*), SUM(fee), SUM(duration_minutes)
+           FROM vehicle_history GROUP BY hour, vehicle_type_name""",
+    ]),
+    (5, "Tarifa aplicada en cada estancia del historial y en la cola de facturas", [
+        # Resumen de la tarifa con la que se cobró (TariffRule.describe), para volver a generar las
+        # facturas tal como se emitieron aunque después cambie TARIFF_CONFIG. NULL en las estancias anteriores.
+        "ALTER TABLE vehicle_history ADD COLUMN tariff TEXT",
+        "ALTER TABLE invoice_jobs ADD COLUMN tariff TEXT",
+    ]),
+]
+
+
+def _ensure_version_table(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at INTEGER NOT NULL
+        )
+    """)
+    conn.commit()
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Devuelve la versión de esquema de la base de datos (0 si no se ha aplicado ninguna migración)."""
+    _ensure_version_table(conn)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def apply_migrations(conn: sqlite3.Connection, migrations: Sequence[Migration] = MIGRATIONS) -> list[int]:
+    """Aplica en orden las migraciones pendientes. Cada migración se ejecuta en su propia transacción
+    junto con el registro de su versión, de modo que un fallo no deja el esquema a medias.
+    Devuelve la lista de versiones aplicadas."""
+    current_version = get_schema_version(conn)
+    applied = []
+    for version, description, steps in sorted(migrations, key=lambda m: m[0]):
+        if version <= current_version:
+            continue
+        if conn.in_transaction:
+            conn.commit()
+        # BEGIN IMMEDIATE toma el bloqueo de escritura: si otro proceso está migrando, se espera
+        # y después se vuelve a comprobar la versión dentro de la transacción.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            current = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+            if version <= current:
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                         (version, description, int(time.time() * 1000)))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
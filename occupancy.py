@@ -0,0 +1,225 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from local_time import LocalClock, ONE_DAY_MS, ONE_HOUR_MS, ONE_MINUTE_MS
+
+DEFAULT_PERCENTILES = (50, 90, 95)
+
+
+def sweep(check_in_times, check_out_times) -> Tuple[np.ndarray, np.ndarray]:
+    """Barrido de eventos: convierte estancias [entrada, salida) en los instantes en que cambia la
+    ocupación y el cambio neto en cada uno (+1 por entrada, -1 por salida), ordenados por hora.
+    Una entrada y una salida en el mismo instante se compensan, así que no inflan los picos."""
+    check_in = np.asarray(check_in_times, dtype=np.int64)
+    check_out = np.asarray(check_out_times, dtype=np.int64)
+    times = np.concatenate([check_in, check_out])
+    deltas = np.concatenate([np.ones(len(check_in), dtype=np.int64), -np.ones(len(check_out), dtype=np.int64)])
+    return _merge_events(times, deltas)
+
+
+def _merge_events(times: np.ndarray, deltas: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Ordena los eventos y suma los cambios de un mismo instante (O(n log n))."""
+    if len(times) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    unique_times, inverse = np.unique(times, return_inverse=True)
+    merged = np.bincount(inverse.reshape(-1), weights=deltas, minlength=len(unique_times)).astype(np.int64)
+    keep = merged != 0
+    return unique_times[keep], merged[keep]
+
+
+class OccupancyCurve:
+    """Ocupación en función del tiempo, como función escalonada: a partir de times[i] (incluido) la
+    ocupación es levels[i]; antes del primer instante es 0.
+
+    Atributos:
+        times np.ndarray: Instantes de cambio (ms desde la época), ordenados
+        levels np.ndarray: Ocupación desde cada instante hasta el siguiente"""
+
+    def __init__(self, times: np.ndarray, deltas: np.ndarray):
+        self.times = times
+        self.levels = np.cumsum(deltas)
+        # area[i] = integral de la ocupación (vehículos x ms) desde times[0] hasta times[i]
+        self._area = np.concatenate([[0], np.cumsum(self.levels[:-1] * np.diff(self.times))]).astype(np.int64)
+
+    def _index(self, query_times: np.ndarray) -> np.ndarray:
+        return np.searchsorted(self.times, query_times, side="right") - 1
+
+    def level_at(self, query_times) -> np.ndarray:
+        """Ocupación en cada instante indicado."""
+        query = np.asarray(query_times, dtype=np.int64)
+        if len(self.times) == 0:
+            return np.zeros(query.shape, dtype=np.int64)
+        index = self._index(query)
+        return np.where(index >= 0, self.levels[np.maximum(index, 0)], 0)
+
+    def area_until(self, query_times) -> np.ndarray:
+        """Integral de la ocupación (vehículos x ms) desde el primer evento hasta cada instante."""
+        query = np.asarray(query_times, dtype=np.int64)
+        if len(self.times) == 0:
+            return np.zeros(query.shape, dtype=np.int64)
+        index = self._index(query)
+        safe = np.maximum(index, 0)
+        area = self._area[safe] + self.levels[safe] * (query - self.times[safe])
+        return np.where(index >= 0, area, 0)
+
+    def bucket_stats(self, edges) -> Tuple[np.ndarray, np.ndarray]:
+        """Pico y media (ponderada por tiempo) de la ocupación en cada intervalo [edges[j], edges[j+1])."""
+        edges = np.asarray(edges, dtype=np.int64)
+        peaks = self.level_at(edges[:-1])
+        if len(self.times):
+            buckets = np.searchsorted(edges, self.times, side="right") - 1
+            inside = (buckets >= 0) & (buckets < len(edges) - 1)
+            np.maximum.at(peaks, buckets[inside], self.levels[inside])
+        areas = self.area_until(edges)
+        averages = np.diff(areas) / np.diff(edges)
+        return peaks, averages
+
+
+class OccupancyEngine:
+    """Calcula curvas de ocupación y picos por día y tipo de vehículo a partir de las estancias del
+    historial y de los vehículos aparcados, con un barrido de eventos vectorizado en NumPy.
+
+    Es incremental: update_from_db() solo lee las filas del historial con id posterior a
+    last_history_id y las funde con los eventos ya acumulados. Los días y las horas se cuentan en
+    hora local, con los cambios de horario de verano, como en TariffEngine y en los informes: los
+    días del cambio tienen 23 o 25 horas.
+
+    Atributos:
+        utc_offset_minutes Optional[int]: Desfase fijo de la hora local respecto a UTC para los días
+        timezone Optional[str]: Zona horaria si no hay desfase fijo (por defecto, la del sistema)
+        last_history_id int: Id de la última fila de vehicle_history incorporada"""
+
+    def __init__(self, utc_offset_minutes: Optional[int] = None, timezone: Optional[str] = None):
+        self.utc_offset_minutes = utc_offset_minutes
+        self.timezone = timezone
+        self.clock = LocalClock(utc_offset_minutes, timezone)
+        self.last_history_id = 0
+        self._closed: dict[str, Tuple[np.ndarray, np.ndarray]] = {} # Eventos de estancias cerradas por tipo
+        self._open: dict[str, Tuple[np.ndarray, np.ndarray]] = {}   # Eventos de los vehículos aparcados
+        self._lock = threading.Lock()
+
+    @property
+    def vehicle_type_names(self) -> list[str]:
+        with self._lock:
+            return sorted(set(self._closed) | set(self._open))
+
+    @staticmethod
+    def _events_by_type(type_names: Sequence[str], check_ins, check_outs) -> dict[str, Tuple[np.ndarray, np.ndarray]]:
+        names = np.asarray(type_names, dtype=str)
+        check_ins = np.asarray(check_ins, dtype=np.int64)
+        check_outs = np.asarray(check_outs, dtype=np.int64)
+        return {str(name): sweep(check_ins[names == name], check_outs[names == name]) for name in np.unique(names)}
+
+    def add_stays(self, type_names: Sequence[str], check_ins, check_outs):
+        """Incorpora estancias cerradas (horas en ms desde la época)."""
+        if len(type_names) == 0:
+            return
+        new_events = self._events_by_type(type_names, check_ins, check_outs)
+        with self._lock:
+            for name, (times, deltas) in new_events.items():
+                old_times, old_deltas = self._closed.get(name, (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)))
+                self._closed[name] = _merge_events(np.concatenate([old_times, times]), np.concatenate([old_deltas, deltas]))
+
+    def set_open_stays(self, type_names: Sequence[str], check_ins, now_ms: int):
+        """Sustituye los vehículos aparcados, que cuentan como ocupación hasta now_ms."""
+        events = self._events_by_type(type_names, check_ins, np.full(len(type_names), now_ms, dtype=np.int64))
+        with self._lock:
+            self._open = events
+
+    def update_from_db(self, conn: sqlite3.Connection, now_ms: Optional[int] = None, batch_size: int = 10000) -> int:
+        """Incorpora las estancias cerradas desde la última llamada y los vehículos aparcados ahora.
+        Devuelve el número de estancias nuevas."""
+        cursor = conn.cursor()
+        added = 0
+        try:
+            cursor.execute(
+                """SELECT id, vehicle_type_name, check_in_time, check_out_time FROM vehicle_history
+                   WHERE id > ? ORDER BY id""", (self.last_history_id,)
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                ids, type_names, check_ins, check_outs = zip(*rows)
+                self.add_stays(type_names, check_ins, check_outs)
+                self.last_history_id = ids[-1]
+                added += len(rows)
+            parked = cursor.execute("SELECT vehicle_type_name, check_in_time FROM parked_vehicles").fetchall()
+        finally:
+            cursor.close()
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        type_names, check_ins = zip(*parked) if parked else ((), ())
+        self.set_open_stays(type_names, check_ins, now_ms)
+        return added
+
+    def curve(self, vehicle_type_name: Optional[str] = None) -> OccupancyCurve:
+        """Curva de ocupación de un tipo de vehículo, o de todo el parking si es None."""
+        with self._lock:
+            sources = [self._closed, self._open]
+            names = [vehicle_type_name] if vehicle_type_name is not None else set(self._closed) | set(self._open)
+            parts = [source[name] for source in sources for name in names if name in source]
+        if not parts:
+            return OccupancyCurve(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        times, deltas = _merge_events(np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts]))
+        return OccupancyCurve(times, deltas)
+
+    def _day_edges(self, start_day: str, days: int) -> np.ndarray:
+        """Inicio de cada uno de los days días locales desde start_day, más el final del último."""
+        first = datetime.strptime(start_day, "%Y-%m-%d").date()
+        return np.array([self.clock.midnight_ms(first + timedelta(days=i)) for i in range(days + 1)], dtype=np.int64)
+
+    @staticmethod
+    def _hour_edges(start_ms: int, end_ms: int) -> np.ndarray:
+        return np.arange(start_ms, end_ms + 1, ONE_HOUR_MS, dtype=np.int64)
+
+    def hourly(self, day: str, vehicle_type_name: Optional[str] = None) -> list[dict]:
+        """Pico y media de ocupación de cada hora de un día (AAAA-MM-DD). Los días de cambio de
+        horario devuelven 23 o 25 horas; "hour" es la hora local de inicio de cada una."""
+        start_ms, end_ms = self._day_edges(day, 1)
+        edges = self._hour_edges(start_ms, end_ms)
+        peaks, averages = self.curve(vehicle_type_name).bucket_stats(edges)
+        return [{"hour": self.clock.local_hour(int(edges[i])), "peak": int(peaks[i]), "average": float(averages[i])}
+                for i in range(len(edges) - 1)]
+
+    def daily_stats(self, start_day: str, end_day: str, percentiles: Iterable[float] = DEFAULT_PERCENTILES,
+                    by_type: bool = True) -> list[dict]:
+        """Pico, media, hora del pico y percentiles de ocupación de cada día entre start_day y end_day
+        (AAAA-MM-DD, ambos incluidos), para todo el parking y, con by_type, por tipo de vehículo.
+        Los percentiles se calculan sobre la ocupación de cada minuto del día (ponderados por tiempo)."""
+        percentiles = list(percentiles)
+        days = (datetime.strptime(end_day, "%Y-%m-%d") - datetime.strptime(start_day, "%Y-%m-%d")).days + 1
+        if days <= 0:
+            return []
+        edges = self._day_edges(start_day, days)
+        hour_edges = self._hour_edges(int(edges[0]), int(edges[-1]))
+        minutes = np.arange(edges[0], edges[-1], ONE_MINUTE_MS, dtype=np.int64)
+        hour_splits = (edges[1:-1] - edges[0]) // ONE_HOUR_MS   # Los días no tienen siempre 24 horas
+        minute_splits = (edges[1:-1] - edges[0]) // ONE_MINUTE_MS
+
+        names: list[Optional[str]] = [None] + (self.vehicle_type_names if by_type else [])
+        stats = []
+        for name in names:
+            curve = self.curve(name)
+            peaks, averages = curve.bucket_stats(edges)
+            hour_peaks, _ = curve.bucket_stats(hour_edges)
+            day_hour_peaks = np.split(hour_peaks, hour_splits)
+            day_samples = np.split(curve.level_at(minutes), minute_splits)
+            values = np.array([np.percentile(samples, percentiles) for samples in day_samples]).reshape(days, -1).T
+            for i in range(days):
+                peak_edge = int(edges[i]) + int(np.argmax(day_hour_peaks[i])) * ONE_HOUR_MS
+                day_stats = {
+                    "day": self.clock.local_date(int(edges[i])).isoformat(),
+                    "vehicle_type_name": name,
+                    "peak": int(peaks[i]),
+                    "peak_hour": self.clock.local_hour(peak_edge),
+                    "average": float(averages[i]),
+                }
+                for p, value in zip(percentiles, values[:, i]):
+                    day_stats[f"p{p:g}"] = float(value)
+                stats.append(day_stats)
+        return stats
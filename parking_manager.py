@@ -1,49 +1,182 @@
 import time
 from datetime import datetime
+import contextlib
 import csv
-from typing import Optional, Tuple
+import io
+import itertools
+import numpy as np
+from typing import Iterator, Optional, Tuple
 import sqlite3
+import threading
 from fpdf import FPDF
 import os
-from vehicle import Vehicle, VehicleType
+from db_pool import SQLiteConnectionPool
+from event_bus import EventBus
+from invoice_queue import InvoiceQueue
+from invoice_template import DEFAULT_ISSUER, EURO_SYMBOL, get_invoice_template, invoice_values
+import metrics
+from metrics import SQL_STATEMENT_SECONDS
+from migrations import apply_migrations
+from occupancy import OccupancyEngine
+import reports
+import tracing
+from tracing import traced
+from tariffs import TariffEngine
+from parking_results import ParkingResult, ResultStatus
+from vehicle import Vehicle, VehicleBatch, VehicleType
+
+
+CSV_HEADERS = ["Matricula", "TipoVehiculo", "HoraEntrada", "HoraSalida", "DuracionMinutos", "CosteEuros"]
+CSV_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _sql_span(statement: str):
+    """Mide una clase de sentencia SQL en su histograma y, si se está trazando, como span "sql:<statement>"."""
+    return tracing.span("sql", SQL_STATEMENT_SECONDS, statement)
+
+
+def build_invoice_pdf(issuer: dict, vehicle: Vehicle, fee: float, check_in_dt: datetime, check_out_dt: datetime,
+                      duration_minutes: int, tariff: str) -> FPDF:
+    """Construye el documento de una factura con la plantilla precompilada para los datos del
+    establecimiento `issuer` (ver ParkingManager.invoice_issuer()). `tariff` es el resumen de la tarifa
+    aplicada (ver TariffRule.describe). Es una función de módulo para poder usarla desde procesos
+    trabajadores (ver invoice_export.py)."""
+    values = invoice_values(issuer, vehicle.plate, vehicle.type.name, tariff, fee,
+                            check_in_dt, check_out_dt, duration_minutes)
+    return get_invoice_template(issuer).render(values, pdf_class=FPDF)
+
+
+def write_invoice_pdf(issuer: dict, filepath: str, vehicle: Vehicle, fee: float, check_in_dt: datetime,
+                      check_out_dt: datetime, duration_minutes: int, tariff: str) -> bool:
+    """Genera la factura y la escribe en `filepath`. Devuelve False (tras mostrar el error) si no se pudo escribir."""
+    start = time.perf_counter()
+    with tracing.span("pdf.build"):
+        pdf = build_invoice_pdf(issuer, vehicle, fee, check_in_dt, check_out_dt, duration_minutes, tariff)
+    try:
+        with tracing.span("file.write_pdf"):
+            pdf.output(filepath, "F")
+        metrics.PDF_RENDER_SECONDS.observe(time.perf_counter() - start, "ok")
+        return True
+    except Exception as e:
+        metrics.PDF_RENDER_SECONDS.observe(time.perf_counter() - start, "error")
+        print(f"Error al generar el PDF de la factura {filepath}: {e}")
+        return False
+
+
+def validate_gate_events(events: list[dict]) -> Tuple[list[ParkingResult], list[tuple]]:
+    """Valida un lote de eventos de barrera (ver ParkingManager.process_gate_events). Devuelve un resultado
+    por evento, ya con el error en los inválidos, y los válidos como (timestamp, índice, evento) en el
+    orden en que deben aplicarse: por hora y, a igual hora, en el orden recibido."""
+    results: list[ParkingResult] = []
+    valid = []
+    for index, event in enumerate(events):
+        if not isinstance(event, dict):
+            event = {}
+        event_type = event.get("type")
+        plate = str(event.get("plate") or "").strip().upper()
+        timestamp = event.get("timestamp")
+        result = ParkingResult(ResultStatus.INVALID_EVENT, plate,
+                               event_type if event_type in ("check_in", "check_out") else None)
+        results.append(result)
+        if result.operation is None:
+            continue
+        if not plate:
+            result.status = ResultStatus.INVALID_PLATE
+        elif isinstance(timestamp, bool) or not isinstance(timestamp, (int, float)) or timestamp < 0:
+            result.status = ResultStatus.INVALID_TIMESTAMP
+        elif event_type == "check_in" and event.get("vehicle_type") not in VehicleType.__members__:
+            result.status = ResultStatus.INVALID_VEHICLE_TYPE
+            result.detail = str(event.get("vehicle_type"))
+        else:
+            valid.append((int(timestamp), index, event))
+    valid.sort(key=lambda item: (item[0], item[1]))
+    return results, valid
 
 
 class ParkingManager:
 
-    def __init__(self, db_name, capacity):
+    def __init__(self, db_name, capacity, pool_size: int = 0, busy_timeout: float = 5.0, invoice_workers: int = 0,
+                 tariffs: Optional[TariffEngine] = None):
+        """Con pool_size > 0 cada hilo usa su propia conexión de un pool acotado (modo WAL),
+        en lugar de compartir una única conexión y cursor entre todos los hilos.
+        Con invoice_workers > 0 las facturas se generan en segundo plano (requiere el modo pool).
+        `tariffs` es el motor de tarifas con el que se cobran las salidas (por defecto, la tarifa
+        plana por hora de cada VehicleType)."""
+        if invoice_workers > 0 and pool_size <= 0:
+            raise ValueError("La generación asíncrona de facturas requiere el modo pool (pool_size > 0).")
         self.db_name = db_name
-        self.conn = sqlite3.connect(self.db_name, check_same_thread=False)
-        self.cursor = self.conn.cursor()
+        self._local = threading.local()
+        self._pool: Optional[SQLiteConnectionPool] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._cursor: Optional[sqlite3.Cursor] = None
+        if pool_size > 0:
+            self._pool = SQLiteConnectionPool(self.db_name, max_connections=pool_size, busy_timeout=busy_timeout)
+        else:
+            self._conn = sqlite3.connect(self.db_name, timeout=busy_timeout, check_same_thread=False)
+            self._cursor = self._conn.cursor()
         self._create_tables()
-        self.date_format_str: str = "%d/%m/%Y %H:%M:%S"
-        self.parking_name: str = "Parking Central"
-        self.parking_address: str = "Cto Juan Pablo II 2457, La Hacienda, 72570 Heroica Puebla de Zaragoza, Pue., México"
-        self.parking_nif: str = "B12345678"
+        self.date_format_str: str = DEFAULT_ISSUER["date_format"]
+        # Datos que aparecen en las facturas (ver invoice_issuer())
+        self.parking_name: str = DEFAULT_ISSUER["name"]
+        self.parking_address: str = DEFAULT_ISSUER["address"]
+        self.parking_nif: str = DEFAULT_ISSUER["nif"]
+        self.invoice_customer: str = DEFAULT_ISSUER["customer"]
+        self.invoice_employee: str = DEFAULT_ISSUER["employee"]
         self.invoices_dir: str = "invoices"
         os.makedirs(self.invoices_dir, exist_ok=True)
         self.capacity = capacity
+        self.tariffs = tariffs if tariffs is not None else TariffEngine.default()
+        # Bus de eventos para avisar en tiempo real de entradas, salidas y cambios de ocupación
+        self.events = EventBus()
+        # Contador de ocupación en memoria: evita el COUNT(*) en cada consulta de capacidad
+        # y, junto con el lock, hace atómica la comprobación de capacidad + inserción.
+        self._occupancy_lock = threading.Lock()
+        self._occupancy = 0
+        self.refresh_occupancy()
+        # Motor de análisis de ocupación; se crea al primer uso y después solo lee las estancias nuevas
+        self._occupancy_engine: Optional[OccupancyEngine] = None
+        self._occupancy_engine_lock = threading.Lock()
+        self.invoice_queue: Optional[InvoiceQueue] = None
+        if invoice_workers > 0:
+            self.invoice_queue = InvoiceQueue(self._pool.connection, self._pool.release, # type: ignore
+                                              self._render_invoice_job, workers=invoice_workers)
+            self.invoice_queue.start()
+
+    @property
+    def conn(self) -> Optional[sqlite3.Connection]:
+        """Conexión a usar desde el hilo actual."""
+        if self._pool is not None:
+            return self._pool.connection()
+        return self._conn
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        """Cursor a usar desde el hilo actual. En modo pool cada hilo tiene el suyo."""
+        if self._pool is None:
+            return self._cursor # type: ignore
+        conn = self._pool.connection()
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None or cursor.connection is not conn:
+            cursor = conn.cursor()
+            self._local.cursor = cursor
+        return cursor
+
+    def _acquire_connection(self):
+        """Obtiene del pool la conexión del hilo actual (sin pool no hace nada). Se llama antes de tomar
+        el lock de ocupación: si se esperase por una conexión con el lock tomado, los hilos que ya
+        tienen conexión quedarían bloqueados en el lock y no la liberarían."""
+        if self._pool is not None:
+            self._pool.connection()
+
+    def release_connection(self):
+        """Devuelve al pool la conexión del hilo actual. No hace nada sin pool."""
+        if self._pool is not None:
+            self._local.cursor = None
+            self._pool.release()
 
     def _create_tables(self):
-        """Crea las tablas de la base de datos si no existen."""
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS parked_vehicles (
-                plate TEXT PRIMARY KEY,
-                vehicle_type_name TEXT NOT NULL,
-                check_in_time INTEGER NOT NULL
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS vehicle_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                plate TEXT NOT NULL,
-                vehicle_type_name TEXT NOT NULL,
-                check_in_time INTEGER NOT NULL,
-                check_out_time INTEGER NOT NULL,
-                duration_minutes INTEGER NOT NULL,
-                fee REAL NOT NULL
-            )
-        """)
-        self.conn.commit()
+        """Crea o actualiza el esquema de la base de datos aplicando las migraciones pendientes."""
+        apply_migrations(self.conn) # type: ignore
 
     def _vehicle_from_row(self, row: tuple, is_history: bool = False) -> Optional[Vehicle]:
         """Convierte una fila de la base de datos en un objeto Vehicle."""
@@ -58,140 +191,252 @@ class ParkingManager:
             print(f"Error: Tipo de vehículo desconocido '{vehicle_type_name}' en la base de datos para la matrícula {plate}.")
             return None
         
+    def refresh_occupancy(self) -> int:
+        """Sincroniza el contador de ocupación con la base de datos y lo devuelve."""
+        cursor = self.cursor # Se obtiene la conexión antes del lock (ver check_in_vehicle)
+        with self._occupancy_lock, _sql_span("count_parked"):
+            cursor.execute("SELECT COUNT(*) FROM parked_vehicles")
+            self._occupancy = cursor.fetchone()[0]
+        self.events.publish("occupancy", self.get_occupancy_snapshot())
+        return self._occupancy
+
     def check_capacity(self) -> bool:
         """Comprueba si hay espacio disponible en el parking."""
-        self.cursor.execute("SELECT COUNT(*) FROM parked_vehicles")
-        current_count = self.cursor.fetchone()[0]
-        return not current_count >= self.capacity
-
-    def check_in_vehicle(self, plate: str, vehicle_type: VehicleType) -> str:
-        """Registra la entrada de un vehículo."""
-        self.cursor.execute("SELECT plate FROM parked_vehicles WHERE plate = ?", (plate,))
-        if self.cursor.fetchone():
-            return f"Error: El vehículo con matrícula {plate} ya está en el parking."
-        
-        check_in_time_millis = int(time.time() * 1000)
-    
-        try:
-            self.cursor.execute(
-                "INSERT INTO parked_vehicles (plate, vehicle_type_name, check_in_time) VALUES (?, ?, ?)",
-                (plate, vehicle_type.name, check_in_time_millis)
+        return self._occupancy < self.capacity
+
+    @traced()
+    def check_in_vehicle(self, plate: str, vehicle_type: VehicleType) -> ParkingResult:
+        """Registra la entrada de un vehículo. La comprobación de capacidad y la inserción
+        se hacen de forma atómica, por lo que dos entradas simultáneas no pueden superar la capacidad."""
+        start = time.perf_counter()
+        self._acquire_connection()
+        with self._occupancy_lock:
+            try:
+                result = self._apply_check_in(plate, vehicle_type.name, int(time.time() * 1000), self._occupancy)
+                if result.ok:
+                    self._commit()
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                return ParkingResult(ResultStatus.DB_ERROR, plate, "check_in", detail=str(e))
+            if result.ok:
+                self._occupancy += 1
+        result.db_ms = (time.perf_counter() - start) * 1000
+        self._publish_results([result])
+        return result
+
+    def _commit(self):
+        """Hace commit de la transacción del hilo actual, midiendo su duración (escritura del WAL)."""
+        with _sql_span("commit"):
+            self.conn.commit() # type: ignore
+
+    def invoice_issuer(self) -> dict:
+        """Datos del establecimiento que aparecen en las facturas."""
+        return {"name": self.parking_name, "address": self.parking_address, "nif": self.parking_nif,
+                "customer": self.invoice_customer, "employee": self.invoice_employee,
+                "date_format": self.date_format_str}
+
+    def _generate_invoice_pdf(self, filepath: str, vehicle: Vehicle, fee: float, check_in_dt: datetime, check_out_dt: datetime,
+                              duration_minutes: int, tariff: Optional[str] = None) -> bool:
+        """ Genera la factura en PDF. `tariff` es el resumen de la tarifa aplicada (por defecto, la actual)."""
+        return write_invoice_pdf(self.invoice_issuer(), filepath, vehicle, fee, check_in_dt, check_out_dt, duration_minutes,
+                                 tariff if tariff is not None else self.tariffs.describe(vehicle.type.name, EURO_SYMBOL))
+
+    @traced()
+    def check_out_vehicle(self, plate: str) -> ParkingResult:
+        """Registra la salida de un vehículo, calcula coste y genera factura. El resultado incluye el
+        nombre de la factura si se generó correctamente (invoice_failed indica que no se pudo generar).
+        Con la cola de facturas activa, la factura se encola y se devuelve su nombre sin esperar a que se genere."""
+        start = time.perf_counter()
+        invoices: list = []
+        self._acquire_connection()
+        with self._shared_connection_lock():
+            try:
+                result = self._apply_check_out(plate, int(time.time() * 1000), invoices)
+                if result.ok:
+                    self._commit()
+                elif self.conn.in_transaction: # Solo se deshace si la salida llegó a escribir algo
+                    self.conn.rollback()
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                return ParkingResult(ResultStatus.DB_ERROR, plate, "check_out", detail=str(e))
+        result.db_ms = (time.perf_counter() - start) * 1000
+        if result.ok:
+            with self._occupancy_lock:
+                self._occupancy = max(self._occupancy - 1, 0)
+            self._finish_invoices(invoices)
+            self._publish_results([result])
+        return result
+
+    def _shared_connection_lock(self):
+        """Sin pool, todos los hilos comparten la conexión y su transacción: un commit o un rollback de
+        un hilo afectaría a una entrada a medias de otro. Las salidas toman entonces el lock de ocupación,
+        como las entradas. En modo pool cada hilo tiene su propia transacción y no hace falta."""
+        return self._occupancy_lock if self._pool is None else contextlib.nullcontext()
+
+    def _publish_results(self, results: list[ParkingResult]):
+        """Publica en el bus las entradas y salidas registradas y, si hubo alguna, la nueva ocupación."""
+        applied = [result for result in results if result.ok]
+        if not applied or not self.events.subscriber_count:
+            return
+        for result in applied:
+            self.events.publish(result.operation, result.to_dict()) # type: ignore
+        self.events.publish("occupancy", self.get_occupancy_snapshot())
+
+    @staticmethod
+    def _invoice_filename(plate: str, check_out_dt: datetime) -> str:
+        return f"factura_{plate}_{check_out_dt.strftime('%Y%m%d_%H%M%S')}.pdf"
+
+    @traced()
+    def _finish_invoices(self, invoices: list):
+        """Tras el commit, envía a la cola o genera en el momento las facturas de las salidas registradas.
+        Cada elemento es (id del trabajo en la cola o None, resultado de la salida)."""
+        for job_id, result in invoices:
+            if job_id is not None:
+                # La factura se genera en segundo plano; la ruta de descarga la genera al vuelo si aún no existe
+                self.invoice_queue.submit(job_id) # type: ignore
+                continue
+            vehicle_obj: Vehicle = result.vehicle
+            start = time.perf_counter()
+            generated = self._generate_invoice_pdf(
+                os.path.join(self.invoices_dir, result.invoice), vehicle_obj, result.fee,
+                datetime.fromtimestamp(vehicle_obj.check_in_time / 1000),
+                datetime.fromtimestamp(vehicle_obj.check_out_time / 1000), # type: ignore
+                result.duration_minutes
             )
-            self.conn.commit()
-            check_in_dt = datetime.fromtimestamp(check_in_time_millis / 1000)
-            return f"Vehículo {plate} ({vehicle_type.name}) registrado. Hora de entrada: {check_in_dt.strftime(self.date_format_str)}"
-        except sqlite3.Error as e:
-            return f"Error de base de datos al registrar entrada: {e}"
-
-    def _generate_invoice_pdf(self, filepath: str, vehicle: Vehicle, fee: float, check_in_dt: datetime, check_out_dt: datetime, duration_minutes: int) -> bool:
-        """ Genera la factura en PDF."""
-        pdf = FPDF()
-        pdf.add_page()
-        euro_symbol = chr(128) # Símbolo del Euro para FPDF
-        
-        # Encabezado de la Factura
-        pdf.set_font("Arial", "B", 16)
-        pdf.cell(0, 10, "FACTURA SIMPLIFICADA", 0, 1, "C")
-        pdf.ln(5)
-
-        # Información del Parking
-        pdf.set_font("Arial", "", 12)
-        pdf.cell(0, 6, f"Establecimiento: {self.parking_name}", 0, 1)
-        pdf.cell(0, 6, f"Dirección: {self.parking_address}", 0, 1)
-        pdf.cell(0, 6, f"NIF: {self.parking_nif}", 0, 1)
-        pdf.ln(5)
-
-        # Fecha de la Factura
-        pdf.set_font("Arial", "B", 10)
-        pdf.cell(0, 6, f"Fecha Factura: {check_out_dt.strftime(self.date_format_str)}", 0, 1)
-        pdf.ln(5)
-
-        # Detalles del Servicio
-        pdf.set_font("Arial", "B", 12)
-        pdf.cell(0, 6, "DETALLES DEL SERVICIO:", 0, 1)
-        pdf.set_font("Arial", "", 11)
-        pdf.cell(0, 6, "Cliente: José Luis Ábalos", 0, 1)
-        pdf.cell(0, 6, "Empleada: Jessica Rodríguez", 0, 1)
-        pdf.cell(0, 6, f"Vehículo Matrícula: {vehicle.plate}", 0, 1)
-        pdf.cell(0, 6, f"Tipo de Vehículo:   {vehicle.type.name}", 0, 1)
-        pdf.ln(3)
-        pdf.cell(0, 6, f"Hora de Entrada: {check_in_dt.strftime(self.date_format_str)}", 0, 1)
-        pdf.cell(0, 6, f"Hora de Salida:  {check_out_dt.strftime(self.date_format_str)}", 0, 1)
-        pdf.cell(0, 6, f"Duración Total:  {duration_minutes} minutos", 0, 1)
-        pdf.ln(5)
-
-        # Importe a Pagar
-        pdf.set_font("Arial", "B", 12)
-        pdf.cell(0, 6, "IMPORTE A PAGAR", 0, 1)
-        pdf.set_font("Arial", "", 11)
-        pdf.cell(0, 6, f"Tarifa Aplicada: {vehicle.type.hourly_rate:.2f} {euro_symbol}/hora", 0, 1)
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 8, f"TOTAL A PAGAR:   {euro_symbol}{fee:.2f}", 0, 1)
-        pdf.ln(10)
-
-        # Agradecimiento
-        pdf.set_font("Arial", "I", 10)
-        pdf.cell(0, 10, "Gracias por su visita.", 0, 1, "C")
-        
-        try:
-            pdf.output(filepath, "F")
-            return True
-        except Exception as e:
-            print(f"Error al generar el PDF de la factura {filepath}: {e}")
-            return False
+            result.invoice_ms = (time.perf_counter() - start) * 1000
+            if not generated:
+                result.invoice = None
+                result.invoice_failed = True
 
-    def check_out_vehicle(self, plate: str) -> Tuple[str, Optional[str]]:
-        """Registra la salida de un vehículo, calcula coste y genera factura. Devuelve el mensaje de exito o error, y el nombre del archivo de la factura si se generó correctamente."""
-        self.cursor.execute("SELECT plate, vehicle_type_name, check_in_time FROM parked_vehicles WHERE plate = ?", (plate,))
-        row = self.cursor.fetchone()
+    @traced()
+    def process_gate_events(self, events: list[dict]) -> list[ParkingResult]:
+        """Aplica en una sola transacción un lote de eventos de barrera (p. ej. los que una barrera
+        reenvía tras recuperar la conexión), usando la hora original de cada evento.
 
-        if not row:
-            return f"Error: El vehículo con matrícula {plate} no se encuentra en el parking.", None
-    
-        db_plate, db_vehicle_type_name, db_check_in_time = row
-        try:
-            vehicle_type_enum = VehicleType[db_vehicle_type_name]
-        except KeyError:
-            error_msg = f"Error: Tipo de vehículo desconocido '{db_vehicle_type_name}' para la matrícula {db_plate} al salir."
-            return error_msg, None
+        Cada evento es un diccionario con:
+            type str: "check_in" o "check_out"
+            plate str: Matrícula del vehículo
+            vehicle_type str: Nombre del tipo de vehículo (solo para "check_in")
+            timestamp int: Hora del evento en ms desde la época
+
+        Los eventos se aplican en orden de hora (a igual hora, en el orden recibido). Un evento inválido
+        se rechaza sin afectar al resto. Devuelve un resultado por evento, en el orden recibido."""
+        results, valid = validate_gate_events(events)
+
+        start = time.perf_counter()
+        invoices: list = []
+        self._acquire_connection()
+        with self._occupancy_lock:
+            occupancy = self._occupancy
+            try:
+                for timestamp, index, event in valid:
+                    plate = results[index].plate
+                    if event["type"] == "check_in":
+                        result = self._apply_check_in(plate, event["vehicle_type"], timestamp, occupancy)
+                        occupancy += result.ok
+                    else:
+                        result = self._apply_check_out(plate, timestamp, invoices)
+                        occupancy -= result.ok
+                    results[index] = result
+                self._commit()
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                for _, index, event in valid:
+                    results[index] = ParkingResult(ResultStatus.DB_ERROR, results[index].plate, event["type"],
+                                                   detail=str(e))
+                return results
+            self._occupancy = max(occupancy, 0)
+        db_ms = (time.perf_counter() - start) * 1000
+        for _, index, _ in valid:
+            results[index].db_ms = db_ms
 
-        current_check_out_time = int(time.time() * 1000)
-        vehicle_obj = Vehicle(db_plate, vehicle_type_enum, db_check_in_time, current_check_out_time)
-        duration_minutes = vehicle_obj.calculate_parking_duration_in_minutes()
-        fee = vehicle_obj.calculate_parking_fee()
+        self._finish_invoices(invoices)
+        self._publish_results(results)
+        return results
 
+    def _apply_check_in(self, plate: str, vehicle_type_name: str, timestamp: int, occupancy: int) -> ParkingResult:
+        """Inserta una entrada sin hacer commit. Debe llamarse con el lock de ocupación tomado."""
+        if occupancy >= self.capacity:
+            return ParkingResult(ResultStatus.FULL, plate, "check_in")
         try:
+            with _sql_span("insert_parked"):
+                self.cursor.execute(
+                    "INSERT INTO parked_vehicles (plate, vehicle_type_name, check_in_time) VALUES (?, ?, ?)",
+                    (plate, vehicle_type_name, timestamp)
+                )
+        except sqlite3.IntegrityError:
+            # SQLite deshace solo la sentencia fallida: el resto de la transacción sigue intacta
+            return ParkingResult(ResultStatus.ALREADY_PARKED, plate, "check_in")
+        return ParkingResult(ResultStatus.CHECKED_IN, plate, "check_in",
+                             vehicle=Vehicle(plate, VehicleType[vehicle_type_name], timestamp))
+
+    def _apply_check_out(self, plate: str, timestamp: int, invoices: list) -> ParkingResult:
+        """Registra una salida sin hacer commit y añade su factura pendiente a `invoices`."""
+        with _sql_span("select_parked"):
+            row = self.cursor.execute(
+                "SELECT vehicle_type_name, check_in_time FROM parked_vehicles WHERE plate = ?", (plate,)
+            ).fetchone()
+        if not row:
+            return ParkingResult(ResultStatus.NOT_FOUND, plate, "check_out")
+        vehicle_type_name, check_in_time = row
+        if vehicle_type_name not in VehicleType.__members__:
+            return ParkingResult(ResultStatus.UNKNOWN_VEHICLE_TYPE, plate, "check_out", detail=vehicle_type_name)
+        if timestamp < check_in_time:
+            return ParkingResult(ResultStatus.CHECK_OUT_BEFORE_CHECK_IN, plate, "check_out")
+
+        with tracing.span("compute.fee"): # Duración, tarifa y nombre de la factura (fechas)
+            vehicle_obj = Vehicle(plate, VehicleType[vehicle_type_name], check_in_time, timestamp)
+            duration_minutes = vehicle_obj.calculate_parking_duration_in_minutes()
+            fee = self.tariffs.fee(vehicle_type_name, check_in_time, timestamp)
+            tariff = self.tariffs.describe(vehicle_type_name, EURO_SYMBOL)
+            invoice_filename = self._invoice_filename(plate, datetime.fromtimestamp(timestamp / 1000))
+
+        with _sql_span("delete_parked"):
             self.cursor.execute("DELETE FROM parked_vehicles WHERE plate = ?", (plate,))
+        if self.cursor.rowcount == 0:
+            # Otra salida simultánea de la misma matrícula ya lo ha retirado
+            return ParkingResult(ResultStatus.NOT_FOUND, plate, "check_out")
+        with _sql_span("insert_history"):
             self.cursor.execute(
-                """INSERT INTO vehicle_history 
-                   (plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee) 
-                   VALUES (?, ?, ?, ?, ?, ?)""",
-                (db_plate, db_vehicle_type_name, db_check_in_time, current_check_out_time, duration_minutes, fee)
-            )
-            self.conn.commit()
-
-            check_in_dt = datetime.fromtimestamp(db_check_in_time / 1000)
-            check_out_dt = datetime.fromtimestamp(current_check_out_time / 1000)
-            message = (
-                f"Salida registrada para {db_plate} ({db_vehicle_type_name}).\n"
-                f"  Hora de entrada: {check_in_dt.strftime(self.date_format_str)}\n"
-                f"  Hora de salida: {check_out_dt.strftime(self.date_format_str)}\n"
-                f"  Duración: {duration_minutes} minutos\n"
-                f"  Coste: €{fee:.2f}"
+                """INSERT INTO vehicle_history
+                   (plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee, tariff)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (plate, vehicle_type_name, check_in_time, timestamp, duration_minutes, fee, tariff)
             )
+        with _sql_span("upsert_rollups"):
+            reports.record_check_out(self.cursor, vehicle_type_name, timestamp, duration_minutes, fee)
+        job_id = None
+        if self.invoice_queue is not None:
+            with _sql_span("enqueue_invoice"):
+                job_id = InvoiceQueue.enqueue(self.cursor, invoice_filename, plate, vehicle_type_name,
+                                              check_in_time, timestamp, duration_minutes, fee, tariff)
+        result = ParkingResult(ResultStatus.CHECKED_OUT, plate, "check_out", vehicle=vehicle_obj,
+                               duration_minutes=duration_minutes, fee=fee, invoice=invoice_filename)
+        invoices.append((job_id, result))
+        return result
 
-            invoice_filename = f"factura_{plate}_{check_out_dt.strftime('%Y%m%d_%H%M%S')}.pdf"
-            invoice_filepath = os.path.join(self.invoices_dir, invoice_filename)
-            generated_invoice_name = None
-            
-            if self._generate_invoice_pdf(invoice_filepath, vehicle_obj, fee, check_in_dt, check_out_dt, duration_minutes):
-                generated_invoice_name = invoice_filename
-            else:
-                message += f"\nError al generar la factura PDF."
-            return message, generated_invoice_name
-        except sqlite3.Error as e:
-            self.conn.rollback()
-            return f"Error de base de datos al registrar salida: {e}", None, None
+    def _render_invoice_job(self, job: dict) -> bool:
+        """Genera el PDF de un trabajo de la cola de facturas."""
+        vehicle_obj = Vehicle(job["plate"], VehicleType[job["vehicle_type_name"]], job["check_in_time"], job["check_out_time"])
+        return self._generate_invoice_pdf(
+            os.path.join(self.invoices_dir, job["filename"]), vehicle_obj, job["fee"],
+            datetime.fromtimestamp(job["check_in_time"] / 1000), datetime.fromtimestamp(job["check_out_time"] / 1000),
+            job["duration_minutes"], job["tariff"]
+        )
+
+    @traced()
+    def render_invoice_now(self, filename: str) -> bool:
+        """Genera en el hilo actual una factura cuyo trabajo sigue en cola (o espera a que termine).
+        Devuelve True si la factura está disponible."""
+        if self.invoice_queue is None:
+            return False
+        return self.invoice_queue.render_now(filename)
+
+    def get_invoice_queue_metrics(self) -> Optional[dict]:
+        """Devuelve las métricas de la cola de facturas (profundidad y tiempos de generación), o None sin cola."""
+        if self.invoice_queue is None:
+            return None
+        return self.invoice_queue.metrics()
 
     def get_current_vehicles(self):
         """Muestra una lista de todos los vehículos que se encuentran actualmente en el aparcamiento."""
@@ -212,72 +457,246 @@ class ParkingManager:
 
     def get_vehicle_history(self):
         """Muestra un historial de todos los vehículos que han salido del aparcamiento."""
-        self.cursor.execute(
+        cursor = self.conn.cursor() # type: ignore
+        cursor.execute(
             "SELECT plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee FROM vehicle_history ORDER BY check_out_time DESC"
         ) # CLI
-        rows = self.cursor.fetchall()
 
-        if not rows:
-            print("No hay vehículos en el historial.")
-            return
-        print("\n--- Historial de Vehículos ---")
-        for i, row in enumerate(rows):
+        printed_header = False
+        for i, row in enumerate(cursor): # Se recorre el cursor sin cargar todo el historial en memoria
+            if not printed_header:
+                print("\n--- Historial de Vehículos ---")
+                printed_header = True
             plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee = row
             check_in_dt = datetime.fromtimestamp(check_in_time / 1000)
             check_out_dt = datetime.fromtimestamp(check_out_time / 1000)
             print(f"{i + 1}. Matrícula: {plate}, Tipo: {vehicle_type_name}, Duración: {duration_minutes} min, Coste: €{fee:.2f}")
             print(f"     Entrada: {check_in_dt.strftime(self.date_format_str)}, Salida: {check_out_dt.strftime(self.date_format_str)}")
+
+        if not printed_header:
+            print("No hay vehículos en el historial.")
+            return
         print("------------------------------")
 
-    def export_history_to_csv(self, filename: str = "historial.csv") -> Optional[str]:
-        """Exporta el historial de vehículos a un archivo CSV."""
-        self.cursor.execute(
-            "SELECT plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee FROM vehicle_history ORDER BY check_out_time ASC"
-        )
-        rows = self.cursor.fetchall()
+    def _iter_history_batches(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                              batch_size: int = 1000, with_tariff: bool = False) -> Iterator[list[tuple]]:
+        """Recorre el historial en orden cronológico por lotes de `batch_size` filas (fetchmany),
+        con un cursor propio, opcionalmente filtrado por hora de salida en [start_ms, end_ms).
+        Con `with_tariff` cada fila lleva además la tarifa aplicada."""
+        conditions, params = [], []
+        if start_ms is not None:
+            conditions.append("check_out_time >= ?")
+            params.append(start_ms)
+        if end_ms is not None:
+            conditions.append("check_out_time < ?")
+            params.append(end_ms)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        cursor = self.conn.cursor() # type: ignore
+        try:
+            with _sql_span("scan_history"): # Solo el inicio de la consulta; los lotes se leen al consumirlos
+                cursor.execute(
+                    f"""SELECT plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee
+                               {', tariff' if with_tariff else ''}
+                        FROM vehicle_history {where} ORDER BY check_out_time ASC, id ASC""",
+                    params
+                )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def iter_history_rows(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                          batch_size: int = 1000) -> Iterator[tuple]:
+        """Recorre el historial en orden cronológico fila a fila (plate, vehicle_type_name, check_in_time,
+        check_out_time, duration_minutes, fee), leyéndolo por lotes y sin cargarlo entero en memoria."""
+        for rows in self._iter_history_batches(start_ms, end_ms, batch_size):
+            yield from rows
+
+    def iter_invoice_rows(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                          batch_size: int = 1000) -> Iterator[tuple]:
+        """Como iter_history_rows, con la tarifa aplicada como séptimo campo (None en las estancias
+        anteriores a la migración 5). Son las filas con las que se vuelven a generar las facturas."""
+        for rows in self._iter_history_batches(start_ms, end_ms, batch_size, with_tariff=True):
+            yield from rows
 
+    def get_history_batch(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                          batch_size: int = 10000) -> VehicleBatch:
+        """Devuelve el historial (opcionalmente, salidas en [start_ms, end_ms)) en orden cronológico
+        como VehicleBatch columnar, sin crear un objeto o diccionario por fila."""
+        parts = []
+        for rows in self._iter_history_batches(start_ms, end_ms, batch_size):
+            plates, type_names, check_ins, check_outs, durations, fees = zip(*rows)
+            parts.append(VehicleBatch.from_columns(plates, type_names, check_ins, check_outs, durations, fees))
+        return VehicleBatch.concatenate(parts)
+
+    def get_current_vehicles_batch(self) -> VehicleBatch:
+        """Devuelve los vehículos aparcados, por hora de entrada, como VehicleBatch columnar."""
+        cursor = self.conn.cursor() # type: ignore
+        try:
+            with _sql_span("list_parked"):
+                rows = cursor.execute(
+                    "SELECT plate, vehicle_type_name, check_in_time FROM parked_vehicles ORDER BY check_in_time ASC"
+                ).fetchall()
+        finally:
+            cursor.close()
         if not rows:
-            return None
+            return VehicleBatch([], [], [])
+        plates, type_names, check_ins = zip(*rows)
+        return VehicleBatch.from_columns(plates, type_names, check_ins)
+
+    def reprice_history(self, tariffs: TariffEngine, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                        batch_size: int = 50000) -> dict:
+        """Simula cuánto se habría cobrado en el historial (opcionalmente, salidas en [start_ms, end_ms))
+        con otras tarifas, sin modificarlo. Cada lote se calcula con TariffEngine.fees() en NumPy.
+        Devuelve el número de estancias y los importes cobrado y simulado, en total y por tipo."""
+        by_type: dict[str, dict] = {}
+        for rows in self._iter_history_batches(start_ms, end_ms, batch_size):
+            _, type_names, check_ins, check_outs, _, fees = zip(*rows)
+            current = np.array(fees, dtype=np.float64)
+            simulated = tariffs.fees(type_names, check_ins, check_outs)
+            names, inverse = np.unique(np.array(type_names, dtype=str), return_inverse=True)
+            counts = np.bincount(inverse, minlength=len(names))
+            current_sums = np.bincount(inverse, weights=current, minlength=len(names))
+            simulated_sums = np.bincount(inverse, weights=simulated, minlength=len(names))
+            for i, name in enumerate(names):
+                totals = by_type.setdefault(str(name), {"rows": 0, "current_total": 0.0, "simulated_total": 0.0})
+                totals["rows"] += int(counts[i])
+                totals["current_total"] += float(current_sums[i])
+                totals["simulated_total"] += float(simulated_sums[i])
+
+        current_total = sum(t["current_total"] for t in by_type.values())
+        simulated_total = sum(t["simulated_total"] for t in by_type.values())
+        return {
+            "rows": sum(t["rows"] for t in by_type.values()),
+            "current_total": current_total,
+            "simulated_total": simulated_total,
+            "difference": simulated_total - current_total,
+            "by_type": by_type,
+        }
+
+    @traced()
+    def get_occupancy_engine(self) -> OccupancyEngine:
+        """Devuelve el motor de análisis de ocupación, actualizado con las estancias cerradas desde la
+        última llamada (solo se leen las filas nuevas del historial) y con los vehículos aparcados ahora."""
+        with self._occupancy_engine_lock:
+            if self._occupancy_engine is None:
+                self._occupancy_engine = OccupancyEngine()
+            with _sql_span("occupancy_update"):
+                self._occupancy_engine.update_from_db(self.conn) # type: ignore
+            return self._occupancy_engine
 
-        headers = ["Matricula", "TipoVehiculo", "HoraEntrada", "HoraSalida", "DuracionMinutos", "CosteEuros"]
-        csv_date_format = "%Y-%m-%d %H:%M:%S" 
+    @traced()
+    def get_daily_report(self, start_day: Optional[str] = None, end_day: Optional[str] = None) -> list[dict]:
+        """Visitas, ingresos y duración media por día y tipo de vehículo entre start_day y end_day
+        (AAAA-MM-DD, ambos incluidos), leídos de los agregados sin recorrer el historial."""
+        with _sql_span("report_daily"):
+            return reports.daily_report(self.conn, start_day, end_day) # type: ignore
 
+    @traced()
+    def get_hourly_report(self, day: str) -> list[dict]:
+        """Visitas, ingresos y duración media por hora y tipo de vehículo de un día (AAAA-MM-DD)."""
+        with _sql_span("report_hourly"):
+            return reports.hourly_report(self.conn, day) # type: ignore
+
+    @traced()
+    def get_report_summary(self, start_day: Optional[str] = None, end_day: Optional[str] = None) -> dict:
+        """Totales del periodo, en conjunto y por tipo de vehículo, leídos de los agregados diarios."""
+        with _sql_span("report_summary"):
+            return reports.summary(self.conn, start_day, end_day) # type: ignore
+
+    @staticmethod
+    def _history_csv_row(row: tuple) -> list:
+        """Convierte una fila del historial en una fila CSV. time.strftime sobre time.localtime es
+        bastante más barato que construir un datetime por cada marca de tiempo."""
+        plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee = row
+        return [
+            plate,
+            vehicle_type_name,
+            time.strftime(CSV_DATE_FORMAT, time.localtime(check_in_time // 1000)),
+            time.strftime(CSV_DATE_FORMAT, time.localtime(check_out_time // 1000)),
+            duration_minutes,
+            f"{fee:.2f}"
+        ]
+
+    def has_history(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> bool:
+        """Indica si hay registros en el historial con hora de salida en [start_ms, end_ms)."""
+        batches = self._iter_history_batches(start_ms, end_ms, batch_size=1)
+        try:
+            return next(batches, None) is not None
+        finally:
+            batches.close()
+
+    def stream_history_csv(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                           batch_size: int = 1000) -> Iterator[str]:
+        """Genera el historial en formato CSV por fragmentos (uno por lote de filas), con memoria constante
+        independientemente del tamaño del historial. Pensado para respuestas HTTP en streaming."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_HEADERS)
+        yield buffer.getvalue()
+        for rows in self._iter_history_batches(start_ms, end_ms, batch_size):
+            buffer.seek(0)
+            buffer.truncate(0)
+            writer.writerows(map(self._history_csv_row, rows))
+            yield buffer.getvalue()
+
+    @traced()
+    def export_history_to_csv(self, filename: str = "historial.csv", start_ms: Optional[int] = None,
+                              end_ms: Optional[int] = None) -> Optional[str]:
+        """Exporta el historial de vehículos a un archivo CSV, leyendo la base de datos por lotes.
+        Devuelve None si no hay datos en el rango o no se pudo escribir el archivo."""
+        batches = self._iter_history_batches(start_ms, end_ms)
         try:
-            with open(filename, mode='w', newline='', encoding='utf-8') as file:
+            first_batch = next(batches, None)
+            if first_batch is None:
+                return None
+
+            with tracing.span("file.write_csv"), open(filename, mode='w', newline='', encoding='utf-8') as file:
                 writer = csv.writer(file)
-                writer.writerow(headers)
-
-                for row_data in rows:
-                    plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee = row_data
-                    row = [
-                                                plate,
-                        vehicle_type_name,
-                        datetime.fromtimestamp(check_in_time / 1000).strftime(csv_date_format),
-                        datetime.fromtimestamp(check_out_time / 1000).strftime(csv_date_format),
-                        duration_minutes,
-                        f"{fee:.2f}"
-                    ]
-                    writer.writerow(row)
+                writer.writerow(CSV_HEADERS)
+                for rows in itertools.chain([first_batch], batches):
+                    for row_data in rows:
+                        writer.writerow(self._history_csv_row(row_data))
             return filename
         except IOError as e:
             return None
+        finally:
+            batches.close()
         
     def close_db(self):
-        """Cierra la conexión a la base de datos."""
-        if self.conn:
-            self.conn.close()
-            self.conn = None # Establecer a None después de cerrar
+        """Cierra la conexión (o todas las conexiones del pool) a la base de datos."""
+        if self.invoice_queue is not None:
+            self.invoice_queue.shutdown()
+            self.invoice_queue = None
+        if self._pool is not None:
+            self._pool.close_all()
+            self._pool = None
+            self._local = threading.local()
+        if self._conn:
+            self._conn.close()
+            self._conn = None # Establecer a None después de cerrar
+            self._cursor = None
+
+    def get_occupancy_snapshot(self) -> dict:
+        """Devuelve la capacidad, la ocupación y las plazas libres (sin consultar la base de datos)."""
+        occupancy = self._occupancy
+        return {"capacity": self.capacity, "occupancy": occupancy, "available": max(self.capacity - occupancy, 0)}
 
     def get_current_occupancy(self) -> int:
-        """Devuelve el número actual de vehículos en el parking."""
-        self.cursor.execute("SELECT COUNT(*) FROM parked_vehicles")
-        current_count = self.cursor.fetchone()[0] # type: ignore
-        return current_count
-
-    def get_current_vehicles_data(self) -> list[dict]:
-        """Devuelve una lista de diccionarios con los vehículos actuales para Flask."""
-        self.cursor.execute("SELECT plate, vehicle_type_name, check_in_time FROM parked_vehicles ORDER BY check_in_time ASC")
-        rows = self.cursor.fetchall()
+        """Devuelve el número actual de vehículos en el parking (contador en memoria)."""
+        return self._occupancy
+
+    @traced()
+    def get_current_vehicles_data(self, raw_times: bool = False) -> list[dict]:
+        """Devuelve una lista de diccionarios con los vehículos actuales para Flask.
+        Con `raw_times` la hora de entrada se devuelve en ms desde la época en lugar de formateada."""
+        with _sql_span("list_parked"):
+            self.cursor.execute("SELECT plate, vehicle_type_name, check_in_time FROM parked_vehicles ORDER BY check_in_time ASC")
+            rows = self.cursor.fetchall()
         vehicles = []
         for row_data in rows:
             plate, vehicle_type_name, check_in_time_millis = row_data
@@ -285,24 +704,92 @@ class ParkingManager:
             vehicles.append({
                 "plate": plate,
                 "vehicle_type_name": vehicle_type_name,
-                "check_in_time": check_in_dt.strftime(self.date_format_str)
+                "check_in_time": check_in_time_millis if raw_times else check_in_dt.strftime(self.date_format_str)
             })
         return vehicles
 
-    def get_vehicle_history_data(self) -> list[dict]:
-        """Devuelve una lista de diccionarios con el historial de vehículos para Flask."""
-        self.cursor.execute(
-            "SELECT plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee FROM vehicle_history ORDER BY check_out_time DESC"
-        )
-        rows = self.cursor.fetchall()
-        history = []
-        for plate_val, vt_name, ci_time, co_time, duration, cost in rows:
-            history.append({
-                "plate": plate_val,
-                "vehicle_type_name": vt_name,
-                "check_in_time": datetime.fromtimestamp(ci_time / 1000).strftime(self.date_format_str),
-                "check_out_time": datetime.fromtimestamp(co_time / 1000).strftime(self.date_format_str) if co_time else None,
-                "duration_minutes": duration,
-                "total_cost": cost
-            })
-        return history
\ No newline at end of file
+    @staticmethod
+    def encode_history_cursor(check_out_time: int, history_id: int) -> str:
+        """Codifica la posición (check_out_time, id) de un registro del historial como cursor de paginación."""
+        return f"{check_out_time}:{history_id}"
+
+    @staticmethod
+    def decode_history_cursor(cursor_token: str) -> Tuple[int, int]:
+        """Decodifica un cursor de paginación. Lanza ValueError si no es válido."""
+        check_out_part, _, id_part = cursor_token.partition(":")
+        return int(check_out_part), int(id_part)
+
+    def _history_row_to_dict(self, row: tuple, raw_times: bool = False) -> dict:
+        """Convierte una fila (plate, tipo, entrada, salida, duración, coste) del historial en un diccionario para Flask.
+        Con `raw_times` las horas se dejan en ms desde la época."""
+        plate_val, vt_name, ci_time, co_time, duration, cost = row
+        if raw_times:
+            return {"plate": plate_val, "vehicle_type_name": vt_name, "check_in_time": ci_time,
+                    "check_out_time": co_time, "duration_minutes": duration, "total_cost": cost}
+        return {
+            "plate": plate_val,
+            "vehicle_type_name": vt_name,
+            "check_in_time": datetime.fromtimestamp(ci_time / 1000).strftime(self.date_format_str),
+            "check_out_time": datetime.fromtimestamp(co_time / 1000).strftime(self.date_format_str) if co_time else None,
+            "duration_minutes": duration,
+            "total_cost": cost
+        }
+
+    @traced()
+    def get_vehicle_history_page(self, limit: int = 50, after: Optional[str] = None,
+                                 raw_times: bool = False) -> Tuple[list[dict], Optional[str]]:
+        """Devuelve una página del historial (de más reciente a más antiguo) y el cursor de la página siguiente.
+        Usa paginación por cursor sobre (check_out_time, id), por lo que el coste de cada página
+        no depende del tamaño del historial ni de la posición de la página.
+        Lanza ValueError si el cursor `after` no es válido."""
+        params: tuple = ()
+        where = ""
+        if after:
+            where = "WHERE (check_out_time, id) < (?, ?)"
+            params = self.decode_history_cursor(after)
+        cursor = self.conn.cursor() # type: ignore
+        with _sql_span("history_page"):
+            cursor.execute(
+                f"""SELECT id, plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee
+                    FROM vehicle_history {where}
+                    ORDER BY check_out_time DESC, id DESC LIMIT ?""",
+                (*params, limit + 1)
+            )
+            rows = cursor.fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = self.encode_history_cursor(last[4], last[0])
+        with tracing.span("format.history_rows"):
+            return [self._history_row_to_dict(row[1:], raw_times) for row in rows], next_cursor
+
+    @traced()
+    def get_plate_history(self, plate: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> list[dict]:
+        """Devuelve el historial de una matrícula (de más reciente a más antiguo), opcionalmente
+        limitado a salidas en [start_ms, end_ms). Usa el índice idx_vehicle_history_plate."""
+        cursor = self.conn.cursor() # type: ignore
+        with _sql_span("plate_history"):
+            cursor.execute(
+                """SELECT plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee
+                   FROM vehicle_history
+                   WHERE plate = ? AND check_out_time >= ? AND check_out_time < ?
+                   ORDER BY check_out_time DESC""",
+                (plate, start_ms if start_ms is not None else 0, end_ms if end_ms is not None else 2**62)
+            )
+            rows = cursor.fetchall()
+        return [self._history_row_to_dict(row) for row in rows]
+
+    @traced()
+    def get_vehicle_history_data(self, limit: Optional[int] = None, after: Optional[str] = None) -> list[dict]:
+        """Devuelve una lista de diccionarios con el historial de vehículos para Flask.
+        Con `limit` devuelve solo una página (ver get_vehicle_history_page)."""
+        if limit is not None:
+            return self.get_vehicle_history_page(limit, after)[0]
+        cursor = self.conn.cursor() # type: ignore
+        with _sql_span("history_all"): # Como en scan_history, solo el inicio de la consulta
+            cursor.execute(
+                "SELECT plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee FROM vehicle_history ORDER BY check_out_time DESC, id DESC"
+            )
+        return [self._history_row_to_dict(row) for row in cursor]
@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+from enum import Enum
+from typing import Optional
+
+from vehicle import Vehicle
+
+
+class ResultStatus(Enum):
+    """Resultado de una operación de entrada o salida. El valor es el código que usa la API JSON."""
+    CHECKED_IN = "checked_in"
+    CHECKED_OUT = "checked_out"
+    FULL = "full"
+    ALREADY_PARKED = "already_parked"
+    NOT_FOUND = "not_found"
+    UNKNOWN_VEHICLE_TYPE = "unknown_vehicle_type" # Tipo guardado en la base de datos que ya no existe
+    CHECK_OUT_BEFORE_CHECK_IN = "check_out_before_check_in"
+    INVALID_EVENT = "invalid_event"
+    INVALID_PLATE = "invalid_plate"
+    INVALID_TIMESTAMP = "invalid_timestamp"
+    INVALID_VEHICLE_TYPE = "invalid_vehicle_type"
+    DB_ERROR = "db_error"
+
+    @property
+    def ok(self) -> bool:
+        return self in (ResultStatus.CHECKED_IN, ResultStatus.CHECKED_OUT)
+
+
+@dataclass
+class ParkingResult:
+    """Resultado de una entrada o salida. Los mensajes para el usuario se construyen en la capa de
+    presentación (ver result_messages.py), no aquí.
+
+    Atributos:
+        status ResultStatus: Resultado de la operación
+        plate str: Matrícula del vehículo
+        operation Optional[str]: "check_in" o "check_out" (None si el evento no era válido)
+        vehicle Optional[Vehicle]: Vehículo con sus horas de entrada y salida (solo si la operación tuvo éxito)
+        duration_minutes Optional[int]: Duración de la estancia (salidas)
+        fee Optional[float]: Importe cobrado (salidas)
+        invoice Optional[str]: Nombre del archivo de la factura, que también la identifica en /invoices
+        invoice_failed bool: La salida se registró pero no se pudo generar la factura
+        detail Optional[str]: Dato adicional del error (tipo de vehículo desconocido, error de base de datos)
+        db_ms float: Tiempo empleado en la base de datos
+        invoice_ms float: Tiempo empleado en generar la factura de forma síncrona"""
+    status: ResultStatus
+    plate: str
+    operation: Optional[str] = None
+    vehicle: Optional[Vehicle] = None
+    duration_minutes: Optional[int] = None
+    fee: Optional[float] = None
+    invoice: Optional[str] = None
+    invoice_failed: bool = False
+    detail: Optional[str] = None
+    db_ms: float = 0.0
+    invoice_ms: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.status.ok
+
+    def to_dict(self) -> dict:
+        """Devuelve el resultado como diccionario serializable a JSON (horas en ms desde la época)."""
+        data: dict = {"status": self.status.value, "ok": self.ok, "plate": self.plate}
+        if self.vehicle is not None:
+            data["vehicle_type_name"] = self.vehicle.type.name
+            data["check_in_time"] = self.vehicle.check_in_time
+            if self.vehicle.check_out_time is not None:
+                data["check_out_time"] = self.vehicle.check_out_time
+        if self.operation == "check_out" and self.ok:
+            data["duration_minutes"] = self.duration_minutes
+            data["fee"] = self.fee
+            data["invoice"] = self.invoice
+        return data
@@ -1,8 +1,16 @@
+import asyncio
 import cv2
+import numpy as np
 import requests
 import os
+import time
 from dotenv import load_dotenv
-from typing import Optional
+import threading
+from collections import OrderedDict
+from typing import Iterator, Optional, Sequence, Tuple, Union
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from metrics import PLATE_API_SECONDS
 
 load_dotenv()
 
@@ -10,7 +18,323 @@ load_dotenv()
 PLATE_RECOGNIZER_API_KEY = os.environ.get("PLATE_RECOGNIZER_API_KEY")
 PLATE_RECOGNIZER_API_URL = "https://api.platerecognizer.com/v1/plate-reader/"
 
-def recognize_plate_from_webcam_api() -> Optional[str]:
+
+def parse_plate_response(data: dict) -> Optional[str]:
+    """Extrae la matrícula (solo caracteres alfanuméricos, en mayúsculas) de la respuesta de la API,
+    o None si la API no encontró ninguna."""
+    if data.get('results') and len(data['results']) > 0:
+        plate_info = data['results'][0]
+        plate_number = plate_info.get('plate')
+        confidence = plate_info.get('score', plate_info.get('confidence', 0))
+
+        if plate_number:
+            plate_number_cleaned = "".join(filter(str.isalnum, plate_number)).upper()
+            print(f"Matrícula reconocida por API: '{plate_number_cleaned}' (Confianza: {confidence:.2f})")
+            return plate_number_cleaned
+        print("La API no devolvió una matrícula en los resultados.")
+    else:
+        print("La API no encontró ninguna matrícula en la imagen.")
+        if 'error' in data:
+            print(f"Error de la API: {data['error']}")
+    return None
+
+
+def frame_signature(frame: np.ndarray, width: int = 128) -> np.ndarray:
+    """Miniatura en escala de grises de un frame ya preprocesado (normalmente la región de interés),
+    con resolución suficiente para que dos matrículas distintas no den la misma firma. El ruido del
+    sensor se promedia al reducir, así que dos capturas del mismo vehículo apenas se diferencian."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    height = max(1, round(gray.shape[0] * width / gray.shape[1]))
+    return cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA)
+
+
+class RecognitionCache:
+    """Caché LRU con caducidad corta de matrículas reconocidas, indexada por la firma del frame.
+
+    Un frame prácticamente idéntico a uno ya reconocido (ningún píxel de la firma difiere en más de
+    max_difference) reutiliza su matrícula en lugar de volver a subirse a la API. Basta con que
+    cambie un carácter de la matrícula para que la diferencia supere el umbral. El ttl es corto, así
+    que solo coinciden capturas del mismo vehículo en la misma pasada. Los frames sin matrícula no
+    se guardan, para que el reintento del operador llegue siempre a la API.
+
+    Atributos:
+        max_entries int: Número máximo de resultados guardados
+        ttl float: Segundos que un resultado sigue siendo válido
+        max_difference int: Diferencia máxima de intensidad (0-255) por píxel de la firma para considerar dos frames iguales"""
+
+    def __init__(self, max_entries: int = 64, ttl: float = 3.0, max_difference: int = 12):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_difference = max_difference
+        # Clave: bytes de la firma -> (firma, matrícula, instante en que se guardó)
+        self._entries: "OrderedDict[bytes, Tuple[np.ndarray, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, signature: np.ndarray) -> Optional[str]:
+        """Devuelve la matrícula de un frame prácticamente idéntico, o None si no hay ninguno."""
+        now = time.monotonic()
+        with self._lock:
+            best_key, best_difference = None, self.max_difference + 1
+            for key, (cached, _, stored_at) in list(self._entries.items()):
+                if now - stored_at > self.ttl:
+                    del self._entries[key]
+                    continue
+                if cached.shape != signature.shape:
+                    continue
+                difference = int(cv2.absdiff(cached, signature).max())
+                if difference < best_difference:
+                    best_key, best_difference = key, difference
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key][1]
+
+    def put(self, signature: np.ndarray, plate: Optional[str]):
+        """Guarda la matrícula reconocida en un frame. Los resultados sin matrícula no se guardan."""
+        if not plate:
+            return
+        key = signature.tobytes()
+        with self._lock:
+            self._entries[key] = (signature, plate, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        """Devuelve los aciertos, fallos y número de entradas de la caché."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+class PlateRecognizerClient:
+    """Cliente de la API de reconocimiento de matrículas.
+
+    Mantiene una sesión HTTP con conexiones keep-alive reutilizables, de modo que solo la primera
+    petición paga el establecimiento de TCP+TLS, y reintenta con espera exponencial los errores de
+    conexión y las respuestas 429/503. Los errores de lectura (p. ej. un tiempo de espera agotado con
+    la petición ya enviada) no se reintentan: la API puede haber procesado ya el frame y cada lectura
+    se paga.
+
+    Atributos:
+        api_url str: URL del endpoint de lectura de matrículas
+        connect_timeout float: Segundos máximos para establecer la conexión
+        read_timeout float: Segundos máximos de espera de la respuesta
+        regions Sequence[str]: Regiones de matrícula que se envían a la API
+        cache Optional[RecognitionCache]: Caché de matrículas para frames prácticamente idénticos"""
+
+    RETRY_STATUS_CODES = (429, 503) # Respuestas que indican que la API no ha procesado el frame
+
+    def __init__(self, api_key: Optional[str] = PLATE_RECOGNIZER_API_KEY, api_url: str = PLATE_RECOGNIZER_API_URL,
+                 connect_timeout: float = 3.05, read_timeout: float = 10.0, max_retries: int = 2,
+                 backoff_factor: float = 0.3, regions: Sequence[str] = ('es',), pool_maxsize: int = 4,
+                 cache: Optional[RecognitionCache] = None):
+        self.api_url = api_url
+        self.cache = cache
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.regions = list(regions)
+        self._stats_lock = threading.Lock()
+        self.requests_count = 0
+        self.total_bytes_sent = 0
+        self.total_latency_ms = 0.0
+        self.last_bytes_sent = 0
+        self.last_latency_ms = 0.0
+        retry = Retry(
+            total=max_retries, connect=max_retries, read=0, other=0, status=max_retries,
+            backoff_factor=backoff_factor, status_forcelist=self.RETRY_STATUS_CODES,
+            allowed_methods=frozenset({"POST"}), raise_on_status=False, respect_retry_after_header=True
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if api_key:
+            self.session.headers['Authorization'] = f'Token {api_key}'
+
+    def recognize(self, image_bytes: bytes) -> Optional[str]:
+        """Envía una imagen JPEG a la API y devuelve la matrícula reconocida o None.
+        Lanza requests.exceptions.RequestException ante errores de red/HTTP y ValueError si la respuesta no es JSON."""
+        start = time.perf_counter()
+        status = "error" # Sin respuesta (error de red o tiempo de espera agotado)
+        try:
+            response = self.session.post(
+                self.api_url,
+                files={'upload': ('frame.jpg', image_bytes, 'image/jpeg')},
+                data={'regions': self.regions},
+                timeout=(self.connect_timeout, self.read_timeout)
+            )
+            status = str(response.status_code)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._record_request(len(image_bytes), elapsed * 1000)
+            PLATE_API_SECONDS.observe(elapsed, status)
+        response.raise_for_status()
+        return parse_plate_response(response.json())
+
+    def recognize_prepared_frame(self, prepared: np.ndarray, preprocessor: "FramePreprocessor") -> Optional[str]:
+        """Reconoce un frame ya preprocesado. Si hay caché y contiene un frame prácticamente idéntico con
+        matrícula reconocida, la devuelve sin llamar a la API. Lanza las mismas excepciones que recognize()."""
+        signature = None
+        if self.cache is not None:
+            signature = frame_signature(prepared)
+            plate = self.cache.lookup(signature)
+            if plate is not None:
+                print(f"Resultado reutilizado de la caché: {plate}.")
+                return plate
+
+        image_bytes = preprocessor.encode(prepared)
+        if image_bytes is None:
+            print("Error: No se pudo codificar la imagen a JPG.")
+            return None
+        plate = self.recognize(image_bytes)
+        print(f"Petición enviada: {self.last_bytes_sent} bytes, {self.last_latency_ms:.0f} ms.")
+        if signature is not None:
+            self.cache.put(signature, plate) # type: ignore
+        return plate
+
+    def _record_request(self, bytes_sent: int, latency_ms: float):
+        with self._stats_lock:
+            self.requests_count += 1
+            self.total_bytes_sent += bytes_sent
+            self.total_latency_ms += latency_ms
+            self.last_bytes_sent = bytes_sent
+            self.last_latency_ms = latency_ms
+
+    def get_stats(self) -> dict:
+        """Devuelve los bytes enviados y la latencia (última y media) de las peticiones a la API,
+        para ajustar el preprocesado al ancho de banda de cada cámara."""
+        with self._stats_lock:
+            count = self.requests_count
+            return {
+                "requests": count,
+                "last_bytes_sent": self.last_bytes_sent,
+                "avg_bytes_sent": self.total_bytes_sent / count if count else 0.0,
+                "last_latency_ms": self.last_latency_ms,
+                "avg_latency_ms": self.total_latency_ms / count if count else 0.0,
+            }
+
+    def close(self):
+        """Cierra la sesión y sus conexiones."""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FramePreprocessor:
+    """Prepara los frames antes de subirlos a la API para reducir el tamaño de la petición.
+
+    Recorta la región de interés (donde aparece la matrícula), reduce la imagen a una dimensión
+    máxima, la pasa opcionalmente a escala de grises y la codifica en JPEG con la calidad indicada.
+
+    Atributos:
+        roi Optional[Tuple[float, float, float, float]]: Región (x, y, ancho, alto) en fracciones
+                       del frame (0-1), o None para usar el frame completo
+        max_dimension Optional[int]: Tamaño máximo en píxeles del lado mayor, o None para no reducir
+        grayscale bool: Si se convierte a escala de grises
+        jpeg_quality int: Calidad JPEG (0-100)"""
+
+    def __init__(self, roi: Optional[Tuple[float, float, float, float]] = None, max_dimension: Optional[int] = 1280,
+                 grayscale: bool = False, jpeg_quality: int = 90):
+        if roi is not None:
+            x, y, w, h = roi
+            if not (0 <= x < 1 and 0 <= y < 1 and 0 < w <= 1 - x + 1e-9 and 0 < h <= 1 - y + 1e-9):
+                raise ValueError(f"Región de interés no válida: {roi}")
+        self.roi = roi
+        self.max_dimension = max_dimension
+        self.grayscale = grayscale
+        self.jpeg_quality = jpeg_quality
+
+    @classmethod
+    def from_env(cls) -> "FramePreprocessor":
+        """Crea el preprocesador a partir de las variables de entorno PLATE_ROI ("x,y,ancho,alto"),
+        PLATE_MAX_DIMENSION, PLATE_GRAYSCALE ("1") y PLATE_JPEG_QUALITY."""
+        roi_env = os.environ.get("PLATE_ROI")
+        roi = tuple(float(v) for v in roi_env.split(",")) if roi_env else None
+        max_dimension = int(os.environ.get("PLATE_MAX_DIMENSION", 1280))
+        return cls(roi=roi, max_dimension=max_dimension or None, # type: ignore[arg-type]
+                   grayscale=os.environ.get("PLATE_GRAYSCALE") == "1",
+                   jpeg_quality=int(os.environ.get("PLATE_JPEG_QUALITY", 90)))
+
+    def prepare(self, frame: np.ndarray) -> np.ndarray:
+        """Aplica recorte, reducción y escala de grises al frame."""
+        if self.roi is not None:
+            height, width = frame.shape[:2]
+            x, y, w, h = self.roi
+            frame = frame[int(y * height):int((y + h) * height), int(x * width):int((x + w) * width)]
+        if self.max_dimension:
+            largest = max(frame.shape[:2])
+            if largest > self.max_dimension:
+                scale = self.max_dimension / largest
+                new_size = (max(1, int(frame.shape[1] * scale)), max(1, int(frame.shape[0] * scale)))
+                frame = cv2.resize(frame, new_size, interpolation=cv2.INTER_AREA)
+        if self.grayscale and frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return frame
+
+    def encode(self, frame: np.ndarray) -> Optional[bytes]:
+        """Codifica en JPEG un frame ya preparado. Devuelve None si falla la codificación."""
+        success, image_bytes_cv = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        return image_bytes_cv.tobytes() if success else None
+
+    def process(self, frame: np.ndarray) -> Optional[bytes]:
+        """Prepara y codifica un frame en un solo paso."""
+        return self.encode(self.prepare(frame))
+
+
+class AsyncPlateRecognizerClient:
+    """Variante asyncio del cliente. Ejecuta las peticiones del cliente síncrono en hilos con
+    asyncio.to_thread, compartiendo su sesión keep-alive, y limita las peticiones simultáneas.
+
+    Atributos:
+        client PlateRecognizerClient: Cliente síncrono subyacente
+        max_concurrency int: Número máximo de peticiones en curso a la vez"""
+
+    def __init__(self, client: Optional[PlateRecognizerClient] = None, max_concurrency: int = 4):
+        self.client = client or PlateRecognizerClient(pool_maxsize=max_concurrency)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def recognize(self, image_bytes: bytes) -> Optional[str]:
+        """Versión asíncrona de PlateRecognizerClient.recognize."""
+        async with self._semaphore:
+            return await asyncio.to_thread(self.client.recognize, image_bytes)
+
+    async def close(self):
+        await asyncio.to_thread(self.client.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+_default_client: Optional[PlateRecognizerClient] = None
+
+def get_default_client() -> PlateRecognizerClient:
+    """Devuelve el cliente compartido del proceso (se crea en el primer uso)."""
+    global _default_client
+    if _default_client is None:
+        _default_client = PlateRecognizerClient(cache=RecognitionCache(
+            ttl=float(os.environ.get("PLATE_CACHE_TTL", 3.0)),
+            max_difference=int(os.environ.get("PLATE_CACHE_MAX_DIFFERENCE", 12))
+        ))
+    return _default_client
+
+
+def recognize_plate_from_webcam_api(client: Optional[PlateRecognizerClient] = None,
+                                    preprocessor: Optional[FramePreprocessor] = None) -> Optional[str]:
     """
     Activa la webcam, captura una imagen y la envía a una API de reconocimiento de matrículas.
 
@@ -18,11 +342,19 @@ def recognize_plate_from_webcam_api() -> Optional[str]:
     - Presionar la tecla 'espacio' para capturar la imagen actual y procesarla.
     - Presionar la tecla 'q' para cerrar la ventana y cancelar la operación.
 
+    Args:
+        client (Optional[PlateRecognizerClient]): Cliente de la API a usar. Por defecto,
+                       el cliente compartido del proceso (conexión keep-alive reutilizada).
+        preprocessor (Optional[FramePreprocessor]): Preprocesado del frame antes de subirlo.
+                       Por defecto se configura con las variables de entorno (FramePreprocessor.from_env).
+
     Returns:
         Optional[str]: La matrícula reconocida por la API o None si no se pudo
                        reconocer, se canceló la operación, o hubo un error.
     """
 
+    client = client or get_default_client()
+    preprocessor = preprocessor or FramePreprocessor.from_env()
     cap = cv2.VideoCapture(0) # 0 es la cámara por defecto del sistema
 
     if not cap.isOpened():
@@ -51,46 +383,10 @@ def recognize_plate_from_webcam_api() -> Optional[str]:
         if key == ord(' '):
             print("Capturando imagen y enviando a la API...")
 
-            success, image_bytes_cv = cv2.imencode('.jpg', frame)
-            if not success:
-                print("Error: No se pudo codificar la imagen a JPG.")
-                continue
-
-            image_bytes = image_bytes_cv.tobytes()
-
             try:
-                headers = {
-                    'Authorization': f'Token {PLATE_RECOGNIZER_API_KEY}'
-                }
-
-                response = requests.post(
-                    PLATE_RECOGNIZER_API_URL,
-                    files={'upload': ('frame.jpg', image_bytes, 'image/jpeg')},
-                    headers=headers,
-                    data={'regions': ['es']},
-                    timeout=10
-                )
-                response.raise_for_status()
-
-                data = response.json()
-
-                if data.get('results') and len(data['results']) > 0:
-                    plate_info = data['results'][0]
-                    plate_number = plate_info.get('plate')
-                    confidence = plate_info.get('score', plate_info.get('confidence', 0))
-
-                    if plate_number:
-                        plate_number_cleaned = "".join(filter(str.isalnum, plate_number)).upper()
-                        print(f"Matrícula reconocida por API: '{plate_number_cleaned}' (Confianza: {confidence:.2f})")
-                        recognized_plate = plate_number_cleaned
-                        break
-                    else:
-                        print("La API no devolvió una matrícula en los resultados.")
-                else:
-                    print("La API no encontró ninguna matrícula en la imagen.")
-                    if 'error' in data:
-                        print(f"Error de la API: {data['error']}")
-
+                recognized_plate = client.recognize_prepared_frame(preprocessor.prepare(frame), preprocessor)
+                if recognized_plate:
+                    break
             except requests.exceptions.RequestException as e:
                 print(f"Error de red o al contactar la API: {e}")
             except ValueError as e:
@@ -107,4 +403,152 @@ def recognize_plate_from_webcam_api() -> Optional[str]:
 
     cap.release()
     cv2.destroyAllWindows()
-    return recognized_plate
\ No newline at end of file
+    return recognized_plate
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def iter_frames(source: Union[int, str], max_frames: Optional[int] = None) -> Iterator[np.ndarray]:
+    """Genera los frames de una fuente sin mostrar ninguna ventana.
+
+    Args:
+        source (Union[int, str]): Índice de cámara (p. ej. 0 o "0"), ruta a un archivo de vídeo
+                       o a un directorio de imágenes (se recorren en orden alfabético).
+        max_frames (Optional[int]): Número máximo de frames a leer.
+    """
+    if isinstance(source, str) and os.path.isdir(source):
+        names = sorted(n for n in os.listdir(source) if n.lower().endswith(IMAGE_EXTENSIONS))
+        for count, name in enumerate(names):
+            if max_frames is not None and count >= max_frames:
+                return
+            frame = cv2.imread(os.path.join(source, name))
+            if frame is not None:
+                yield frame
+        return
+
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        print(f"Error: No se pudo abrir la fuente de vídeo {source}.")
+        return
+    try:
+        count = 0
+        while max_frames is None or count < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            count += 1
+            yield frame
+    finally:
+        cap.release()
+
+
+class MotionDetector:
+    """Detector local y barato de cambios de escena para elegir qué frames enviar a la API.
+
+    Compara versiones reducidas y en escala de grises de los frames. El primer frame se toma como
+    fondo y no se envía. Un frame es candidato cuando la escena ha cambiado respecto al último frame
+    enviado o, si aún no se ha enviado ninguno, respecto al fondo, y además lleva `settle_frames`
+    frames estable (p. ej. ha llegado un vehículo y se ha detenido), de modo que no se envían frames
+    movidos ni se repite la misma escena.
+
+    Atributos:
+        change_threshold float: Fracción de píxeles que deben cambiar para considerar que hay cambio
+        pixel_threshold int: Diferencia de intensidad (0-255) a partir de la cual un píxel ha cambiado
+        settle_frames int: Frames consecutivos sin movimiento necesarios antes de elegir un frame
+        width int: Anchura a la que se reducen los frames para compararlos"""
+
+    def __init__(self, change_threshold: float = 0.02, pixel_threshold: int = 25, settle_frames: int = 2, width: int = 160):
+        self.change_threshold = change_threshold
+        self.pixel_threshold = pixel_threshold
+        self.settle_frames = settle_frames
+        self.width = width
+        self._previous: Optional[np.ndarray] = None
+        self._reference: Optional[np.ndarray] = None
+        self._still_count = 0
+
+    def _small_gray(self, frame: np.ndarray) -> np.ndarray:
+        height = max(1, int(frame.shape[0] * self.width / frame.shape[1]))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def _changed_fraction(self, a: np.ndarray, b: np.ndarray) -> float:
+        return float(np.count_nonzero(cv2.absdiff(a, b) > self.pixel_threshold)) / a.size
+
+    def is_candidate(self, frame: np.ndarray) -> bool:
+        """Procesa un frame y devuelve True si debe enviarse a reconocimiento."""
+        small = self._small_gray(frame)
+        previous, self._previous = self._previous, small
+        if previous is None:
+            self._reference = small # El primer frame (normalmente la escena vacía) solo sirve de fondo
+            return False
+
+        if self._changed_fraction(small, previous) > self.change_threshold:
+            self._still_count = 0 # Hay movimiento: se espera a que la escena se estabilice
+            if self.settle_frames > 0:
+                return False
+        else:
+            self._still_count += 1
+
+        if self._still_count < self.settle_frames:
+            return False
+        if self._reference is not None and self._changed_fraction(small, self._reference) <= self.change_threshold:
+            return False # Misma escena que el último frame enviado
+        self._reference = small
+        return True
+
+
+def recognize_plate_headless(source: Union[int, str] = 0, client: Optional[PlateRecognizerClient] = None,
+                             detector: Optional[MotionDetector] = None,
+                             preprocessor: Optional[FramePreprocessor] = None, max_attempts: int = 5,
+                             timeout: Optional[float] = 30.0, max_frames: Optional[int] = None) -> Optional[str]:
+    """
+    Reconoce una matrícula sin intervención del usuario ni ventanas, apta para el servidor.
+
+    Lee frames de la fuente, los preprocesa (recorte de la región de interés, reducción), usa un
+    MotionDetector para elegir los frames candidatos y solo envía esos a la API, devolviendo la
+    primera matrícula reconocida.
+
+    Args:
+        source (Union[int, str]): Índice de cámara, archivo de vídeo o directorio de imágenes.
+        client (Optional[PlateRecognizerClient]): Cliente de la API (por defecto el compartido).
+        detector (Optional[MotionDetector]): Detector de cambios (por defecto uno nuevo).
+        preprocessor (Optional[FramePreprocessor]): Preprocesado (por defecto FramePreprocessor.from_env).
+        max_attempts (int): Número máximo de frames enviados a la API.
+        timeout (Optional[float]): Segundos máximos de espera; None para no limitar.
+        max_frames (Optional[int]): Número máximo de frames a leer de la fuente.
+
+    Returns:
+        Optional[str]: La matrícula reconocida o None si se agotaron los frames, los intentos o el tiempo.
+    """
+    client = client or get_default_client()
+    detector = detector or MotionDetector()
+    preprocessor = preprocessor or FramePreprocessor.from_env()
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    attempts = 0
+
+    for frame in iter_frames(source, max_frames):
+        if deadline is not None and time.monotonic() > deadline:
+            print("Reconocimiento de matrícula cancelado: tiempo de espera agotado.")
+            break
+        prepared = preprocessor.prepare(frame) # El detector trabaja solo sobre la región de interés
+        if not detector.is_candidate(prepared):
+            continue
+
+        attempts += 1
+        try:
+            plate = client.recognize_prepared_frame(prepared, preprocessor)
+            if plate:
+                return plate
+        except requests.exceptions.RequestException as e:
+            print(f"Error de red o al contactar la API: {e}")
+        except ValueError as e:
+            print(f"Error al procesar la respuesta de la API (JSON inválido): {e}")
+
+        if attempts >= max_attempts:
+            print(f"No se reconoció ninguna matrícula tras {attempts} intentos.")
+            break
+    return None
@@ -0,0 +1,90 @@
+import sqlite3
+from typing import Optional
+
+# Las claves de día ('AAAA-MM-DD') y de hora ('AAAA-MM-DD HH') se calculan en SQLite con la hora
+# local de la salida, igual que en la migración que rellena las tablas a partir del historial.
+_UPSERT_ROLLUP = """
+    INSERT INTO {table} ({key}, vehicle_type_name, visits, revenue, total_duration_minutes)
+    VALUES (strftime('{fmt}', ? / 1000, 'unixepoch', 'localtime'), ?, 1, ?, ?)
+    ON CONFLICT ({key}, vehicle_type_name) DO UPDATE SET
+        visits = visits + 1,
+        revenue = revenue + excluded.revenue,
+        total_duration_minutes = total_duration_minutes + excluded.total_duration_minutes
+"""
+_UPSERT_DAILY = _UPSERT_ROLLUP.format(table="daily_rollup", key="day", fmt="%Y-%m-%d")
+_UPSERT_HOURLY = _UPSERT_ROLLUP.format(table="hourly_rollup", key="hour", fmt="%Y-%m-%d %H")
+
+
+def record_check_out(cursor: sqlite3.Cursor, vehicle_type_name: str, check_out_time: int,
+                     duration_minutes: int, fee: float):
+    """Suma una salida a los agregados diario y horario de su tipo de vehículo. Usa el cursor del
+    llamante sin hacer commit, para quedar dentro de la misma transacción que la salida."""
+    params = (check_out_time, vehicle_type_name, fee, duration_minutes)
+    cursor.execute(_UPSERT_DAILY, params)
+    cursor.execute(_UPSERT_HOURLY, params)
+
+
+def rebuild_rollups(conn: sqlite3.Connection):
+    """Vuelve a calcular los agregados a partir de todo el historial (p. ej. tras cargar el historial
+    directamente en la base de datos, sin pasar por check_out_vehicle) y hace commit."""
+    for table, key, fmt in (("daily_rollup", "day", "%Y-%m-%d"), ("hourly_rollup", "hour", "%Y-%m-%d %H")):
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(
+            f"""INSERT INTO {table} ({key}, vehicle_type_name, visits, revenue, total_duration_minutes)
+                SELECT strftime('{fmt}', check_out_time / 1000, 'unixepoch', 'localtime') AS period,
+                       vehicle_type_name, COUNT(*), SUM(fee), SUM(duration_minutes)
+                FROM vehicle_history GROUP BY period, vehicle_type_name"""
+        )
+    conn.commit()
+
+
+def _rollup_rows(rows) -> list[dict]:
+    return [{
+        "period": period,
+        "vehicle_type_name": vehicle_type_name,
+        "visits": visits,
+        "revenue": revenue,
+        "avg_duration_minutes": total_duration / visits if visits else 0.0,
+    } for period, vehicle_type_name, visits, revenue, total_duration in rows]
+
+
+def daily_report(conn: sqlite3.Connection, start_day: Optional[str] = None,
+                 end_day: Optional[str] = None) -> list[dict]:
+    """Devuelve los agregados por día y tipo de vehículo entre start_day y end_day ('AAAA-MM-DD',
+    ambos incluidos), ordenados por día."""
+    rows = conn.execute(
+        """SELECT day, vehicle_type_name, visits, revenue, total_duration_minutes FROM daily_rollup
+           WHERE day >= ? AND day <= ? ORDER BY day, vehicle_type_name""",
+        (start_day or "", end_day or "9999-12-31")
+    ).fetchall()
+    return _rollup_rows(rows)
+
+
+def hourly_report(conn: sqlite3.Connection, day: str) -> list[dict]:
+    """Devuelve los agregados por hora y tipo de vehículo de un día ('AAAA-MM-DD')."""
+    rows = conn.execute(
+        """SELECT hour, vehicle_type_name, visits, revenue, total_duration_minutes FROM hourly_rollup
+           WHERE hour >= ? AND hour < ? ORDER BY hour, vehicle_type_name""",
+        (day, day + "~") # '~' es posterior a ' ' y a los dígitos: cubre todas las horas del día
+    ).fetchall()
+    return _rollup_rows(rows)
+
+
+def summary(conn: sqlite3.Connection, start_day: Optional[str] = None, end_day: Optional[str] = None) -> dict:
+    """Totales del periodo por tipo de vehículo y en conjunto (visitas, ingresos y duración media)."""
+    rows = conn.execute(
+        """SELECT vehicle_type_name, SUM(visits), SUM(revenue), SUM(total_duration_minutes) FROM daily_rollup
+           WHERE day >= ? AND day <= ? GROUP BY vehicle_type_name ORDER BY vehicle_type_name""",
+        (start_day or "", end_day or "9999-12-31")
+    ).fetchall()
+    by_type = {name: {"visits": visits, "revenue": revenue,
+                      "avg_duration_minutes": duration / visits if visits else 0.0}
+               for name, visits, revenue, duration in rows}
+    visits = sum(row[1] for row in rows)
+    duration = sum(row[3] for row in rows)
+    return {
+        "visits": visits,
+        "revenue": sum(row[2] for row in rows),
+        "avg_duration_minutes": duration / visits if visits else 0.0,
+        "by_type": by_type,
+    }
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from parking_results import ParkingResult, ResultStatus
+
+DEFAULT_DATE_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+
+def _format_time(millis: int, date_format: str) -> str:
+    return datetime.fromtimestamp(millis / 1000).strftime(date_format)
+
+
+def format_result(result: ParkingResult, date_format: str = DEFAULT_DATE_FORMAT) -> str:
+    """Construye el mensaje para el usuario (web o consola) de una entrada o salida."""
+    status, plate = result.status, result.plate
+    vehicle = result.vehicle
+
+    if status == ResultStatus.CHECKED_IN and vehicle is not None:
+        return (f"Vehículo {plate} ({vehicle.type.name}) registrado. "
+                f"Hora de entrada: {_format_time(vehicle.check_in_time, date_format)}")
+    if status == ResultStatus.CHECKED_OUT and vehicle is not None:
+        message = (
+            f"Salida registrada para {plate} ({vehicle.type.name}).\n"
+            f"  Hora de entrada: {_format_time(vehicle.check_in_time, date_format)}\n"
+            f"  Hora de salida: {_format_time(vehicle.check_out_time, date_format)}\n" # type: ignore
+            f"  Duración: {result.duration_minutes} minutos\n"
+            f"  Coste: €{result.fee:.2f}"
+        )
+        if result.invoice_failed:
+            message += "\nError al generar la factura PDF."
+        return message
+    if status == ResultStatus.FULL:
+        return "Error: El parking está lleno."
+    if status == ResultStatus.ALREADY_PARKED:
+        return f"Error: El vehículo con matrícula {plate} ya está en el parking."
+    if status == ResultStatus.NOT_FOUND:
+        return f"Error: El vehículo con matrícula {plate} no se encuentra en el parking."
+    if status == ResultStatus.UNKNOWN_VEHICLE_TYPE:
+        return f"Error: Tipo de vehículo desconocido '{result.detail}' para la matrícula {plate} al salir."
+    if status == ResultStatus.INVALID_VEHICLE_TYPE:
+        return f"Error: Tipo de vehículo desconocido '{result.detail}'."
+    if status == ResultStatus.CHECK_OUT_BEFORE_CHECK_IN:
+        return f"Error: La hora de salida de {plate} es anterior a su hora de entrada."
+    if status == ResultStatus.INVALID_EVENT:
+        return "Error: Tipo de evento desconocido."
+    if status == ResultStatus.INVALID_PLATE:
+        return "Error: La matrícula no puede estar vacía."
+    if status == ResultStatus.INVALID_TIMESTAMP:
+        return "Error: La hora del evento no es válida."
+    if status == ResultStatus.DB_ERROR:
+        action = "registrar entrada" if result.operation == "check_in" else "registrar salida"
+        return f"Error de base de datos al {action}: {result.detail}"
+    return f"Error: Resultado inesperado ({status})."
@@ -0,0 +1,234 @@
+import json
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+from local_time import LocalClock, ONE_MINUTE_MS
+from vehicle import VehicleType
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def _parse_clock(value: str) -> int:
+    """Convierte "HH:MM" en minutos desde la medianoche ("24:00" es el final del día)."""
+    hours, _, minutes = str(value).partition(":")
+    total = int(hours) * 60 + int(minutes or 0)
+    if not 0 <= total <= MINUTES_PER_DAY:
+        raise ValueError(f"Hora no válida en la tarifa: '{value}'.")
+    return total
+
+
+def _format_clock(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class TimeBand:
+    """Franja horaria con una tarifa propia. Si end es anterior a start, la franja cruza la medianoche.
+
+    Atributos:
+        start int: Inicio de la franja (minutos desde la medianoche, incluido)
+        end int: Fin de la franja (minutos desde la medianoche, excluido)
+        hourly_rate float: Tarifa por hora dentro de la franja"""
+
+    def __init__(self, start: int, end: int, hourly_rate: float):
+        if hourly_rate < 0:
+            raise ValueError("La tarifa de una franja no puede ser negativa.")
+        self.start = start
+        self.end = end
+        self.hourly_rate = hourly_rate
+
+    def minutes(self) -> np.ndarray:
+        """Devuelve los minutos del día que cubre la franja."""
+        if self.start <= self.end:
+            return np.arange(self.start, self.end)
+        return np.concatenate([np.arange(self.start, MINUTES_PER_DAY), np.arange(0, self.end)])
+
+
+class TariffRule:
+    """Tarifa de un tipo de vehículo.
+
+    Atributos:
+        hourly_rate float: Tarifa por hora fuera de las franjas
+        bands list[TimeBand]: Franjas horarias con tarifa propia (la última definida prevalece)
+        daily_cap Optional[float]: Importe máximo por cada periodo de 24 horas desde la entrada
+        grace_minutes int: Estancias de esta duración o menos no se cobran"""
+
+    def __init__(self, hourly_rate: float, bands: Sequence[TimeBand] = (), daily_cap: Optional[float] = None,
+                 grace_minutes: int = 0):
+        if hourly_rate < 0:
+            raise ValueError("La tarifa por hora no puede ser negativa.")
+        if daily_cap is not None and daily_cap < 0:
+            raise ValueError("El máximo diario no puede ser negativo.")
+        if grace_minutes < 0:
+            raise ValueError("El periodo de cortesía no puede ser negativo.")
+        self.hourly_rate = hourly_rate
+        self.bands = list(bands)
+        self.daily_cap = daily_cap
+        self.grace_minutes = grace_minutes
+
+    def cumulative_day_cost(self) -> np.ndarray:
+        """Devuelve F, con F[m] = coste (en tarifa-hora x minutos) de los minutos [0, m) del día.
+        El coste de cualquier intervalo se obtiene como diferencia de F, sin recorrer los minutos."""
+        rates = np.full(MINUTES_PER_DAY, self.hourly_rate, dtype=np.float64)
+        for band in self.bands:
+            rates[band.minutes()] = band.hourly_rate
+        return np.concatenate([[0.0], np.cumsum(rates)])
+
+    def describe(self, currency: str = "€") -> str:
+        """Resumen de la tarifa para las facturas, p. ej. "2.00 €/hora; 20:00-08:00: 0.50 €/hora;
+        máximo 20.00 € por día; 15 min sin cargo". Con solo tarifa por hora, "1.50 €/hora"."""
+        parts = [f"{self.hourly_rate:.2f} {currency}/hora"]
+        for band in self.bands:
+            parts.append(f"{_format_clock(band.start)}-{_format_clock(band.end)}: {band.hourly_rate:.2f} {currency}/hora")
+        if self.daily_cap is not None:
+            parts.append(f"máximo {self.daily_cap:.2f} {currency} por día")
+        if self.grace_minutes:
+            parts.append(f"{self.grace_minutes} min sin cargo")
+        return "; ".join(parts)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TariffRule":
+        bands = [TimeBand(_parse_clock(b["start"]), _parse_clock(b["end"]), float(b["hourly_rate"]))
+                 for b in data.get("bands", [])]
+        daily_cap = data.get("daily_cap")
+        return cls(float(data["hourly_rate"]), bands, float(daily_cap) if daily_cap is not None else None,
+                   int(data.get("grace_minutes", 0)))
+
+
+class TariffEngine:
+    """Calcula el importe de las estancias según las tarifas de cada tipo de vehículo.
+
+    La duración se cuenta en minutos completos desde la entrada (como Vehicle) y cada minuto se cobra
+    a la tarifa de la franja horaria (hora local) en la que cae. Con máximo diario, cada periodo de
+    24 horas desde la entrada se cobra como mucho daily_cap. Las estancias dentro del periodo de
+    cortesía no se cobran. La hora local tiene en cuenta los cambios de horario de verano (ver
+    LocalClock), salvo que se fije utc_offset_minutes.
+
+    fee() calcula una estancia y fees() un lote completo con NumPy, sin un bucle de Python por fila;
+    solo las estancias con un cambio de horario dentro (o de una semana o más) se calculan por días.
+
+    Atributos:
+        rules dict[str, TariffRule]: Tarifa por nombre de tipo de vehículo
+        utc_offset_minutes Optional[int]: Desfase fijo de la hora local respecto a UTC para las franjas
+        timezone Optional[str]: Zona horaria de las franjas si no hay desfase fijo (por defecto, la del sistema)"""
+
+    def __init__(self, rules: dict[str, TariffRule], utc_offset_minutes: Optional[int] = None,
+                 timezone: Optional[str] = None):
+        if not rules:
+            raise ValueError("Se necesita al menos una tarifa.")
+        self.rules = dict(rules)
+        self.utc_offset_minutes = utc_offset_minutes
+        self.timezone = timezone
+        self.clock = LocalClock(utc_offset_minutes, timezone)
+        self._type_names = list(self.rules)
+        self._type_index = {name: i for i, name in enumerate(self._type_names)}
+        rule_list = [self.rules[name] for name in self._type_names]
+        self._cumulative = np.vstack([rule.cumulative_day_cost() for rule in rule_list])
+        self._day_cost = self._cumulative[:, -1]
+        self._caps = np.array([rule.daily_cap if rule.daily_cap is not None else np.inf for rule in rule_list])
+        self._grace = np.array([rule.grace_minutes for rule in rule_list])
+
+    @classmethod
+    def default(cls) -> "TariffEngine":
+        """Tarifa plana por hora de cada VehicleType, sin franjas, máximos ni cortesía."""
+        return cls({vt.name: TariffRule(vt.hourly_rate) for vt in VehicleType}, utc_offset_minutes=0)
+
+    @classmethod
+    def from_dict(cls, config: dict) -> "TariffEngine":
+        """Crea el motor a partir de una configuración como:
+        {"timezone": "Europe/Madrid",
+         "rules": {"COCHE": {"hourly_rate": 1.5, "daily_cap": 15, "grace_minutes": 10,
+                             "bands": [{"start": "20:00", "end": "08:00", "hourly_rate": 0.5}]}}}
+        Los tipos de vehículo sin regla usan la tarifa plana de VehicleType. En lugar de "timezone" se
+        puede fijar "utc_offset_minutes"; sin ninguno de los dos se usa la zona horaria del sistema."""
+        rules = {vt.name: TariffRule(vt.hourly_rate) for vt in VehicleType}
+        for name, data in config.get("rules", {}).items():
+            rules[name] = TariffRule.from_dict(data)
+        return cls(rules, config.get("utc_offset_minutes"), config.get("timezone"))
+
+    @classmethod
+    def from_file(cls, path: str) -> "TariffEngine":
+        """Carga la configuración de tarifas de un archivo JSON."""
+        with open(path, encoding="utf-8") as config_file:
+            return cls.from_dict(json.load(config_file))
+
+    def _type_codes(self, vehicle_type_names: Iterable[str]) -> np.ndarray:
+        names, inverse = np.unique(np.asarray(vehicle_type_names, dtype=str), return_inverse=True)
+        unknown = [name for name in names if name not in self._type_index]
+        if unknown:
+            raise KeyError(f"No hay tarifa para los tipos de vehículo: {', '.join(unknown)}")
+        return np.array([self._type_index[name] for name in names], dtype=np.intp)[inverse.reshape(-1)]
+
+    def fees(self, vehicle_type_names: Sequence[str], check_in_times, check_out_times) -> np.ndarray:
+        """Calcula el importe de un lote de estancias (horas en ms desde la época)."""
+        check_in = np.asarray(check_in_times, dtype=np.int64)
+        check_out = np.asarray(check_out_times, dtype=np.int64)
+        if len(check_in) == 0:
+            return np.zeros(0)
+        codes = self._type_codes(vehicle_type_names)
+
+        duration = np.maximum(check_out - check_in, 0) // ONE_MINUTE_MS
+        first = check_in // ONE_MINUTE_MS # Minuto (UTC) de la entrada
+        offset = self.clock.offsets(first * ONE_MINUTE_MS)
+        if self.clock.fixed:
+            irregular = np.zeros(len(first), dtype=bool)
+        else:
+            # Estancias con un cambio de horario dentro: el desfase del último minuto es otro. Las de una
+            # semana o más podrían contener dos cambios que se compensan, así que también van aparte
+            last_offset = self.clock.offsets((first + np.maximum(duration - 1, 0)) * ONE_MINUTE_MS)
+            irregular = (offset != last_offset) | (duration >= 7 * MINUTES_PER_DAY)
+        start = first + offset # Minuto local de la entrada
+        full_days, remainder = np.divmod(duration, MINUTES_PER_DAY)
+        start_of_day = np.mod(start, MINUTES_PER_DAY)
+        end_of_day = start_of_day + remainder
+        cumulative = self._cumulative
+        day_cost = self._day_cost[codes]
+        # Coste del tramo final (menos de un día), que puede cruzar la medianoche
+        wraps = end_of_day > MINUTES_PER_DAY
+        before_midnight = cumulative[codes, np.minimum(end_of_day, MINUTES_PER_DAY)] - cumulative[codes, start_of_day]
+        after_midnight = cumulative[codes, np.clip(end_of_day - MINUTES_PER_DAY, 0, MINUTES_PER_DAY)]
+        partial = np.where(wraps, before_midnight + after_midnight, before_midnight) / 60.0
+        caps = self._caps[codes]
+        fee = full_days * np.minimum(day_cost / 60.0, caps) + np.minimum(partial, caps)
+        for i in np.flatnonzero(irregular):
+            fee[i] = self._fee_by_periods(int(codes[i]), int(first[i]), int(duration[i]))
+        return np.where(duration <= self._grace[codes], 0.0, fee)
+
+    def _local_cost(self, code: int, start: int, end: int) -> float:
+        """Coste (tarifa-hora x minutos) de los minutos locales [start, end), con end - start < 2 días."""
+        days, minute = divmod(end, MINUTES_PER_DAY)
+        start_days, start_minute = divmod(start, MINUTES_PER_DAY)
+        return ((days - start_days) * self._day_cost[code]
+                + self._cumulative[code, minute] - self._cumulative[code, start_minute])
+
+    def _period_cost(self, code: int, start: int, end: int) -> float:
+        """Coste de los minutos UTC [start, end) de un periodo de 24 horas como mucho, que puede
+        contener un cambio de horario: cada tramo se cobra con su propio desfase."""
+        before = self.clock.offset_at(start * ONE_MINUTE_MS)
+        after = self.clock.offset_at((end - 1) * ONE_MINUTE_MS)
+        if before == after:
+            return self._local_cost(code, start + before, end + before)
+        low, high = start, end - 1 # Búsqueda binaria del primer minuto con el desfase nuevo
+        while high - low > 1:
+            middle = (low + high) // 2
+            if self.clock.offset_at(middle * ONE_MINUTE_MS) == before:
+                low = middle
+            else:
+                high = middle
+        return self._local_cost(code, start + before, high + before) + self._local_cost(code, high + after, end + after)
+
+    def _fee_by_periods(self, code: int, first: int, duration: int) -> float:
+        """Importe de una estancia calculado periodo a periodo de 24 horas (sin cortesía)."""
+        total = 0.0
+        for start in range(first, first + duration, MINUTES_PER_DAY):
+            end = min(start + MINUTES_PER_DAY, first + duration)
+            total += min(self._period_cost(code, start, end) / 60.0, self._caps[code])
+        return total
+
+    def describe(self, vehicle_type_name: str, currency: str = "€") -> str:
+        """Resumen de la tarifa con la que se cobra un tipo de vehículo (ver TariffRule.describe)."""
+        return self.rules[vehicle_type_name].describe(currency)
+
+    def fee(self, vehicle_type_name: str, check_in_time: int, check_out_time: int) -> float:
+        """Calcula el importe de una estancia (horas en ms desde la época)."""
+        return float(self.fees([vehicle_type_name], [check_in_time], [check_out_time])[0])
@@ -0,0 +1,284 @@
+import unittest
+import csv
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipfile
+from unittest.mock import patch
+
+import app as app_module
+import metrics
+import tracing
+from event_log import EventLogParkingManager
+from local_time import LocalClock
+from parking_manager import ParkingManager
+from tracing import Tracer
+from vehicle import VehicleType
+
+FIXED_TIME_MS_BASE = 1678886400000
+ONE_HOUR_MS = 60 * 60 * 1000
+
+
+class TestApp(unittest.TestCase):
+    """Pruebas de las rutas de app.py con el cliente de pruebas de Flask y un ParkingManager en memoria."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.manager = ParkingManager(":memory:", capacity=3)
+        self.manager.invoices_dir = self.temp_dir
+        app_module.set_parking_manager(self.manager)
+        app_module.app.config["TESTING"] = True
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        app_module.set_parking_manager(None)
+        self.manager.close_db()
+        shutil.rmtree(self.temp_dir)
+
+    def _stay(self, plate: str, check_in_ms: int, check_out_ms: int):
+        with patch("time.time", return_value=check_in_ms / 1000):
+            self.manager.check_in_vehicle(plate, VehicleType.COCHE)
+        with patch("time.time", return_value=check_out_ms / 1000):
+            self.manager.check_out_vehicle(plate)
+
+    def test_api_check_in(self):
+        with patch("time.time", return_value=FIXED_TIME_MS_BASE / 1000):
+            response = self.client.post("/api/v1/check_in", json={"plate": "api1", "vehicle_type": "COCHE"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.get_json(), {"status": "checked_in", "ok": True, "plate": "API1",
+                                               "vehicle_type_name": "COCHE", "check_in_time": FIXED_TIME_MS_BASE})
+        self.assertEqual(self.client.post("/api/v1/check_in", json={"plate": "API1", "vehicle_type": "COCHE"}).status_code, 409)
+        response = self.client.post("/api/v1/check_in", json={"plate": "API2", "vehicle_type": "CAMION"})
+        self.assertEqual((response.status_code, response.get_json()["status"]), (400, "invalid_vehicle_type"))
+        self.assertEqual(self.client.post("/api/v1/check_in", data="no es JSON").status_code, 400)
+        for plate in ("API3", "API4"):
+            self.client.post("/api/v1/check_in", json={"plate": plate, "vehicle_type": "MOTO"})
+        response = self.client.post("/api/v1/check_in", json={"plate": "API5", "vehicle_type": "MOTO"})
+        self.assertEqual((response.status_code, response.get_json()["status"]), (409, "full"))
+
+    def test_api_check_out_and_invoice_download(self):
+        with patch("time.time", return_value=FIXED_TIME_MS_BASE / 1000):
+            self.client.post("/api/v1/check_in", json={"plate": "OUT1", "vehicle_type": "COCHE"})
+        with patch("time.time", return_value=(FIXED_TIME_MS_BASE + 2 * ONE_HOUR_MS) / 1000):
+            response = self.client.post("/api/v1/check_out", json={"plate": "OUT1"})
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual((body["status"], body["duration_minutes"], body["fee"]),
+                         ("checked_out", 120, 2 * VehicleType.COCHE.hourly_rate))
+        self.assertEqual(body["invoice_url"], f"/invoices/{body['invoice']}")
+
+        invoice = self.client.get(body["invoice_url"])
+        self.assertEqual(invoice.status_code, 200)
+        self.assertEqual(invoice.mimetype, "application/pdf")
+        self.assertIn("attachment", invoice.headers["Content-Disposition"])
+        self.assertTrue(invoice.data.startswith(b"%PDF"))
+        invoice.close()
+        self.assertEqual(self.client.get("/invoices/factura_NADIE.pdf").status_code, 404)
+
+        response = self.client.post("/api/v1/check_out", json={"plate": "OUT1"})
+        self.assertEqual((response.status_code, response.get_json()["status"]), (404, "not_found"))
+        self.assertEqual(self.client.post("/api/v1/check_out", json=["OUT1"]).status_code, 400)
+
+    def test_api_vehicles_and_occupancy(self):
+        with patch("time.time", return_value=FIXED_TIME_MS_BASE / 1000):
+            self.client.post("/api/v1/check_in", json={"plate": "VEH1", "vehicle_type": "MOTO"})
+        self.assertEqual(self.client.get("/api/v1/vehicles").get_json(),
+                         {"vehicles": [{"plate": "VEH1", "vehicle_type_name": "MOTO", "check_in_time": FIXED_TIME_MS_BASE}]})
+        self.assertEqual(self.client.get("/api/v1/occupancy").get_json(), {"capacity": 3, "occupancy": 1, "available": 2})
+
+    def test_api_occupancy_daily_and_hourly(self):
+        self.manager.get_occupancy_engine().clock = LocalClock(utc_offset_minutes=0) # Días en UTC
+        self._stay("DAY1", FIXED_TIME_MS_BASE, FIXED_TIME_MS_BASE + ONE_HOUR_MS) # 15/03/2023 13:20 UTC
+        days = self.client.get("/api/v1/occupancy/daily?start=2023-03-15&end=2023-03-16").get_json()["days"]
+        total = [day for day in days if day["vehicle_type_name"] is None]
+        self.assertEqual([(day["day"], day["peak"]) for day in total], [("2023-03-15", 1), ("2023-03-16", 0)])
+        self.assertEqual(total[0]["peak_hour"], 13)
+        hours = self.client.get("/api/v1/occupancy/hourly?day=2023-03-15&vehicle_type=COCHE").get_json()
+        self.assertEqual((hours["day"], hours["vehicle_type_name"]), ("2023-03-15", "COCHE"))
+        self.assertEqual([hour["hour"] for hour in hours["hours"] if hour["peak"]], [13, 14])
+        self.assertEqual(self.client.get("/api/v1/occupancy/daily?start=15-03-2023").status_code, 400)
+        self.assertEqual(self.client.get("/api/v1/occupancy/daily?start=2023-03-16&end=2023-03-15").get_json(),
+                         {"status": "invalid_range"})
+        self.assertEqual(self.client.get("/api/v1/occupancy/hourly?day=ayer").status_code, 400)
+
+    def test_api_occupancy_stream_starts_with_current_occupancy(self):
+        self.manager.check_in_vehicle("SSE1", VehicleType.COCHE)
+        response = self.client.get("/api/v1/occupancy/stream", buffered=False)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        first = next(response.response).decode()
+        self.assertEqual(first, 'retry: 3000\nid: 0\nevent: occupancy\n'
+                                'data: {"capacity": 3, "occupancy": 1, "available": 2}\n\n')
+        self.manager.check_in_vehicle("SSE2", VehicleType.MOTO) # Publicado en el bus tras suscribirse
+        self.assertIn("event: check_in", next(response.response).decode())
+        response.close()
+        self.assertEqual(self.manager.events.subscriber_count, 0)
+
+    def test_api_history_pages_with_cursor(self):
+        for i in range(3):
+            self._stay(f"HIS{i}", FIXED_TIME_MS_BASE, FIXED_TIME_MS_BASE + (i + 1) * ONE_HOUR_MS)
+        page = self.client.get("/api/v1/history?limit=2").get_json()
+        self.assertEqual([item["plate"] for item in page["items"]], ["HIS2", "HIS1"])
+        self.assertEqual(page["items"][0]["check_out_time"], FIXED_TIME_MS_BASE + 3 * ONE_HOUR_MS)
+        last = self.client.get(f"/api/v1/history?limit=2&after={page['next']}").get_json()
+        self.assertEqual(([item["plate"] for item in last["items"]], last["next"]), (["HIS0"], None))
+        response = self.client.get("/api/v1/history?after=no-es-un-cursor")
+        self.assertEqual((response.status_code, response.get_json()), (400, {"status": "invalid_cursor"}))
+
+    def test_api_gate_events(self):
+        events = [{"type": "check_in", "plate": "EV1", "vehicle_type": "COCHE", "timestamp": FIXED_TIME_MS_BASE},
+                  {"type": "salida", "plate": "EV1", "timestamp": FIXED_TIME_MS_BASE},
+                  {"type": "check_out", "plate": "EV1", "timestamp": FIXED_TIME_MS_BASE + ONE_HOUR_MS}]
+        body = self.client.post("/api/v1/events", json={"events": events}).get_json()
+        self.assertEqual((body["applied"], body["rejected"]), (2, 1))
+        self.assertEqual([(r["index"], r["type"], r["status"]) for r in body["results"]],
+                         [(0, "check_in", "checked_in"), (1, None, "invalid_event"), (2, "check_out", "checked_out")])
+        self.assertIn("invoice_url", body["results"][2])
+        self.assertEqual(self.client.post("/api/v1/events", json={"eventos": []}).status_code, 400)
+        too_many = {"events": events * (app_module.GATE_EVENTS_MAX_BATCH // 3 + 1)}
+        self.assertEqual(self.client.post("/api/v1/events", json=too_many).status_code, 413)
+
+    def test_export_csv_streams_history(self):
+        self.assertEqual(self.client.get("/export_csv").status_code, 302) # Sin historial
+        self._stay("CSV1", FIXED_TIME_MS_BASE, FIXED_TIME_MS_BASE + ONE_HOUR_MS)
+        self._stay("CSV2", FIXED_TIME_MS_BASE, FIXED_TIME_MS_BASE + 2 * ONE_HOUR_MS)
+        response = self.client.get("/export_csv", buffered=False)
+        self.assertEqual(response.mimetype, "text/csv")
+        self.assertTrue(response.is_streamed)
+        rows = list(csv.reader(io.StringIO(b"".join(response.response).decode("utf-8"))))
+        response.close()
+        self.assertEqual(rows[0], ["Matricula", "TipoVehiculo", "HoraEntrada", "HoraSalida", "DuracionMinutos", "CosteEuros"])
+        self.assertEqual([row[0] for row in rows[1:]], ["CSV1", "CSV2"])
+        self.assertEqual(self.client.get("/export_csv?start=2023-13-01").status_code, 302)
+
+    def test_metrics_exposition(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404) # Desactivadas por defecto
+        metrics.REGISTRY.clear()
+        metrics.REGISTRY.enabled = True
+        try:
+            self.client.get("/api/v1/occupancy")
+            response = self.client.get("/metrics")
+        finally:
+            metrics.REGISTRY.enabled = False
+            metrics.REGISTRY.clear()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_type, metrics.CONTENT_TYPE)
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertIn("# TYPE parking_http_request_duration_seconds histogram", lines)
+        self.assertIn('parking_http_request_duration_seconds_count{route="api_occupancy",method="GET",status="200"} 1', lines)
+        self.assertIn('parking_http_request_duration_seconds_bucket{route="api_occupancy",method="GET",status="200",le="+Inf"} 1', lines)
+        self.assertIn("# TYPE parking_occupancy gauge", lines)
+        self.assertIn("parking_capacity 3", lines)
+        for line in lines: # Cada línea es un comentario o "nombre{etiquetas} valor"
+            self.assertRegex(line, r'^(# (HELP|TYPE) \w+ .+|\w+(\{(\w+="[^"]*",?)+\})? [-+\w.]+)$')
+
+    def test_debug_traces(self):
+        self.assertEqual(self.client.get("/debug/traces").status_code, 404) # Desactivadas por defecto
+        with patch.object(tracing, "TRACER", Tracer(sample_rate=1, buffer_size=10, slow_ms=0.0)):
+            self.client.post("/api/v1/check_in", json={"plate": "TRC1", "vehicle_type": "COCHE"})
+            body = self.client.get("/debug/traces?limit=1").get_json()
+        self.assertEqual((body["sample_rate"], len(body["traces"])), (1, 1))
+        trace = body["traces"][0]
+        self.assertEqual(trace["root"]["name"], "api_check_in")
+        self.assertEqual(trace["root"]["attributes"]["status"], 201)
+
+    def test_invoice_queue_metrics(self):
+        self.assertEqual(self.client.get("/invoice_queue_metrics").get_json(), {}) # Sin cola
+        db_path = os.path.join(self.temp_dir, "cola.db")
+        manager = ParkingManager(db_path, capacity=3, pool_size=2, invoice_workers=1)
+        manager.invoices_dir = self.temp_dir
+        app_module.set_parking_manager(manager)
+        try:
+            self.client.post("/api/v1/check_in", json={"plate": "COLA1", "vehicle_type": "COCHE"})
+            invoice_url = self.client.post("/api/v1/check_out", json={"plate": "COLA1"}).get_json()["invoice_url"]
+            invoice = self.client.get(invoice_url) # Se genera en el momento si sigue en la cola
+            self.assertTrue(invoice.data.startswith(b"%PDF"))
+            invoice.close()
+            queue_metrics = self.client.get("/invoice_queue_metrics").get_json()
+        finally:
+            app_module.set_parking_manager(self.manager)
+            manager.close_db()
+        self.assertEqual(queue_metrics["queue_depth"], 0)
+
+    def test_export_invoices_with_worker_processes(self):
+        self._stay("ZIP1", FIXED_TIME_MS_BASE, FIXED_TIME_MS_BASE + ONE_HOUR_MS)
+        self._stay("ZIP2", FIXED_TIME_MS_BASE, FIXED_TIME_MS_BASE + 2 * ONE_HOUR_MS)
+        with patch.object(app_module, "INVOICE_EXPORT_WORKERS", 1):
+            response = self.client.get("/export_invoices")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/zip")
+        with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+            names = archive.namelist()
+            self.assertEqual(sorted(names), sorted(os.listdir(self.temp_dir)))
+            self.assertTrue(all(archive.read(name).startswith(b"%PDF") for name in names))
+
+    def test_export_invoices_without_history_redirects(self):
+        response = self.client.get("/export_invoices")
+        self.assertEqual(response.status_code, 302)
+
+    def test_import_does_not_create_parking_manager(self):
+        # Los procesos 'spawn' de /export_invoices vuelven a importar el módulo principal (ni importarlo
+        # ni exponer las métricas debe abrir la base de datos)
+        output = self._run_fresh_app("metrics.REGISTRY.expose()")
+        self.assertEqual(output, ["True", "False"])
+
+    def test_metrics_request_does_not_create_parking_manager(self):
+        output = self._run_fresh_app("metrics.REGISTRY.enabled = True; "
+                                     "assert app.app.test_client().get('/metrics').status_code == 200")
+        self.assertEqual(output, ["True", "False"])
+
+    def _run_fresh_app(self, code: str) -> list[str]:
+        """Importa app.py en un proceso nuevo, en un directorio vacío, ejecuta `code` y devuelve si el
+        gestor sigue sin crear y si existe la base de datos."""
+        with tempfile.TemporaryDirectory() as cwd:
+            env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(app_module.__file__)))
+            return subprocess.run(
+                [sys.executable, "-c", f"import os, app, metrics; {code}; "
+                 "print(app._parking_manager is None, os.path.exists(app.DB_NAME))"],
+                cwd=cwd, env=env, capture_output=True, text=True, check=True
+            ).stdout.split()
+
+
+class TestAppEventLogBackend(TestApp):
+    """Las mismas pruebas de las rutas con el almacenamiento STORAGE_BACKEND=event_log."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.log_dir = tempfile.mkdtemp() # Fuera del directorio de facturas, que las pruebas listan
+        with patch.multiple(app_module, STORAGE_BACKEND="event_log", EVENT_LOG_DIR=self.log_dir, PARKING_CAPACITY=3):
+            self.manager = app_module.create_parking_manager()
+        self.assertIsInstance(self.manager, EventLogParkingManager)
+        self.manager.invoices_dir = self.temp_dir
+        app_module.set_parking_manager(self.manager)
+        app_module.app.config["TESTING"] = True
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.log_dir)
+
+    def test_reports_page(self):
+        self._stay("REP1", FIXED_TIME_MS_BASE, FIXED_TIME_MS_BASE + ONE_HOUR_MS)
+        response = self.client.get("/reports?start=2023-03-01&end=2023-03-31")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.manager.get_report_summary("2023-03-01", "2023-03-31")["visits"], 1)
+        self._stay("REP2", FIXED_TIME_MS_BASE, FIXED_TIME_MS_BASE + 2 * ONE_HOUR_MS) # Se suma a los agregados ya creados
+        self.assertEqual(self.manager.get_report_summary("2023-03-01", "2023-03-31")["visits"], 2)
+
+    def test_history_page(self):
+        for i in range(3):
+            self._stay(f"PAG{i}", FIXED_TIME_MS_BASE, FIXED_TIME_MS_BASE + (i + 1) * ONE_HOUR_MS)
+        response = self.client.get("/history?limit=2")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"PAG2", response.data)
+        self.assertNotIn(b"PAG0", response.data)
+
+    def test_unknown_storage_backend(self):
+        with patch.object(app_module, "STORAGE_BACKEND", "otro"), self.assertRaises(ValueError):
+            app_module.create_parking_manager()
+
+
+if __name__ == '__main__':
+    unittest.main()
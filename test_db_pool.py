@@ -0,0 +1,80 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+import threading
+
+from db_pool import SQLiteConnectionPool
+
+
+class TestSQLiteConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "pool_test.db")
+        self.pool = SQLiteConnectionPool(self.db_path, max_connections=2, busy_timeout=1.0, acquire_timeout=0.2)
+
+    def tearDown(self):
+        self.pool.close_all()
+        self.tmp_dir.cleanup()
+
+    def test_rejects_memory_database(self):
+        with self.assertRaises(ValueError):
+            SQLiteConnectionPool(":memory:")
+
+    def test_same_thread_reuses_connection(self):
+        self.assertIs(self.pool.connection(), self.pool.connection())
+
+    def test_connection_uses_wal(self):
+        mode = self.pool.connection().execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode.lower(), "wal")
+
+    def test_threads_get_distinct_connections(self):
+        main_conn = self.pool.connection()
+        other = {}
+
+        def worker():
+            other["conn"] = self.pool.connection()
+            self.pool.release()
+
+        t = threading.Thread(target=worker)
+        t.start()
+        t.join()
+        self.assertIsNot(other["conn"], main_conn)
+
+    def test_released_connection_is_reused(self):
+        conn = self.pool.connection()
+        self.pool.release()
+        self.assertFalse(self.pool.has_connection())
+        self.assertIs(self.pool.connection(), conn)
+
+    def test_pool_is_bounded(self):
+        self.pool.connection()
+        errors = []
+
+        def worker():
+            try:
+                self.pool.connection()
+                self.pool.connection() # Misma conexión, no ocupa otro hueco
+            except sqlite3.OperationalError as e:
+                errors.append(e)
+
+        t1 = threading.Thread(target=worker) # Ocupa el segundo hueco y no lo libera
+        t1.start()
+        t1.join()
+        t2 = threading.Thread(target=worker) # Ya no quedan huecos
+        t2.start()
+        t2.join()
+        self.assertEqual(len(errors), 1)
+
+    def test_release_rolls_back_open_transaction(self):
+        conn = self.pool.connection()
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+        conn.execute("INSERT INTO t VALUES (1)")
+        self.pool.release()
+        count = self.pool.connection().execute("SELECT COUNT(*) FROM t").fetchone()[0]
+        self.assertEqual(count, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import threading
+
+from event_bus import EventBus
+
+
+class TestEventBus(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = EventBus(max_pending=3)
+
+    def test_publish_fans_out_to_all_subscribers(self):
+        first, second = self.bus.subscribe(), self.bus.subscribe()
+        self.bus.publish("occupancy", {"occupancy": 1})
+        for subscription in (first, second):
+            event = subscription.get(timeout=1)
+            self.assertEqual(event["type"], "occupancy")
+            self.assertEqual(event["data"], {"occupancy": 1})
+
+    def test_event_ids_are_sequential(self):
+        subscription = self.bus.subscribe()
+        ids = [self.bus.publish("check_in", {})["id"] for _ in range(3)]
+        self.assertEqual([subscription.get(timeout=1)["id"] for _ in range(3)], ids)
+        self.assertEqual(ids, sorted(ids))
+
+    def test_get_times_out_without_events(self):
+        self.assertIsNone(self.bus.subscribe().get(timeout=0.01))
+
+    def test_slow_subscriber_drops_oldest_events(self):
+        subscription = self.bus.subscribe()
+        for i in range(5):
+            self.bus.publish("occupancy", {"occupancy": i})
+        self.assertEqual([subscription.get(timeout=1)["data"]["occupancy"] for _ in range(3)], [2, 3, 4])
+        self.assertEqual(subscription.dropped, 2)
+
+    def test_unsubscribe(self):
+        subscription = self.bus.subscribe()
+        self.assertEqual(self.bus.subscriber_count, 1)
+        self.bus.unsubscribe(subscription)
+        self.assertEqual(self.bus.subscriber_count, 0)
+        self.bus.publish("occupancy", {})
+        self.assertIsNone(subscription.get(timeout=0.01))
+
+    def test_waiting_subscriber_is_woken_up(self):
+        subscription = self.bus.subscribe()
+        received = []
+        thread = threading.Thread(target=lambda: received.append(subscription.get(timeout=5)))
+        thread.start()
+        self.bus.publish("check_out", {"plate": "ABC123"})
+        thread.join()
+        self.assertEqual(received[0]["data"], {"plate": "ABC123"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest.mock import patch
+
+import reports
+from event_log import EventLogParkingManager
+from loadgen import PROFILES, generate_events
+from parking_manager import ParkingManager
+from parking_results import ResultStatus
+from vehicle import VehicleType
+
+BASE_MS = 1710000000000
+ONE_HOUR_MS = 60 * 60 * 1000
+
+
+class TestEventLogParkingManager(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.log_dir = os.path.join(self.temp_dir, "log")
+        self.managers = []
+
+    def tearDown(self):
+        for manager in self.managers:
+            manager.close_db()
+        shutil.rmtree(self.temp_dir)
+
+    def _open(self, capacity=10, **kwargs) -> EventLogParkingManager:
+        manager = EventLogParkingManager(self.log_dir, capacity, **kwargs)
+        manager.invoices_dir = self.temp_dir
+        self.managers.append(manager)
+        return manager
+
+    def _reopen(self, manager, **kwargs) -> EventLogParkingManager:
+        manager.close_db()
+        self.managers.remove(manager)
+        return self._open(manager.capacity, **kwargs)
+
+    def _segment_paths(self) -> list[str]:
+        return sorted(os.path.join(self.log_dir, name) for name in os.listdir(self.log_dir) if name.endswith(".log"))
+
+    def test_check_in_check_out_and_recovery(self):
+        manager = self._open()
+        self.assertEqual(manager.check_in_vehicle("EVT1", VehicleType.COCHE).status, ResultStatus.CHECKED_IN)
+        self.assertEqual(manager.check_in_vehicle("EVT1", VehicleType.COCHE).status, ResultStatus.ALREADY_PARKED)
+        manager.check_in_vehicle("EVT2", VehicleType.MOTO)
+        result = manager.check_out_vehicle("EVT1")
+        self.assertEqual(result.status, ResultStatus.CHECKED_OUT)
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, result.invoice)))
+        self.assertEqual(manager.check_out_vehicle("EVT1").status, ResultStatus.NOT_FOUND)
+
+        manager = self._reopen(manager)
+        self.assertEqual(manager.recovered_events, 3)
+        self.assertEqual([v["plate"] for v in manager.get_current_vehicles_data()], ["EVT2"])
+        history = manager.get_vehicle_history_data()
+        self.assertEqual(len(history), 1)
+        self.assertEqual((history[0]["plate"], history[0]["total_cost"]), ("EVT1", result.fee))
+        self.assertEqual(manager.check_out_vehicle("EVT2").status, ResultStatus.CHECKED_OUT)
+
+    def test_snapshots_bound_recovery_and_keep_audit_trail(self):
+        manager = self._open(snapshot_every=4)
+        for i in range(3):
+            manager.check_in_vehicle(f"SNP{i}", VehicleType.COCHE)
+        manager.check_out_vehicle("SNP0") # Cuarto evento: snapshot y segmento nuevo
+        manager.check_in_vehicle("SNP3", VehicleType.FURGONETA)
+        self.assertEqual(len(self._segment_paths()), 2)
+        self.assertEqual([name for name in os.listdir(self.log_dir) if name.startswith("snapshot_")],
+                         ["snapshot_000000000004.json"])
+
+        manager = self._reopen(manager, snapshot_every=4)
+        self.assertEqual(manager.recovered_events, 1) # Solo el evento posterior al snapshot
+        self.assertEqual(manager.get_current_occupancy(), 3)
+        self.assertEqual([(e["seq"], e["type"]) for e in manager.audit_events(plate="SNP0")],
+                         [(1, "check_in"), (4, "check_out")])
+        self.assertEqual(len(manager.audit_events()), 5)
+        self.assertEqual(manager.get_plate_history("SNP0")[0]["plate"], "SNP0")
+
+    def test_torn_tail_is_truncated_and_corruption_is_detected(self):
+        manager = self._open(snapshot_every=2)
+        for i in range(3):
+            manager.check_in_vehicle(f"TRN{i}", VehicleType.COCHE)
+        manager.close_db()
+        last_segment = self._segment_paths()[-1]
+        with open(last_segment, "ab") as segment:
+            segment.write(b'0badc0de {"seq":4,"type":"check_in"') # Escritura interrumpida
+        size = os.path.getsize(last_segment)
+
+        with patch("builtins.print"):
+            manager = self._reopen(manager)
+        self.assertLess(os.path.getsize(last_segment), size)
+        self.assertEqual(manager.get_current_occupancy(), 3)
+        self.assertEqual(manager.check_in_vehicle("TRN3", VehicleType.COCHE).status, ResultStatus.CHECKED_IN)
+        self.assertEqual(manager.audit_events()[-1]["seq"], 4)
+        manager.close_db()
+
+        first_segment = self._segment_paths()[0]
+        with open(first_segment, "r+b") as segment:
+            segment.seek(12)
+            segment.write(b"X") # Dañado fuera del último segmento
+        self.managers.remove(manager)
+        manager = self._open() # La recuperación empieza en el snapshot y no lee el primer segmento...
+        with self.assertRaises(ValueError):
+            manager.audit_events() # ...pero la auditoría sí lo detecta
+
+    def test_batches_match_parking_manager_and_project_to_sqlite(self):
+        events = generate_events(PROFILES["noche_evento"], BASE_MS, 6, seed=4)
+        events.insert(5, {"type": "check_out", "plate": "NADIE", "timestamp": BASE_MS})
+        events.insert(7, {"type": "check_in", "plate": "", "vehicle_type": "COCHE", "timestamp": BASE_MS})
+        reference = ParkingManager(":memory:", capacity=60)
+        reference.invoices_dir = self.temp_dir
+        manager = self._open(capacity=60, snapshot_every=100)
+        try:
+            expected = reference.process_gate_events(events)
+            with patch("event_log.write_invoice_pdf", return_value=True):
+                results = manager.process_gate_events(events)
+            self.assertEqual([(r.status, r.fee) for r in results], [(r.status, r.fee) for r in expected])
+            self.assertIn(ResultStatus.FULL, {r.status for r in results})
+            self.assertEqual(len(self._segment_paths()), 2) # Un snapshot tras el lote
+            self.assertEqual(manager.get_vehicle_history_data(), reference.get_vehicle_history_data())
+            self.assertEqual(list(manager.iter_history_rows(BASE_MS, BASE_MS + 3 * ONE_HOUR_MS)),
+                             list(reference.iter_history_rows(BASE_MS, BASE_MS + 3 * ONE_HOUR_MS)))
+            self.assertEqual(list(manager.iter_invoice_rows()), list(reference.iter_invoice_rows())) # Con la tarifa aplicada
+
+            conn = sqlite3.connect(":memory:")
+            count = manager.project_to_sqlite(conn)
+            self.assertEqual(count, sum(1 for r in results if r.status == ResultStatus.CHECKED_OUT))
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM vehicle_history WHERE tariff IS NULL").fetchone()[0], 0)
+            self.assertEqual(reports.daily_report(conn), reference.get_daily_report())
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM parked_vehicles").fetchone()[0],
+                             manager.get_current_occupancy())
+            conn.close()
+        finally:
+            reference.close_db()
+
+    def test_failed_append_leaves_state_unchanged(self):
+        manager = self._open()
+        manager.check_in_vehicle("ERR1", VehicleType.COCHE)
+        with patch.object(manager.log, "append", side_effect=OSError("disco lleno")):
+            results = manager.process_gate_events([
+                {"type": "check_out", "plate": "ERR1", "timestamp": BASE_MS * 2},
+                {"type": "check_in", "plate": "ERR2", "vehicle_type": "MOTO", "timestamp": BASE_MS * 2},
+            ])
+        self.assertEqual([r.status for r in results], [ResultStatus.DB_ERROR] * 2)
+        self.assertEqual(results[0].detail, "disco lleno")
+        self.assertEqual([v["plate"] for v in manager.get_current_vehicles_data()], ["ERR1"])
+        self.assertEqual(manager.get_vehicle_history_data(), [])
+
+    def test_failed_fsync_disables_manager_until_reopened(self):
+        manager = self._open()
+        manager.check_in_vehicle("SYNC1", VehicleType.COCHE)
+        with patch("event_log.os.fsync", side_effect=OSError("fsync fallido")):
+            result = manager.check_in_vehicle("SYNC2", VehicleType.COCHE)
+        self.assertEqual((result.status, result.detail), (ResultStatus.DB_ERROR, "fsync fallido"))
+        self.assertEqual(manager.check_out_vehicle("SYNC1").status, ResultStatus.DB_ERROR)
+        with self.assertRaises(OSError):
+            manager.get_current_occupancy()
+        with self.assertRaises(OSError):
+            manager.get_vehicle_history_data()
+
+        manager = self._reopen(manager) # La recuperación decide qué llegó al disco
+        self.assertEqual(manager.check_in_vehicle("SYNC3", VehicleType.COCHE).status, ResultStatus.CHECKED_IN)
+        self.assertIn("SYNC1", [v["plate"] for v in manager.get_current_vehicles_data()])
+
+    def test_history_index_is_incremental_and_ordered(self):
+        manager = self._open(snapshot_every=3)
+        events = []
+        for i in range(6):
+            events.append({"type": "check_in", "plate": f"HIS{i}", "vehicle_type": "COCHE", "timestamp": BASE_MS})
+            # Las salidas llegan en desorden respecto a su hora (lotes reenviados por las barreras)
+            events.append({"type": "check_out", "plate": f"HIS{i}", "timestamp": BASE_MS + (6 - i) * ONE_HOUR_MS})
+        with patch("event_log.write_invoice_pdf", return_value=True):
+            manager.process_gate_events(events[:6])
+            self.assertEqual([h["plate"] for h in manager.get_vehicle_history_data(limit=2)], ["HIS0", "HIS1"])
+            manager.process_gate_events(events[6:])
+        with patch.object(manager.log, "read", wraps=manager.log.read) as read:
+            rows = list(manager.iter_history_rows(BASE_MS + 2 * ONE_HOUR_MS, BASE_MS + 6 * ONE_HOUR_MS, batch_size=2))
+        read.assert_called_once_with(7) # Solo los eventos posteriores a la última consulta
+        self.assertEqual([row[0] for row in rows], ["HIS4", "HIS3", "HIS2", "HIS1"])
+        self.assertEqual([h["plate"] for h in manager.get_plate_history("HIS5")], ["HIS5"])
+        self.assertEqual(len(manager.get_vehicle_history_data()), 6)
+        self.assertEqual(manager.get_vehicle_history_data(limit=0), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
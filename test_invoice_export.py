@@ -0,0 +1,102 @@
+import unittest
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest.mock import patch
+
+from invoice_export import export_invoices_zip, regenerate_invoices, render_invoices, stream_invoice_zip
+from invoice_template import EURO_SYMBOL, UNRECORDED_TARIFF
+from parking_manager import ParkingManager, build_invoice_pdf
+from tariffs import TariffEngine
+from vehicle import VehicleType
+
+BASE_MS = 1710000000000
+ONE_HOUR_MS = 60 * 60 * 1000
+
+
+class TestInvoiceExport(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.manager = ParkingManager(":memory:", capacity=3)
+        self.manager.invoices_dir = os.path.join(self.temp_dir, "invoices")
+        for i in range(5):
+            self.manager.cursor.execute(
+                """INSERT INTO vehicle_history (plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (f"EXP{i}", "COCHE", BASE_MS + i * ONE_HOUR_MS, BASE_MS + (i + 1) * ONE_HOUR_MS, 60, 1.5)
+            )
+        self.manager.conn.commit()
+
+    def tearDown(self):
+        self.manager.close_db()
+        shutil.rmtree(self.temp_dir)
+
+    def test_export_zip_contains_one_pdf_per_stay(self):
+        stats: dict = {}
+        data = b"".join(export_invoices_zip(self.manager, BASE_MS + 2 * ONE_HOUR_MS, stats=stats))
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            names = archive.namelist()
+            self.assertEqual(len(names), 4)
+            self.assertTrue(all(name.startswith("factura_EXP") and name.endswith(".pdf") for name in names))
+            self.assertTrue(archive.read(names[0]).startswith(b"%PDF"))
+        self.assertEqual(stats, {"written": 4, "failed": 0})
+
+    def test_zip_is_streamed_per_invoice(self):
+        invoices = [("a.pdf", b"%PDF-a"), ("roto.pdf", None), ("b.pdf", b"%PDF-b")]
+        stats: dict = {}
+        chunks = list(stream_invoice_zip(invoices, stats))
+        self.assertEqual(len(chunks), 3) # Una por factura escrita y el directorio central
+        with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+            self.assertEqual(archive.namelist(), ["a.pdf", "b.pdf"])
+        self.assertEqual(stats["failed"], 1)
+
+    def test_process_pool_keeps_order(self):
+        rows = list(self.manager.iter_invoice_rows())
+        issuer = self.manager.invoice_issuer()
+        in_process = [name for name, _ in render_invoices(issuer, rows)]
+        pooled = list(render_invoices(issuer, rows, workers=2, chunk_size=2))
+        self.assertEqual([name for name, _ in pooled], in_process)
+        self.assertTrue(all(content.startswith(b"%PDF") for _, content in pooled))
+
+    def test_regenerate_skips_existing_invoices(self):
+        stats = regenerate_invoices(self.manager)
+        self.assertEqual(stats, {"written": 5, "skipped": 0, "failed": 0})
+        self.assertEqual(len(os.listdir(self.manager.invoices_dir)), 5)
+        self.assertEqual(regenerate_invoices(self.manager), {"written": 0, "skipped": 5, "failed": 0})
+        self.assertEqual(regenerate_invoices(self.manager, overwrite=True)["written"], 5)
+
+    def test_regenerated_invoices_keep_the_applied_tariff(self):
+        applied = TariffEngine.from_dict({"utc_offset_minutes": 0, "rules": {"COCHE": {"hourly_rate": 2.0}}})
+        self.manager.tariffs = applied
+        check_out_ms = BASE_MS + 10 * ONE_HOUR_MS
+        with patch("time.time", return_value=BASE_MS / 1000):
+            self.manager.check_in_vehicle("TAR1", VehicleType.COCHE)
+        with patch("time.time", return_value=check_out_ms / 1000), \
+             patch("parking_manager.ParkingManager._generate_invoice_pdf", return_value=True):
+            self.manager.check_out_vehicle("TAR1")
+        # Cambia la configuración de tarifas después de cobrar la estancia
+        self.manager.tariffs = TariffEngine.from_dict({"utc_offset_minutes": 0, "rules": {"COCHE": {"hourly_rate": 3.0}}})
+
+        with patch("invoice_export.build_invoice_pdf", wraps=build_invoice_pdf) as build:
+            stats = regenerate_invoices(self.manager)
+        self.assertEqual(stats["written"], 6)
+        tariffs = {call.args[1].plate: call.args[6] for call in build.call_args_list}
+        self.assertEqual(tariffs["TAR1"], applied.describe("COCHE", EURO_SYMBOL))
+        self.assertEqual(tariffs["EXP0"], UNRECORDED_TARIFF) # Cobrada sin guardar la tarifa
+
+    def test_unknown_vehicle_type_is_counted_as_failed(self):
+        self.manager.cursor.execute(
+            """INSERT INTO vehicle_history (plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee)
+               VALUES ('BAD1', 'TANQUE', 0, 60000, 1, 0.1)"""
+        )
+        self.manager.conn.commit()
+        stats: dict = {}
+        b"".join(export_invoices_zip(self.manager, stats=stats))
+        self.assertEqual(stats, {"written": 5, "failed": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
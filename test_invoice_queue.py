@@ -0,0 +1,93 @@
+import unittest
+import os
+import tempfile
+import threading
+
+from db_pool import SQLiteConnectionPool
+from invoice_queue import InvoiceQueue
+from parking_manager import ParkingManager
+
+
+class TestInvoiceQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "invoice_queue.db")
+        # ParkingManager crea la tabla invoice_jobs
+        ParkingManager(self.db_path, capacity=1, pool_size=1).close_db()
+        self.pool = SQLiteConnectionPool(self.db_path, max_connections=4)
+        self.rendered = []
+        self.render_gate = threading.Event()
+        self.render_gate.set()
+
+    def tearDown(self):
+        self.pool.close_all()
+        self.tmp_dir.cleanup()
+
+    def _render(self, job):
+        self.render_gate.wait(5)
+        self.rendered.append(job["filename"])
+        return True
+
+    def _make_queue(self, workers=1):
+        return InvoiceQueue(self.pool.connection, self.pool.release, self._render, workers=workers)
+
+    def _enqueue(self, filename):
+        conn = self.pool.connection()
+        job_id = InvoiceQueue.enqueue(conn.cursor(), filename, "ABC123", "COCHE", 0, 3600000, 60, 1.5)
+        conn.commit()
+        return job_id
+
+    def _status(self, job_id):
+        return self.pool.connection().execute("SELECT status FROM invoice_jobs WHERE id = ?", (job_id,)).fetchone()[0]
+
+    def test_worker_renders_submitted_job(self):
+        invoice_queue = self._make_queue()
+        invoice_queue.start()
+        job_id = self._enqueue("f1.pdf")
+        invoice_queue.submit(job_id)
+        self.assertTrue(invoice_queue.render_now("f1.pdf"))
+        invoice_queue.shutdown()
+        self.assertEqual(self.rendered, ["f1.pdf"])
+        self.assertEqual(self._status(job_id), "done")
+        metrics = invoice_queue.metrics()
+        self.assertEqual(metrics["queue_depth"], 0)
+        self.assertEqual(metrics["rendered"], 1)
+
+    def test_render_now_runs_pending_job_in_caller_thread(self):
+        invoice_queue = self._make_queue(workers=0)
+        job_id = self._enqueue("f2.pdf")
+        invoice_queue.submit(job_id)
+        self.assertEqual(invoice_queue.metrics()["queue_depth"], 1)
+        self.assertTrue(invoice_queue.render_now("f2.pdf"))
+        self.assertEqual(self.rendered, ["f2.pdf"])
+        self.assertEqual(invoice_queue.metrics()["queue_depth"], 0)
+
+    def test_render_now_unknown_invoice(self):
+        invoice_queue = self._make_queue(workers=0)
+        self.assertFalse(invoice_queue.render_now("missing.pdf"))
+
+    def test_start_recovers_interrupted_jobs(self):
+        pending_id = self._enqueue("pending.pdf")
+        interrupted_id = self._enqueue("interrupted.pdf")
+        conn = self.pool.connection()
+        conn.execute("UPDATE invoice_jobs SET status = 'rendering' WHERE id = ?", (interrupted_id,))
+        conn.commit()
+
+        invoice_queue = self._make_queue()
+        invoice_queue.start()
+        invoice_queue.shutdown()
+        self.assertEqual(sorted(self.rendered), ["interrupted.pdf", "pending.pdf"])
+        self.assertEqual(self._status(pending_id), "done")
+        self.assertEqual(self._status(interrupted_id), "done")
+
+    def test_failed_render_is_recorded(self):
+        invoice_queue = InvoiceQueue(self.pool.connection, self.pool.release, lambda job: False, workers=0)
+        job_id = self._enqueue("bad.pdf")
+        invoice_queue.submit(job_id)
+        self.assertFalse(invoice_queue.render_now("bad.pdf"))
+        self.assertEqual(self._status(job_id), "failed")
+        self.assertEqual(invoice_queue.metrics()["failed"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import re
+from datetime import datetime
+
+from invoice_template import EURO_SYMBOL, InvoiceTemplate, get_invoice_template, invoice_values, layout_invoice
+from parking_manager import build_invoice_pdf
+from tariffs import TariffRule, TimeBand
+from vehicle import Vehicle, VehicleType
+
+ISSUER = {"name": "Parking Norte", "address": "Calle Mayor 1", "nif": "B87654321",
+          "customer": "Cliente de contado", "employee": "Ana Pérez"}
+
+
+def _values(plate="1234ABC", fee=3.0, tariff=f"1.50 {EURO_SYMBOL}/hora"):
+    return invoice_values(ISSUER, plate, "COCHE", tariff, fee, datetime(2024, 3, 10, 9, 0),
+                          datetime(2024, 3, 10, 11, 0), 120)
+
+
+class TestInvoiceTemplate(unittest.TestCase):
+
+    def test_precompiled_template_matches_full_layout(self):
+        template = InvoiceTemplate(ISSUER)
+        for plate, fee in (("1234ABC", 3.0), ("9999ZZZ", 1234.5)):
+            rendered = template.render(_values(plate, fee))
+            reference = layout_invoice(ISSUER, _values(plate, fee))
+            self.assertEqual(rendered.pages, reference.pages)
+            self.assertEqual(rendered.fonts.keys(), reference.fonts.keys())
+
+    def test_invoice_output_matches_layout_without_template(self):
+        # InvoiceTemplate usa atributos internos de FPDF (ver requirements.txt): el documento final
+        # de build_invoice_pdf debe ser el mismo que el maquetado solo con la API pública
+        check_in, check_out = datetime(2024, 3, 10, 9, 0), datetime(2024, 3, 10, 11, 0)
+        vehicle = Vehicle("1234ABC", VehicleType.COCHE, int(check_in.timestamp() * 1000), int(check_out.timestamp() * 1000))
+        tariff = TariffRule(2.0, [TimeBand(20 * 60, 8 * 60, 0.5)]).describe(EURO_SYMBOL)
+        built = build_invoice_pdf(ISSUER, vehicle, 3.0, check_in, check_out, 120, tariff)
+        reference = layout_invoice(ISSUER, invoice_values(ISSUER, "1234ABC", "COCHE", tariff, 3.0, check_in, check_out, 120))
+
+        def text(pdf) -> list[str]:
+            return re.findall(r"\((.*?)\) Tj", pdf.pages[1])
+
+        self.assertEqual(text(built), text(reference))
+        self.assertIn("Tarifa Aplicada: " + tariff, text(built))
+        without_date = re.compile(r"/CreationDate \(D:\d+\)")
+        self.assertEqual(without_date.sub("", built.output(dest="S")), without_date.sub("", reference.output(dest="S")))
+
+    def test_issuer_data_is_configurable(self):
+        content = InvoiceTemplate(ISSUER).render(_values()).pages[1]
+        for text in ("Parking Norte", "Calle Mayor 1", "B87654321", "Cliente de contado", "Ana P"):
+            self.assertIn(text, content)
+        self.assertNotIn("Parking Central", content)
+
+    def test_variable_fields_are_filled(self):
+        content = InvoiceTemplate(ISSUER).render(_values("5678XYZ", 42.0)).pages[1]
+        self.assertIn("5678XYZ", content)
+        self.assertIn("42.00", content)
+        self.assertIn("10/03/2024 11:00:00", content)
+
+    def test_applied_tariff_is_printed(self):
+        rule = TariffRule(2.0, [TimeBand(20 * 60, 8 * 60, 0.5)], daily_cap=20.0, grace_minutes=15)
+        content = InvoiceTemplate(ISSUER).render(_values(tariff=rule.describe(EURO_SYMBOL))).pages[1]
+        self.assertIn("Tarifa Aplicada: 2.00 \x80/hora; 20:00-08:00: 0.50 \x80/hora; m\xe1ximo 20.00 \x80 por d\xeda; "
+                      "15 min sin cargo", content)
+
+    def test_template_is_cached_per_issuer(self):
+        self.assertIs(get_invoice_template(ISSUER), get_invoice_template(dict(ISSUER)))
+        self.assertIsNot(get_invoice_template(ISSUER), get_invoice_template({**ISSUER, "nif": "X"}))
+
+    def test_output_is_valid_pdf(self):
+        data = InvoiceTemplate(ISSUER).render(_values()).output(dest="S").encode("latin-1")
+        self.assertTrue(data.startswith(b"%PDF"))
+        self.assertTrue(data.rstrip().endswith(b"%%EOF"))
+
+
+if __name__ == '__main__':
+    unittest.main()
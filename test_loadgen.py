@@ -0,0 +1,156 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from loadgen import (PROFILES, HttpTarget, ManagerTarget, VehicleTraffic, events_from_history, generate_events,
+                     load_profile, read_event_log, replay, synthetic_plate, write_event_log)
+from parking_manager import ParkingManager
+
+BASE_MS = 1710000000000
+ONE_HOUR_MS = 60 * 60 * 1000
+
+
+class FailingTarget:
+    def send(self, event):
+        raise ConnectionError("sin conexión")
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    drop_after_response = False # Cierra la conexión sin avisar, como al agotarse el keep-alive
+
+    def setup(self): # Se llama una vez por conexión aceptada
+        super().setup()
+        KeepAliveHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.close_connection = KeepAliveHandler.drop_after_response
+        body = json.dumps({"status": "ok", "ok": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestLoadGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.manager = ParkingManager(":memory:", capacity=1000)
+        self.manager.invoices_dir = os.path.join(self.temp_dir, "invoices")
+
+    def tearDown(self):
+        self.manager.close_db()
+        shutil.rmtree(self.temp_dir)
+
+    def test_generate_events_is_reproducible_and_ordered(self):
+        events = generate_events(PROFILES["laborable"], BASE_MS, 24, seed=3)
+        self.assertEqual(events, generate_events(PROFILES["laborable"], BASE_MS, 24, seed=3))
+        timestamps = [event["timestamp"] for event in events]
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertTrue(all(BASE_MS <= t < BASE_MS + 24 * ONE_HOUR_MS for t in timestamps))
+        self.assertEqual({event["vehicle_type"] for event in events if event["type"] == "check_in"},
+                         {"COCHE", "MOTO", "FURGONETA"})
+
+        check_ins = {}
+        for event in events:
+            if event["type"] == "check_in":
+                self.assertNotIn(event["plate"], check_ins) # Una matrícula distinta por estancia
+                check_ins[event["plate"]] = event["timestamp"]
+            else:
+                self.assertGreater(event["timestamp"], check_ins[event["plate"]])
+
+        doubled = generate_events(PROFILES["laborable"], BASE_MS, 24, scale=2.0, seed=3)
+        self.assertGreater(len(doubled), 1.5 * len(events))
+
+    def test_arrivals_follow_hourly_profile(self):
+        rush_hour = [0.0] * 24
+        rush_hour[8] = 500.0
+        profile = {"COCHE": VehicleTraffic(rush_hour, median_stay_minutes=30, stay_sigma=0.1)}
+        start_ms = int(time.mktime((2024, 3, 11, 0, 0, 0, 0, 0, -1)) * 1000) # Medianoche local
+        check_ins = [e["timestamp"] for e in generate_events(profile, start_ms, 24) if e["type"] == "check_in"]
+        self.assertGreater(len(check_ins), 400)
+        self.assertTrue(all(start_ms + 8 * ONE_HOUR_MS <= t < start_ms + 9 * ONE_HOUR_MS for t in check_ins))
+
+    def test_profile_validation(self):
+        with self.assertRaises(ValueError):
+            VehicleTraffic([1.0] * 23, median_stay_minutes=60)
+        path = os.path.join(self.temp_dir, "perfil.json")
+        with open(path, "w", encoding="utf-8") as profile_file:
+            json.dump({"BICI": {"arrivals_per_hour": [1] * 24, "median_stay_minutes": 60}}, profile_file)
+        with self.assertRaises(ValueError):
+            load_profile(path)
+
+    def test_synthetic_plates_are_unique(self):
+        plates = [synthetic_plate(i) for i in range(0, 5000000, 997)]
+        self.assertEqual(len(set(plates)), len(plates))
+        self.assertRegex(synthetic_plate(123456), r"^\d{4}[BCDFGHJKLMNPRSTVWXYZ]{3}$")
+
+    def test_event_log_round_trip_and_history_recording(self):
+        events = generate_events(PROFILES["noche_evento"], BASE_MS, 6, seed=1)
+        path = os.path.join(self.temp_dir, "eventos.jsonl")
+        self.assertEqual(write_event_log(path, events), len(events))
+        self.assertEqual(list(read_event_log(path)), events)
+
+        self.manager.process_gate_events(events)
+        recorded = events_from_history(self.manager)
+        self.assertEqual(recorded, [e for e in events if e["plate"] in {r["plate"] for r in recorded}])
+        self.assertEqual(len(recorded), 2 * sum(1 for e in events if e["type"] == "check_out"))
+
+    def test_replay_keeps_per_plate_order_across_workers(self):
+        events = generate_events(PROFILES["laborable"], BASE_MS, 12, seed=2)
+        report = replay(events, ManagerTarget(self.manager, keep_timestamps=True), speed=0, workers=4)
+        check_outs = sum(1 for event in events if event["type"] == "check_out")
+        self.assertEqual(report["events"], len(events))
+        self.assertEqual(report["statuses"], {"checked_in": len(events) - check_outs, "checked_out": check_outs})
+        self.assertEqual(report["errors"], 0)
+        self.assertEqual(report["latency"]["check_in"]["count"], len(events) - check_outs)
+        self.assertEqual(self.manager.get_current_occupancy(), len(events) - 2 * check_outs)
+
+    def test_replay_respects_speed_and_counts_errors(self):
+        events = [{"type": "check_in", "plate": "A1", "vehicle_type": "COCHE", "timestamp": BASE_MS},
+                  {"type": "check_out", "plate": "A1", "timestamp": BASE_MS + 2000}]
+        start = time.perf_counter()
+        report = replay(events, FailingTarget(), speed=10, workers=2)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.2)
+        self.assertEqual(report["errors"], 2)
+        self.assertEqual(report["statuses"], {"error": 2})
+        self.assertIn("sin conexión", report["last_error"])
+
+    def test_http_target_reuses_one_connection_per_thread(self):
+        KeepAliveHandler.connections = 0
+        server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            target = HttpTarget(f"http://127.0.0.1:{server.server_address[1]}")
+            events = [{"type": "check_in", "plate": synthetic_plate(i), "vehicle_type": "COCHE"} for i in range(20)]
+            report = replay(events, target, speed=0, workers=2)
+            self.assertEqual(report["statuses"], {"ok": 20})
+            self.assertLessEqual(KeepAliveHandler.connections, 2)
+
+            # Si el servidor cierra la conexión inactiva, la siguiente petición abre otra
+            connections = KeepAliveHandler.connections
+            KeepAliveHandler.drop_after_response = True
+            self.assertEqual(target.send(events[0]), ("ok", True))
+            KeepAliveHandler.drop_after_response = False
+            self.assertEqual(target.send(events[1]), ("ok", True))
+            self.assertEqual(KeepAliveHandler.connections, connections + 2)
+            target.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from local_time import LocalClock, ONE_HOUR_MS, ONE_MINUTE_MS
+
+
+class TestLocalClock(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = LocalClock(timezone="Europe/Madrid")
+        self.zone = ZoneInfo("Europe/Madrid")
+
+    def test_offsets_follow_daylight_saving(self):
+        change = int(datetime(2024, 3, 31, 3, 0, tzinfo=self.zone).timestamp() * 1000) # 01:00 UTC
+        values = np.array([change - ONE_MINUTE_MS, change, change + ONE_HOUR_MS, change - 30 * ONE_MINUTE_MS])
+        self.assertEqual(list(self.clock.offsets(values)), [60, 120, 120, 60])
+        self.assertEqual([self.clock.offset_at(v) for v in values], [60, 120, 120, 60])
+
+    def test_midnight_and_local_date(self):
+        midnight = self.clock.midnight_ms(date(2024, 10, 27))
+        next_midnight = self.clock.midnight_ms(date(2024, 10, 28))
+        self.assertEqual(next_midnight - midnight, 25 * ONE_HOUR_MS)
+        self.assertEqual(self.clock.local_date(next_midnight - 1), date(2024, 10, 27))
+        self.assertEqual(self.clock.local_hour(midnight + 3 * ONE_HOUR_MS), 2) # 02:00 se repite
+
+    def test_fixed_offset(self):
+        clock = LocalClock(utc_offset_minutes=90)
+        self.assertTrue(clock.fixed)
+        self.assertEqual(list(clock.offsets([0, 10 ** 12])), [90, 90])
+        self.assertEqual(clock.midnight_ms(date(1970, 1, 2)), 24 * ONE_HOUR_MS - 90 * ONE_MINUTE_MS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,8 @@ from unittest.mock import patch, MagicMock, call
 # Si main.py y vehicle.py están en el mismo directorio que este test,
 # los imports directos deberían funcionar.
 from main import main, ask_vehicle_type
-from vehicle import VehicleType
+from vehicle import Vehicle, VehicleType
+from parking_results import ParkingResult, ResultStatus
 # ParkingManager será mockeado, por lo que no necesitamos importarlo para usarlo,
 # pero sí para que el decorador @patch('main.ParkingManager') lo encuentre.
 # from parking_manager import ParkingManager # Necesario para que @patch funcione correctamente
@@ -41,8 +42,10 @@ class TestMainCLI(unittest.TestCase):
     def test_main_check_in_vehicle_success(self, mock_print, mock_input, MockParkingManager):
         mock_pm_instance = MockParkingManager.return_value
         mock_pm_instance.check_capacity.return_value = True
-        # La función check_in_vehicle de ParkingManager es la que imprime el mensaje de éxito/error.
-        # main.py no lo reimprime.
+        mock_pm_instance.date_format_str = "%d/%m/%Y"
+        # check_in_vehicle devuelve un resultado y main.py imprime el mensaje correspondiente
+        mock_pm_instance.check_in_vehicle.return_value = ParkingResult(
+            ResultStatus.CHECKED_IN, "ABC123", "check_in", vehicle=Vehicle("ABC123", VehicleType.COCHE, 0))
 
         # Simular entradas: opción 1 (check-in), matrícula, tipo 1 (COCHE), opción 7 (salir)
         mock_input.side_effect = ["1", "ABC123", "1", "7"]
@@ -51,6 +54,7 @@ class TestMainCLI(unittest.TestCase):
         mock_pm_instance.check_capacity.assert_called_once()
         mock_pm_instance.check_in_vehicle.assert_called_once_with("ABC123", VehicleType.COCHE)
         mock_print.assert_any_call("\n--- Registrar Entrada de Vehículo ---") # main.py imprime esto
+        self.assertTrue(any("ABC123 (COCHE) registrado" in str(c) for c in mock_print.call_args_list))
         mock_print.assert_any_call("\nCerrando el programa.") # main.py imprime esto al salir
         mock_pm_instance.close_db.assert_called_once()
 
@@ -95,12 +99,12 @@ class TestMainCLI(unittest.TestCase):
     @patch('main.print', create=True)
     def test_main_check_out_vehicle(self, mock_print, mock_input, MockParkingManager):
         mock_pm_instance = MockParkingManager.return_value
-        # check_out_vehicle de ParkingManager imprime sus propios mensajes.
-        # main.py no reimprime el mensaje de éxito/error de check_out_vehicle.
+        mock_pm_instance.check_out_vehicle.return_value = ParkingResult(ResultStatus.NOT_FOUND, "GHI789", "check_out")
 
         mock_input.side_effect = ["2", "GHI789", "7"] # Opción 2 (check-out), matrícula, salir
         main()
         mock_pm_instance.check_out_vehicle.assert_called_once_with("GHI789")
+        mock_print.assert_any_call("Error: El vehículo con matrícula GHI789 no se encuentra en el parking.")
         mock_print.assert_any_call("\n--- Registrar Salida de Vehículo ---")
 
     @patch('main.ParkingManager')
@@ -0,0 +1,82 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+import metrics
+from metrics import MetricsRegistry
+from parking_manager import ParkingManager
+from vehicle import VehicleType
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_histogram_exposition_format(self):
+        registry = MetricsRegistry(enabled=True)
+        histogram = registry.histogram("test_seconds", "Latencia de prueba.", ("route",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, "index")
+        histogram.observe(0.1, "index") # El límite del bucket está incluido (le = "menor o igual")
+        histogram.observe(3.0, "index")
+        histogram.observe(0.5, 'con "comillas"')
+        registry.gauge_function("test_occupancy", "Ocupación.", lambda: 7)
+        registry.gauge_function("test_missing", "Sin valor.", lambda: None)
+
+        text = registry.expose()
+        self.assertIn("# TYPE test_seconds histogram\n", text)
+        self.assertIn('test_seconds_bucket{route="index",le="0.1"} 2\n', text)
+        self.assertIn('test_seconds_bucket{route="index",le="1"} 2\n', text)
+        self.assertIn('test_seconds_bucket{route="index",le="+Inf"} 3\n', text)
+        self.assertIn('test_seconds_sum{route="index"} 3.15\n', text)
+        self.assertIn('test_seconds_count{route="index"} 3\n', text)
+        self.assertIn('test_seconds_count{route="con \\"comillas\\""} 1\n', text)
+        self.assertIn("# TYPE test_occupancy gauge\ntest_occupancy 7\n", text)
+        self.assertNotIn("test_missing", text)
+
+    def test_disabled_registry_records_nothing(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("test_seconds", "Latencia de prueba.")
+        histogram.observe(1.0)
+        with histogram.time():
+            pass
+        self.assertIs(histogram.time(), histogram.time()) # Temporizador vacío compartido
+        self.assertIsNone(histogram.snapshot())
+
+        registry.enabled = True
+        with histogram.time():
+            pass
+        self.assertEqual(histogram.snapshot()["count"], 1)
+        self.assertIs(registry.histogram("test_seconds", "Otra descripción."), histogram)
+
+
+class TestParkingManagerMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        metrics.REGISTRY.clear()
+        metrics.REGISTRY.enabled = True
+        self.manager = ParkingManager(":memory:", capacity=5)
+        self.manager.invoices_dir = self.temp_dir
+
+    def tearDown(self):
+        metrics.REGISTRY.enabled = False
+        metrics.REGISTRY.clear()
+        self.manager.close_db()
+        shutil.rmtree(self.temp_dir)
+
+    def test_statement_classes_and_invoice_render_are_timed(self):
+        self.manager.check_in_vehicle("MET1", VehicleType.COCHE)
+        self.manager.check_out_vehicle("MET1")
+        self.manager.get_vehicle_history_page(limit=10)
+
+        for statement in ("insert_parked", "select_parked", "delete_parked", "insert_history", "upsert_rollups",
+                          "history_page"):
+            self.assertEqual(metrics.SQL_STATEMENT_SECONDS.snapshot(statement)["count"], 1, statement)
+        self.assertEqual(metrics.SQL_STATEMENT_SECONDS.snapshot("commit")["count"], 2)
+        self.assertEqual(metrics.PDF_RENDER_SECONDS.snapshot("ok")["count"], 1)
+        self.assertTrue(os.listdir(self.temp_dir))
+        self.assertIn('parking_sql_statement_duration_seconds_count{statement="insert_parked"} 1',
+                      metrics.REGISTRY.expose())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import sqlite3
+
+from migrations import MIGRATIONS, apply_migrations, get_schema_version
+
+
+def _index_names(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA index_list({table})")}
+
+
+class TestMigrations(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_fresh_database_gets_latest_version(self):
+        applied = apply_migrations(self.conn)
+        latest = max(version for version, _, _ in MIGRATIONS)
+        self.assertEqual(applied, sorted(version for version, _, _ in MIGRATIONS))
+        self.assertEqual(get_schema_version(self.conn), latest)
+        self.assertIn("idx_vehicle_history_plate", _index_names(self.conn, "vehicle_history"))
+        self.assertIn("idx_vehicle_history_checkout", _index_names(self.conn, "vehicle_history"))
+
+    def test_apply_is_idempotent(self):
+        apply_migrations(self.conn)
+        self.assertEqual(apply_migrations(self.conn), [])
+
+    def test_upgrades_legacy_database_keeping_data(self):
+        # Esquema creado por versiones anteriores, sin tabla schema_version
+        self.conn.execute("CREATE TABLE parked_vehicles (plate TEXT PRIMARY KEY, vehicle_type_name TEXT NOT NULL, check_in_time INTEGER NOT NULL)")
+        self.conn.execute("""CREATE TABLE vehicle_history (id INTEGER PRIMARY KEY AUTOINCREMENT, plate TEXT NOT NULL,
+                             vehicle_type_name TEXT NOT NULL, check_in_time INTEGER NOT NULL, check_out_time INTEGER NOT NULL,
+                             duration_minutes INTEGER NOT NULL, fee REAL NOT NULL)""")
+        self.conn.execute("INSERT INTO vehicle_history (plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee) VALUES ('OLD1', 'COCHE', 0, 60000, 1, 0.03)")
+        self.conn.commit()
+
+        apply_migrations(self.conn)
+        self.assertEqual(self.conn.execute("SELECT plate FROM vehicle_history").fetchall(), [("OLD1",)])
+        self.assertIn("idx_vehicle_history_plate", _index_names(self.conn, "vehicle_history"))
+
+    def test_plate_lookup_uses_index(self):
+        apply_migrations(self.conn)
+        plan = self.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM vehicle_history WHERE plate = ? AND check_out_time >= ? ORDER BY check_out_time DESC",
+            ("ABC", 0)
+        ).fetchall()
+        self.assertIn("idx_vehicle_history_plate", " ".join(str(row[-1]) for row in plan))
+
+    def test_failed_migration_is_rolled_back(self):
+        apply_migrations(self.conn)
+        version = get_schema_version(self.conn)
+        broken = [(version + 1, "Migración rota", [
+            "CREATE TABLE temp_table (x INTEGER)",
+            "ESTO NO ES SQL",
+        ])]
+        with self.assertRaises(sqlite3.OperationalError):
+            apply_migrations(self.conn, broken)
+        self.assertEqual(get_schema_version(self.conn), version)
+        tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertNotIn("temp_table", tables)
+
+    def test_callable_steps(self):
+        apply_migrations(self.conn)
+        version = get_schema_version(self.conn)
+        calls = []
+        apply_migrations(self.conn, [(version + 1, "Paso Python", [lambda conn: calls.append(conn)])])
+        self.assertEqual(calls, [self.conn])
+        self.assertEqual(get_schema_version(self.conn), version + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+import sqlite3
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from migrations import apply_migrations
+from occupancy import ONE_DAY_MS, ONE_HOUR_MS, ONE_MINUTE_MS, OccupancyCurve, OccupancyEngine, sweep
+
+DAY_START_MS = 19800 * ONE_DAY_MS # 2024-03-18 00:00 UTC
+DAY = "2024-03-18"
+
+
+def brute_force_levels(check_ins, check_outs, query_times):
+    return np.array([sum(ci <= t < co for ci, co in zip(check_ins, check_outs)) for t in query_times])
+
+
+class TestOccupancyCurve(unittest.TestCase):
+
+    def test_sweep_matches_brute_force(self):
+        rng = np.random.default_rng(7)
+        check_ins = rng.integers(0, ONE_DAY_MS, 300)
+        check_outs = check_ins + rng.integers(0, 6 * ONE_HOUR_MS, 300)
+        curve = OccupancyCurve(*sweep(check_ins, check_outs))
+        queries = rng.integers(-ONE_HOUR_MS, 2 * ONE_DAY_MS, 500)
+        np.testing.assert_array_equal(curve.level_at(queries), brute_force_levels(check_ins, check_outs, queries))
+
+    def test_simultaneous_check_out_and_check_in_do_not_inflate_peak(self):
+        curve = OccupancyCurve(*sweep([0, ONE_HOUR_MS], [ONE_HOUR_MS, 2 * ONE_HOUR_MS]))
+        peaks, averages = curve.bucket_stats([0, 2 * ONE_HOUR_MS])
+        self.assertEqual(peaks[0], 1)
+        self.assertAlmostEqual(averages[0], 1.0)
+
+    def test_bucket_stats(self):
+        # Un vehículo de 0:30 a 2:00 y otro de 1:15 a 1:45
+        curve = OccupancyCurve(*sweep([30 * ONE_MINUTE_MS, 75 * ONE_MINUTE_MS],
+                                      [120 * ONE_MINUTE_MS, 105 * ONE_MINUTE_MS]))
+        peaks, averages = curve.bucket_stats(np.arange(4) * ONE_HOUR_MS)
+        self.assertEqual(list(peaks), [1, 2, 0])
+        np.testing.assert_allclose(averages, [0.5, 1.5, 0.0])
+
+    def test_empty_curve(self):
+        curve = OccupancyCurve(*sweep([], []))
+        peaks, averages = curve.bucket_stats([0, ONE_HOUR_MS])
+        self.assertEqual(list(peaks), [0])
+        self.assertEqual(list(averages), [0.0])
+
+
+class TestOccupancyEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = OccupancyEngine(utc_offset_minutes=0)
+
+    def test_daily_stats_by_type(self):
+        h = ONE_HOUR_MS
+        self.engine.add_stays(["COCHE", "COCHE", "MOTO"],
+                              [DAY_START_MS + 8 * h, DAY_START_MS + 9 * h, DAY_START_MS + 9 * h],
+                              [DAY_START_MS + 20 * h, DAY_START_MS + 10 * h, DAY_START_MS + 33 * h])
+        stats = self.engine.daily_stats(DAY, "2024-03-19", percentiles=(50, 100))
+        total = [s for s in stats if s["vehicle_type_name"] is None]
+        self.assertEqual([s["day"] for s in total], [DAY, "2024-03-19"])
+        self.assertEqual(total[0]["peak"], 3)
+        self.assertEqual(total[0]["peak_hour"], 9)
+        self.assertAlmostEqual(total[0]["average"], (12 + 1 + 15) / 24)
+        self.assertEqual(total[0]["p100"], 3)
+        self.assertEqual(total[1]["peak"], 1)
+        moto = [s for s in stats if s["vehicle_type_name"] == "MOTO"]
+        self.assertEqual([s["peak"] for s in moto], [1, 1])
+        self.assertEqual([s["p50"] for s in moto], [1.0, 0.0])
+
+    def test_incremental_matches_full_computation(self):
+        rng = np.random.default_rng(3)
+        check_ins = DAY_START_MS + rng.integers(0, ONE_DAY_MS, 200)
+        check_outs = check_ins + rng.integers(0, 8 * ONE_HOUR_MS, 200)
+        types = rng.choice(["COCHE", "MOTO"], 200)
+        for start in range(0, 200, 50):
+            self.engine.add_stays(types[start:start + 50], check_ins[start:start + 50], check_outs[start:start + 50])
+        full = OccupancyEngine(utc_offset_minutes=0)
+        full.add_stays(types, check_ins, check_outs)
+        self.assertEqual(self.engine.daily_stats(DAY, DAY), full.daily_stats(DAY, DAY))
+        self.assertEqual(self.engine.hourly(DAY, "MOTO"), full.hourly(DAY, "MOTO"))
+
+    def test_daylight_saving_days(self):
+        engine = OccupancyEngine(timezone="Europe/Madrid")
+        zone = ZoneInfo("Europe/Madrid")
+        # 31/03/2024 (23 horas) y 27/10/2024 (25 horas) en hora de Madrid
+        spring = int(datetime(2024, 3, 31, tzinfo=zone).timestamp() * 1000)
+        autumn = int(datetime(2024, 10, 27, tzinfo=zone).timestamp() * 1000)
+        engine.add_stays(["COCHE", "COCHE"], [spring + 4 * ONE_HOUR_MS, autumn + 4 * ONE_HOUR_MS],
+                         [spring + 5 * ONE_HOUR_MS, autumn + 5 * ONE_HOUR_MS])
+        spring_hours = engine.hourly("2024-03-31")
+        self.assertEqual(len(spring_hours), 23)
+        self.assertEqual([h["hour"] for h in spring_hours[:4]], [0, 1, 3, 4])
+        self.assertEqual([h["hour"] for h in spring_hours if h["peak"]], [5]) # 4 horas reales tras la medianoche
+        autumn_hours = engine.hourly("2024-10-27")
+        self.assertEqual(len(autumn_hours), 25)
+        self.assertEqual([h["hour"] for h in autumn_hours[:4]], [0, 1, 2, 2])
+        self.assertEqual([h["hour"] for h in autumn_hours if h["peak"]], [3])
+
+        stats = engine.daily_stats("2024-03-31", "2024-04-01", percentiles=(100,), by_type=False)
+        self.assertEqual([(s["day"], s["peak"], s["peak_hour"]) for s in stats], [("2024-03-31", 1, 5), ("2024-04-01", 0, 0)])
+        self.assertAlmostEqual(stats[0]["average"], 1 / 23)
+        stats = engine.daily_stats("2024-10-27", "2024-10-27", by_type=False)
+        self.assertEqual((stats[0]["peak_hour"], stats[0]["average"]), (3, 1 / 25))
+
+    def test_update_from_db_reads_only_new_stays(self):
+        conn = sqlite3.connect(":memory:")
+        apply_migrations(conn)
+        insert = """INSERT INTO vehicle_history (plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee)
+                    VALUES (?, 'COCHE', ?, ?, 60, 1.5)"""
+        conn.execute(insert, ("A1", DAY_START_MS, DAY_START_MS + ONE_HOUR_MS))
+        conn.execute("INSERT INTO parked_vehicles VALUES ('P1', 'MOTO', ?)", (DAY_START_MS + 2 * ONE_HOUR_MS,))
+        conn.commit()
+        self.assertEqual(self.engine.update_from_db(conn, now_ms=DAY_START_MS + 4 * ONE_HOUR_MS), 1)
+        conn.execute(insert, ("A2", DAY_START_MS + 30 * ONE_MINUTE_MS, DAY_START_MS + ONE_HOUR_MS))
+        conn.commit()
+        self.assertEqual(self.engine.update_from_db(conn, now_ms=DAY_START_MS + 4 * ONE_HOUR_MS), 1)
+        self.assertEqual(self.engine.update_from_db(conn, now_ms=DAY_START_MS + 4 * ONE_HOUR_MS), 0)
+
+        hours = self.engine.hourly(DAY)
+        self.assertEqual([h["peak"] for h in hours[:5]], [2, 0, 1, 1, 0])
+        self.assertAlmostEqual(hours[0]["average"], 1.5)
+        self.assertEqual(self.engine.vehicle_type_names, ["COCHE", "MOTO"])
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
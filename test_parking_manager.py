@@ -3,9 +3,13 @@ from unittest.mock import patch, MagicMock, mock_open, call
 import sqlite3
 import time
 import os
+import tempfile
+import threading
 from datetime import datetime
 
 from parking_manager import ParkingManager
+from parking_results import ResultStatus
+from tariffs import TariffEngine, TariffRule
 from vehicle import Vehicle, VehicleType
 
 # Constantes de tiempo para pruebas (milisegundos desde la época)
@@ -70,9 +74,12 @@ class TestParkingManager(unittest.TestCase):
         self.mock_time.return_value = FIXED_TIME_MS_BASE / 1000
         plate = "TEST001"
         vehicle_type = VehicleType.COCHE
-        msg = self.parking_manager.check_in_vehicle(plate, vehicle_type)
+        result = self.parking_manager.check_in_vehicle(plate, vehicle_type)
 
-        self.assertIn(f"Vehículo {plate} ({vehicle_type.name}) registrado.", msg)
+        self.assertEqual(result.status, ResultStatus.CHECKED_IN)
+        self.assertTrue(result.ok)
+        self.assertEqual(result.vehicle.type, vehicle_type)
+        self.assertEqual(result.vehicle.check_in_time, FIXED_TIME_MS_BASE)
         self.parking_manager.cursor.execute("SELECT plate, vehicle_type_name, check_in_time FROM parked_vehicles WHERE plate = ?", (plate,))
         row = self.parking_manager.cursor.fetchone()
         self.assertIsNotNone(row)
@@ -81,11 +88,30 @@ class TestParkingManager(unittest.TestCase):
         self.assertEqual(row[2], FIXED_TIME_MS_BASE)
         self.assertEqual(self.parking_manager.get_current_occupancy(), 1)
 
+    def test_check_in_vehicle_parking_full(self):
+        for i in range(self.capacity):
+            self.parking_manager.check_in_vehicle(f"FULL{i}", VehicleType.COCHE)
+        result = self.parking_manager.check_in_vehicle("FULLX", VehicleType.COCHE)
+        self.assertEqual(result.status, ResultStatus.FULL)
+        self.assertFalse(result.ok)
+        self.parking_manager.cursor.execute("SELECT COUNT(*) FROM parked_vehicles")
+        self.assertEqual(self.parking_manager.cursor.fetchone()[0], self.capacity)
+
+    def test_refresh_occupancy_syncs_with_db(self):
+        self.parking_manager.cursor.execute(
+            "INSERT INTO parked_vehicles (plate, vehicle_type_name, check_in_time) VALUES (?, ?, ?)",
+            ("EXTERNAL1", VehicleType.COCHE.name, FIXED_TIME_MS_BASE)
+        )
+        self.parking_manager.conn.commit()
+        self.assertEqual(self.parking_manager.get_current_occupancy(), 0)
+        self.assertEqual(self.parking_manager.refresh_occupancy(), 1)
+        self.assertEqual(self.parking_manager.get_current_occupancy(), 1)
+
     def test_check_in_vehicle_already_parked(self):
         plate = "TEST002"
         self.parking_manager.check_in_vehicle(plate, VehicleType.MOTO)
-        msg = self.parking_manager.check_in_vehicle(plate, VehicleType.MOTO)
-        self.assertIn(f"Error: El vehículo con matrícula {plate} ya está en el parking.", msg)
+        result = self.parking_manager.check_in_vehicle(plate, VehicleType.MOTO)
+        self.assertEqual(result.status, ResultStatus.ALREADY_PARKED)
         self.assertEqual(self.parking_manager.get_current_occupancy(), 1) # No debe aumentar
 
     @patch('parking_manager.ParkingManager._generate_invoice_pdf', return_value=True)
@@ -100,15 +126,17 @@ class TestParkingManager(unittest.TestCase):
         check_out_time_ms = check_in_time_ms + ONE_HOUR_MS # 1 hora después
         self.mock_time.return_value = check_out_time_ms / 1000
 
-        msg, invoice_file = self.parking_manager.check_out_vehicle(plate)
+        result = self.parking_manager.check_out_vehicle(plate)
 
         expected_duration_minutes = ONE_HOUR_MS // (60 * 1000)
         expected_fee = vehicle_type.hourly_rate * (expected_duration_minutes / 60.0)
 
-        self.assertIn(f"Salida registrada para {plate}", msg)
-        self.assertIn(f"Duración: {expected_duration_minutes} minutos", msg)
-        self.assertIn(f"Coste: €{expected_fee:.2f}", msg)
-        self.assertIsNotNone(invoice_file)
+        self.assertEqual(result.status, ResultStatus.CHECKED_OUT)
+        self.assertEqual(result.duration_minutes, expected_duration_minutes)
+        self.assertAlmostEqual(result.fee, expected_fee)
+        self.assertEqual(result.vehicle.check_out_time, check_out_time_ms)
+        self.assertIsNotNone(result.invoice)
+        self.assertFalse(result.invoice_failed)
         mock_generate_pdf.assert_called_once()
         
         # Verificar que el vehículo ya no está en parked_vehicles y está en history
@@ -119,9 +147,9 @@ class TestParkingManager(unittest.TestCase):
         self.assertEqual(self.parking_manager.get_current_occupancy(), 0)
 
     def test_check_out_vehicle_not_found(self):
-        msg, invoice_file = self.parking_manager.check_out_vehicle("NONEXIST")
-        self.assertIn("Error: El vehículo con matrícula NONEXIST no se encuentra en el parking.", msg)
-        self.assertIsNone(invoice_file)
+        result = self.parking_manager.check_out_vehicle("NONEXIST")
+        self.assertEqual(result.status, ResultStatus.NOT_FOUND)
+        self.assertIsNone(result.invoice)
 
     @patch('parking_manager.ParkingManager._generate_invoice_pdf', return_value=True)
     def test_check_out_vehicle_unknown_type_in_db(self, mock_generate_pdf):
@@ -133,9 +161,10 @@ class TestParkingManager(unittest.TestCase):
         self.parking_manager.conn.commit()
 
         self.mock_time.return_value = (FIXED_TIME_MS_BASE + ONE_HOUR_MS) / 1000
-        msg, invoice_file = self.parking_manager.check_out_vehicle(plate)
-        self.assertIn(f"Error: Tipo de vehículo desconocido 'INVALIDTYPE' para la matrícula {plate}", msg)
-        self.assertIsNone(invoice_file)
+        result = self.parking_manager.check_out_vehicle(plate)
+        self.assertEqual(result.status, ResultStatus.UNKNOWN_VEHICLE_TYPE)
+        self.assertEqual(result.detail, "INVALIDTYPE")
+        self.assertIsNone(result.invoice)
         mock_generate_pdf.assert_not_called()
 
     @patch('parking_manager.ParkingManager._generate_invoice_pdf', return_value=False) # Simular fallo en PDF
@@ -145,12 +174,84 @@ class TestParkingManager(unittest.TestCase):
         self.parking_manager.check_in_vehicle(plate, VehicleType.MOTO)
         self.mock_time.return_value = (FIXED_TIME_MS_BASE + ONE_HOUR_MS) / 1000
         
-        msg, invoice_file = self.parking_manager.check_out_vehicle(plate)
-        self.assertIn(f"Salida registrada para {plate}", msg)
-        self.assertIn("Error al generar la factura PDF.", msg)
-        self.assertIsNone(invoice_file) # No se devuelve nombre de archivo
+        result = self.parking_manager.check_out_vehicle(plate)
+        self.assertEqual(result.status, ResultStatus.CHECKED_OUT)
+        self.assertTrue(result.invoice_failed)
+        self.assertIsNone(result.invoice) # No se devuelve nombre de archivo
         mock_generate_pdf_fail.assert_called_once()
 
+    @patch('parking_manager.ParkingManager._generate_invoice_pdf', return_value=True)
+    def test_process_gate_events_uses_event_timestamps(self, mock_generate_pdf):
+        # Se envían desordenados: se aplican por hora del evento
+        events = [
+            {"type": "check_out", "plate": "BATCH01", "timestamp": FIXED_TIME_MS_BASE + NINETY_MINUTES_MS},
+            {"type": "check_in", "plate": "batch01", "vehicle_type": "COCHE", "timestamp": FIXED_TIME_MS_BASE},
+            {"type": "check_in", "plate": "BATCH02", "vehicle_type": "MOTO", "timestamp": FIXED_TIME_MS_BASE + ONE_HOUR_MS},
+        ]
+        results = self.parking_manager.process_gate_events(events)
+
+        self.assertEqual([r.plate for r in results], ["BATCH01", "BATCH01", "BATCH02"])
+        self.assertTrue(all(r.ok for r in results))
+        self.assertEqual(results[0].status, ResultStatus.CHECKED_OUT)
+        self.assertEqual(results[0].duration_minutes, 90)
+        self.assertAlmostEqual(results[0].fee, 2.25)
+        self.assertEqual(results[1].vehicle.check_in_time, FIXED_TIME_MS_BASE)
+        self.assertIsNotNone(results[0].invoice)
+        mock_generate_pdf.assert_called_once()
+        self.assertEqual(self.parking_manager.get_current_occupancy(), 1)
+        self.parking_manager.cursor.execute("SELECT check_in_time FROM parked_vehicles WHERE plate = 'BATCH02'")
+        self.assertEqual(self.parking_manager.cursor.fetchone()[0], FIXED_TIME_MS_BASE + ONE_HOUR_MS)
+        self.parking_manager.cursor.execute("SELECT check_in_time, check_out_time FROM vehicle_history")
+        self.assertEqual(self.parking_manager.cursor.fetchone(),
+                         (FIXED_TIME_MS_BASE, FIXED_TIME_MS_BASE + NINETY_MINUTES_MS))
+
+    @patch('parking_manager.ParkingManager._generate_invoice_pdf', return_value=True)
+    def test_process_gate_events_rejects_invalid_events_individually(self, mock_generate_pdf):
+        self.parking_manager.check_in_vehicle("INSIDE01", VehicleType.COCHE)
+        t = FIXED_TIME_MS_BASE + ONE_HOUR_MS
+        events = [
+            {"type": "check_in", "plate": "INSIDE01", "vehicle_type": "COCHE", "timestamp": t},   # Ya dentro
+            {"type": "check_out", "plate": "NOPE01", "timestamp": t},                           # No está
+            {"type": "check_in", "plate": "BAD01", "vehicle_type": "CAMION", "timestamp": t},     # Tipo inválido
+            {"type": "open_gate", "plate": "X", "timestamp": t},                                # Evento desconocido
+            {"type": "check_in", "plate": "NOTIME01", "vehicle_type": "COCHE"},                 # Sin hora
+            {"type": "check_out", "plate": "INSIDE01", "timestamp": FIXED_TIME_MS_BASE - 1},    # Antes de entrar
+            {"type": "check_in", "plate": "OK01", "vehicle_type": "FURGONETA", "timestamp": t},
+        ]
+        results = self.parking_manager.process_gate_events(events)
+
+        self.assertEqual([r.ok for r in results], [False] * 6 + [True])
+        self.assertEqual([r.status for r in results],
+                         [ResultStatus.ALREADY_PARKED, ResultStatus.NOT_FOUND, ResultStatus.INVALID_VEHICLE_TYPE,
+                          ResultStatus.INVALID_EVENT, ResultStatus.INVALID_TIMESTAMP,
+                          ResultStatus.CHECK_OUT_BEFORE_CHECK_IN, ResultStatus.CHECKED_IN])
+        self.assertEqual(results[2].detail, "CAMION")
+        self.assertEqual(self.parking_manager.get_current_occupancy(), 2)
+        mock_generate_pdf.assert_not_called()
+
+    @patch('parking_manager.ParkingManager._generate_invoice_pdf', return_value=True)
+    def test_state_changes_are_published(self, mock_generate_pdf):
+        subscription = self.parking_manager.events.subscribe()
+        self.parking_manager.check_in_vehicle("BUS001", VehicleType.COCHE)
+        self.parking_manager.check_in_vehicle("BUS001", VehicleType.COCHE) # Rechazada: no se publica
+        self.parking_manager.check_out_vehicle("BUS001")
+
+        events = []
+        while (event := subscription.get(timeout=0)) is not None:
+            events.append(event)
+        self.assertEqual([e["type"] for e in events], ["check_in", "occupancy", "check_out", "occupancy"])
+        self.assertEqual(events[0]["data"]["plate"], "BUS001")
+        self.assertEqual(events[1]["data"], {"capacity": self.capacity, "occupancy": 1, "available": 2})
+        self.assertEqual(events[3]["data"]["occupancy"], 0)
+
+    def test_process_gate_events_respects_capacity(self):
+        events = [{"type": "check_in", "plate": f"CAP{i}", "vehicle_type": "MOTO", "timestamp": FIXED_TIME_MS_BASE + i}
+                  for i in range(self.capacity + 2)]
+        results = self.parking_manager.process_gate_events(events)
+        self.assertEqual([r.ok for r in results], [True] * self.capacity + [False, False])
+        self.assertEqual(results[-1].status, ResultStatus.FULL)
+        self.assertEqual(self.parking_manager.get_current_occupancy(), self.capacity)
+
     @patch('parking_manager.FPDF')
     def test_generate_invoice_pdf_success(self, MockFPDF):
         mock_pdf_instance = MockFPDF.return_value
@@ -256,6 +357,143 @@ class TestParkingManager(unittest.TestCase):
         self.assertEqual(data[0]['check_in_time'], check_in_dt_str)
         self.assertEqual(data[0]['check_out_time'], check_out_dt_str)
 
+    def _insert_history(self, count, check_out_base=FIXED_TIME_MS_BASE, same_time=False):
+        for i in range(count):
+            check_out = check_out_base if same_time else check_out_base + i * 1000
+            self.parking_manager.cursor.execute(
+                """INSERT INTO vehicle_history (plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (f"PAGE{i}", VehicleType.COCHE.name, check_out - ONE_HOUR_MS, check_out, 60, 1.5)
+            )
+        self.parking_manager.conn.commit()
+
+    def test_get_vehicle_history_page_keyset(self):
+        self._insert_history(5)
+        page1, cursor1 = self.parking_manager.get_vehicle_history_page(limit=2)
+        self.assertEqual([r['plate'] for r in page1], ["PAGE4", "PAGE3"])
+        self.assertIsNotNone(cursor1)
+        page2, cursor2 = self.parking_manager.get_vehicle_history_page(limit=2, after=cursor1)
+        self.assertEqual([r['plate'] for r in page2], ["PAGE2", "PAGE1"])
+        page3, cursor3 = self.parking_manager.get_vehicle_history_page(limit=2, after=cursor2)
+        self.assertEqual([r['plate'] for r in page3], ["PAGE0"])
+        self.assertIsNone(cursor3)
+
+    def test_get_vehicle_history_page_ties_on_check_out_time(self):
+        self._insert_history(5, same_time=True)
+        plates, after = [], None
+        while True:
+            page, after = self.parking_manager.get_vehicle_history_page(limit=2, after=after)
+            plates.extend(r['plate'] for r in page)
+            if after is None:
+                break
+        self.assertEqual(plates, ["PAGE4", "PAGE3", "PAGE2", "PAGE1", "PAGE0"])
+
+    def test_raw_times_for_json_api(self):
+        self._insert_history(1)
+        self.parking_manager.check_in_vehicle("RAW001", VehicleType.COCHE)
+        page, _ = self.parking_manager.get_vehicle_history_page(limit=1, raw_times=True)
+        self.assertEqual(page[0]['check_out_time'], FIXED_TIME_MS_BASE)
+        self.assertEqual(page[0]['check_in_time'], FIXED_TIME_MS_BASE - ONE_HOUR_MS)
+        vehicles = self.parking_manager.get_current_vehicles_data(raw_times=True)
+        self.assertEqual(vehicles[0]['check_in_time'], FIXED_TIME_MS_BASE)
+
+    def test_get_history_batch(self):
+        self._insert_history(5)
+        batch = self.parking_manager.get_history_batch(start_ms=FIXED_TIME_MS_BASE + 1000, batch_size=2)
+        self.assertEqual(batch.plates, ["PAGE1", "PAGE2", "PAGE3", "PAGE4"])
+        self.assertEqual(list(batch.check_out_times - batch.check_in_times), [ONE_HOUR_MS] * 4)
+        self.assertEqual(list(batch.vehicle_type_names), ["COCHE"] * 4)
+        self.assertAlmostEqual(batch.fees.sum(), 6.0)
+        self.assertEqual(len(self.parking_manager.get_history_batch(start_ms=FIXED_TIME_MS_BASE * 2)), 0)
+
+    def test_get_current_vehicles_batch(self):
+        self.assertEqual(len(self.parking_manager.get_current_vehicles_batch()), 0)
+        self.parking_manager.check_in_vehicle("BATCHC1", VehicleType.MOTO)
+        batch = self.parking_manager.get_current_vehicles_batch()
+        self.assertEqual(batch.plates, ["BATCHC1"])
+        self.assertEqual(batch.vehicle(0).type, VehicleType.MOTO)
+
+    def test_reprice_history(self):
+        self._insert_history(4) # Estancias de 1 hora de COCHE cobradas a 1,50
+        cheaper = TariffEngine({"COCHE": TariffRule(1.0)}, utc_offset_minutes=0)
+        summary = self.parking_manager.reprice_history(cheaper, batch_size=3)
+        self.assertEqual(summary["rows"], 4)
+        self.assertAlmostEqual(summary["current_total"], 6.0)
+        self.assertAlmostEqual(summary["simulated_total"], 4.0)
+        self.assertAlmostEqual(summary["difference"], -2.0)
+        self.assertEqual(summary["by_type"]["COCHE"]["rows"], 4)
+        # Solo simula: el historial no cambia
+        self.parking_manager.cursor.execute("SELECT SUM(fee) FROM vehicle_history")
+        self.assertAlmostEqual(self.parking_manager.cursor.fetchone()[0], 6.0)
+
+    @patch('parking_manager.ParkingManager._generate_invoice_pdf', return_value=True)
+    def test_check_out_uses_tariff_engine(self, mock_generate_pdf):
+        self.parking_manager.tariffs = TariffEngine({"COCHE": TariffRule(1.5, grace_minutes=90)}, utc_offset_minutes=0)
+        self.parking_manager.check_in_vehicle("GRACE1", VehicleType.COCHE)
+        self.mock_time.return_value = (FIXED_TIME_MS_BASE + ONE_HOUR_MS) / 1000
+        self.assertEqual(self.parking_manager.check_out_vehicle("GRACE1").fee, 0.0)
+
+    def test_invoice_shows_applied_tariff(self):
+        self.parking_manager.tariffs = TariffEngine({"COCHE": TariffRule(1.5, grace_minutes=90)}, utc_offset_minutes=0)
+        self.parking_manager.check_in_vehicle("TARIFA1", VehicleType.COCHE)
+        self.mock_time.return_value = (FIXED_TIME_MS_BASE + ONE_HOUR_MS) / 1000
+        with patch('parking_manager.write_invoice_pdf', return_value=True) as mock_write:
+            self.parking_manager.check_out_vehicle("TARIFA1")
+        self.assertEqual(mock_write.call_args.args[-1], "1.50 \x80/hora; 90 min sin cargo")
+
+    @patch('parking_manager.ParkingManager._generate_invoice_pdf', return_value=True)
+    def test_check_out_updates_report_rollups(self, mock_generate_pdf):
+        day = datetime.fromtimestamp((FIXED_TIME_MS_BASE + ONE_HOUR_MS) / 1000).strftime("%Y-%m-%d")
+        for plate in ("ROLL1", "ROLL2"):
+            self.mock_time.return_value = FIXED_TIME_MS_BASE / 1000
+            self.parking_manager.check_in_vehicle(plate, VehicleType.COCHE)
+            self.mock_time.return_value = (FIXED_TIME_MS_BASE + ONE_HOUR_MS) / 1000
+            self.parking_manager.check_out_vehicle(plate)
+        self.parking_manager.check_out_vehicle("NONEXIST") # Las salidas fallidas no cuentan
+
+        daily = self.parking_manager.get_daily_report(day, day)
+        self.assertEqual(len(daily), 1)
+        self.assertEqual(daily[0]["visits"], 2)
+        self.assertAlmostEqual(daily[0]["revenue"], 2 * VehicleType.COCHE.hourly_rate)
+        self.assertEqual(daily[0]["avg_duration_minutes"], 60)
+        self.assertEqual(sum(row["visits"] for row in self.parking_manager.get_hourly_report(day)), 2)
+        self.assertEqual(self.parking_manager.get_report_summary(day, day)["by_type"]["COCHE"]["visits"], 2)
+
+    def test_occupancy_engine_is_updated_incrementally(self):
+        self._insert_history(2)
+        engine = self.parking_manager.get_occupancy_engine()
+        self.assertEqual(engine.curve().level_at([FIXED_TIME_MS_BASE - 1])[0], 2)
+        last_id = engine.last_history_id
+        self._insert_history(1, check_out_base=FIXED_TIME_MS_BASE + ONE_HOUR_MS)
+        self.assertIs(self.parking_manager.get_occupancy_engine(), engine)
+        self.assertEqual(engine.last_history_id, last_id + 1)
+        self.assertEqual(engine.curve().level_at([FIXED_TIME_MS_BASE + 500])[0], 2)
+
+    def test_get_vehicle_history_page_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            self.parking_manager.get_vehicle_history_page(limit=2, after="no-es-un-cursor")
+
+    def test_get_plate_history(self):
+        self._insert_history(3)
+        self.parking_manager.cursor.execute(
+            """INSERT INTO vehicle_history (plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            ("PAGE1", VehicleType.MOTO.name, FIXED_TIME_MS_BASE, FIXED_TIME_MS_BASE + ONE_HOUR_MS, 60, 1.0)
+        )
+        self.parking_manager.conn.commit()
+        history = self.parking_manager.get_plate_history("PAGE1")
+        self.assertEqual([r['vehicle_type_name'] for r in history], [VehicleType.MOTO.name, VehicleType.COCHE.name])
+        self.assertEqual(len(self.parking_manager.get_plate_history("PAGE1", start_ms=FIXED_TIME_MS_BASE + ONE_HOUR_MS)), 1)
+
+    def test_history_query_uses_index(self):
+        self.parking_manager.cursor.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM vehicle_history WHERE (check_out_time, id) < (?, ?) ORDER BY check_out_time DESC, id DESC LIMIT 10",
+            (FIXED_TIME_MS_BASE, 10)
+        )
+        plan = " ".join(str(row[-1]) for row in self.parking_manager.cursor.fetchall())
+        self.assertIn("idx_vehicle_history_checkout", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
     @patch('parking_manager.ParkingManager._generate_invoice_pdf', return_value=True)
     @patch('builtins.open', new_callable=mock_open)
     @patch('csv.writer')
@@ -276,6 +514,29 @@ class TestParkingManager(unittest.TestCase):
         # Verificar datos escritos (simplificado)
         self.assertTrue(mock_csv_writer.return_value.writerow.call_count >= 2)
 
+    def test_stream_history_csv_batches(self):
+        self._insert_history(5)
+        chunks = list(self.parking_manager.stream_history_csv(batch_size=2))
+        self.assertEqual(len(chunks), 4) # Cabecera + 3 lotes (2, 2, 1)
+        lines = "".join(chunks).splitlines()
+        self.assertEqual(lines[0], ",".join(["Matricula", "TipoVehiculo", "HoraEntrada", "HoraSalida", "DuracionMinutos", "CosteEuros"]))
+        self.assertEqual([line.split(",")[0] for line in lines[1:]], ["PAGE0", "PAGE1", "PAGE2", "PAGE3", "PAGE4"])
+        expected_out = datetime.fromtimestamp(FIXED_TIME_MS_BASE / 1000).strftime("%Y-%m-%d %H:%M:%S")
+        self.assertEqual(lines[1].split(",")[3], expected_out)
+        self.assertEqual(lines[1].split(",")[5], "1.50")
+
+    def test_stream_history_csv_date_range(self):
+        self._insert_history(5)
+        chunks = self.parking_manager.stream_history_csv(start_ms=FIXED_TIME_MS_BASE + 1000, end_ms=FIXED_TIME_MS_BASE + 3000)
+        plates = [line.split(",")[0] for line in "".join(chunks).splitlines()[1:]]
+        self.assertEqual(plates, ["PAGE1", "PAGE2"])
+
+    def test_has_history(self):
+        self.assertFalse(self.parking_manager.has_history())
+        self._insert_history(1)
+        self.assertTrue(self.parking_manager.has_history())
+        self.assertFalse(self.parking_manager.has_history(start_ms=FIXED_TIME_MS_BASE + 1))
+
     def test_export_history_to_csv_no_data(self):
         result_path = self.parking_manager.export_history_to_csv("empty_historial.csv")
         self.assertIsNone(result_path)
@@ -331,5 +592,166 @@ class TestParkingManager(unittest.TestCase):
         except Exception as e:
             self.fail(f"close_db() en conexión ya cerrada (conn=None) lanzó: {e}")
 
+class TestParkingManagerPool(unittest.TestCase):
+    """Pruebas del modo pool (una conexión por hilo) sobre una base de datos en disco."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "parking_pool.db")
+        self.parking_manager = ParkingManager(self.db_path, capacity=100, pool_size=4)
+
+    def tearDown(self):
+        self.parking_manager.close_db()
+        self.tmp_dir.cleanup()
+
+    def test_each_thread_gets_its_own_cursor(self):
+        main_cursor = self.parking_manager.cursor
+        cursors = []
+
+        def worker():
+            cursors.append(self.parking_manager.cursor)
+            self.parking_manager.release_connection()
+
+        t = threading.Thread(target=worker)
+        t.start()
+        t.join()
+        self.assertIsNot(cursors[0], main_cursor)
+        self.assertIsNot(cursors[0].connection, main_cursor.connection)
+
+    @patch('parking_manager.ParkingManager._generate_invoice_pdf', return_value=True)
+    def test_concurrent_check_in_and_check_out(self, mock_pdf):
+        errors = []
+
+        def gate(gate_id):
+            try:
+                for i in range(10):
+                    plate = f"G{gate_id}P{i}"
+                    self.parking_manager.check_in_vehicle(plate, VehicleType.COCHE)
+                    if i % 2 == 0:
+                        self.parking_manager.check_out_vehicle(plate)
+                    self.parking_manager.get_vehicle_history_data()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                self.parking_manager.release_connection()
+
+        threads = [threading.Thread(target=gate, args=(g,)) for g in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.parking_manager.get_current_occupancy(), 20)
+        self.assertEqual(len(self.parking_manager.get_vehicle_history_data()), 20)
+
+    def test_concurrent_check_ins_do_not_exceed_capacity(self):
+        self.parking_manager.capacity = 5
+        results = []
+
+        def gate(gate_id):
+            for i in range(5):
+                results.append(self.parking_manager.check_in_vehicle(f"R{gate_id}P{i}", VehicleType.MOTO))
+            self.parking_manager.release_connection()
+
+        threads = [threading.Thread(target=gate, args=(g,)) for g in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(sum(r.ok for r in results), 5)
+        self.assertEqual(self.parking_manager.get_current_occupancy(), 5)
+        self.parking_manager.cursor.execute("SELECT COUNT(*) FROM parked_vehicles")
+        self.assertEqual(self.parking_manager.cursor.fetchone()[0], 5)
+
+    def test_check_in_waiting_for_connection_does_not_block_others(self):
+        self.parking_manager.close_db()
+        self.parking_manager = ParkingManager(self.db_path, capacity=10, pool_size=1)
+        self.parking_manager.release_connection()
+        holder_ready, holder_go = threading.Event(), threading.Event()
+        results = {}
+
+        def holder():
+            self.parking_manager.conn # Ocupa la única conexión del pool
+            holder_ready.set()
+            holder_go.wait(5)
+            results["holder"] = self.parking_manager.check_in_vehicle("HOLD1", VehicleType.COCHE)
+            self.parking_manager.release_connection()
+
+        def waiter():
+            results["waiter"] = self.parking_manager.check_in_vehicle("WAIT1", VehicleType.COCHE)
+            self.parking_manager.release_connection()
+
+        holder_thread = threading.Thread(target=holder)
+        holder_thread.start()
+        holder_ready.wait(5)
+        waiter_thread = threading.Thread(target=waiter)
+        waiter_thread.start()
+        time.sleep(0.1) # El segundo hilo queda esperando una conexión libre
+        holder_go.set()
+        holder_thread.join(5)
+        waiter_thread.join(5)
+
+        self.assertTrue(results["holder"].ok)
+        self.assertTrue(results["waiter"].ok)
+
+    def test_occupancy_seeded_from_existing_db(self):
+        self.parking_manager.check_in_vehicle("SEED1", VehicleType.COCHE)
+        self.parking_manager.check_in_vehicle("SEED2", VehicleType.COCHE)
+        other_manager = ParkingManager(self.db_path, capacity=100, pool_size=2)
+        try:
+            self.assertEqual(other_manager.get_current_occupancy(), 2)
+        finally:
+            other_manager.close_db()
+
+    def test_shared_connection_check_out_does_not_undo_concurrent_check_in(self):
+        self.parking_manager.close_db()
+        self.parking_manager = ParkingManager(self.db_path, capacity=10, pool_size=0)
+        inserted = threading.Event()
+        apply_check_in = self.parking_manager._apply_check_in
+
+        def slow_apply_check_in(*args):
+            result = apply_check_in(*args)
+            inserted.set()
+            time.sleep(0.2) # Entrada insertada y aún sin commit
+            return result
+
+        with patch.object(self.parking_manager, "_apply_check_in", side_effect=slow_apply_check_in):
+            check_in = threading.Thread(target=self.parking_manager.check_in_vehicle, args=("SHARED1", VehicleType.COCHE))
+            check_in.start()
+            inserted.wait(5)
+            # Salida de una matrícula desconocida mientras la entrada sigue en la transacción compartida
+            self.assertEqual(self.parking_manager.check_out_vehicle("NADIE").status, ResultStatus.NOT_FOUND)
+            check_in.join(5)
+
+        other_manager = ParkingManager(self.db_path, capacity=10)
+        try:
+            self.assertEqual([v["plate"] for v in other_manager.get_current_vehicles_data()], ["SHARED1"])
+        finally:
+            other_manager.close_db()
+        self.assertEqual(self.parking_manager.get_current_occupancy(), 1)
+
+    def test_invoice_workers_require_pool(self):
+        with self.assertRaises(ValueError):
+            ParkingManager(":memory:", capacity=1, invoice_workers=1)
+
+    def test_async_invoice_check_out(self):
+        self.parking_manager.close_db()
+        self.parking_manager = ParkingManager(self.db_path, capacity=10, pool_size=4, invoice_workers=1)
+        self.parking_manager.invoices_dir = self.tmp_dir.name
+        with patch('parking_manager.ParkingManager._generate_invoice_pdf', return_value=True) as mock_pdf:
+            self.parking_manager.check_in_vehicle("ASYNC1", VehicleType.COCHE)
+            result = self.parking_manager.check_out_vehicle("ASYNC1")
+            self.assertEqual(result.status, ResultStatus.CHECKED_OUT)
+            self.assertTrue(result.invoice.startswith("factura_ASYNC1_"))
+            self.assertTrue(self.parking_manager.render_invoice_now(result.invoice))
+            mock_pdf.assert_called_once()
+        self.assertEqual(self.parking_manager.get_invoice_queue_metrics()["queue_depth"], 0)
+
+    def test_close_db_with_pool(self):
+        self.parking_manager.close_db()
+        self.assertIsNone(self.parking_manager.conn)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,304 @@
+import unittest
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch, MagicMock
+
+import cv2
+import numpy as np
+import requests
+
+from plate_recognizer import (PlateRecognizerClient, AsyncPlateRecognizerClient, MotionDetector, FramePreprocessor,
+                              RecognitionCache, parse_plate_response, frame_signature, iter_frames,
+                              recognize_plate_headless)
+
+
+def _car_with_plate(text: str, rng: np.random.Generator = None) -> np.ndarray:
+    """Frame sintético de cámara (640x480, sin recortar) con un vehículo y su matrícula, opcionalmente con ruido del sensor."""
+    frame = np.full((480, 640, 3), 90, dtype=np.uint8)
+    frame[200:420, 160:480] = (40, 40, 160)
+    cv2.rectangle(frame, (260, 360), (380, 385), (255, 255, 255), -1)
+    cv2.putText(frame, text, (265, 380), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
+    if rng is not None:
+        frame = np.clip(frame.astype(int) + rng.integers(-3, 4, size=frame.shape), 0, 255).astype(np.uint8)
+    return frame
+
+
+def _scene(value: int, car: bool = False) -> np.ndarray:
+    """Frame sintético: fondo uniforme y, opcionalmente, un rectángulo que hace de vehículo."""
+    frame = np.full((120, 160, 3), value, dtype=np.uint8)
+    if car:
+        frame[30:90, 40:120] = 230
+    return frame
+
+
+class StubPlateReaderHandler(BaseHTTPRequestHandler):
+    """Servidor de prueba que imita la API de Plate Recognizer."""
+    protocol_version = "HTTP/1.1" # Permite conexiones keep-alive
+
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address)
+            server.auth_headers.append(self.headers.get("Authorization"))
+            status = server.statuses.pop(0) if server.statuses else 200
+            delay = server.delays.pop(0) if server.delays else 0
+        time.sleep(delay)
+        body = json.dumps({"results": [{"plate": "1234-abc", "score": 0.9}]} if status == 200 else {}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPlateRecognizerClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubPlateReaderHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = 0
+        self.server.connections = set()
+        self.server.auth_headers = []
+        self.server.statuses = []
+        self.server.delays = []
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/plate-reader/"
+        self.print_patcher = patch('builtins.print')
+        self.print_patcher.start()
+
+    def tearDown(self):
+        self.print_patcher.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_recognize_returns_cleaned_plate(self):
+        with PlateRecognizerClient(api_key="KEY", api_url=self.url) as client:
+            self.assertEqual(client.recognize(b"jpeg"), "1234ABC")
+        self.assertEqual(self.server.auth_headers, ["Token KEY"])
+
+    def test_connection_is_reused(self):
+        with PlateRecognizerClient(api_key="KEY", api_url=self.url) as client:
+            for _ in range(5):
+                client.recognize(b"jpeg")
+        self.assertEqual(self.server.requests, 5)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_retries_server_errors(self):
+        self.server.statuses = [503, 429]
+        with PlateRecognizerClient(api_key="KEY", api_url=self.url, max_retries=2, backoff_factor=0) as client:
+            self.assertEqual(client.recognize(b"jpeg"), "1234ABC")
+        self.assertEqual(self.server.requests, 3)
+
+    def test_responses_and_read_timeouts_after_processing_are_not_retried(self):
+        self.server.statuses = [502]
+        with PlateRecognizerClient(api_key="KEY", api_url=self.url, max_retries=2, backoff_factor=0) as client:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                client.recognize(b"jpeg")
+        self.assertEqual(self.server.requests, 1)
+
+        self.server.delays = [0.5]
+        with PlateRecognizerClient(api_key="KEY", api_url=self.url, max_retries=2, backoff_factor=0,
+                                   read_timeout=0.1) as client:
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                client.recognize(b"jpeg")
+        time.sleep(0.5)
+        self.assertEqual(self.server.requests, 2) # Una sola petición más: la lectura no se reintentó
+
+    def test_gives_up_after_max_retries(self):
+        self.server.statuses = [503, 503, 503]
+        with PlateRecognizerClient(api_key="KEY", api_url=self.url, max_retries=1, backoff_factor=0) as client:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                client.recognize(b"jpeg")
+        self.assertEqual(self.server.requests, 2)
+
+    def test_async_client(self):
+        async def run():
+            async with AsyncPlateRecognizerClient(PlateRecognizerClient(api_key="KEY", api_url=self.url)) as client:
+                return await asyncio.gather(*(client.recognize(b"jpeg") for _ in range(3)))
+        self.assertEqual(asyncio.run(run()), ["1234ABC"] * 3)
+
+    def test_stats_report_bytes_and_latency(self):
+        with PlateRecognizerClient(api_key="KEY", api_url=self.url) as client:
+            client.recognize(b"x" * 100)
+            client.recognize(b"x" * 300)
+            stats = client.get_stats()
+        self.assertEqual(stats["requests"], 2)
+        self.assertEqual(stats["last_bytes_sent"], 300)
+        self.assertEqual(stats["avg_bytes_sent"], 200)
+        self.assertGreater(stats["avg_latency_ms"], 0)
+
+    @patch('builtins.print')
+    def test_cached_frame_is_not_uploaded_again(self, mock_print):
+        rng = np.random.default_rng(1)
+        preprocessor = FramePreprocessor(max_dimension=None)
+        with PlateRecognizerClient(api_key="KEY", api_url=self.url, cache=RecognitionCache()) as client:
+            self.assertEqual(client.recognize_prepared_frame(_car_with_plate("1234ABC"), preprocessor), "1234ABC")
+            self.assertEqual(client.recognize_prepared_frame(_car_with_plate("1234ABC", rng), preprocessor), "1234ABC")
+            self.assertEqual(self.server.requests, 1)
+            # Otro vehículo parecido con otra matrícula justo después: no debe reutilizar la anterior
+            client.recognize_prepared_frame(_car_with_plate("5678XYZ"), preprocessor)
+            self.assertEqual(self.server.requests, 2)
+        self.assertEqual(client.cache.get_stats(), {"hits": 1, "misses": 2, "entries": 2})
+
+    @patch('builtins.print')
+    def test_failed_read_is_retried_against_the_api(self, mock_print):
+        frame = _car_with_plate("1234ABC")
+        with PlateRecognizerClient(api_key="KEY", api_url=self.url, cache=RecognitionCache()) as client:
+            with patch("plate_recognizer.parse_plate_response", return_value=None):
+                self.assertIsNone(client.recognize_prepared_frame(frame, FramePreprocessor()))
+            self.assertEqual(client.recognize_prepared_frame(frame, FramePreprocessor()), "1234ABC")
+        self.assertEqual(self.server.requests, 2)
+
+    def test_parse_plate_response_without_results(self):
+        self.assertIsNone(parse_plate_response({"results": []}))
+        self.assertIsNone(parse_plate_response({"results": [{"score": 0.5}]}))
+
+class TestFramePreprocessor(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.frame = rng.integers(0, 255, size=(1080, 1920, 3), dtype=np.uint8)
+
+    def test_roi_crop(self):
+        prepared = FramePreprocessor(roi=(0.25, 0.5, 0.5, 0.5), max_dimension=None).prepare(self.frame)
+        self.assertEqual(prepared.shape, (540, 960, 3))
+        np.testing.assert_array_equal(prepared, self.frame[540:1080, 480:1440])
+
+    def test_downscale_keeps_aspect_ratio(self):
+        prepared = FramePreprocessor(max_dimension=640).prepare(self.frame)
+        self.assertEqual(prepared.shape, (360, 640, 3))
+
+    def test_small_frames_are_not_upscaled(self):
+        small = self.frame[:100, :200]
+        self.assertEqual(FramePreprocessor(max_dimension=640).prepare(small).shape, (100, 200, 3))
+
+    def test_grayscale(self):
+        prepared = FramePreprocessor(max_dimension=None, grayscale=True).prepare(self.frame)
+        self.assertEqual(prepared.shape, (1080, 1920))
+
+    def test_preprocessing_reduces_payload(self):
+        full = FramePreprocessor(max_dimension=None, jpeg_quality=95).process(self.frame)
+        reduced = FramePreprocessor(roi=(0.25, 0.5, 0.5, 0.5), max_dimension=480, grayscale=True, jpeg_quality=70).process(self.frame)
+        self.assertLess(len(reduced), len(full) / 10)
+
+    def test_invalid_roi(self):
+        with self.assertRaises(ValueError):
+            FramePreprocessor(roi=(0.5, 0.5, 0.8, 0.2))
+
+    @patch.dict(os.environ, {"PLATE_ROI": "0.1,0.2,0.5,0.5", "PLATE_MAX_DIMENSION": "800",
+                             "PLATE_GRAYSCALE": "1", "PLATE_JPEG_QUALITY": "75"})
+    def test_from_env(self):
+        preprocessor = FramePreprocessor.from_env()
+        self.assertEqual(preprocessor.roi, (0.1, 0.2, 0.5, 0.5))
+        self.assertEqual(preprocessor.max_dimension, 800)
+        self.assertTrue(preprocessor.grayscale)
+        self.assertEqual(preprocessor.jpeg_quality, 75)
+
+
+class TestRecognitionCache(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.plate_a = frame_signature(_car_with_plate("1234ABC"))
+        self.noisy_a = frame_signature(_car_with_plate("1234ABC", rng))
+        self.plate_b = frame_signature(_car_with_plate("1234ABD")) # Solo cambia un carácter
+
+    def test_lookup_hits_and_misses(self):
+        cache = RecognitionCache()
+        self.assertIsNone(cache.lookup(self.plate_a))
+        cache.put(self.plate_a, "1234ABC")
+        self.assertEqual(cache.lookup(self.noisy_a), "1234ABC")
+        self.assertIsNone(cache.lookup(self.plate_b))
+        self.assertEqual(cache.get_stats(), {"hits": 1, "misses": 2, "entries": 1})
+
+    def test_results_without_plate_are_not_cached(self):
+        cache = RecognitionCache()
+        cache.put(self.plate_a, None)
+        self.assertIsNone(cache.lookup(self.plate_a))
+        self.assertEqual(cache.get_stats()["entries"], 0)
+
+    @patch('plate_recognizer.time.monotonic')
+    def test_entries_expire(self, mock_monotonic):
+        cache = RecognitionCache(ttl=3.0)
+        mock_monotonic.return_value = 100.0
+        cache.put(self.plate_a, "1234ABC")
+        mock_monotonic.return_value = 103.5
+        self.assertIsNone(cache.lookup(self.plate_a))
+        self.assertEqual(cache.get_stats()["entries"], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = RecognitionCache(max_entries=2, max_difference=0)
+        signatures = [np.full((4, 4), value, dtype=np.uint8) for value in (0, 100, 200)]
+        cache.put(signatures[0], "A")
+        cache.put(signatures[1], "B")
+        cache.lookup(signatures[0])
+        cache.put(signatures[2], "C")
+        self.assertIsNone(cache.lookup(signatures[1]))
+        self.assertEqual(cache.lookup(signatures[0]), "A")
+
+
+class TestHeadlessRecognition(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.print_patcher = patch('builtins.print')
+        self.print_patcher.start()
+
+    def tearDown(self):
+        self.print_patcher.stop()
+        self.tmp_dir.cleanup()
+
+    def _write_frames(self, frames):
+        for i, frame in enumerate(frames):
+            cv2.imwrite(os.path.join(self.tmp_dir.name, f"frame_{i:03d}.png"), frame)
+
+    def test_iter_frames_from_image_directory(self):
+        self._write_frames([_scene(10), _scene(20), _scene(30)])
+        frames = list(iter_frames(self.tmp_dir.name))
+        self.assertEqual(len(frames), 3)
+        self.assertEqual(len(list(iter_frames(self.tmp_dir.name, max_frames=2))), 2)
+
+    def test_detector_waits_for_scene_to_settle(self):
+        detector = MotionDetector(settle_frames=2)
+        results = [detector.is_candidate(f) for f in [
+            _scene(50), _scene(50), _scene(50),                # Escena vacía: el primer frame es el fondo y no se envía
+            _scene(50, car=True), _scene(50, car=True),        # Llega el vehículo y aún no se ha estabilizado
+            _scene(50, car=True), _scene(50, car=True),        # Vehículo detenido: se envía una vez
+        ]]
+        self.assertEqual(results, [False, False, False, False, False, True, False])
+
+    def test_first_frame_is_not_submitted(self):
+        detector = MotionDetector(settle_frames=0)
+        self.assertEqual([detector.is_candidate(f) for f in [_scene(50), _scene(50), _scene(50, car=True)]],
+                         [False, False, True])
+
+    def test_headless_submits_only_candidate_frames(self):
+        self._write_frames([_scene(50)] * 3 + [_scene(50, car=True)] * 4)
+        client = MagicMock()
+        client.recognize_prepared_frame.side_effect = ["1234ABC"]
+        plate = recognize_plate_headless(self.tmp_dir.name, client=client, detector=MotionDetector(settle_frames=0))
+        self.assertEqual(plate, "1234ABC")
+        self.assertEqual(client.recognize_prepared_frame.call_count, 1) # Solo el vehículo, no la escena vacía
+
+    def test_headless_gives_up_after_max_attempts(self):
+        self._write_frames([_scene(v) for v in range(0, 250, 50)])
+        client = MagicMock()
+        client.recognize_prepared_frame.return_value = None
+        plate = recognize_plate_headless(self.tmp_dir.name, client=client, max_attempts=2,
+                                         detector=MotionDetector(settle_frames=0))
+        self.assertIsNone(plate)
+        self.assertEqual(client.recognize_prepared_frame.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
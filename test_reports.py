@@ -0,0 +1,92 @@
+import unittest
+import sqlite3
+from datetime import datetime
+
+import reports
+from migrations import MIGRATIONS, apply_migrations
+
+BASE_MS = int(datetime(2024, 3, 10, 9, 30).timestamp() * 1000) # Hora local
+ONE_HOUR_MS = 60 * 60 * 1000
+ONE_DAY_MS = 24 * ONE_HOUR_MS
+
+
+class TestReports(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        apply_migrations(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _record(self, type_name, check_out_time, duration, fee):
+        reports.record_check_out(self.conn.cursor(), type_name, check_out_time, duration, fee)
+
+    def test_record_check_out_accumulates_by_day_and_type(self):
+        self._record("COCHE", BASE_MS, 60, 1.5)
+        self._record("COCHE", BASE_MS + ONE_HOUR_MS, 120, 3.0)
+        self._record("MOTO", BASE_MS, 30, 0.5)
+        self._record("COCHE", BASE_MS + ONE_DAY_MS, 10, 0.25)
+
+        rows = reports.daily_report(self.conn, "2024-03-10", "2024-03-10")
+        self.assertEqual([(r["period"], r["vehicle_type_name"], r["visits"]) for r in rows],
+                         [("2024-03-10", "COCHE", 2), ("2024-03-10", "MOTO", 1)])
+        self.assertAlmostEqual(rows[0]["revenue"], 4.5)
+        self.assertEqual(rows[0]["avg_duration_minutes"], 90)
+        self.assertEqual(len(reports.daily_report(self.conn)), 3)
+
+    def test_hourly_report(self):
+        self._record("COCHE", BASE_MS, 60, 1.5)
+        self._record("COCHE", BASE_MS + 10 * 60000, 60, 1.5)
+        self._record("COCHE", BASE_MS + ONE_HOUR_MS, 60, 1.5)
+        self._record("COCHE", BASE_MS + ONE_DAY_MS, 60, 1.5)
+        rows = reports.hourly_report(self.conn, "2024-03-10")
+        self.assertEqual([(r["period"], r["visits"]) for r in rows], [("2024-03-10 09", 2), ("2024-03-10 10", 1)])
+
+    def test_summary(self):
+        self._record("COCHE", BASE_MS, 60, 1.5)
+        self._record("MOTO", BASE_MS + ONE_DAY_MS, 30, 0.5)
+        self._record("MOTO", BASE_MS + 5 * ONE_DAY_MS, 30, 0.5)
+        totals = reports.summary(self.conn, "2024-03-10", "2024-03-11")
+        self.assertEqual(totals["visits"], 2)
+        self.assertAlmostEqual(totals["revenue"], 2.0)
+        self.assertEqual(totals["avg_duration_minutes"], 45)
+        self.assertEqual(set(totals["by_type"]), {"COCHE", "MOTO"})
+        self.assertEqual(reports.summary(self.conn, "2030-01-01", "2030-01-31"),
+                         {"visits": 0, "revenue": 0, "avg_duration_minutes": 0.0, "by_type": {}})
+
+    def test_migration_backfills_existing_history(self):
+        conn = sqlite3.connect(":memory:")
+        apply_migrations(conn, [m for m in MIGRATIONS if m[0] < 4])
+        conn.executemany(
+            """INSERT INTO vehicle_history (plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            [("A1", "COCHE", BASE_MS - ONE_HOUR_MS, BASE_MS, 60, 1.5),
+             ("A2", "COCHE", BASE_MS - ONE_HOUR_MS, BASE_MS, 60, 1.5)]
+        )
+        conn.commit()
+        apply_migrations(conn)
+        rows = reports.daily_report(conn)
+        self.assertEqual([(r["period"], r["visits"], r["revenue"]) for r in rows], [("2024-03-10", 2, 3.0)])
+        self.assertEqual(reports.hourly_report(conn, "2024-03-10")[0]["period"], "2024-03-10 09")
+        conn.close()
+
+    def test_rebuild_rollups_matches_history(self):
+        self._record("MOTO", BASE_MS, 5, 9.0) # Agregado sin historial: se descarta al recalcular
+        self.conn.executemany(
+            """INSERT INTO vehicle_history (plate, vehicle_type_name, check_in_time, check_out_time, duration_minutes, fee)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            [("A1", "COCHE", BASE_MS - ONE_HOUR_MS, BASE_MS, 60, 1.5),
+             ("A2", "COCHE", BASE_MS, BASE_MS + ONE_HOUR_MS, 60, 1.5),
+             ("A3", "FURGONETA", BASE_MS, BASE_MS + ONE_DAY_MS, 30, 2.0)]
+        )
+        reports.rebuild_rollups(self.conn)
+        rows = reports.daily_report(self.conn)
+        self.assertEqual([(r["period"], r["vehicle_type_name"], r["visits"], r["revenue"]) for r in rows],
+                         [("2024-03-10", "COCHE", 2, 3.0), ("2024-03-11", "FURGONETA", 1, 2.0)])
+        self.assertEqual([r["period"] for r in reports.hourly_report(self.conn, "2024-03-10")],
+                         ["2024-03-10 09", "2024-03-10 10"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+from parking_results import ParkingResult, ResultStatus
+from result_messages import format_result
+from vehicle import Vehicle, VehicleType
+
+CHECK_IN_MS = 1678886400000
+ONE_HOUR_MS = 60 * 60 * 1000
+
+
+class TestFormatResult(unittest.TestCase):
+
+    def test_check_in_message(self):
+        result = ParkingResult(ResultStatus.CHECKED_IN, "ABC123", "check_in",
+                               vehicle=Vehicle("ABC123", VehicleType.COCHE, CHECK_IN_MS))
+        self.assertTrue(format_result(result).startswith("Vehículo ABC123 (COCHE) registrado. Hora de entrada: "))
+
+    def test_check_out_message(self):
+        vehicle = Vehicle("ABC123", VehicleType.COCHE, CHECK_IN_MS, CHECK_IN_MS + ONE_HOUR_MS)
+        result = ParkingResult(ResultStatus.CHECKED_OUT, "ABC123", "check_out", vehicle=vehicle,
+                               duration_minutes=60, fee=1.5, invoice="factura.pdf")
+        message = format_result(result)
+        self.assertIn("Salida registrada para ABC123 (COCHE).", message)
+        self.assertIn("Duración: 60 minutos", message)
+        self.assertIn("Coste: €1.50", message)
+        self.assertNotIn("Error al generar la factura PDF.", message)
+
+        result.invoice_failed = True
+        self.assertTrue(format_result(result).endswith("\nError al generar la factura PDF."))
+
+    def test_error_messages(self):
+        self.assertEqual(format_result(ParkingResult(ResultStatus.FULL, "X1")), "Error: El parking está lleno.")
+        self.assertEqual(format_result(ParkingResult(ResultStatus.ALREADY_PARKED, "X1")),
+                         "Error: El vehículo con matrícula X1 ya está en el parking.")
+        self.assertEqual(format_result(ParkingResult(ResultStatus.NOT_FOUND, "X1")),
+                         "Error: El vehículo con matrícula X1 no se encuentra en el parking.")
+        self.assertEqual(format_result(ParkingResult(ResultStatus.UNKNOWN_VEHICLE_TYPE, "X1", detail="CAMION")),
+                         "Error: Tipo de vehículo desconocido 'CAMION' para la matrícula X1 al salir.")
+        self.assertEqual(format_result(ParkingResult(ResultStatus.DB_ERROR, "X1", "check_out", detail="locked")),
+                         "Error de base de datos al registrar salida: locked")
+
+    def test_every_error_status_has_a_message(self):
+        for status in ResultStatus:
+            if status.ok:
+                continue
+            self.assertNotIn("Resultado inesperado", format_result(ParkingResult(status, "X1", "check_in")))
+
+
+class TestParkingResult(unittest.TestCase):
+
+    def test_to_dict(self):
+        vehicle = Vehicle("ABC123", VehicleType.MOTO, CHECK_IN_MS, CHECK_IN_MS + ONE_HOUR_MS)
+        result = ParkingResult(ResultStatus.CHECKED_OUT, "ABC123", "check_out", vehicle=vehicle,
+                               duration_minutes=60, fee=1.0, invoice="factura.pdf")
+        self.assertEqual(result.to_dict(), {
+            "status": "checked_out", "ok": True, "plate": "ABC123", "vehicle_type_name": "MOTO",
+            "check_in_time": CHECK_IN_MS, "check_out_time": CHECK_IN_MS + ONE_HOUR_MS,
+            "duration_minutes": 60, "fee": 1.0, "invoice": "factura.pdf",
+        })
+        self.assertEqual(ParkingResult(ResultStatus.FULL, "X1", "check_in").to_dict(),
+                         {"status": "full", "ok": False, "plate": "X1"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+import json
+import os
+import tempfile
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from tariffs import TariffEngine, TariffRule, TimeBand, MINUTES_PER_DAY
+from vehicle import Vehicle, VehicleType
+
+BASE_MS = 1678886400000 # 15/03/2023 13:20 UTC
+MINUTE_MS = 60000
+
+
+def brute_force_fee(rule: TariffRule, offset, check_in: int, check_out: int) -> float:
+    """Referencia minuto a minuto, con el máximo diario aplicado a cada periodo de 24 horas.
+    offset es el desfase fijo en minutos o una zona horaria, que se consulta en cada minuto."""
+    duration = max(check_out - check_in, 0) // MINUTE_MS
+    if duration <= rule.grace_minutes:
+        return 0.0
+    rates = np.full(MINUTES_PER_DAY, rule.hourly_rate)
+    for band in rule.bands:
+        rates[band.minutes()] = band.hourly_rate
+    first = check_in // MINUTE_MS
+    total, period = 0.0, 0.0
+    for i in range(duration):
+        if i and i % MINUTES_PER_DAY == 0:
+            total += min(period, rule.daily_cap if rule.daily_cap is not None else np.inf)
+            period = 0.0
+        if isinstance(offset, ZoneInfo):
+            local = datetime.fromtimestamp((first + i) * 60, offset)
+            period += rates[local.hour * 60 + local.minute] / 60
+        else:
+            period += rates[(first + i + offset) % MINUTES_PER_DAY] / 60
+    return total + min(period, rule.daily_cap if rule.daily_cap is not None else np.inf)
+
+
+class TestTariffEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.night_rule = TariffRule(2.0, [TimeBand(20 * 60, 8 * 60, 0.5), TimeBand(12 * 60, 14 * 60, 3.0)],
+                                     daily_cap=20.0, grace_minutes=15)
+        self.engine = TariffEngine({"COCHE": self.night_rule, "MOTO": TariffRule(1.0)}, utc_offset_minutes=60)
+
+    def test_default_engine_matches_vehicle_fee(self):
+        engine = TariffEngine.default()
+        for vehicle_type in VehicleType:
+            for minutes in (0, 1, 59, 90, 1500):
+                vehicle = Vehicle("X", vehicle_type, BASE_MS, BASE_MS + minutes * MINUTE_MS + 30000)
+                self.assertAlmostEqual(engine.fee(vehicle_type.name, BASE_MS, vehicle.check_out_time),
+                                       vehicle.calculate_parking_fee())
+
+    def test_batch_matches_minute_by_minute_reference(self):
+        count = 300
+        check_in = BASE_MS + self.rng.integers(0, 7 * 24 * 60, count) * MINUTE_MS + self.rng.integers(0, MINUTE_MS, count)
+        check_out = check_in + self.rng.integers(0, 3 * 24 * 60, count) * MINUTE_MS + self.rng.integers(0, MINUTE_MS, count)
+        types = self.rng.choice(["COCHE", "MOTO"], count)
+        fees = self.engine.fees(types, check_in, check_out)
+        for i in range(count):
+            expected = brute_force_fee(self.engine.rules[types[i]], 60, int(check_in[i]), int(check_out[i]))
+            self.assertAlmostEqual(fees[i], expected, places=9)
+
+    def test_night_band_crossing_midnight(self):
+        # 22:00 a 02:00 hora local (UTC+1): 4 horas a 0,50
+        check_in = BASE_MS + (22 * 60 - 13 * 60 - 20 - 60) * MINUTE_MS
+        self.assertAlmostEqual(self.engine.fee("COCHE", check_in, check_in + 4 * 60 * MINUTE_MS), 2.0)
+
+    def test_daylight_saving_transitions(self):
+        engine = TariffEngine({"COCHE": self.night_rule}, timezone="Europe/Madrid")
+        zone = ZoneInfo("Europe/Madrid")
+        # 22:00 a 04:00 hora local del 25 al 26/03/2023: a las 02:00 se adelanta a las 03:00
+        check_in = int(datetime(2023, 3, 25, 22, 0, tzinfo=zone).timestamp() * 1000)
+        check_out = int(datetime(2023, 3, 26, 4, 0, tzinfo=zone).timestamp() * 1000)
+        self.assertAlmostEqual(engine.fee("COCHE", check_in, check_out), 5 * 0.5) # 5 horas reales
+        # Estancias de hasta tres días alrededor de ambos cambios de 2023, frente a la referencia
+        count = 60
+        spring = int(datetime(2023, 3, 24, tzinfo=zone).timestamp() * 1000)
+        autumn = int(datetime(2023, 10, 27, tzinfo=zone).timestamp() * 1000)
+        check_ins = np.where(self.rng.random(count) < 0.5, spring, autumn) + self.rng.integers(0, 3 * 24 * 60, count) * MINUTE_MS
+        check_outs = check_ins + self.rng.integers(0, 3 * 24 * 60, count) * MINUTE_MS + self.rng.integers(0, MINUTE_MS, count)
+        fees = engine.fees(["COCHE"] * count, check_ins, check_outs)
+        for i in range(count):
+            expected = brute_force_fee(self.night_rule, zone, int(check_ins[i]), int(check_outs[i]))
+            self.assertAlmostEqual(fees[i], expected, places=9)
+
+    def test_daily_cap_applies_per_24_hours(self):
+        fee = self.engine.fee("COCHE", BASE_MS, BASE_MS + (3 * 24 * 60 + 30) * MINUTE_MS)
+        day_cost = self.engine.fee("COCHE", BASE_MS, BASE_MS + 24 * 60 * MINUTE_MS)
+        self.assertEqual(day_cost, 20.0)
+        self.assertAlmostEqual(fee, 3 * 20.0 + self.engine.fee("COCHE", BASE_MS, BASE_MS + 30 * MINUTE_MS))
+
+    def test_grace_period(self):
+        self.assertEqual(self.engine.fee("COCHE", BASE_MS, BASE_MS + 15 * MINUTE_MS), 0.0)
+        self.assertGreater(self.engine.fee("COCHE", BASE_MS, BASE_MS + 16 * MINUTE_MS), 0.0)
+
+    def test_unknown_vehicle_type(self):
+        with self.assertRaises(KeyError):
+            self.engine.fees(["COCHE", "CAMION"], [BASE_MS, BASE_MS], [BASE_MS, BASE_MS])
+
+    def test_empty_batch(self):
+        self.assertEqual(len(self.engine.fees([], [], [])), 0)
+
+    def test_from_file(self):
+        config = {"utc_offset_minutes": 120,
+                  "rules": {"COCHE": {"hourly_rate": 3, "daily_cap": 25, "grace_minutes": 10,
+                                      "bands": [{"start": "21:00", "end": "07:30", "hourly_rate": 1}]}}}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "tarifas.json")
+            with open(path, "w", encoding="utf-8") as config_file:
+                json.dump(config, config_file)
+            engine = TariffEngine.from_file(path)
+        self.assertEqual(engine.utc_offset_minutes, 120)
+        rule = engine.rules["COCHE"]
+        self.assertEqual((rule.hourly_rate, rule.daily_cap, rule.grace_minutes), (3.0, 25.0, 10))
+        self.assertEqual((rule.bands[0].start, rule.bands[0].end), (21 * 60, 7 * 60 + 30))
+        self.assertEqual(engine.rules["MOTO"].hourly_rate, VehicleType.MOTO.hourly_rate) # Sin regla: tarifa plana
+
+    def test_invalid_config(self):
+        with self.assertRaises(ValueError):
+            TariffEngine.from_dict({"rules": {"COCHE": {"hourly_rate": 1, "bands": [{"start": "25:00", "end": "02:00", "hourly_rate": 1}]}}})
+        with self.assertRaises(ValueError):
+            TariffRule(-1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+import tracing
+from metrics import MetricsRegistry
+from parking_manager import ParkingManager
+from tracing import Tracer, traced
+from vehicle import VehicleType
+
+
+def span_names(span: dict) -> list[str]:
+    return [span["name"]] + [name for child in span.get("children", []) for name in span_names(child)]
+
+
+class TestTracer(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.tracer = Tracer(sample_rate=1, buffer_size=3, slow_ms=0.0)
+        self.patcher = patch.object(tracing, "TRACER", self.tracer)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def _request(self, name="ruta", nested=1):
+        handle = self.tracer.begin(name, method="GET")
+        try:
+            for i in range(nested):
+                with tracing.span("sql", None, f"consulta{i}"):
+                    with tracing.span("format.rows"):
+                        pass
+        finally:
+            if handle is not None:
+                self.tracer.end(handle, status=200)
+
+    def test_span_tree_and_ring_buffer(self):
+        for i in range(5):
+            self._request(f"ruta{i}", nested=2)
+        traces = self.tracer.recent()
+        self.assertEqual([trace["name"] for trace in traces], ["ruta4", "ruta3", "ruta2"])
+        root = traces[0]["root"]
+        self.assertEqual(root["attributes"], {"method": "GET", "status": 200})
+        self.assertEqual(span_names(root), ["ruta4", "sql:consulta0", "format.rows", "sql:consulta1", "format.rows"])
+        self.assertIsNone(tracing.current_span()) # El contexto queda limpio al terminar
+
+    def test_sampling_one_in_n(self):
+        self.tracer.sample_rate = 3
+        self.tracer.buffer_size = 10
+        for _ in range(7):
+            self._request()
+        self.assertEqual(len(self.tracer.recent()), 3) # Peticiones 0, 3 y 6
+
+        self.tracer.sample_rate = 0
+        self.tracer.clear()
+        self._request()
+        self.assertEqual(self.tracer.recent(), [])
+
+    def test_slow_traces_are_dumped(self):
+        self.tracer.dump_dir = os.path.join(self.temp_dir, "traces")
+        self.tracer.slow_ms = 10 ** 6
+        self._request("rapida")
+        self.assertFalse(os.path.exists(self.tracer.dump_dir))
+        self.tracer.slow_ms = 0.0
+        self._request("lenta")
+        files = os.listdir(self.tracer.dump_dir)
+        self.assertEqual(len(files), 1)
+        with open(os.path.join(self.tracer.dump_dir, files[0]), encoding="utf-8") as trace_file:
+            self.assertEqual(json.load(trace_file)["name"], "lenta")
+        self.assertEqual(len(self.tracer.recent(min_duration_ms=10 ** 6)), 0)
+
+    def test_spans_still_feed_histograms(self):
+        registry = MetricsRegistry(enabled=True)
+        histogram = registry.histogram("test_seconds", "Prueba.", ("statement",))
+        with tracing.span("sql", histogram, "sin_traza"):
+            pass
+        with patch.object(tracing, "MAX_SPANS_PER_TRACE", 2):
+            handle = self.tracer.begin("ruta")
+            for _ in range(3):
+                with tracing.span("sql", histogram, "con_traza"):
+                    pass
+            self.tracer.end(handle)
+        self.assertEqual(histogram.snapshot("sin_traza")["count"], 1)
+        self.assertEqual(histogram.snapshot("con_traza")["count"], 3) # También los spans descartados
+        self.assertEqual(self.tracer.recent()[0]["dropped_spans"], 2)
+
+    def test_traced_methods_start_a_trace_outside_requests(self):
+        manager = ParkingManager(":memory:", capacity=5)
+        manager.invoices_dir = self.temp_dir
+        try:
+            manager.check_in_vehicle("TRZ1", VehicleType.COCHE)
+            manager.check_out_vehicle("TRZ1")
+        finally:
+            manager.close_db()
+        check_out = self.tracer.recent()[0]
+        self.assertEqual(check_out["name"], "check_out_vehicle")
+        names = span_names(check_out["root"])
+        for name in ("sql:select_parked", "sql:delete_parked", "sql:insert_history", "sql:commit",
+                     "_finish_invoices", "pdf.build", "file.write_pdf"):
+            self.assertIn(name, names)
+
+    def test_traced_decorator_without_sampling_is_transparent(self):
+        self.tracer.sample_rate = 0
+
+        @traced()
+        def add(a, b):
+            return a + b
+
+        self.assertEqual(add(2, 3), 5)
+        self.assertEqual(add.__name__, "add")
+        self.assertEqual(self.tracer.recent(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
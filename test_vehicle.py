@@ -1,5 +1,7 @@
 import unittest
-from vehicle import Vehicle, VehicleType # Asegúrate de que vehicle.py esté accesible
+import numpy as np
+from unittest.mock import patch
+from vehicle import Vehicle, VehicleBatch, VehicleType, NO_CHECK_OUT # Asegúrate de que vehicle.py esté accesible
 
 # Constantes para facilitar la lectura de tiempos en milisegundos
 MS_IN_MINUTE = 60 * 1000
@@ -91,5 +93,57 @@ class TestVehicleCalculations(unittest.TestCase):
         vehicle_2_5h = Vehicle("FURGO2", VehicleType.FURGONETA, check_in_time, int(2.5 * MS_IN_HOUR))
         self.assertAlmostEqual(vehicle_2_5h.calculate_parking_fee(), 2.0 * 2.5, msg="Coste para FURGONETA 2.5 horas incorrecto.") # 5.0
 
+    def test_default_tariffs_are_built_once(self):
+        """
+        Sin tarifas, todos los vehículos usan el mismo TariffEngine.default() en lugar de crear uno por llamada.
+        """
+        Vehicle("UNO", VehicleType.COCHE, 0, MS_IN_HOUR).calculate_parking_fee()
+        with patch("tariffs.TariffEngine.default") as default:
+            fee = Vehicle("DOS", VehicleType.MOTO, 0, MS_IN_HOUR).calculate_parking_fee()
+        default.assert_not_called()
+        self.assertAlmostEqual(fee, 1.0)
+
+class TestVehicleBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.batch = VehicleBatch.from_columns(
+            ["A1", "B2", "C3"], ["COCHE", "MOTO", "DESCONOCIDO"],
+            [0, MS_IN_HOUR, 2 * MS_IN_HOUR], [MS_IN_HOUR, 3 * MS_IN_HOUR, 3 * MS_IN_HOUR],
+            [60, 120, 60], [1.5, 2.0, 0.0]
+        )
+
+    def test_vehicle_has_no_instance_dict(self):
+        vehicle = Vehicle("SLOT1", VehicleType.COCHE, 0)
+        self.assertFalse(hasattr(vehicle, "__dict__"))
+        with self.assertRaises(AttributeError):
+            vehicle.color = "rojo"
+
+    def test_columns_are_typed_arrays(self):
+        self.assertEqual(len(self.batch), 3)
+        self.assertEqual(self.batch.type_codes.dtype, np.int8)
+        self.assertEqual(self.batch.check_in_times.dtype, np.int64)
+        self.assertEqual(list(self.batch.type_codes), [0, 1, -1])
+        self.assertEqual(list(self.batch.vehicle_type_names), ["COCHE", "MOTO", ""])
+        self.assertAlmostEqual(self.batch.fees.sum(), 3.5)
+        self.assertEqual(self.batch.nbytes(), 3 * (1 + 8 + 8 + 4 + 8))
+
+    def test_vehicle_from_row(self):
+        vehicle = self.batch.vehicle(1)
+        self.assertEqual((vehicle.plate, vehicle.type, vehicle.check_out_time), ("B2", VehicleType.MOTO, 3 * MS_IN_HOUR))
+        self.assertEqual(vehicle.calculate_parking_duration_in_minutes(), 120)
+        self.assertIsNone(self.batch.vehicle(2))
+
+    def test_parked_vehicles_have_no_check_out(self):
+        batch = VehicleBatch.from_columns(["P1"], ["FURGONETA"], [MS_IN_HOUR])
+        self.assertEqual(batch.check_out_times[0], NO_CHECK_OUT)
+        self.assertIsNone(batch.vehicle(0).check_out_time)
+
+    def test_concatenate(self):
+        combined = VehicleBatch.concatenate([self.batch, self.batch])
+        self.assertEqual(len(combined), 6)
+        self.assertEqual(combined.plates[3], "A1")
+        self.assertEqual(len(VehicleBatch.concatenate([])), 0)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
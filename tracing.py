@@ -0,0 +1,247 @@
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from metrics import Histogram
+
+MAX_SPANS_PER_TRACE = 1000 # Un lote grande de eventos de barrera no debe crecer sin límite en memoria
+
+
+class Span:
+    """Operación medida dentro de una traza, con sus operaciones hijas.
+
+    Atributos:
+        name str: Nombre de la operación ("sql:insert_parked", "pdf.build", "check_out_vehicle"...)
+        trace Trace: Traza a la que pertenece
+        attributes dict: Datos adicionales (ruta, código HTTP...)
+        start float: Inicio (time.perf_counter())
+        end Optional[float]: Fin (None mientras está abierta)
+        children list[Span]: Operaciones hijas, en orden de inicio"""
+    __slots__ = ("name", "trace", "attributes", "start", "end", "children")
+
+    def __init__(self, name: str, trace: "Trace", attributes: Optional[dict] = None):
+        self.name = name
+        self.trace = trace
+        self.attributes = attributes or {}
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.children: list[Span] = []
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end if self.end is not None else time.perf_counter()) - self.start) * 1000
+
+    def to_dict(self, origin: float) -> dict:
+        """Convierte el span y sus hijos en un diccionario serializable, con el inicio en ms desde `origin`."""
+        data = {"name": self.name, "start_ms": round((self.start - origin) * 1000, 3),
+                "duration_ms": round(self.duration_ms, 3)}
+        if self.attributes:
+            data["attributes"] = self.attributes
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+class Trace:
+    """Árbol de spans de una petición o llamada muestreada.
+
+    Atributos:
+        id int: Número de la traza (secuencial)
+        started_at int: Hora de inicio en ms desde la época
+        root Span: Span raíz (la ruta o el método que inició la traza)
+        span_count int: Spans registrados
+        dropped_spans int: Spans descartados al superar MAX_SPANS_PER_TRACE"""
+
+    def __init__(self, trace_id: int, name: str, attributes: Optional[dict] = None):
+        self.id = trace_id
+        self.started_at = int(time.time() * 1000)
+        self.span_count = 1
+        self.dropped_spans = 0
+        self.root = Span(name, self, attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "name": self.root.name, "started_at": self.started_at,
+                "duration_ms": round(self.duration_ms, 3), "dropped_spans": self.dropped_spans,
+                "root": self.root.to_dict(self.root.start)}
+
+
+# Span abierto en el contexto actual (hilo o petición); None si no se está trazando
+_current_span: ContextVar[Optional[Span]] = ContextVar("parking_current_span", default=None)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _SpanContext:
+    """Abre un span hijo del span actual y, con histograma, registra también su duración en la métrica."""
+    __slots__ = ("_parent", "_name", "_histogram", "_labels", "_span", "_token", "_start")
+
+    def __init__(self, parent: Span, name: str, histogram: Optional[Histogram], labels: tuple):
+        self._parent = parent
+        self._name = name
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self) -> Optional[Span]:
+        trace = self._parent.trace
+        self._span = None
+        if trace.span_count >= MAX_SPANS_PER_TRACE:
+            trace.dropped_spans += 1
+        else:
+            trace.span_count += 1
+            name = ":".join((self._name, *self._labels)) if self._labels else self._name
+            self._span = Span(name, trace)
+            self._parent.children.append(self._span)
+            self._token = _current_span.set(self._span)
+        self._start = self._span.start if self._span is not None else time.perf_counter()
+        return self._span
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        if self._span is not None:
+            self._span.end = end
+            if exc_info[0] is not None:
+                self._span.attributes["error"] = exc_info[0].__name__
+            _current_span.reset(self._token)
+        if self._histogram is not None:
+            self._histogram.observe(end - self._start, *self._labels)
+        return False
+
+
+def span(name: str, histogram: Optional[Histogram] = None, *labels: str):
+    """Context manager que mide una operación: si la petición actual se está trazando, la añade como
+    span hijo del span abierto (con los valores de etiqueta en el nombre, p. ej. "sql:commit"); con
+    `histogram`, registra además su duración en la métrica como Histogram.time(*labels).
+    Sin traza activa cuesta lo mismo que Histogram.time() (o nada, sin histograma)."""
+    parent = _current_span.get()
+    if parent is None:
+        return histogram.time(*labels) if histogram is not None else _NOOP_SPAN
+    return _SpanContext(parent, name, histogram, labels)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+class Tracer:
+    """Muestreador de trazas: traza 1 de cada `sample_rate` peticiones (o llamadas a métodos
+    decorados con `traced` fuera de una petición), guarda las últimas en un buffer circular y escribe
+    en `dump_dir` las que tardan al menos `slow_ms`.
+
+    Atributos:
+        sample_rate int: Se traza una de cada sample_rate peticiones (0: desactivado)
+        slow_ms float: Duración a partir de la cual una traza se considera lenta
+        dump_dir Optional[str]: Directorio donde se escriben las trazas lentas (None: no se escriben)
+        buffer_size int: Trazas recientes que se conservan en memoria"""
+
+    def __init__(self, sample_rate: int = 0, buffer_size: int = 100, slow_ms: float = 500.0,
+                 dump_dir: Optional[str] = None):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.dump_dir = dump_dir
+        self._lock = threading.Lock()
+        self._traces: deque = deque(maxlen=buffer_size)
+        self._requests = itertools.count()
+        self._ids = itertools.count(1)
+        self.dumped_count = 0
+
+    @property
+    def buffer_size(self) -> int:
+        return self._traces.maxlen # type: ignore
+
+    @buffer_size.setter
+    def buffer_size(self, size: int):
+        with self._lock:
+            self._traces = deque(self._traces, maxlen=size)
+
+    def begin(self, name: str, **attributes) -> Optional[tuple]:
+        """Decide si se traza esta petición y, si es así, abre la traza en el contexto actual.
+        Devuelve el identificador que hay que pasar a end(), o None si no se traza."""
+        if self.sample_rate <= 0 or _current_span.get() is not None:
+            return None
+        if next(self._requests) % self.sample_rate:
+            return None
+        trace = Trace(next(self._ids), name, attributes)
+        return trace, _current_span.set(trace.root)
+
+    def end(self, handle: tuple, **attributes):
+        """Cierra una traza abierta con begin(), la guarda en el buffer y la escribe si es lenta."""
+        trace, token = handle
+        trace.root.end = time.perf_counter()
+        trace.root.attributes.update(attributes)
+        try:
+            _current_span.reset(token)
+        except ValueError: # Cerrada desde otro contexto (p. ej. al terminar una respuesta en streaming)
+            _current_span.set(None)
+        with self._lock:
+            self._traces.append(trace)
+        if self.dump_dir and trace.duration_ms >= self.slow_ms:
+            self._dump(trace)
+
+    def _dump(self, trace: Trace):
+        try:
+            os.makedirs(self.dump_dir, exist_ok=True) # type: ignore
+            path = os.path.join(self.dump_dir, f"trace_{trace.started_at}_{trace.id}.json") # type: ignore
+            with open(path, "w", encoding="utf-8") as trace_file:
+                json.dump(trace.to_dict(), trace_file, indent=2)
+            self.dumped_count += 1
+        except OSError as e:
+            print(f"Error al guardar la traza {trace.id}: {e}")
+
+    def recent(self, limit: Optional[int] = None, min_duration_ms: float = 0.0) -> list[dict]:
+        """Trazas del buffer (de más reciente a más antigua) que duran al menos min_duration_ms."""
+        with self._lock:
+            traces = list(self._traces)
+        selected = [trace.to_dict() for trace in reversed(traces) if trace.duration_ms >= min_duration_ms]
+        return selected[:limit] if limit is not None else selected
+
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
+
+
+# Trazador global que usan app.py y ParkingManager (desactivado hasta que se configura sample_rate)
+TRACER = Tracer()
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorador para los métodos que se quieren ver en las trazas: dentro de una traza añaden un span
+    con su duración; fuera de ella (CLI, scripts) cuentan como una petición para el muestreo."""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            parent = _current_span.get()
+            if parent is not None:
+                with _SpanContext(parent, span_name, None, ()):
+                    return func(*args, **kwargs)
+            handle = TRACER.begin(span_name)
+            if handle is None:
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                TRACER.end(handle)
+        return wrapper
+    return decorator
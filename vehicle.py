@@ -1,7 +1,12 @@
 from enum import Enum
-from typing import Optional
+from typing import TYPE_CHECKING, Iterable, Optional, Sequence
 import time
 
+import numpy as np
+
+if TYPE_CHECKING:
+    from tariffs import TariffEngine
+
 
 class VehicleType(Enum):
     """Enum de tipos de vehículos con sus tarifas por hora."""
@@ -19,6 +24,9 @@ class Vehicle:
         type VehicleType: El tipo de vehículo
         check_in_time int: La hora en que el vehículo entró al parking (ms desde la época)
         check_out_time Optional[int]: La hora en que el vehículo salió del parking (ms desde la época)"""
+    # Sin __dict__ por instancia: los listados grandes crean muchos objetos Vehicle
+    __slots__ = ("plate", "type", "check_in_time", "check_out_time")
+
     def __init__(self, plate: str, vehicle_type: VehicleType, check_in_time: int, check_out_time: Optional[int] = None):
         self.plate: str = plate
         self.type: VehicleType = vehicle_type
@@ -33,8 +41,95 @@ class Vehicle:
         duration_millis = end_time - self.check_in_time
         return int(duration_millis / 60000) if duration_millis >= 0 else 0
 
-    def calculate_parking_fee(self) -> float:
-        """Calcula la tarifa total de estacionamiento."""
-        duration_in_minutes = self.calculate_parking_duration_in_minutes()
-        duration_in_hours = duration_in_minutes / 60.0
-        return duration_in_hours * self.type.hourly_rate
\ No newline at end of file
+    def calculate_parking_fee(self, tariffs: Optional["TariffEngine"] = None) -> float:
+        """Calcula el importe de la estancia con el motor de tarifas `tariffs` (por defecto, la tarifa
+        plana por hora de cada tipo, TariffEngine.default()), igual que ParkingManager al registrar la salida."""
+        engine = tariffs if tariffs is not None else _default_tariffs()
+        end_time = self.check_out_time if self.check_out_time is not None else int(time.time() * 1000)
+        return engine.fee(self.type.name, self.check_in_time, end_time)
+
+_DEFAULT_TARIFFS: Optional["TariffEngine"] = None
+
+def _default_tariffs() -> "TariffEngine":
+    """TariffEngine.default(), creado una sola vez: construir el motor prepara los arrays de sus franjas."""
+    global _DEFAULT_TARIFFS
+    if _DEFAULT_TARIFFS is None:
+        from tariffs import TariffEngine # tariffs.py importa este módulo
+        _DEFAULT_TARIFFS = TariffEngine.default()
+    return _DEFAULT_TARIFFS
+
+# Código numérico de cada tipo de vehículo en VehicleBatch (-1 para tipos desconocidos)
+VEHICLE_TYPE_CODES = {vt.name: code for code, vt in enumerate(VehicleType)}
+VEHICLE_TYPES_BY_CODE = list(VehicleType)
+NO_CHECK_OUT = -1 # Valor de check_out_times para vehículos que siguen aparcados
+
+
+class VehicleBatch:
+    """Lote de vehículos en formato columnar: un array por campo en lugar de un objeto por fila,
+    para listados e informes grandes. Los arrays se pueden pasar directamente a TariffEngine.fees().
+
+    Atributos:
+        plates list[str]: Matrículas
+        type_codes np.ndarray[int8]: Código del tipo de vehículo (ver VEHICLE_TYPE_CODES)
+        check_in_times np.ndarray[int64]: Horas de entrada (ms desde la época)
+        check_out_times np.ndarray[int64]: Horas de salida (NO_CHECK_OUT si sigue aparcado)
+        duration_minutes np.ndarray[int32]: Duración de la estancia (0 si sigue aparcado)
+        fees np.ndarray[float64]: Importe cobrado (0 si sigue aparcado)"""
+    __slots__ = ("plates", "type_codes", "check_in_times", "check_out_times", "duration_minutes", "fees")
+
+    def __init__(self, plates: Sequence[str], type_codes, check_in_times, check_out_times=None,
+                 duration_minutes=None, fees=None):
+        count = len(plates)
+        self.plates = list(plates)
+        self.type_codes = np.asarray(type_codes, dtype=np.int8)
+        self.check_in_times = np.asarray(check_in_times, dtype=np.int64)
+        self.check_out_times = (np.asarray(check_out_times, dtype=np.int64) if check_out_times is not None
+                                else np.full(count, NO_CHECK_OUT, dtype=np.int64))
+        self.duration_minutes = (np.asarray(duration_minutes, dtype=np.int32) if duration_minutes is not None
+                                 else np.zeros(count, dtype=np.int32))
+        self.fees = np.asarray(fees, dtype=np.float64) if fees is not None else np.zeros(count)
+
+    @staticmethod
+    def encode_types(vehicle_type_names: Iterable[str]) -> np.ndarray:
+        """Convierte nombres de tipo de vehículo en códigos (-1 si el tipo no existe)."""
+        return np.fromiter((VEHICLE_TYPE_CODES.get(name, -1) for name in vehicle_type_names), dtype=np.int8)
+
+    @classmethod
+    def from_columns(cls, plates: Sequence[str], vehicle_type_names: Sequence[str], *columns) -> "VehicleBatch":
+        return cls(plates, cls.encode_types(vehicle_type_names), *columns)
+
+    @classmethod
+    def concatenate(cls, batches: Sequence["VehicleBatch"]) -> "VehicleBatch":
+        if not batches:
+            return cls([], [], [])
+        return cls(
+            [plate for batch in batches for plate in batch.plates],
+            np.concatenate([batch.type_codes for batch in batches]),
+            np.concatenate([batch.check_in_times for batch in batches]),
+            np.concatenate([batch.check_out_times for batch in batches]),
+            np.concatenate([batch.duration_minutes for batch in batches]),
+            np.concatenate([batch.fees for batch in batches]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.plates)
+
+    @property
+    def vehicle_type_names(self) -> np.ndarray:
+        """Nombres de tipo de vehículo de cada fila ("" para tipos desconocidos)."""
+        names = np.array([vt.name for vt in VEHICLE_TYPES_BY_CODE] + [""])
+        return names[self.type_codes] # El código -1 selecciona el último elemento, ""
+
+    def vehicle(self, index: int) -> Optional[Vehicle]:
+        """Crea el Vehicle de una fila (None si su tipo es desconocido)."""
+        code = int(self.type_codes[index])
+        if code < 0:
+            return None
+        check_out = int(self.check_out_times[index])
+        return Vehicle(self.plates[index], VEHICLE_TYPES_BY_CODE[code], int(self.check_in_times[index]),
+                       check_out if check_out != NO_CHECK_OUT else None)
+
+    def nbytes(self) -> int:
+        """Memoria ocupada por las columnas numéricas (sin contar las matrículas)."""
+        return sum(column.nbytes for column in (self.type_codes, self.check_in_times, self.check_out_times,
+                                                  self.duration_minutes, self.fees))